@@ -9,6 +9,7 @@ from app.middlewares.global_error import GlobalErrorMiddleware
 from app.middlewares.auth import AuthMiddleware
 from app.middlewares.logging import LoggingMiddleware
 from app.middlewares.throttling import ThrottlingMiddleware
+from app.middlewares.user_context import UserContextMiddleware
 from app.middlewares.subscription_checker import SubscriptionStatusMiddleware
 from app.middlewares.maintenance import MaintenanceMiddleware
 from app.middlewares.display_name_restriction import DisplayNameRestrictionMiddleware
@@ -107,8 +108,12 @@ async def setup_bot() -> tuple[Bot, Dispatcher]:
     dp.message.middleware(display_name_middleware)
     dp.callback_query.middleware(display_name_middleware)
     dp.pre_checkout_query.middleware(display_name_middleware)
-    dp.message.middleware(ThrottlingMiddleware())
-    dp.callback_query.middleware(ThrottlingMiddleware())
+    throttling_middleware = ThrottlingMiddleware()
+    dp.message.middleware(throttling_middleware)
+    dp.callback_query.middleware(throttling_middleware)
+    user_context_middleware = UserContextMiddleware()
+    dp.message.middleware(user_context_middleware)
+    dp.callback_query.middleware(user_context_middleware)
 
     if settings.CHANNEL_IS_REQUIRED_SUB:
         from app.middlewares.channel_checker import ChannelCheckerMiddleware
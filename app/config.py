@@ -6,7 +6,7 @@ import re
 import html
 from collections import defaultdict
 from datetime import time
-from typing import List, Optional, Union, Dict
+from typing import List, Optional, Union, Dict, Tuple
 from pydantic_settings import BaseSettings
 from pydantic import field_validator, Field
 from pathlib import Path
@@ -37,11 +37,19 @@ class Settings(BaseSettings):
     ADMIN_NOTIFICATIONS_CHAT_ID: Optional[str] = None
     ADMIN_NOTIFICATIONS_TOPIC_ID: Optional[int] = None
     ADMIN_NOTIFICATIONS_TICKET_TOPIC_ID: Optional[int] = None
+    ADMIN_NOTIFICATIONS_QUEUE_ENABLED: bool = True
+    ADMIN_NOTIFICATIONS_QUEUE_WORKERS: int = 3
+    ADMIN_NOTIFICATIONS_QUEUE_RATE_PER_SECOND: float = 0.5
+    ADMIN_NOTIFICATIONS_QUEUE_MAX_SIZE: int = 1000
+    ADMIN_NOTIFICATIONS_QUEUE_MAX_ATTEMPTS: int = 5
+    ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS: float = 60.0
 
     ADMIN_REPORTS_ENABLED: bool = False
     ADMIN_REPORTS_CHAT_ID: Optional[str] = None
     ADMIN_REPORTS_TOPIC_ID: Optional[int] = None
     ADMIN_REPORTS_SEND_TIME: Optional[str] = None
+    STATISTICS_CACHE_TTL_SECONDS: float = 30.0
+    STATISTICS_ROLLUPS_ENABLED: bool = True
 
     CHANNEL_SUB_ID: Optional[str] = None
     CHANNEL_LINK: Optional[str] = None
@@ -59,8 +67,37 @@ class Settings(BaseSettings):
     LOCALES_PATH: str = "./locales"
     
     DATABASE_MODE: str = "auto"
+
+    DATABASE_POOL_MODE: str = "auto"  # auto, queue или null
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_POOL_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: int = 30
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_WEB_API_POOL_SIZE: int = 5
+    DATABASE_WEB_API_POOL_MAX_OVERFLOW: int = 5
+    DATABASE_BACKGROUND_POOL_SIZE: int = 3
+    DATABASE_BACKGROUND_POOL_MAX_OVERFLOW: int = 2
     
     REDIS_URL: str = "redis://localhost:6379/0"
+
+    USER_CACHE_ENABLED: bool = False
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_LOCAL_TTL_SECONDS: int = 2
+    USER_CACHE_LOCAL_MAX_SIZE: int = 2048
+
+    THROTTLING_BACKEND: str = "memory"  # memory или redis
+    THROTTLING_MESSAGE_RATE: float = 2.0
+    THROTTLING_MESSAGE_BURST: int = 1
+    THROTTLING_CALLBACK_RATE: float = 2.0
+    THROTTLING_CALLBACK_BURST: int = 1
+    THROTTLING_ROUTE_LIMITS: str = ""
+
+    BROADCAST_RATE_LIMIT: float = 25.0
+    BROADCAST_RATE_BURST: int = 5
+    BROADCAST_WORKERS: int = 10
+    BROADCAST_MAX_RETRIES: int = 3
+    BROADCAST_CHECKPOINT_INTERVAL_SECONDS: int = 5
     
     REMNAWAVE_API_URL: Optional[str] = None
     REMNAWAVE_API_KEY: Optional[str] = None
@@ -73,6 +110,27 @@ class Settings(BaseSettings):
     REMNAWAVE_USER_DELETE_MODE: str = "delete"  # "delete" или "disable"
     REMNAWAVE_AUTO_SYNC_ENABLED: bool = False
     REMNAWAVE_AUTO_SYNC_TIMES: str = "03:00"
+    REMNAWAVE_SYNC_PAGE_SIZE: int = 500
+    REMNAWAVE_SYNC_CONCURRENCY: int = 4
+    REMNAWAVE_SYNC_BATCH_SIZE: int = 500
+    REMNAWAVE_API_POOL_SIZE: int = 100
+    REMNAWAVE_API_POOL_LIMIT_PER_HOST: int = 20
+    REMNAWAVE_API_KEEPALIVE_SECONDS: float = 30.0
+    REMNAWAVE_API_DNS_CACHE_SECONDS: int = 300
+    REMNAWAVE_STATS_CACHE_TTL_SECONDS: float = 5.0
+    REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS: float = 10.0
+    REMNAWAVE_READ_CACHE_ENABLED: bool = True
+    REMNAWAVE_READ_CACHE_USER_TTL_SECONDS: float = 5.0
+    REMNAWAVE_READ_CACHE_DEVICES_TTL_SECONDS: float = 10.0
+    REMNAWAVE_READ_CACHE_SQUADS_TTL_SECONDS: float = 60.0
+    REMNAWAVE_READ_CACHE_NODES_TTL_SECONDS: float = 15.0
+    REMNAWAVE_WRITE_CONCURRENCY: int = 8
+    REMNAWAVE_WRITE_RATE_LIMIT: float = 20.0
+    REMNAWAVE_WRITE_BULK_ENABLED: bool = True
+    REMNAWAVE_WRITE_BULK_SIZE: int = 500
+    REMNAWAVE_WRITE_MAX_ATTEMPTS: int = 3
+    REMNAWAVE_WRITE_RETRY_BASE_SECONDS: float = 1.0
+    REMNAWAVE_WRITE_PROGRESS_INTERVAL_SECONDS: float = 3.0
     
     TRIAL_DURATION_DAYS: int = 3
     TRIAL_TRAFFIC_LIMIT_GB: int = 10
@@ -148,6 +206,10 @@ class Settings(BaseSettings):
     MIN_BALANCE_FOR_AUTOPAY_KOPEKS: int = 10000  
     
     MONITORING_INTERVAL: int = 60
+    MONITORING_STAGE_CONCURRENCY: int = 3
+    MONITORING_NOTIFICATION_CONCURRENCY: int = 5
+    MONITORING_PANEL_CONCURRENCY: int = 5
+    MONITORING_SLOW_STAGE_SECONDS: float = 30.0
     INACTIVE_USER_DELETE_MONTHS: int = 3
 
     MAINTENANCE_MODE: bool = False
@@ -246,6 +308,21 @@ class Settings(BaseSettings):
     WATA_MAX_AMOUNT_KOPEKS: int = 100000000
     WATA_REQUEST_TIMEOUT: int = 30
 
+    PAYMENT_WEBHOOK_GATEWAY_HOST: str = "0.0.0.0"
+    PAYMENT_WEBHOOK_GATEWAY_PORT: int = 8081
+    PAYMENT_WEBHOOK_LEGACY_PORTS_ENABLED: bool = True
+    PAYMENT_WEBHOOK_MAX_BODY_BYTES: int = 1048576
+    PAYMENT_WEBHOOK_IDEMPOTENCY_TTL_SECONDS: int = 86400
+
+    PAYMENT_INBOX_ENABLED: bool = True
+    PAYMENT_INBOX_WORKERS: int = 4
+    PAYMENT_INBOX_BATCH_SIZE: int = 50
+    PAYMENT_INBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    PAYMENT_INBOX_MAX_ATTEMPTS: int = 8
+    PAYMENT_INBOX_RETRY_BASE_SECONDS: int = 5
+    PAYMENT_INBOX_RETRY_MAX_SECONDS: int = 1800
+    PAYMENT_INBOX_LEASE_SECONDS: int = 600
+
     MAIN_MENU_MODE: str = "default"
     CONNECT_BUTTON_MODE: str = "guide"
     MINIAPP_CUSTOM_URL: str = ""
@@ -306,6 +383,8 @@ class Settings(BaseSettings):
     BACKUP_COMPRESSION: bool = True
     BACKUP_INCLUDE_LOGS: bool = False
     BACKUP_LOCATION: str = "/app/data/backups"
+    BACKUP_RESTORE_BATCH_SIZE: int = 1000
+    BACKUP_RESTORE_PROGRESS_INTERVAL_SECONDS: float = 3.0
     BACKUP_SEND_ENABLED: bool = False
     BACKUP_SEND_CHAT_ID: Optional[str] = None
     BACKUP_SEND_TOPIC_ID: Optional[int] = None
@@ -442,6 +521,31 @@ class Settings(BaseSettings):
         """Проверяет, используется ли SQLite"""
         return "sqlite" in self.get_database_url()
     
+    def get_database_pool_mode(self) -> str:
+        mode = (self.DATABASE_POOL_MODE or "auto").strip().lower()
+        if mode == "auto":
+            return "queue" if self.is_postgresql() else "null"
+        return mode if mode in {"queue", "null"} else "null"
+
+    def is_database_pool_enabled(self) -> bool:
+        return self.get_database_pool_mode() == "queue"
+
+    def get_database_pool_options(self, role: str = "bot") -> Dict[str, Union[int, bool]]:
+        if role == "web_api":
+            size, overflow = self.DATABASE_WEB_API_POOL_SIZE, self.DATABASE_WEB_API_POOL_MAX_OVERFLOW
+        elif role == "background":
+            size, overflow = self.DATABASE_BACKGROUND_POOL_SIZE, self.DATABASE_BACKGROUND_POOL_MAX_OVERFLOW
+        else:
+            size, overflow = self.DATABASE_POOL_SIZE, self.DATABASE_POOL_MAX_OVERFLOW
+
+        return {
+            "pool_size": max(1, int(size)),
+            "max_overflow": max(0, int(overflow)),
+            "pool_timeout": max(1, int(self.DATABASE_POOL_TIMEOUT)),
+            "pool_recycle": int(self.DATABASE_POOL_RECYCLE),
+            "pool_pre_ping": bool(self.DATABASE_POOL_PRE_PING),
+        }
+
     def is_admin(self, user_id: int) -> bool:
         return user_id in self.get_admin_ids()
     
@@ -574,6 +678,39 @@ class Settings(BaseSettings):
 
         return unique
     
+    def get_throttling_backend(self) -> str:
+        backend = (self.THROTTLING_BACKEND or "memory").strip().lower()
+        return backend if backend in {"memory", "redis"} else "memory"
+
+    def get_throttling_route_limits(self) -> List[Tuple[str, float, int]]:
+        """Разбирает правила вида ``prefix=rate/burst`` через запятую или перевод строки."""
+
+        raw_value = self.THROTTLING_ROUTE_LIMITS or ""
+        limits: List[Tuple[str, float, int]] = []
+
+        for chunk in re.split(r"[\n,;]+", raw_value):
+            chunk = chunk.strip()
+            if not chunk or "=" not in chunk:
+                continue
+
+            prefix, _, limit = chunk.partition("=")
+            rate_part, _, burst_part = limit.partition("/")
+            try:
+                rate = float(rate_part.strip())
+                burst = int(burst_part.strip()) if burst_part.strip() else 1
+            except ValueError:
+                logging.getLogger(__name__).warning("Некорректное правило троттлинга: %s", chunk)
+                continue
+
+            if not prefix.strip() or rate <= 0 or burst <= 0:
+                logging.getLogger(__name__).warning("Некорректное правило троттлинга: %s", chunk)
+                continue
+
+            limits.append((prefix.strip(), rate, burst))
+
+        limits.sort(key=lambda item: len(item[0]), reverse=True)
+        return limits
+
     def get_autopay_warning_days(self) -> List[int]:
         try:
             days = self.AUTOPAY_WARNING_DAYS
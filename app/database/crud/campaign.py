@@ -2,7 +2,7 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from sqlalchemy import and_, func, select, update, delete
+from sqlalchemy import and_, func, select, true, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -220,214 +220,100 @@ async def get_campaign_statistics(
     db: AsyncSession,
     campaign_id: int,
 ) -> Dict[str, Optional[int]]:
-    registrations_query = select(AdvertisingCampaignRegistration.user_id).where(
+    """Статистика кампании одним запросом.
+
+    Пользователи кампании выбираются один раз подзапросом, а каждая связанная
+    таблица агрегируется одним проходом с условными счётчиками.
+    """
+
+    campaign_users = select(AdvertisingCampaignRegistration.user_id).where(
         AdvertisingCampaignRegistration.campaign_id == campaign_id
     )
-    registrations_subquery = registrations_query.subquery()
 
-    result = await db.execute(
+    registrations = (
         select(
-            func.count(AdvertisingCampaignRegistration.id),
+            func.count(AdvertisingCampaignRegistration.id).label("count"),
             func.coalesce(
                 func.sum(AdvertisingCampaignRegistration.balance_bonus_kopeks), 0
-            ),
-            func.max(AdvertisingCampaignRegistration.created_at),
-        ).where(AdvertisingCampaignRegistration.campaign_id == campaign_id)
-    )
-    count, total_balance, last_registration = result.one()
-    count = count or 0
-    total_balance = total_balance or 0
-
-    subscription_count_result = await db.execute(
-        select(func.count(AdvertisingCampaignRegistration.id)).where(
-            and_(
-                AdvertisingCampaignRegistration.campaign_id == campaign_id,
-                AdvertisingCampaignRegistration.bonus_type == "subscription",
-            )
-        )
-    )
-    subscription_bonuses_issued = subscription_count_result.scalar() or 0
-
-    deposits_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0)).where(
-            Transaction.user_id.in_(select(registrations_subquery.c.user_id)),
-            Transaction.type == TransactionType.DEPOSIT.value,
-            Transaction.is_completed.is_(True),
-        )
-    )
-    deposits_total = deposits_result.scalar() or 0
-
-    trials_result = await db.execute(
-        select(func.count(func.distinct(Subscription.user_id))).where(
-            Subscription.user_id.in_(select(registrations_subquery.c.user_id)),
-            Subscription.is_trial.is_(True),
-        )
-    )
-    trial_users_count = trials_result.scalar() or 0
-
-    active_trials_result = await db.execute(
-        select(func.count(func.distinct(Subscription.user_id))).where(
-            Subscription.user_id.in_(select(registrations_subquery.c.user_id)),
-            Subscription.is_trial.is_(True),
-            Subscription.status == SubscriptionStatus.ACTIVE.value,
-        )
-    )
-    active_trials_count = active_trials_result.scalar() or 0
-
-    conversions_result = await db.execute(
-        select(func.count(func.distinct(SubscriptionConversion.user_id))).where(
-            SubscriptionConversion.user_id.in_(select(registrations_subquery.c.user_id))
-        )
-    )
-    conversion_count = conversions_result.scalar() or 0
-
-    paid_users_result = await db.execute(
-        select(func.count(User.id)).where(
-            User.id.in_(select(registrations_subquery.c.user_id)),
-            User.has_had_paid_subscription.is_(True),
+            ).label("total_balance"),
+            func.max(AdvertisingCampaignRegistration.created_at).label("last_registration"),
+            func.count(AdvertisingCampaignRegistration.id)
+            .filter(AdvertisingCampaignRegistration.bonus_type == "subscription")
+            .label("subscription_bonuses"),
         )
+        .where(AdvertisingCampaignRegistration.campaign_id == campaign_id)
+        .subquery()
     )
-    paid_users_from_flag = paid_users_result.scalar() or 0
 
-    conversions_rows = await db.execute(
+    trials = (
         select(
-            SubscriptionConversion.user_id,
-            SubscriptionConversion.first_payment_amount_kopeks,
-            SubscriptionConversion.converted_at,
+            func.count(func.distinct(Subscription.user_id)).label("trial_users"),
+            func.count(func.distinct(Subscription.user_id))
+            .filter(Subscription.status == SubscriptionStatus.ACTIVE.value)
+            .label("active_trials"),
         )
         .where(
-            SubscriptionConversion.user_id.in_(
-                select(registrations_subquery.c.user_id)
-            )
+            Subscription.user_id.in_(campaign_users),
+            Subscription.is_trial.is_(True),
         )
-        .order_by(SubscriptionConversion.converted_at)
+        .subquery()
     )
-    conversion_entries = conversions_rows.all()
 
-    subscription_payments_rows = await db.execute(
+    conversions = (
         select(
-            Transaction.user_id,
-            Transaction.amount_kopeks,
-            Transaction.created_at,
-        )
-        .where(
-            Transaction.user_id.in_(select(registrations_subquery.c.user_id)),
-            Transaction.type == TransactionType.SUBSCRIPTION_PAYMENT.value,
-            Transaction.is_completed.is_(True),
+            func.count(func.distinct(SubscriptionConversion.user_id)).label("conversion_count"),
+            func.coalesce(
+                func.avg(SubscriptionConversion.first_payment_amount_kopeks), 0
+            ).label("avg_first_payment"),
         )
-        .order_by(Transaction.user_id, Transaction.created_at)
+        .where(SubscriptionConversion.user_id.in_(campaign_users))
+        .subquery()
     )
-    subscription_payments = subscription_payments_rows.all()
-
-    subscription_payments_total = 0
-    paid_users_from_transactions = set()
-    conversion_user_ids = set()
-    first_payment_amount_by_user: Dict[int, int] = {}
-    first_payment_time_by_user: Dict[int, Optional[datetime]] = {}
-
-    for user_id, amount_kopeks, converted_at in conversion_entries:
-        conversion_user_ids.add(user_id)
-        amount_value = int(amount_kopeks or 0)
-        first_payment_amount_by_user[user_id] = amount_value
-        first_payment_time_by_user[user_id] = converted_at
-
-    for user_id, amount_kopeks, created_at in subscription_payments:
-        amount_value = int(amount_kopeks or 0)
-        subscription_payments_total += amount_value
-        paid_users_from_transactions.add(user_id)
-
-        if user_id not in first_payment_amount_by_user:
-            first_payment_amount_by_user[user_id] = amount_value
-            first_payment_time_by_user[user_id] = created_at
-        else:
-            existing_time = first_payment_time_by_user.get(user_id)
-            if existing_time is None and created_at is not None:
-                first_payment_amount_by_user[user_id] = amount_value
-                first_payment_time_by_user[user_id] = created_at
-            elif (
-                existing_time is not None
-                and created_at is not None
-                and created_at < existing_time
-            ):
-                first_payment_amount_by_user[user_id] = amount_value
-                first_payment_time_by_user[user_id] = created_at
-
-    total_revenue = deposits_total + subscription_payments_total
-
-    paid_user_ids = set(paid_users_from_transactions)
-    paid_user_ids.update(conversion_user_ids)
-    paid_users_count = max(len(paid_user_ids), paid_users_from_flag)
-
-    conversion_count = conversion_count or len(paid_user_ids)
-    if conversion_count < len(paid_user_ids):
-        conversion_count = len(paid_user_ids)
-
-    avg_first_payment = 0
-    if first_payment_amount_by_user:
-        avg_first_payment = int(
-            sum(first_payment_amount_by_user.values())
-            / len(first_payment_amount_by_user)
-        )
-
-    conversion_rate = 0.0
-    if count:
-        conversion_rate = round((paid_users_count / count) * 100, 1)
-
-    trial_conversion_rate = 0.0
-    if trial_users_count:
-        trial_conversion_rate = round((conversion_count / trial_users_count) * 100, 1)
-
-    avg_revenue_per_user = 0
-    if count:
-        avg_revenue_per_user = int(total_revenue / count)
 
-    deposits_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0)).where(
-            Transaction.user_id.in_(select(registrations_subquery.c.user_id)),
+    deposits_total = (
+        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
+        .where(
+            Transaction.user_id.in_(campaign_users),
             Transaction.type == TransactionType.DEPOSIT.value,
             Transaction.is_completed.is_(True),
         )
+        .scalar_subquery()
     )
-    total_revenue = deposits_result.scalar() or 0
-
-    trials_result = await db.execute(
-        select(func.count(func.distinct(Subscription.user_id))).where(
-            Subscription.user_id.in_(select(registrations_subquery.c.user_id)),
-            Subscription.is_trial.is_(True),
-        )
-    )
-    trial_users_count = trials_result.scalar() or 0
-
-    active_trials_result = await db.execute(
-        select(func.count(func.distinct(Subscription.user_id))).where(
-            Subscription.user_id.in_(select(registrations_subquery.c.user_id)),
-            Subscription.is_trial.is_(True),
-            Subscription.status == SubscriptionStatus.ACTIVE.value,
-        )
-    )
-    active_trials_count = active_trials_result.scalar() or 0
-
-    conversions_result = await db.execute(
-        select(func.count(func.distinct(SubscriptionConversion.user_id))).where(
-            SubscriptionConversion.user_id.in_(select(registrations_subquery.c.user_id))
-        )
-    )
-    conversion_count = conversions_result.scalar() or 0
 
-    paid_users_result = await db.execute(
-        select(func.count(User.id)).where(
-            User.id.in_(select(registrations_subquery.c.user_id)),
+    paid_users = (
+        select(func.count(User.id))
+        .where(
+            User.id.in_(campaign_users),
             User.has_had_paid_subscription.is_(True),
         )
+        .scalar_subquery()
     )
-    paid_users_count = paid_users_result.scalar() or 0
 
-    avg_first_payment_result = await db.execute(
-        select(func.coalesce(func.avg(SubscriptionConversion.first_payment_amount_kopeks), 0)).where(
-            SubscriptionConversion.user_id.in_(select(registrations_subquery.c.user_id))
+    # Каждый подзапрос — агрегат без GROUP BY, то есть ровно одна строка
+    result = await db.execute(
+        select(
+            registrations.c.count,
+            registrations.c.total_balance,
+            registrations.c.last_registration,
+            registrations.c.subscription_bonuses,
+            trials.c.trial_users,
+            trials.c.active_trials,
+            conversions.c.conversion_count,
+            conversions.c.avg_first_payment,
+            deposits_total.label("deposits_total"),
+            paid_users.label("paid_users"),
         )
+        .select_from(registrations)
+        .join(trials, true())
+        .join(conversions, true())
     )
-    avg_first_payment = int(avg_first_payment_result.scalar() or 0)
+    row = result.one()
+
+    count = row.count or 0
+    total_revenue = row.deposits_total or 0
+    trial_users_count = row.trial_users or 0
+    conversion_count = row.conversion_count or 0
+    paid_users_count = row.paid_users or 0
 
     conversion_rate = 0.0
     if count:
@@ -443,18 +329,18 @@ async def get_campaign_statistics(
 
     return {
         "registrations": count,
-        "balance_issued": total_balance,
-        "subscription_issued": subscription_bonuses_issued,
-        "last_registration": last_registration,
+        "balance_issued": row.total_balance or 0,
+        "subscription_issued": row.subscription_bonuses or 0,
+        "last_registration": row.last_registration,
         "total_revenue_kopeks": total_revenue,
         "trial_users_count": trial_users_count,
-        "active_trials_count": active_trials_count,
+        "active_trials_count": row.active_trials or 0,
         "conversion_count": conversion_count,
         "paid_users_count": paid_users_count,
         "conversion_rate": conversion_rate,
         "trial_conversion_rate": trial_conversion_rate,
         "avg_revenue_per_user_kopeks": avg_revenue_per_user,
-        "avg_first_payment_kopeks": avg_first_payment,
+        "avg_first_payment_kopeks": int(row.avg_first_payment or 0),
     }
 
 
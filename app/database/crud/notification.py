@@ -1,5 +1,5 @@
 import logging
-from typing import Optional
+from typing import Iterable, Optional, Set, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 
@@ -64,3 +64,50 @@ async def clear_notification_by_type(
         )
     )
     await db.commit()
+
+
+async def get_sent_notification_keys(
+    db: AsyncSession,
+    subscription_ids: Iterable[int],
+    notification_types: Iterable[str],
+) -> Set[Tuple[int, str, Optional[int]]]:
+    """Одним запросом возвращает (subscription_id, type, days_before) уже отправленных уведомлений."""
+
+    subscription_ids = list(subscription_ids)
+    if not subscription_ids:
+        return set()
+
+    result = await db.execute(
+        select(
+            SentNotification.subscription_id,
+            SentNotification.notification_type,
+            SentNotification.days_before,
+        ).where(
+            SentNotification.subscription_id.in_(subscription_ids),
+            SentNotification.notification_type.in_(list(notification_types)),
+        )
+    )
+    return {tuple(row) for row in result}
+
+
+async def record_notifications(
+    db: AsyncSession,
+    entries: Iterable[Tuple[int, int, str, Optional[int]]],
+) -> int:
+    """Сохраняет пачку (user_id, subscription_id, type, days_before) одним коммитом."""
+
+    notifications = [
+        SentNotification(
+            user_id=user_id,
+            subscription_id=subscription_id,
+            notification_type=notification_type,
+            days_before=days_before,
+        )
+        for user_id, subscription_id, notification_type, days_before in entries
+    ]
+    if not notifications:
+        return 0
+
+    db.add_all(notifications)
+    await db.commit()
+    return len(notifications)
@@ -0,0 +1,238 @@
+"""CRUD helpers for the inbox of incoming payment provider events."""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import exists, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.database.models import PaymentEvent, PaymentEventStatus
+
+logger = logging.getLogger(__name__)
+
+_OPEN_STATUSES = (PaymentEventStatus.PENDING.value, PaymentEventStatus.PROCESSING.value)
+
+
+async def get_payment_event(db: AsyncSession, provider: str, event_key: str) -> Optional[PaymentEvent]:
+    result = await db.execute(
+        select(PaymentEvent).where(
+            PaymentEvent.provider == provider,
+            PaymentEvent.event_key == event_key,
+        )
+    )
+    return result.scalar_one_or_none()
+
+
+async def enqueue_payment_event(
+    db: AsyncSession,
+    *,
+    provider: str,
+    event_key: str,
+    ordering_key: str,
+    payload: Dict[str, Any],
+) -> Tuple[PaymentEvent, bool]:
+    """Сохраняет событие во входящую очередь. Возвращает событие и признак новой записи."""
+
+    existing = await get_payment_event(db, provider, event_key)
+    if existing:
+        return existing, False
+
+    event = PaymentEvent(
+        provider=provider,
+        event_key=event_key,
+        ordering_key=ordering_key,
+        payload=payload,
+        status=PaymentEventStatus.PENDING.value,
+        next_attempt_at=datetime.utcnow(),
+        created_at=datetime.utcnow(),
+    )
+    db.add(event)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Параллельная доставка того же события успела записать его первой
+        await db.rollback()
+        existing = await get_payment_event(db, provider, event_key)
+        if existing:
+            return existing, False
+        raise
+
+    await db.refresh(event)
+    return event, True
+
+
+async def claim_due_payment_events(
+    db: AsyncSession,
+    limit: int,
+    *,
+    now: Optional[datetime] = None,
+) -> List[PaymentEvent]:
+    """Забирает готовые к обработке события, не более одного на платёж.
+
+    Событие пропускается, пока более раннее событие того же платежа ещё не
+    обработано, поэтому события одного платежа применяются строго по порядку.
+    Захват атомарен: кандидаты блокируются ``FOR UPDATE SKIP LOCKED``, а
+    статус меняется условным ``UPDATE ... RETURNING``. Несколько реплик бота
+    получают непересекающиеся наборы событий.
+    """
+
+    now = now or datetime.utcnow()
+    earlier = aliased(PaymentEvent)
+    blocked = exists().where(
+        earlier.provider == PaymentEvent.provider,
+        earlier.ordering_key == PaymentEvent.ordering_key,
+        earlier.id < PaymentEvent.id,
+        earlier.status.in_(_OPEN_STATUSES),
+    )
+
+    candidates = await db.execute(
+        select(PaymentEvent.id)
+        .where(
+            PaymentEvent.status == PaymentEventStatus.PENDING.value,
+            PaymentEvent.next_attempt_at <= now,
+            ~blocked,
+        )
+        .order_by(PaymentEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    event_ids = list(candidates.scalars().all())
+    if not event_ids:
+        await db.rollback()
+        return []
+
+    # Повторная проверка статуса: строки, уже захваченные другой репликой, не возвращаются
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(
+            PaymentEvent.id.in_(event_ids),
+            PaymentEvent.status == PaymentEventStatus.PENDING.value,
+        )
+        .values(
+            status=PaymentEventStatus.PROCESSING.value,
+            attempts=PaymentEvent.attempts + 1,
+            claimed_at=now,
+        )
+        .returning(PaymentEvent)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    events = sorted(result.scalars().all(), key=lambda event: event.id)
+    await db.commit()
+    return events
+
+
+async def complete_payment_event(db: AsyncSession, event_id: int) -> None:
+    await db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.id == event_id)
+        .values(
+            status=PaymentEventStatus.DONE.value,
+            processed_at=datetime.utcnow(),
+            last_error=None,
+        )
+    )
+    await db.commit()
+
+
+async def fail_payment_event(
+    db: AsyncSession,
+    event_id: int,
+    error: str,
+    *,
+    retry_at: Optional[datetime],
+) -> None:
+    """Возвращает событие в очередь до ``retry_at`` либо переносит в dead-letter."""
+
+    values: Dict[str, Any] = {"last_error": error[:2000]}
+    if retry_at is None:
+        values.update(status=PaymentEventStatus.DEAD.value, processed_at=datetime.utcnow())
+    else:
+        values.update(status=PaymentEventStatus.PENDING.value, next_attempt_at=retry_at)
+
+    await db.execute(update(PaymentEvent).where(PaymentEvent.id == event_id).values(**values))
+    await db.commit()
+
+
+async def requeue_stale_payment_events(
+    db: AsyncSession,
+    lease_seconds: int,
+    *,
+    now: Optional[datetime] = None,
+) -> int:
+    """Возвращает в очередь события, захват которых истёк.
+
+    Событие, захваченное недавно, может обрабатываться другой живой репликой,
+    поэтому в очередь возвращаются только события старше ``lease_seconds``.
+    """
+
+    now = now or datetime.utcnow()
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(
+            PaymentEvent.status == PaymentEventStatus.PROCESSING.value,
+            or_(
+                PaymentEvent.claimed_at.is_(None),
+                PaymentEvent.claimed_at <= now - timedelta(seconds=lease_seconds),
+            ),
+        )
+        .values(status=PaymentEventStatus.PENDING.value, claimed_at=None)
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def requeue_dead_payment_event(db: AsyncSession, event_id: int) -> bool:
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(
+            PaymentEvent.id == event_id,
+            PaymentEvent.status == PaymentEventStatus.DEAD.value,
+        )
+        .values(
+            status=PaymentEventStatus.PENDING.value,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            processed_at=None,
+        )
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def get_payment_event_stats(db: AsyncSession, *, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Размер очереди по статусам, задержка самого старого события и пропускная способность."""
+
+    now = now or datetime.utcnow()
+
+    status_rows = await db.execute(
+        select(PaymentEvent.status, func.count(PaymentEvent.id)).group_by(PaymentEvent.status)
+    )
+    by_status = {status.value: 0 for status in PaymentEventStatus}
+    by_status.update({status: count for status, count in status_rows.all()})
+
+    oldest_pending = (
+        await db.execute(
+            select(func.min(PaymentEvent.created_at)).where(PaymentEvent.status.in_(_OPEN_STATUSES))
+        )
+    ).scalar()
+
+    processed_rows = await db.execute(
+        select(
+            func.count(PaymentEvent.id).filter(PaymentEvent.processed_at >= now - timedelta(minutes=1)),
+            func.count(PaymentEvent.id).filter(PaymentEvent.processed_at >= now - timedelta(hours=1)),
+        ).where(PaymentEvent.status == PaymentEventStatus.DONE.value)
+    )
+    processed_last_minute, processed_last_hour = processed_rows.one()
+
+    return {
+        "by_status": by_status,
+        "lag_seconds": max(0.0, (now - oldest_pending).total_seconds()) if oldest_pending else 0.0,
+        "oldest_pending_at": oldest_pending,
+        "processed_last_minute": processed_last_minute or 0,
+        "processed_last_hour": processed_last_hour or 0,
+    }
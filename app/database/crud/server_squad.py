@@ -9,20 +9,22 @@ from sqlalchemy import (
     func,
     update,
     delete,
-    text,
     or_,
-    cast,
-    String,
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.database.crud.subscription_squad import (
+    ACTIVE_SUBSCRIPTION_STATUSES,
+    count_subscriptions_by_squad,
+    subscription_ids_for_squads,
+)
 from app.database.models import (
     PromoGroup,
     ServerSquad,
     SubscriptionServer,
     Subscription,
-    SubscriptionStatus,
+    SubscriptionSquad,
     User,
 )
 
@@ -314,27 +316,20 @@ async def sync_with_remnawave(
 
         subscriptions_to_update: dict[int, Subscription] = {}
 
+        membership_filters = []
         if subscription_ids:
+            membership_filters.append(Subscription.id.in_(subscription_ids))
+        squad_uuids = [squad_uuid for squad_uuid in removed_uuids if squad_uuid]
+        if squad_uuids:
+            membership_filters.append(Subscription.id.in_(subscription_ids_for_squads(squad_uuids)))
+
+        if membership_filters:
             subscriptions_result = await db.execute(
-                select(Subscription).where(Subscription.id.in_(subscription_ids))
+                select(Subscription).where(or_(*membership_filters))
             )
             for subscription in subscriptions_result.scalars().unique().all():
                 subscriptions_to_update[subscription.id] = subscription
 
-        for squad_uuid in removed_uuids:
-            if not squad_uuid:
-                continue
-
-            extra_result = await db.execute(
-                select(Subscription).where(
-                    text("connected_squads::text LIKE :uuid_pattern")
-                ),
-                {"uuid_pattern": f'%"{squad_uuid}"%'}
-            )
-
-            for subscription in extra_result.scalars().unique().all():
-                subscriptions_to_update[subscription.id] = subscription
-
         cleaned_subscriptions = 0
 
         for subscription in subscriptions_to_update.values():
@@ -380,9 +375,7 @@ async def get_server_connected_users(
 
     if server_uuid:
         connection_filters.append(
-            cast(Subscription.connected_squads, String).like(
-                f'%"{server_uuid}"%'
-            )
+            Subscription.id.in_(subscription_ids_for_squads([server_uuid]))
         )
 
     result = await db.execute(
@@ -512,23 +505,13 @@ async def get_server_statistics(db: AsyncSession) -> dict:
     )
     available_servers = available_result.scalar()
     
-    servers_with_connections = 0
-    all_servers_result = await db.execute(select(ServerSquad.squad_uuid))
-    all_server_uuids = [row[0] for row in all_servers_result.fetchall()]
-    
-    for squad_uuid in all_server_uuids:
-        count_result = await db.execute(
-            text("""
-                SELECT COUNT(s.id) 
-                FROM subscriptions s 
-                WHERE s.status IN ('active', 'trial') 
-                AND s.connected_squads::text LIKE :uuid_pattern
-            """),
-            {"uuid_pattern": f'%"{squad_uuid}"%'}
-        )
-        user_count = count_result.scalar() or 0
-        if user_count > 0:
-            servers_with_connections += 1
+    connections_result = await db.execute(
+        select(func.count(func.distinct(ServerSquad.id)))
+        .join(SubscriptionSquad, SubscriptionSquad.squad_uuid == ServerSquad.squad_uuid)
+        .join(Subscription, Subscription.id == SubscriptionSquad.subscription_id)
+        .where(Subscription.status.in_(ACTIVE_SUBSCRIPTION_STATUSES))
+    )
+    servers_with_connections = connections_result.scalar() or 0
     
     revenue_result = await db.execute(
         select(func.coalesce(func.sum(SubscriptionServer.paid_price_kopeks), 0))
@@ -549,14 +532,11 @@ async def count_active_users_for_squad(db: AsyncSession, squad_uuid: str) -> int
     """Возвращает количество активных подписок, подключенных к указанному скваду."""
 
     result = await db.execute(
-        select(func.count(Subscription.id)).where(
-            Subscription.status.in_(
-                [
-                    SubscriptionStatus.ACTIVE.value,
-                    SubscriptionStatus.TRIAL.value,
-                ]
-            ),
-            cast(Subscription.connected_squads, String).like(f'%"{squad_uuid}"%'),
+        select(func.count(SubscriptionSquad.subscription_id))
+        .join(Subscription, Subscription.id == SubscriptionSquad.subscription_id)
+        .where(
+            SubscriptionSquad.squad_uuid == squad_uuid,
+            Subscription.status.in_(ACTIVE_SUBSCRIPTION_STATUSES),
         )
     )
 
@@ -628,28 +608,18 @@ async def sync_server_user_counts(db: AsyncSession) -> int:
         all_servers = all_servers_result.fetchall()
         
         logger.info(f"🔍 Найдено серверов для синхронизации: {len(all_servers)}")
-        
-        updated_count = 0
+
+        counts = await count_subscriptions_by_squad(db)
+        updates = [
+            {"id": server_id, "current_users": counts.get(squad_uuid, 0)}
+            for server_id, squad_uuid in all_servers
+        ]
         for server_id, squad_uuid in all_servers:
-            count_result = await db.execute(
-                text("""
-                    SELECT COUNT(s.id) 
-                    FROM subscriptions s 
-                    WHERE s.status IN ('active', 'trial') 
-                    AND s.connected_squads::text LIKE :uuid_pattern
-                """),
-                {"uuid_pattern": f'%"{squad_uuid}"%'}
-            )
-            actual_users = count_result.scalar() or 0
-            
-            logger.info(f"📊 Сервер {server_id} ({squad_uuid[:8]}): {actual_users} пользователей")
-            
-            await db.execute(
-                update(ServerSquad)
-                .where(ServerSquad.id == server_id)
-                .values(current_users=actual_users)
-            )
-            updated_count += 1
+            logger.debug(f"📊 Сервер {server_id} ({squad_uuid[:8]}): {counts.get(squad_uuid, 0)} пользователей")
+
+        if updates:
+            await db.execute(update(ServerSquad), updates)
+        updated_count = len(updates)
         
         await db.commit()
         logger.info(f"✅ Синхронизированы счетчики для {updated_count} серверов")
@@ -0,0 +1,412 @@
+"""CRUD helpers for hourly statistics rollups."""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import (
+    StatisticsMetric,
+    StatisticsRollup,
+    Subscription,
+    SubscriptionConversion,
+    Ticket,
+    Transaction,
+    User,
+)
+
+logger = logging.getLogger(__name__)
+
+_TRANSACTION_PREFIX = f"{StatisticsMetric.TRANSACTION.value}:"
+_REBUILD_CHUNK_SIZE = 500
+
+RollupKey = Tuple[datetime, str, str]
+
+
+def rollup_bucket(moment: datetime) -> datetime:
+    """Начало часовой корзины (UTC, без tzinfo) для момента ``moment``."""
+
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _bucket_after(moment: datetime) -> datetime:
+    bucket = rollup_bucket(moment)
+    return bucket if bucket == moment.replace(tzinfo=None) else bucket + timedelta(hours=1)
+
+
+def transaction_metric(transaction_type: str) -> str:
+    return f"{_TRANSACTION_PREFIX}{transaction_type}"
+
+
+def parse_transaction_metric(metric: str) -> Optional[str]:
+    if metric.startswith(_TRANSACTION_PREFIX):
+        return metric[len(_TRANSACTION_PREFIX):]
+    return None
+
+
+def _dialect_name(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+
+def _upsert_statement(dialect_name: str, rows: List[Dict[str, Any]]):
+    """INSERT, прибавляющий счётчики к уже существующей корзине."""
+
+    insert = postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert(StatisticsRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["bucket_start", "metric", "dimension"],
+        set_={
+            "events_count": StatisticsRollup.events_count + stmt.excluded.events_count,
+            "amount_kopeks": StatisticsRollup.amount_kopeks + stmt.excluded.amount_kopeks,
+            "updated_at": func.now(),
+        },
+    )
+
+
+async def record_statistics_event(
+    db: AsyncSession,
+    metric: str,
+    *,
+    moment: Optional[datetime] = None,
+    dimension: Optional[str] = None,
+    count: int = 1,
+    amount_kopeks: int = 0,
+) -> None:
+    """Прибавляет событие к часовой корзине в текущей транзакции ``db``.
+
+    Коммит остаётся за вызывающим кодом, так что счётчик фиксируется вместе
+    с исходной записью.
+    """
+
+    row = {
+        "bucket_start": rollup_bucket(moment or datetime.utcnow()),
+        "metric": metric,
+        "dimension": dimension or "",
+        "events_count": count,
+        "amount_kopeks": int(amount_kopeks or 0),
+    }
+    await db.execute(_upsert_statement(_dialect_name(db), [row]))
+
+
+async def record_statistics_events(
+    db: AsyncSession,
+    events: Iterable[Tuple[str, Optional[datetime]]],
+) -> None:
+    """Прибавляет пачку событий ``(метрика, момент)`` одним upsert.
+
+    Нужна для bulk-вставок Core, которые обходят поштучные хуки; события
+    сворачиваются в одну строку на пару (корзина, метрика).
+    """
+
+    now = datetime.utcnow()
+    counts: Dict[Tuple[datetime, str], int] = defaultdict(int)
+    for metric, moment in events:
+        counts[(rollup_bucket(moment or now), metric)] += 1
+    if not counts:
+        return
+
+    rows = [
+        {
+            "bucket_start": bucket,
+            "metric": metric,
+            "dimension": "",
+            "events_count": count,
+            "amount_kopeks": 0,
+        }
+        for (bucket, metric), count in counts.items()
+    ]
+    await db.execute(_upsert_statement(_dialect_name(db), rows))
+
+
+async def record_transaction_completed(db: AsyncSession, transaction: Transaction) -> None:
+    await record_statistics_event(
+        db,
+        transaction_metric(transaction.type),
+        moment=transaction.created_at,
+        dimension=transaction.payment_method,
+        amount_kopeks=transaction.amount_kopeks,
+    )
+
+
+async def record_subscription_created(
+    db: AsyncSession,
+    is_trial: bool,
+    moment: Optional[datetime] = None,
+) -> None:
+    metric = StatisticsMetric.TRIAL_SUBSCRIPTION if is_trial else StatisticsMetric.PAID_SUBSCRIPTION
+    await record_statistics_event(db, metric.value, moment=moment)
+
+
+async def sum_statistics_rollups(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    metrics: Optional[Sequence[str]] = None,
+) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """Суммы ``(количество, сумма)`` по метрике и измерению за ``[start, end)``.
+
+    Границы округляются до часа: начало вниз, конец вверх.
+    """
+
+    query = (
+        select(
+            StatisticsRollup.metric,
+            StatisticsRollup.dimension,
+            func.coalesce(func.sum(StatisticsRollup.events_count), 0),
+            func.coalesce(func.sum(StatisticsRollup.amount_kopeks), 0),
+        )
+        .where(
+            StatisticsRollup.bucket_start >= rollup_bucket(start),
+            StatisticsRollup.bucket_start < _bucket_after(end),
+        )
+        .group_by(StatisticsRollup.metric, StatisticsRollup.dimension)
+    )
+    if metrics is not None:
+        query = query.where(StatisticsRollup.metric.in_(list(metrics)))
+
+    result = await db.execute(query)
+    return {
+        (metric, dimension): (int(count or 0), int(amount or 0))
+        for metric, dimension, count, amount in result.all()
+    }
+
+
+async def get_transaction_rollups(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    today_start: datetime,
+) -> List[Tuple[str, Optional[str], int, int, int, int]]:
+    """Завершённые транзакции за период и с ``today_start`` одним запросом.
+
+    Строки ``(тип, способ оплаты, количество, сумма, количество сегодня, сумма сегодня)``.
+    """
+
+    in_period = and_(
+        StatisticsRollup.bucket_start >= rollup_bucket(start),
+        StatisticsRollup.bucket_start < _bucket_after(end),
+    )
+    is_today = and_(
+        StatisticsRollup.bucket_start >= rollup_bucket(today_start),
+        StatisticsRollup.bucket_start < _bucket_after(end),
+    )
+    result = await db.execute(
+        select(
+            StatisticsRollup.metric,
+            StatisticsRollup.dimension,
+            func.coalesce(func.sum(StatisticsRollup.events_count).filter(in_period), 0),
+            func.coalesce(func.sum(StatisticsRollup.amount_kopeks).filter(in_period), 0),
+            func.coalesce(func.sum(StatisticsRollup.events_count).filter(is_today), 0),
+            func.coalesce(func.sum(StatisticsRollup.amount_kopeks).filter(is_today), 0),
+        )
+        .where(
+            StatisticsRollup.metric.like(f"{_TRANSACTION_PREFIX}%"),
+            or_(in_period, is_today),
+        )
+        .group_by(StatisticsRollup.metric, StatisticsRollup.dimension)
+    )
+
+    return [
+        (
+            parse_transaction_metric(metric),
+            dimension or None,
+            int(count or 0),
+            int(amount or 0),
+            int(today_count or 0),
+            int(today_amount or 0),
+        )
+        for metric, dimension, count, amount, today_count, today_amount in result.all()
+    ]
+
+
+async def get_daily_rollups(
+    db: AsyncSession,
+    metric: str,
+    start: datetime,
+    end: datetime,
+) -> List[Tuple[date, int, int]]:
+    """Дневные суммы метрики (по дате UTC) за ``[start, end)``."""
+
+    day = func.date(StatisticsRollup.bucket_start)
+    result = await db.execute(
+        select(
+            day.label("day"),
+            func.sum(StatisticsRollup.events_count),
+            func.sum(StatisticsRollup.amount_kopeks),
+        )
+        .where(
+            StatisticsRollup.metric == metric,
+            StatisticsRollup.bucket_start >= rollup_bucket(start),
+            StatisticsRollup.bucket_start < _bucket_after(end),
+        )
+        .group_by(day)
+        .order_by(day)
+    )
+
+    rows = []
+    for day_value, count, amount in result.all():
+        if isinstance(day_value, str):
+            day_value = date.fromisoformat(day_value)
+        rows.append((day_value, int(count or 0), int(amount or 0)))
+    return rows
+
+
+async def has_statistics_rollups(db: AsyncSession) -> bool:
+    result = await db.execute(select(literal(1)).select_from(StatisticsRollup).limit(1))
+    return result.first() is not None
+
+
+def _hour_expression(column, dialect_name: str):
+    if dialect_name == "postgresql":
+        return func.date_trunc("hour", column)
+    return func.strftime("%Y-%m-%d %H:00:00", column)
+
+
+def _as_bucket(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return rollup_bucket(value)
+
+
+async def _collect_rollups(
+    db: AsyncSession,
+    dialect_name: str,
+    column,
+    conditions: Iterable[Any],
+    group_columns: Sequence[Any],
+    to_key: Callable[..., Tuple[str, Optional[str]]],
+    totals: Dict[RollupKey, List[int]],
+    amount_column=None,
+) -> None:
+    """Добавляет в ``totals`` часовые суммы одной таблицы.
+
+    ``to_key`` превращает значения ``group_columns`` в пару (метрика, измерение).
+    """
+
+    hour = _hour_expression(column, dialect_name)
+    amount = func.sum(amount_column) if amount_column is not None else literal(0)
+    result = await db.execute(
+        select(hour, func.count(), amount, *group_columns)
+        .where(column.is_not(None), *conditions)
+        .group_by(hour, *group_columns)
+    )
+
+    for bucket, count, amount_value, *group_values in result.all():
+        metric, dimension = to_key(*group_values)
+        entry = totals[(_as_bucket(bucket), metric, dimension or "")]
+        entry[0] += int(count or 0)
+        entry[1] += int(amount_value or 0)
+
+
+async def rebuild_statistics_rollups(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> int:
+    """Пересчитывает корзины за период (по умолчанию — за всю историю) из исходных таблиц.
+
+    Старые корзины периода удаляются. Возвращает число записанных корзин;
+    коммит остаётся за вызывающим кодом.
+    """
+
+    dialect_name = _dialect_name(db)
+
+    def in_range(column) -> List[Any]:
+        conditions = []
+        if start is not None:
+            conditions.append(column >= rollup_bucket(start))
+        if end is not None:
+            conditions.append(column < _bucket_after(end))
+        return conditions
+
+    def constant(metric: StatisticsMetric) -> Callable[[], Tuple[str, None]]:
+        return lambda: (metric.value, None)
+
+    totals: Dict[RollupKey, List[int]] = defaultdict(lambda: [0, 0])
+
+    await _collect_rollups(
+        db,
+        dialect_name,
+        User.created_at,
+        in_range(User.created_at),
+        (),
+        constant(StatisticsMetric.NEW_USER),
+        totals,
+    )
+    await _collect_rollups(
+        db,
+        dialect_name,
+        Subscription.created_at,
+        in_range(Subscription.created_at),
+        (Subscription.is_trial,),
+        lambda is_trial: (
+            (
+                StatisticsMetric.TRIAL_SUBSCRIPTION
+                if is_trial
+                else StatisticsMetric.PAID_SUBSCRIPTION
+            ).value,
+            None,
+        ),
+        totals,
+    )
+    await _collect_rollups(
+        db,
+        dialect_name,
+        SubscriptionConversion.converted_at,
+        in_range(SubscriptionConversion.converted_at),
+        (),
+        constant(StatisticsMetric.CONVERSION),
+        totals,
+    )
+    await _collect_rollups(
+        db,
+        dialect_name,
+        Ticket.created_at,
+        in_range(Ticket.created_at),
+        (),
+        constant(StatisticsMetric.TICKET),
+        totals,
+    )
+    await _collect_rollups(
+        db,
+        dialect_name,
+        Transaction.created_at,
+        [Transaction.is_completed.is_(True), *in_range(Transaction.created_at)],
+        (Transaction.type, Transaction.payment_method),
+        lambda transaction_type, payment_method: (transaction_metric(transaction_type), payment_method),
+        totals,
+        amount_column=Transaction.amount_kopeks,
+    )
+
+    rows = [
+        {
+            "bucket_start": bucket,
+            "metric": metric,
+            "dimension": dimension,
+            "events_count": count,
+            "amount_kopeks": amount,
+        }
+        for (bucket, metric, dimension), (count, amount) in totals.items()
+    ]
+
+    cleanup = delete(StatisticsRollup)
+    if start is not None:
+        cleanup = cleanup.where(StatisticsRollup.bucket_start >= rollup_bucket(start))
+    if end is not None:
+        cleanup = cleanup.where(StatisticsRollup.bucket_start < _bucket_after(end))
+    await db.execute(cleanup)
+
+    for offset in range(0, len(rows), _REBUILD_CHUNK_SIZE):
+        await db.execute(_upsert_statement(dialect_name, rows[offset:offset + _REBUILD_CHUNK_SIZE]))
+
+    logger.info("📊 Пересчитано корзин статистики: %s", len(rows))
+    return len(rows)
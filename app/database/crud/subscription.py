@@ -13,6 +13,7 @@ from app.database.models import (
     PromoGroup,
 )
 from app.database.crud.notification import clear_notifications
+from app.database.crud.statistics_rollup import record_subscription_created
 from app.utils.pricing_utils import calculate_months_from_days, get_remaining_months
 from app.config import settings
 
@@ -86,6 +87,7 @@ async def create_trial_subscription(
     )
     
     db.add(subscription)
+    await record_subscription_created(db, is_trial=True)
     await db.commit()
     await db.refresh(subscription)
 
@@ -146,6 +148,7 @@ async def create_paid_subscription(
     )
     
     db.add(subscription)
+    await record_subscription_created(db, is_trial=False)
     await db.commit()
     await db.refresh(subscription)
     
@@ -476,106 +479,63 @@ async def get_subscriptions_for_autopay(db: AsyncSession) -> List[Subscription]:
 
 
 async def get_subscriptions_statistics(db: AsyncSession) -> dict:
-    
-    total_result = await db.execute(select(func.count(Subscription.id)))
-    total_subscriptions = total_result.scalar()
-    
-    active_result = await db.execute(
-        select(func.count(Subscription.id))
-        .where(Subscription.status == SubscriptionStatus.ACTIVE.value)
-    )
-    active_subscriptions = active_result.scalar()
-    
-    trial_result = await db.execute(
-        select(func.count(Subscription.id))
-        .where(
-            and_(
-                Subscription.is_trial == True,
-                Subscription.status == SubscriptionStatus.ACTIVE.value
-            )
-        )
+    """Счётчики подписок и конверсий одним запросом (условные агрегаты и скалярные подзапросы)."""
+
+    from app.database.crud.subscription_conversion import conversion_rate_percent
+    from app.database.models import SubscriptionConversion
+
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    is_active = Subscription.status == SubscriptionStatus.ACTIVE.value
+    is_paid = Subscription.is_trial == False
+
+    total_conversions = select(func.count(SubscriptionConversion.id)).scalar_subquery()
+    month_conversions = (
+        select(func.count(SubscriptionConversion.id))
+        .where(SubscriptionConversion.converted_at >= now - timedelta(days=30))
+        .scalar_subquery()
     )
-    trial_subscriptions = trial_result.scalar()
-    
-    paid_subscriptions = active_subscriptions - trial_subscriptions
-    
-    today = datetime.utcnow().date()
-    today_result = await db.execute(
-        select(func.count(Subscription.id))
-        .where(
-            and_(
-                Subscription.created_at >= today,
-                Subscription.is_trial == False
-            )
-        )
+    users_with_paid = (
+        select(func.count(User.id))
+        .where(User.has_had_paid_subscription == True)
+        .scalar_subquery()
     )
-    purchased_today = today_result.scalar()
-    
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    week_result = await db.execute(
-        select(func.count(Subscription.id))
-        .where(
-            and_(
-                Subscription.created_at >= week_ago,
-                Subscription.is_trial == False
-            )
-        )
-    )
-    purchased_week = week_result.scalar()
-    
-    month_ago = datetime.utcnow() - timedelta(days=30)
-    month_result = await db.execute(
-        select(func.count(Subscription.id))
-        .where(
-            and_(
-                Subscription.created_at >= month_ago,
-                Subscription.is_trial == False
-            )
+
+    result = await db.execute(
+        select(
+            func.count(Subscription.id),
+            func.count(Subscription.id).filter(is_active),
+            func.count(Subscription.id).filter(and_(Subscription.is_trial == True, is_active)),
+            func.count(Subscription.id).filter(and_(is_paid, Subscription.created_at >= today)),
+            func.count(Subscription.id).filter(and_(is_paid, Subscription.created_at >= now - timedelta(days=7))),
+            func.count(Subscription.id).filter(and_(is_paid, Subscription.created_at >= now - timedelta(days=30))),
+            total_conversions,
+            month_conversions,
+            users_with_paid,
         )
     )
-    purchased_month = month_result.scalar()
-    
-    try:
-        from app.database.crud.subscription_conversion import get_conversion_statistics
-        conversion_stats = await get_conversion_statistics(db)
-        
-        trial_to_paid_conversion = conversion_stats.get("conversion_rate", 0)
-        renewals_count = conversion_stats.get("month_conversions", 0)
-        
-        logger.info(f"📊 Статистика конверсии из таблицы conversions:")
-        logger.info(f"   Общее количество конверсий: {conversion_stats.get('total_conversions', 0)}")
-        logger.info(f"   Процент конверсии: {trial_to_paid_conversion}%")
-        logger.info(f"   Конверсий за месяц: {renewals_count}")
-        
-    except ImportError:
-        logger.warning("⚠️ Таблица subscription_conversions не найдена, используем старую логику")
-        
-        users_with_paid_result = await db.execute(
-            select(func.count(User.id))
-            .where(User.has_had_paid_subscription == True)
-        )
-        users_with_paid = users_with_paid_result.scalar()
-        
-        total_users_result = await db.execute(select(func.count(User.id)))
-        total_users = total_users_result.scalar()
-        
-        if total_users > 0:
-            trial_to_paid_conversion = round((users_with_paid / total_users) * 100, 1)
-        else:
-            trial_to_paid_conversion = 0
-            
-        renewals_count = 0
+    (
+        total_subscriptions,
+        active_subscriptions,
+        trial_subscriptions,
+        purchased_today,
+        purchased_week,
+        purchased_month,
+        total_conversions,
+        renewals_count,
+        users_with_paid,
+    ) = result.one()
     
     return {
         "total_subscriptions": total_subscriptions,
         "active_subscriptions": active_subscriptions,
         "trial_subscriptions": trial_subscriptions,
-        "paid_subscriptions": paid_subscriptions,
+        "paid_subscriptions": active_subscriptions - trial_subscriptions,
         "purchased_today": purchased_today,
         "purchased_week": purchased_week,
         "purchased_month": purchased_month,
-        "trial_to_paid_conversion": trial_to_paid_conversion, 
-        "renewals_count": renewals_count 
+        "trial_to_paid_conversion": conversion_rate_percent(total_conversions or 0, users_with_paid or 0), 
+        "renewals_count": renewals_count or 0 
     }
 
 async def update_subscription_usage(
@@ -1178,6 +1138,7 @@ async def create_subscription(
     )
     
     db.add(subscription)
+    await record_subscription_created(db, is_trial=is_trial)
     await db.commit()
     await db.refresh(subscription)
     
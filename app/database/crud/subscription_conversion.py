@@ -4,7 +4,8 @@ from typing import Optional, List
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import SubscriptionConversion, User
+from app.database.crud.statistics_rollup import record_statistics_event
+from app.database.models import StatisticsMetric, SubscriptionConversion, User
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,7 @@ async def create_subscription_conversion(
     )
     
     db.add(conversion)
+    await record_statistics_event(db, StatisticsMetric.CONVERSION.value, moment=conversion.converted_at)
     await db.commit()
     await db.refresh(conversion)
     
@@ -51,53 +53,48 @@ async def get_conversion_by_user_id(
     return result.scalar_one_or_none()
 
 
+def conversion_rate_percent(total_conversions: int, users_with_paid: int) -> float:
+    if total_conversions > 0:
+        return round((total_conversions / max(total_conversions, users_with_paid)) * 100, 1)
+    if users_with_paid > 0:
+        return 100.0
+    return 0.0
+
+
 async def get_conversion_statistics(db: AsyncSession) -> dict:
     
-    total_conversions_result = await db.execute(
-        select(func.count(SubscriptionConversion.id))
-    )
-    total_conversions = total_conversions_result.scalar()
-    
-    users_with_paid_result = await db.execute(
+    month_ago = datetime.utcnow() - timedelta(days=30)
+    users_with_paid = (
         select(func.count(User.id))
         .where(User.has_had_paid_subscription == True)
+        .scalar_subquery()
     )
-    users_with_paid = users_with_paid_result.scalar()
-    
-    if total_conversions > 0:
-        conversion_rate = round((total_conversions / max(total_conversions, users_with_paid)) * 100, 1)
-    elif users_with_paid > 0:
-        conversion_rate = 100.0
-    else:
-        conversion_rate = 0.0
-    
-    avg_trial_duration_result = await db.execute(
-        select(func.avg(SubscriptionConversion.trial_duration_days))
-    )
-    avg_trial_duration = avg_trial_duration_result.scalar() or 0
-    
-    avg_first_payment_result = await db.execute(
-        select(func.avg(SubscriptionConversion.first_payment_amount_kopeks))
+
+    result = await db.execute(
+        select(
+            func.count(SubscriptionConversion.id),
+            users_with_paid,
+            func.avg(SubscriptionConversion.trial_duration_days),
+            func.avg(SubscriptionConversion.first_payment_amount_kopeks),
+            func.count(SubscriptionConversion.id).filter(SubscriptionConversion.converted_at >= month_ago),
+        )
     )
-    avg_first_payment = avg_first_payment_result.scalar() or 0
-    
-    month_ago = datetime.utcnow() - timedelta(days=30)
-    month_conversions_result = await db.execute(
-        select(func.count(SubscriptionConversion.id))
-        .where(SubscriptionConversion.converted_at >= month_ago)
+    total_conversions, users_with_paid, avg_trial_duration, avg_first_payment, month_conversions = result.one()
+    users_with_paid = users_with_paid or 0
+    conversion_rate = conversion_rate_percent(total_conversions, users_with_paid)
+    
+    logger.debug(
+        "📊 Конверсии: записей %s, пользователей с платными подписками %s, конверсия %s%%",
+        total_conversions,
+        users_with_paid,
+        conversion_rate,
     )
-    month_conversions = month_conversions_result.scalar()
-    
-    logger.info(f"📊 Статистика конверсий:")
-    logger.info(f"   Всего записей о конверсиях: {total_conversions}")
-    logger.info(f"   Пользователей с платными подписками: {users_with_paid}")
-    logger.info(f"   Рассчитанная конверсия: {conversion_rate}%")
     
     return {
         "total_conversions": total_conversions,
         "conversion_rate": conversion_rate,
-        "avg_trial_duration_days": round(avg_trial_duration, 1),
-        "avg_first_payment_rubles": round((avg_first_payment or 0) / 100, 2),
+        "avg_trial_duration_days": round(float(avg_trial_duration or 0), 1),
+        "avg_first_payment_rubles": round(float(avg_first_payment or 0) / 100, 2),
         "month_conversions": month_conversions
     }
 
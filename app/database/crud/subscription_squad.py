@@ -0,0 +1,145 @@
+import logging
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database.models import Subscription, SubscriptionSquad, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_SUBSCRIPTION_STATUSES = (
+    SubscriptionStatus.ACTIVE.value,
+    SubscriptionStatus.TRIAL.value,
+)
+
+_BACKFILL_CHUNK_SIZE = 1000
+
+_squads_table = SubscriptionSquad.__table__
+
+
+def _membership_rows(subscription_id: int, squads: Optional[Iterable[str]]) -> List[Dict[str, object]]:
+    unique = dict.fromkeys(str(squad) for squad in (squads or []) if squad)
+    return [{"subscription_id": subscription_id, "squad_uuid": squad} for squad in unique]
+
+
+def _replace_statements(mapping: Mapping[int, Optional[Iterable[str]]], *, fresh: bool = False):
+    rows = [
+        row
+        for subscription_id, squads in mapping.items()
+        for row in _membership_rows(subscription_id, squads)
+    ]
+    if not fresh:
+        yield delete(_squads_table).where(_squads_table.c.subscription_id.in_(list(mapping))), None
+    if rows:
+        yield insert(_squads_table), rows
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_squad_membership(session: Session, flush_context) -> None:  # noqa: ANN001
+    created: Dict[int, Optional[List[str]]] = {}
+    replacements: Dict[int, Optional[List[str]]] = {}
+
+    for instance in session.new:
+        if isinstance(instance, Subscription) and instance.id is not None:
+            created[instance.id] = instance.connected_squads
+    for instance in session.dirty:
+        if not isinstance(instance, Subscription) or instance.id is None:
+            continue
+        if inspect(instance).attrs.connected_squads.history.has_changes():
+            replacements[instance.id] = instance.connected_squads
+    for instance in session.deleted:
+        if isinstance(instance, Subscription) and instance.id is not None:
+            replacements[instance.id] = None
+
+    if not created and not replacements:
+        return
+
+    connection = session.connection()
+    statements = []
+    if created:
+        statements.extend(_replace_statements(created, fresh=True))
+    if replacements:
+        statements.extend(_replace_statements(replacements))
+    for statement, rows in statements:
+        if rows is None:
+            connection.execute(statement)
+        else:
+            connection.execute(statement, rows)
+
+
+async def replace_subscription_squads(
+    db: AsyncSession,
+    squads_by_subscription: Mapping[int, Optional[Iterable[str]]],
+    *,
+    fresh: bool = False,
+) -> None:
+    """Синхронизирует членство для подписок, изменённых bulk-запросами в обход ORM.
+
+    ``fresh=True`` — подписки только что созданы и старых записей у них быть не может.
+    """
+
+    if not squads_by_subscription:
+        return
+    for statement, rows in _replace_statements(squads_by_subscription, fresh=fresh):
+        if rows is None:
+            await db.execute(statement)
+        else:
+            await db.execute(statement, rows)
+
+
+def subscription_ids_for_squads(squad_uuids: Sequence[str]):
+    """Подзапрос id подписок, подключённых хотя бы к одному из сквадов."""
+
+    return (
+        select(SubscriptionSquad.subscription_id)
+        .where(SubscriptionSquad.squad_uuid.in_(list(squad_uuids)))
+        .scalar_subquery()
+    )
+
+
+async def count_subscriptions_by_squad(
+    db: AsyncSession,
+    statuses: Sequence[str] = ACTIVE_SUBSCRIPTION_STATUSES,
+) -> Dict[str, int]:
+    result = await db.execute(
+        select(SubscriptionSquad.squad_uuid, func.count(SubscriptionSquad.subscription_id))
+        .join(Subscription, Subscription.id == SubscriptionSquad.subscription_id)
+        .where(Subscription.status.in_(list(statuses)))
+        .group_by(SubscriptionSquad.squad_uuid)
+    )
+    return {squad_uuid: count for squad_uuid, count in result}
+
+
+async def rebuild_subscription_squads(db: AsyncSession) -> int:
+    """Перестраивает таблицу членства по Subscription.connected_squads."""
+
+    await db.execute(delete(_squads_table))
+
+    total = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Subscription.id, Subscription.connected_squads)
+            .where(Subscription.id > last_id)
+            .order_by(Subscription.id)
+            .limit(_BACKFILL_CHUNK_SIZE)
+        )
+        chunk = result.all()
+        if not chunk:
+            break
+
+        rows = [
+            row
+            for subscription_id, squads in chunk
+            for row in _membership_rows(subscription_id, squads)
+        ]
+        if rows:
+            await db.execute(insert(_squads_table), rows)
+            total += len(rows)
+        last_id = chunk[-1][0]
+
+    await db.commit()
+    logger.info("✅ Таблица subscription_squads перестроена: %s записей", total)
+    return total
@@ -4,7 +4,15 @@ from sqlalchemy import select, desc, and_, or_, update, func
 from sqlalchemy.orm import selectinload
 from datetime import datetime
 
-from app.database.models import Ticket, TicketMessage, TicketStatus, User, SupportAuditLog
+from app.database.crud.statistics_rollup import record_statistics_event
+from app.database.models import (
+    StatisticsMetric,
+    SupportAuditLog,
+    Ticket,
+    TicketMessage,
+    TicketStatus,
+    User,
+)
 
 
 class TicketCRUD:
@@ -44,6 +52,7 @@ class TicketCRUD:
             media_caption=media_caption,
         )
         db.add(message)
+        await record_statistics_event(db, StatisticsMetric.TICKET.value)
         
         await db.commit()
         await db.refresh(ticket)
@@ -1,16 +1,17 @@
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Iterable, Optional, List, Tuple
 from sqlalchemy import select, and_, or_, func, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.database.crud.statistics_rollup import record_transaction_completed
 from app.database.models import Transaction, TransactionType, PaymentMethod, User
 
 logger = logging.getLogger(__name__)
 
 
-async def create_transaction(
+async def stage_transaction(
     db: AsyncSession,
     user_id: int,
     type: TransactionType,
@@ -20,7 +21,12 @@ async def create_transaction(
     external_id: Optional[str] = None,
     is_completed: bool = True
 ) -> Transaction:
-    
+    """Добавляет транзакцию в сессию без коммита.
+
+    Запись фиксируется тем же коммитом, что и остальные изменения вызывающего
+    кода; после коммита нужно вызвать ``finalize_transaction``.
+    """
+
     transaction = Transaction(
         user_id=user_id,
         type=type.value,
@@ -33,24 +39,56 @@ async def create_transaction(
     )
     
     db.add(transaction)
-    await db.commit()
-    await db.refresh(transaction)
-    
-    logger.info(f"💳 Создана транзакция: {type.value} на {amount_kopeks/100}₽ для пользователя {user_id}")
+    if is_completed:
+        await record_transaction_completed(db, transaction)
+    return transaction
+
+
+async def finalize_transaction(db: AsyncSession, transaction: Transaction) -> None:
+    logger.info(
+        f"💳 Создана транзакция: {transaction.type} на {transaction.amount_kopeks/100}₽ "
+        f"для пользователя {transaction.user_id}"
+    )
 
     try:
         from app.services.promo_group_assignment import (
             maybe_assign_promo_group_by_total_spent,
         )
 
-        await maybe_assign_promo_group_by_total_spent(db, user_id)
+        await maybe_assign_promo_group_by_total_spent(db, transaction.user_id)
     except Exception as exc:
         logger.debug(
             "Не удалось проверить автовыдачу промогруппы для пользователя %s: %s",
-            user_id,
+            transaction.user_id,
             exc,
         )
 
+
+async def create_transaction(
+    db: AsyncSession,
+    user_id: int,
+    type: TransactionType,
+    amount_kopeks: int,
+    description: str,
+    payment_method: Optional[PaymentMethod] = None,
+    external_id: Optional[str] = None,
+    is_completed: bool = True
+) -> Transaction:
+    
+    transaction = await stage_transaction(
+        db,
+        user_id=user_id,
+        type=type,
+        amount_kopeks=amount_kopeks,
+        description=description,
+        payment_method=payment_method,
+        external_id=external_id,
+        is_completed=is_completed,
+    )
+    await db.commit()
+    await db.refresh(transaction)
+
+    await finalize_transaction(db, transaction)
     return transaction
 
 
@@ -127,6 +165,9 @@ async def get_user_total_spent_kopeks(db: AsyncSession, user_id: int) -> int:
 
 async def complete_transaction(db: AsyncSession, transaction: Transaction) -> Transaction:
 
+    if not transaction.is_completed:
+        await record_transaction_completed(db, transaction)
+
     transaction.is_completed = True
     transaction.completed_at = datetime.utcnow()
 
@@ -173,105 +214,66 @@ async def get_transactions_statistics(
     if not end_date:
         end_date = datetime.utcnow()
     
-    income_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
-        .where(
-            and_(
-                Transaction.type == TransactionType.DEPOSIT.value,
-                Transaction.is_completed == True,
-                Transaction.created_at >= start_date,
-                Transaction.created_at <= end_date
-            )
-        )
-    )
-    total_income = income_result.scalar()
-    
-    expenses_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
-        .where(
-            and_(
-                Transaction.type == TransactionType.WITHDRAWAL.value,
-                Transaction.is_completed == True,
-                Transaction.created_at >= start_date,
-                Transaction.created_at <= end_date
-            )
-        )
-    )
-    total_expenses = expenses_result.scalar()
-    
-    subscription_income_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
-        .where(
-            and_(
-                Transaction.type == TransactionType.SUBSCRIPTION_PAYMENT.value,
-                Transaction.is_completed == True,
-                Transaction.created_at >= start_date,
-                Transaction.created_at <= end_date
-            )
-        )
-    )
-    subscription_income = subscription_income_result.scalar()
-    
-    transactions_count_result = await db.execute(
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    in_period = and_(Transaction.created_at >= start_date, Transaction.created_at <= end_date)
+    is_today = Transaction.created_at >= today
+
+    # Один проход: период и «сегодня» считаются условными агрегатами по (тип, способ оплаты)
+    rows = await db.execute(
         select(
             Transaction.type,
-            func.count(Transaction.id).label('count'),
-            func.coalesce(func.sum(Transaction.amount_kopeks), 0).label('total_amount')
-        )
-        .where(
-            and_(
-                Transaction.is_completed == True,
-                Transaction.created_at >= start_date,
-                Transaction.created_at <= end_date
-            )
-        )
-        .group_by(Transaction.type)
-    )
-    transactions_by_type = {row.type: {"count": row.count, "amount": row.total_amount} 
-                           for row in transactions_count_result}
-    
-    payment_methods_result = await db.execute(
-        select(
             Transaction.payment_method,
-            func.count(Transaction.id).label('count'),
-            func.coalesce(func.sum(Transaction.amount_kopeks), 0).label('total_amount')
+            func.count(Transaction.id).filter(in_period),
+            func.coalesce(func.sum(Transaction.amount_kopeks).filter(in_period), 0),
+            func.count(Transaction.id).filter(is_today),
+            func.coalesce(func.sum(Transaction.amount_kopeks).filter(is_today), 0),
         )
         .where(
-            and_(
-                Transaction.type == TransactionType.DEPOSIT.value,
-                Transaction.is_completed == True,
-                Transaction.created_at >= start_date,
-                Transaction.created_at <= end_date
-            )
-        )
-        .group_by(Transaction.payment_method)
-    )
-    payment_methods = {row.payment_method: {"count": row.count, "amount": row.total_amount} 
-                      for row in payment_methods_result}
-    
-    today = datetime.utcnow().date()
-    today_result = await db.execute(
-        select(func.count(Transaction.id))
-        .where(
-            and_(
-                Transaction.is_completed == True,
-                Transaction.created_at >= today
-            )
-        )
-    )
-    transactions_today = today_result.scalar()
-    
-    today_income_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
-        .where(
-            and_(
-                Transaction.type == TransactionType.DEPOSIT.value,
-                Transaction.is_completed == True,
-                Transaction.created_at >= today
-            )
+            Transaction.is_completed == True,
+            or_(in_period, is_today),
         )
+        .group_by(Transaction.type, Transaction.payment_method)
     )
-    income_today = today_income_result.scalar()
+
+    return build_transactions_statistics(rows.all(), start_date, end_date)
+
+
+def build_transactions_statistics(
+    rows: Iterable[Tuple[str, Optional[str], int, int, int, int]],
+    start_date: datetime,
+    end_date: datetime,
+) -> dict:
+    """Собирает ответ статистики платежей из строк
+    ``(тип, способ оплаты, количество, сумма, количество сегодня, сумма сегодня)``."""
+
+    transactions_by_type = {}
+    payment_methods = {}
+    transactions_today = 0
+    income_today = 0
+
+    for type_, payment_method, count, amount, today_count, today_amount in rows:
+        transactions_today += today_count
+        if type_ == TransactionType.DEPOSIT.value:
+            income_today += today_amount
+
+        if not count:
+            continue
+
+        by_type = transactions_by_type.setdefault(type_, {"count": 0, "amount": 0})
+        by_type["count"] += count
+        by_type["amount"] += amount
+
+        if type_ == TransactionType.DEPOSIT.value:
+            by_method = payment_methods.setdefault(payment_method, {"count": 0, "amount": 0})
+            by_method["count"] += count
+            by_method["amount"] += amount
+
+    def period_amount(transaction_type: TransactionType) -> int:
+        return transactions_by_type.get(transaction_type.value, {}).get("amount", 0)
+
+    total_income = period_amount(TransactionType.DEPOSIT)
+    total_expenses = period_amount(TransactionType.WITHDRAWAL)
+    subscription_income = period_amount(TransactionType.SUBSCRIPTION_PAYMENT)
     
     return {
         "period": {
@@ -377,14 +379,11 @@ async def check_tribute_payment_duplicate(
     return transaction
 
 
-async def create_unique_tribute_transaction(
+async def get_unique_tribute_external_id(
     db: AsyncSession,
-    user_id: int,
     payment_id: str,
     amount_kopeks: int,
-    description: str
-) -> Transaction:
-    
+) -> str:
     external_id = f"donation_{payment_id}"
     
     existing = await get_transaction_by_external_id(db, external_id, PaymentMethod.TRIBUTE)
@@ -394,6 +393,19 @@ async def create_unique_tribute_transaction(
         external_id = f"donation_{payment_id}_{amount_kopeks}_{timestamp}"
         
         logger.info(f"Создан уникальный external_id для избежания дубликатов: {external_id}")
+
+    return external_id
+
+
+async def create_unique_tribute_transaction(
+    db: AsyncSession,
+    user_id: int,
+    payment_id: str,
+    amount_kopeks: int,
+    description: str
+) -> Transaction:
+    
+    external_id = await get_unique_tribute_external_id(db, payment_id, amount_kopeks)
     
     return await create_transaction(
         db=db,
@@ -3,9 +3,10 @@ import secrets
 import string
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
-from sqlalchemy import select, and_, or_, func, case, nullslast, text
+from sqlalchemy import select, and_, or_, func, case, nullslast, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.exc import IntegrityError
 
 from app.database.models import (
@@ -16,12 +17,19 @@ from app.database.models import (
     Transaction,
     PromoGroup,
     PaymentMethod,
+    StatisticsMetric,
     TransactionType,
 )
 from app.config import settings
 from app.database.crud.promo_group import get_default_promo_group
 from app.database.crud.discount_offer import get_latest_claimed_offer_for_user
 from app.database.crud.promo_offer_log import log_promo_offer_action
+from app.database.crud.statistics_rollup import record_statistics_event
+from app.database.user_cache import (
+    has_uncommitted_user_changes,
+    mark_users_changed,
+    user_snapshot_cache,
+)
 from app.utils.validators import sanitize_telegram_name
 
 logger = logging.getLogger(__name__)
@@ -33,7 +41,7 @@ def generate_referral_code() -> str:
     return f"ref{code_suffix}"
 
 
-async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+async def _load_user(db: AsyncSession, condition) -> Optional[User]:
     result = await db.execute(
         select(User)
         .options(
@@ -41,32 +49,36 @@ async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
             selectinload(User.promo_group),
             selectinload(User.referrer),
         )
-        .where(User.id == user_id)
+        .where(condition)
     )
     user = result.scalar_one_or_none()
     
     if user and user.subscription:
         _ = user.subscription.is_active
+
+    # Снимок берём только из чистой сессии: незакоммиченные изменения могут откатиться
+    if user and user_snapshot_cache.enabled and not has_uncommitted_user_changes(db, user):
+        await user_snapshot_cache.store(user)
     
     return user
 
 
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    if user_snapshot_cache.enabled:
+        cached_user = await user_snapshot_cache.get_by_id(db, user_id)
+        if cached_user is not None:
+            return cached_user
+
+    return await _load_user(db, User.id == user_id)
+
+
 async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[User]:
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.subscription),
-            selectinload(User.promo_group),
-            selectinload(User.referrer),
-        )
-        .where(User.telegram_id == telegram_id)
-    )
-    user = result.scalar_one_or_none()
-    
-    if user and user.subscription:
-        _ = user.subscription.is_active
-    
-    return user
+    if user_snapshot_cache.enabled:
+        cached_user = await user_snapshot_cache.get_by_telegram_id(db, telegram_id)
+        if cached_user is not None:
+            return cached_user
+
+    return await _load_user(db, User.telegram_id == telegram_id)
 
 
 async def get_user_by_referral_code(db: AsyncSession, referral_code: str) -> Optional[User]:
@@ -161,6 +173,7 @@ async def create_user(
         db.add(user)
 
         try:
+            await record_statistics_event(db, StatisticsMetric.NEW_USER.value)
             await db.commit()
             await db.refresh(user)
 
@@ -213,6 +226,91 @@ async def update_user(
     return user
 
 
+async def change_user_balance(
+    db: AsyncSession,
+    user: User,
+    delta_kopeks: int,
+    *,
+    required_kopeks: Optional[int] = None,
+    values: Optional[Dict[str, object]] = None,
+) -> Optional[int]:
+    """Атомарно меняет баланс одним ``UPDATE ... RETURNING``.
+
+    Баланс считается в БД, поэтому параллельные изменения не теряются.
+    С ``required_kopeks`` строка меняется, только если на балансе не меньше
+    этой суммы. Возвращает новый баланс или ``None``, если условие не
+    выполнено. ``user`` получает новые значения без повторного чтения;
+    коммит остаётся за вызывающим кодом.
+    """
+
+    now = datetime.utcnow()
+    changes = {"updated_at": now, **(values or {})}
+    stmt = (
+        update(User)
+        .where(User.id == user.id)
+        .values(balance_kopeks=User.balance_kopeks + delta_kopeks, **changes)
+        .returning(User.balance_kopeks)
+        .execution_options(synchronize_session=False)
+    )
+    if required_kopeks is not None:
+        stmt = stmt.where(User.balance_kopeks >= required_kopeks)
+
+    result = await db.execute(stmt)
+    new_balance = result.scalar_one_or_none()
+    if new_balance is None:
+        return None
+
+    set_committed_value(user, "balance_kopeks", new_balance)
+    for key, value in changes.items():
+        set_committed_value(user, key, value)
+    mark_users_changed(db, user_ids=[user.id], telegram_ids=[user.telegram_id])
+    return new_balance
+
+
+async def credit_user_balance(
+    db: AsyncSession,
+    user: User,
+    amount_kopeks: int,
+    description: str,
+    *,
+    payment_method: Optional[PaymentMethod] = None,
+    external_id: Optional[str] = None,
+) -> Optional[Transaction]:
+    """Начисляет баланс и записывает DEPOSIT-транзакцию одним коммитом.
+
+    Возвращает транзакцию или ``None``, если пользователь не найден. Ошибки
+    БД откатывают сессию и пробрасываются вызывающему коду.
+    """
+
+    from app.database.crud.transaction import finalize_transaction, stage_transaction
+
+    try:
+        new_balance = await change_user_balance(db, user, amount_kopeks)
+        if new_balance is None:
+            await db.rollback()
+            return None
+
+        transaction = await stage_transaction(
+            db=db,
+            user_id=user.id,
+            type=TransactionType.DEPOSIT,
+            amount_kopeks=amount_kopeks,
+            description=description,
+            payment_method=payment_method,
+            external_id=external_id,
+        )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    await finalize_transaction(db, transaction)
+    logger.info(
+        f"💰 Баланс пользователя {user.telegram_id} изменен: {new_balance - amount_kopeks} → {new_balance} (изменение: +{amount_kopeks})"
+    )
+    return transaction
+
+
 async def add_user_balance(
     db: AsyncSession,
     user: User,
@@ -222,27 +320,22 @@ async def add_user_balance(
     bot = None 
 ) -> bool:
     try:
-        old_balance = user.balance_kopeks
-        user.balance_kopeks += amount_kopeks
-        user.updated_at = datetime.utcnow()
-        
         if create_transaction:
-            from app.database.crud.transaction import create_transaction as create_trans
-            from app.database.models import TransactionType
-            
-            await create_trans(
-                db=db,
-                user_id=user.id,
-                type=TransactionType.DEPOSIT,
-                amount_kopeks=amount_kopeks,
-                description=description
-            )
-        
+            transaction = await credit_user_balance(db, user, amount_kopeks, description)
+            if transaction is None:
+                logger.error(f"Пользователь {user.id} не найден при изменении баланса")
+                return False
+            return True
+
+        new_balance = await change_user_balance(db, user, amount_kopeks)
+        if new_balance is None:
+            logger.error(f"Пользователь {user.id} не найден при изменении баланса")
+            await db.rollback()
+            return False
+
         await db.commit()
-        await db.refresh(user)
-        
         
-        logger.info(f"💰 Баланс пользователя {user.telegram_id} изменен: {old_balance} → {user.balance_kopeks} (изменение: +{amount_kopeks})")
+        logger.info(f"💰 Баланс пользователя {user.telegram_id} изменен: {new_balance - amount_kopeks} → {new_balance} (изменение: +{amount_kopeks})")
         return True
         
     except Exception as e:
@@ -322,30 +415,31 @@ async def subtract_user_balance(
                 if not log_context["percent"] and offer.discount_percent:
                     log_context["percent"] = offer.discount_percent
 
-    if user.balance_kopeks < amount_kopeks:
-        logger.error(f"   ❌ НЕДОСТАТОЧНО СРЕДСТВ!")
-        return False
+    promo_reset: Dict[str, object] = {}
+    if consume_promo_offer and getattr(user, "promo_offer_discount_percent", 0):
+        promo_reset = {
+            "promo_offer_discount_percent": 0,
+            "promo_offer_discount_source": None,
+            "promo_offer_discount_expires_at": None,
+        }
 
     try:
-        old_balance = user.balance_kopeks
-        user.balance_kopeks -= amount_kopeks
-
-        if consume_promo_offer and getattr(user, "promo_offer_discount_percent", 0):
-            user.promo_offer_discount_percent = 0
-            user.promo_offer_discount_source = None
-            user.promo_offer_discount_expires_at = None
-
-        user.updated_at = datetime.utcnow()
-
-        await db.commit()
-        await db.refresh(user)
+        new_balance = await change_user_balance(
+            db,
+            user,
+            -amount_kopeks,
+            required_kopeks=amount_kopeks,
+            values=promo_reset,
+        )
+        if new_balance is None:
+            logger.error(f"   ❌ НЕДОСТАТОЧНО СРЕДСТВ!")
+            return False
 
+        transaction = None
         if create_transaction:
-            from app.database.crud.transaction import (
-                create_transaction as create_trans,
-            )
+            from app.database.crud.transaction import stage_transaction
 
-            await create_trans(
+            transaction = await stage_transaction(
                 db=db,
                 user_id=user.id,
                 type=TransactionType.WITHDRAWAL,
@@ -354,6 +448,13 @@ async def subtract_user_balance(
                 payment_method=payment_method,
             )
 
+        await db.commit()
+
+        if transaction is not None:
+            from app.database.crud.transaction import finalize_transaction
+
+            await finalize_transaction(db, transaction)
+
         if consume_promo_offer and log_context:
             try:
                 await log_promo_offer_action(
@@ -380,7 +481,7 @@ async def subtract_user_balance(
                         rollback_error,
                     )
 
-        logger.error(f"   ✅ Средства списаны: {old_balance} → {user.balance_kopeks}")
+        logger.error(f"   ✅ Средства списаны: {new_balance + amount_kopeks} → {new_balance}")
         return True
         
     except Exception as e:
@@ -763,47 +864,22 @@ async def delete_user(db: AsyncSession, user: User) -> bool:
 
 
 async def get_users_statistics(db: AsyncSession) -> dict:
-    
-    total_result = await db.execute(select(func.count(User.id)))
-    total_users = total_result.scalar()
-    
-    active_result = await db.execute(
-        select(func.count(User.id)).where(User.status == UserStatus.ACTIVE.value)
-    )
-    active_users = active_result.scalar()
-    
-    today = datetime.utcnow().date()
-    today_result = await db.execute(
-        select(func.count(User.id)).where(
-            and_(
-                User.created_at >= today,
-                User.status == UserStatus.ACTIVE.value
-            )
-        )
-    )
-    new_today = today_result.scalar()
-    
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    week_result = await db.execute(
-        select(func.count(User.id)).where(
-            and_(
-                User.created_at >= week_ago,
-                User.status == UserStatus.ACTIVE.value
-            )
-        )
-    )
-    new_week = week_result.scalar()
-    
-    month_ago = datetime.utcnow() - timedelta(days=30)
-    month_result = await db.execute(
-        select(func.count(User.id)).where(
-            and_(
-                User.created_at >= month_ago,
-                User.status == UserStatus.ACTIVE.value
-            )
+    """Счётчики пользователей одним проходом по таблице (условные агрегаты)."""
+
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    is_active = User.status == UserStatus.ACTIVE.value
+
+    result = await db.execute(
+        select(
+            func.count(User.id),
+            func.count(User.id).filter(is_active),
+            func.count(User.id).filter(and_(is_active, User.created_at >= today)),
+            func.count(User.id).filter(and_(is_active, User.created_at >= now - timedelta(days=7))),
+            func.count(User.id).filter(and_(is_active, User.created_at >= now - timedelta(days=30))),
         )
     )
-    new_month = month_result.scalar()
+    total_users, active_users, new_today, new_week, new_month = result.one()
     
     return {
         "total_users": total_users,
@@ -1,28 +1,72 @@
 import logging
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import NullPool
 
 from app.config import settings
 from app.database.models import Base
+from app.database.pool_metrics import InstrumentedAsyncAdaptedQueuePool, PoolMetrics
+from app.database.query_counter import install_query_counter
+from app.database.crud import subscription_squad as _subscription_squad  # noqa: F401  регистрирует синхронизацию членства в сквадах
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(
-    settings.get_database_url(),
-    poolclass=NullPool,
-    echo=settings.DEBUG,
-    future=True
-)
+ENGINE_ROLES = ("bot", "web_api", "background")
 
-AsyncSessionLocal = async_sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=True,
-    autocommit=False
-)
+
+def _create_engine(role: str) -> AsyncEngine:
+    if not settings.is_database_pool_enabled():
+        return create_async_engine(
+            settings.get_database_url(),
+            poolclass=NullPool,
+            echo=settings.DEBUG,
+            future=True
+        )
+
+    pool_engine = create_async_engine(
+        settings.get_database_url(),
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        echo=settings.DEBUG,
+        future=True,
+        **settings.get_database_pool_options(role),
+    )
+    pool_engine.sync_engine.pool.metrics = PoolMetrics(role)
+    return pool_engine
+
+
+def _create_sessionmaker(bind: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(
+        bind=bind,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autoflush=True,
+        autocommit=False
+    )
+
+
+engine = _create_engine("bot")
+
+if settings.is_database_pool_enabled():
+    # Отдельные пулы не дают фоновым задачам и веб-API забрать все соединения у бота
+    web_api_engine = _create_engine("web_api")
+    background_engine = _create_engine("background")
+else:
+    web_api_engine = engine
+    background_engine = engine
+
+ENGINES: Dict[str, AsyncEngine] = {
+    "bot": engine,
+    "web_api": web_api_engine,
+    "background": background_engine,
+}
+
+for _role_engine in set(ENGINES.values()):
+    install_query_counter(_role_engine)
+
+AsyncSessionLocal = _create_sessionmaker(engine)
+WebApiSessionLocal = _create_sessionmaker(web_api_engine)
+BackgroundSessionLocal = _create_sessionmaker(background_engine)
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -37,15 +81,47 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def get_background_db() -> AsyncGenerator[AsyncSession, None]:
+    async with BackgroundSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+def get_pool_statistics() -> Dict[str, Dict[str, Any]]:
+    """Возвращает состояние пулов соединений по ролям."""
+
+    statistics: Dict[str, Dict[str, Any]] = {}
+    for role in ENGINE_ROLES:
+        pool = ENGINES[role].sync_engine.pool
+        metrics = getattr(pool, "metrics", None)
+        if metrics is None:
+            statistics[role] = {"role": role, "mode": "null"}
+            continue
+        statistics[role] = metrics.snapshot(pool)
+    return statistics
+
+
 async def init_db():
     logger.info("Создание таблиц базы данных...")
-    
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
+
     logger.info("✅ База данных успешно инициализирована")
 
 
 async def close_db():
-    await engine.dispose()
+    disposed = set()
+    for role in ENGINE_ROLES:
+        role_engine = ENGINES[role]
+        if id(role_engine) in disposed:
+            continue
+        disposed.add(id(role_engine))
+        await role_engine.dispose()
     logger.info("✅ Подключение к базе данных закрыто")
@@ -16,6 +16,7 @@ from sqlalchemy import (
     UniqueConstraint,
     Index,
     Table,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -344,6 +345,50 @@ class WataPayment(Base):
         )
 
 
+class PaymentEventStatus(Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    DEAD = "dead"
+
+
+class PaymentEvent(Base):
+    """Входящее событие платёжного провайдера, ожидающее обработки воркером."""
+
+    __tablename__ = "payment_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(32), nullable=False)
+    event_key = Column(String(255), nullable=False)
+    # События одного платежа обрабатываются строго по очереди
+    ordering_key = Column(String(255), nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String(20), nullable=False, default=PaymentEventStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+    # Время захвата воркером: по нему истёкшие захваты возвращаются в очередь
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("provider", "event_key", name="uq_payment_events_provider_event"),
+        Index("ix_payment_events_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_payment_events_ordering", "provider", "ordering_key", "id"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover - debug helper
+        return "<PaymentEvent(id={0}, provider={1}, key={2}, status={3})>".format(
+            self.id,
+            self.provider,
+            self.event_key,
+            self.status,
+        )
+
+
 class PromoGroup(Base):
     __tablename__ = "promo_groups"
 
@@ -456,6 +501,7 @@ class User(Base):
     promo_offer_discount_source = Column(String(100), nullable=True)
     promo_offer_discount_expires_at = Column(DateTime, nullable=True)
     last_remnawave_sync = Column(DateTime, nullable=True)
+    broadcast_unreachable_at = Column(DateTime, nullable=True)
     trojan_password = Column(String(255), nullable=True)
     vless_uuid = Column(String(255), nullable=True)
     ss_password = Column(String(255), nullable=True)
@@ -476,19 +522,23 @@ class User(Base):
         if not self.promo_group:
             return 0
         return self.promo_group.get_discount_percent(category, period_days)
-    
-    def add_balance(self, kopeks: int) -> None:
-        self.balance_kopeks += kopeks
-    
-    def subtract_balance(self, kopeks: int) -> bool:
-        if self.balance_kopeks >= kopeks:
-            self.balance_kopeks -= kopeks
-            return True
-        return False
 
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Проходы мониторинга: статус + окно end_date (+ is_trial без обращения к таблице)
+        Index("ix_subscriptions_status_end_date", "status", "end_date", "is_trial"),
+        Index(
+            "ix_subscriptions_autopay",
+            "status",
+            "is_trial",
+            postgresql_where=text("autopay_enabled = true"),
+            sqlite_where=text("autopay_enabled = 1"),
+        ),
+        # Отчёты: новые подписки за период
+        Index("ix_subscriptions_created_at_trial", "created_at", "is_trial"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
@@ -655,6 +705,19 @@ class Subscription(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_user_created_at", "user_id", "created_at"),
+        # Статистика и выручка: тип + признак завершения + период
+        Index("ix_transactions_type_completed_created_at", "type", "is_completed", "created_at"),
+        Index("ix_transactions_completed_created_at", "is_completed", "created_at"),
+        Index(
+            "ix_transactions_external_id",
+            "external_id",
+            "payment_method",
+            postgresql_where=text("external_id IS NOT NULL"),
+            sqlite_where=text("external_id IS NOT NULL"),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -705,6 +768,49 @@ class SubscriptionConversion(Base):
         return f"<SubscriptionConversion(user_id={self.user_id}, converted_at={self.converted_at})>"
 
 
+class StatisticsMetric(Enum):
+    NEW_USER = "new_user"
+    TRIAL_SUBSCRIPTION = "trial_subscription"
+    PAID_SUBSCRIPTION = "paid_subscription"
+    CONVERSION = "conversion"
+    TICKET = "ticket"
+    # Завершённые транзакции: метрика ``transaction:<тип>``, измерение — способ оплаты
+    TRANSACTION = "transaction"
+
+
+class StatisticsRollup(Base):
+    """Накопленные счётчики статистики за час (UTC).
+
+    Строки обновляются инкрементально вместе с исходной записью, поэтому
+    выручка и отчёты за любой период читают только часовые корзины периода.
+    """
+
+    __tablename__ = "statistics_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_start = Column(DateTime, nullable=False)
+    metric = Column(String(64), nullable=False)
+    dimension = Column(String(64), nullable=False, default="")
+
+    events_count = Column(BigInteger, nullable=False, default=0)
+    amount_kopeks = Column(BigInteger, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "metric", "dimension", name="uq_statistics_rollups_bucket"),
+        Index("ix_statistics_rollups_metric_bucket", "metric", "bucket_start"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover - debug helper
+        return "<StatisticsRollup(bucket={0}, metric={1}, dimension={2}, count={3})>".format(
+            self.bucket_start,
+            self.metric,
+            self.dimension,
+            self.events_count,
+        )
+
+
 class PromoCode(Base):
     __tablename__ = "promocodes"
     
@@ -896,6 +1002,14 @@ class MonitoringLog(Base):
 
 class SentNotification(Base):
     __tablename__ = "sent_notifications"
+    __table_args__ = (
+        Index(
+            "ix_sent_notifications_lookup",
+            "subscription_id",
+            "notification_type",
+            "days_before",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -1004,6 +1118,9 @@ class BroadcastHistory(Base):
     total_count = Column(Integer, default=0) 
     sent_count = Column(Integer, default=0)  
     failed_count = Column(Integer, default=0) 
+    blocked_count = Column(Integer, default=0)
+    selected_buttons = Column(JSON, nullable=True)
+    last_processed_user_id = Column(Integer, nullable=True)
     status = Column(String(50), default="in_progress")
     admin_id = Column(Integer, ForeignKey("users.id")) 
     admin_name = Column(String(255)) 
@@ -1081,6 +1198,23 @@ class SubscriptionServer(Base):
     server_squad = relationship("ServerSquad", backref="subscription_servers")
 
 
+class SubscriptionSquad(Base):
+    """Нормализованное членство подписки в скваде — индексируемая копия Subscription.connected_squads."""
+
+    __tablename__ = "subscription_squads"
+
+    subscription_id = Column(
+        Integer,
+        ForeignKey("subscriptions.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    squad_uuid = Column(String(255), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_subscription_squads_squad_uuid", "squad_uuid", "subscription_id"),
+    )
+
+
 class SupportAuditLog(Base):
     __tablename__ = "support_audit_logs"
 
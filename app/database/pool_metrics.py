@@ -0,0 +1,120 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Счетчики выдачи соединений из пула одной роли (бот, веб-API, фон)."""
+
+    RECENT_SAMPLES = 512
+
+    def __init__(self, role: str) -> None:
+        self.role = role
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+        self._recent: Deque[float] = deque(maxlen=self.RECENT_SAMPLES)
+
+    def record_checkout(self, elapsed: float, waited: bool) -> None:
+        self.checkouts += 1
+        if waited:
+            self.waits += 1
+        self.total_checkout_time += elapsed
+        self.max_checkout_time = max(self.max_checkout_time, elapsed)
+        self._recent.append(elapsed)
+
+    def record_timeout(self, elapsed: float) -> None:
+        self.timeouts += 1
+        self.waits += 1
+        self.max_checkout_time = max(self.max_checkout_time, elapsed)
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+        self._recent.clear()
+
+    def _percentile_ms(self, percentile: float) -> float:
+        if not self._recent:
+            return 0.0
+        samples = sorted(self._recent)
+        index = min(len(samples) - 1, int(round(percentile * (len(samples) - 1))))
+        return round(samples[index] * 1000, 2)
+
+    def snapshot(self, pool: Optional[Any] = None) -> Dict[str, Any]:
+        avg_ms = (
+            round(self.total_checkout_time / self.checkouts * 1000, 2)
+            if self.checkouts
+            else 0.0
+        )
+
+        data: Dict[str, Any] = {
+            "role": self.role,
+            "mode": "queue",
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "avg_checkout_ms": avg_ms,
+            "p95_checkout_ms": self._percentile_ms(0.95),
+            "max_checkout_ms": round(self.max_checkout_time * 1000, 2),
+        }
+
+        if pool is not None:
+            size = pool.size()
+            max_overflow = max(0, getattr(pool, "_max_overflow", 0))
+            capacity = size + max_overflow
+            checked_out = pool.checkedout()
+            data.update(
+                {
+                    "size": size,
+                    "max_overflow": max_overflow,
+                    "capacity": capacity,
+                    "checked_out": checked_out,
+                    "checked_in": pool.checkedin(),
+                    "overflow": max(0, pool.overflow()),
+                    "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+                }
+            )
+
+        return data
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, замеряющий время ожидания соединения."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _is_saturated(self) -> bool:
+        return (
+            self.checkedin() == 0
+            and self._max_overflow > -1
+            and self.overflow() >= self._max_overflow
+        )
+
+    def connect(self):  # type: ignore[override]
+        metrics = self.metrics
+        if metrics is None:
+            return super().connect()
+
+        waited = self._is_saturated()
+        started_at = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            metrics.record_timeout(time.perf_counter() - started_at)
+            raise
+
+        metrics.record_checkout(time.perf_counter() - started_at, waited)
+        return connection
+
+    def recreate(self) -> "InstrumentedAsyncAdaptedQueuePool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
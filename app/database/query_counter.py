@@ -0,0 +1,80 @@
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class QueryCounter:
+    """Количество SQL-запросов, выполненных в рамках одного апдейта."""
+
+    __slots__ = ("queries", "started_at")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+class QueryStatistics:
+    """Агрегированная статистика SQL-запросов на апдейт."""
+
+    def __init__(self) -> None:
+        self.updates = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.last_queries = 0
+
+    def record(self, counter: QueryCounter) -> None:
+        self.updates += 1
+        self.queries += counter.queries
+        self.max_queries = max(self.max_queries, counter.queries)
+        self.last_queries = counter.queries
+
+    def reset(self) -> None:
+        self.updates = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.last_queries = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "queries": self.queries,
+            "avg_queries_per_update": round(self.queries / self.updates, 2) if self.updates else 0.0,
+            "max_queries_per_update": self.max_queries,
+            "last_queries_per_update": self.last_queries,
+        }
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+update_query_statistics = QueryStatistics()
+
+
+def start_query_counter() -> tuple[QueryCounter, Token]:
+    counter = QueryCounter()
+    return counter, _current_counter.set(counter)
+
+
+def stop_query_counter(token: Token) -> None:
+    _current_counter.reset(token)
+
+
+def get_current_query_counter() -> Optional[QueryCounter]:
+    return _current_counter.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # noqa: ANN001
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.queries += 1
+
+
+def install_query_counter(engine: AsyncEngine) -> None:
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
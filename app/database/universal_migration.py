@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database.database import AsyncSessionLocal, engine
-from app.database.models import WebApiToken
+from app.database.models import Base, WebApiToken
 from app.utils.security import hash_api_token
 
 logger = logging.getLogger(__name__)
@@ -2456,6 +2456,62 @@ async def add_media_fields_to_broadcast_history():
         return False
 
 
+async def add_broadcast_delivery_columns():
+    logger.info("=== ДОБАВЛЕНИЕ ПОЛЕЙ ДОСТАВКИ РАССЫЛОК ===")
+
+    broadcast_fields = {
+        'blocked_count': 'INTEGER DEFAULT 0',
+        'selected_buttons': 'JSON',
+        'last_processed_user_id': 'INTEGER',
+    }
+
+    try:
+        async with engine.begin() as conn:
+            db_type = await get_database_type()
+
+            for field_name, field_type in broadcast_fields.items():
+                field_exists = await check_column_exists('broadcast_history', field_name)
+                if field_exists:
+                    continue
+
+                await conn.execute(text(f"ALTER TABLE broadcast_history ADD COLUMN {field_name} {field_type}"))
+                logger.info(f"✅ Поле broadcast_history.{field_name} добавлено")
+
+            unreachable_exists = await check_column_exists('users', 'broadcast_unreachable_at')
+            if not unreachable_exists:
+                column_type = 'TIMESTAMP' if db_type == 'postgresql' else 'DATETIME'
+                await conn.execute(
+                    text(f"ALTER TABLE users ADD COLUMN broadcast_unreachable_at {column_type} NULL")
+                )
+                logger.info("✅ Поле users.broadcast_unreachable_at добавлено")
+
+            return True
+
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении полей доставки рассылок: {e}")
+        return False
+
+
+async def add_payment_event_lease_column():
+    try:
+        # Новая таблица создаётся сразу с полем через create_all
+        if not await check_table_exists('payment_events'):
+            return True
+        if await check_column_exists('payment_events', 'claimed_at'):
+            return True
+
+        async with engine.begin() as conn:
+            db_type = await get_database_type()
+            column_type = 'TIMESTAMP' if db_type == 'postgresql' else 'DATETIME'
+            await conn.execute(text(f"ALTER TABLE payment_events ADD COLUMN claimed_at {column_type} NULL"))
+            logger.info("✅ Поле payment_events.claimed_at добавлено")
+            return True
+
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении поля захвата платёжных событий: {e}")
+        return False
+
+
 async def add_ticket_reply_block_columns():
     try:
         col_perm_exists = await check_column_exists('tickets', 'user_reply_block_permanent')
@@ -2943,6 +2999,79 @@ async def add_server_trial_flag_column() -> bool:
         return False
 
 
+QUERY_INDEXES = (
+    ("transactions", "ix_transactions_user_created_at"),
+    ("transactions", "ix_transactions_type_completed_created_at"),
+    ("transactions", "ix_transactions_completed_created_at"),
+    ("transactions", "ix_transactions_external_id"),
+    ("subscriptions", "ix_subscriptions_status_end_date"),
+    ("subscriptions", "ix_subscriptions_autopay"),
+    ("subscriptions", "ix_subscriptions_created_at_trial"),
+    ("sent_notifications", "ix_sent_notifications_lookup"),
+)
+
+
+async def ensure_query_indexes() -> bool:
+    """Создаёт индексы под горячие запросы статистики, мониторинга и платежей."""
+
+    success = True
+    for table_name, index_name in QUERY_INDEXES:
+        if await check_index_exists(table_name, index_name):
+            continue
+
+        index = next(
+            index for index in Base.metadata.tables[table_name].indexes if index.name == index_name
+        )
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync_conn: index.create(sync_conn, checkfirst=True))
+            logger.info(f"✅ Создан индекс {index_name} для {table_name}")
+        except Exception as error:
+            logger.error(f"Ошибка создания индекса {index_name} для {table_name}: {error}")
+            success = False
+
+    return success
+
+
+async def ensure_subscription_squads_table() -> bool:
+    """Создаёт таблицу членства в сквадах и заполняет её из connected_squads."""
+
+    try:
+        if not await check_table_exists("subscription_squads"):
+            async with engine.begin() as conn:
+                db_type = await get_database_type()
+                on_delete = "" if db_type == "sqlite" else " ON DELETE CASCADE"
+                await conn.execute(text(f"""
+                    CREATE TABLE subscription_squads (
+                        subscription_id INTEGER NOT NULL REFERENCES subscriptions(id){on_delete},
+                        squad_uuid VARCHAR(255) NOT NULL,
+                        PRIMARY KEY (subscription_id, squad_uuid)
+                    )
+                """))
+                await conn.execute(text(
+                    "CREATE INDEX ix_subscription_squads_squad_uuid "
+                    "ON subscription_squads(squad_uuid, subscription_id)"
+                ))
+            logger.info("✅ Таблица subscription_squads создана")
+
+        async with engine.begin() as conn:
+            has_rows = (await conn.execute(text("SELECT 1 FROM subscription_squads LIMIT 1"))).first()
+
+        if has_rows:
+            logger.info("ℹ️ Таблица subscription_squads уже заполнена")
+            return True
+
+        from app.database.crud.subscription_squad import rebuild_subscription_squads
+
+        async with AsyncSessionLocal() as session:
+            await rebuild_subscription_squads(session)
+        return True
+
+    except Exception as error:
+        logger.error(f"Ошибка подготовки таблицы subscription_squads: {error}")
+        return False
+
+
 async def create_system_settings_table() -> bool:
     table_exists = await check_table_exists("system_settings")
     if table_exists:
@@ -3546,6 +3675,18 @@ async def run_universal_migration():
         else:
             logger.warning("⚠️ Проблемы с добавлением медиа полей")
 
+        broadcast_delivery_ready = await add_broadcast_delivery_columns()
+        if broadcast_delivery_ready:
+            logger.info("✅ Поля доставки рассылок готовы")
+        else:
+            logger.warning("⚠️ Проблемы с добавлением полей доставки рассылок")
+
+        payment_event_lease_ready = await add_payment_event_lease_column()
+        if payment_event_lease_ready:
+            logger.info("✅ Поле захвата платёжных событий готово")
+        else:
+            logger.warning("⚠️ Проблемы с добавлением поля захвата платёжных событий")
+
         logger.info("=== ДОБАВЛЕНИЕ ПОЛЕЙ БЛОКИРОВКИ В TICKETS ===")
         tickets_block_cols_added = await add_ticket_reply_block_columns()
         if tickets_block_cols_added:
@@ -3653,6 +3794,20 @@ async def run_universal_migration():
         else:
             logger.warning("⚠️ Проблемы с обновлением внешних ключей")
         
+        logger.info("=== ИНДЕКСЫ ДЛЯ ГОРЯЧИХ ЗАПРОСОВ ===")
+        query_indexes_ready = await ensure_query_indexes()
+        if query_indexes_ready:
+            logger.info("✅ Индексы транзакций, подписок и уведомлений готовы")
+        else:
+            logger.warning("⚠️ Проблемы с созданием индексов для горячих запросов")
+
+        logger.info("=== ИНДЕКС ЧЛЕНСТВА ПОДПИСОК В СКВАДАХ ===")
+        subscription_squads_ready = await ensure_subscription_squads_table()
+        if subscription_squads_ready:
+            logger.info("✅ Таблица subscription_squads готова")
+        else:
+            logger.warning("⚠️ Проблемы с таблицей subscription_squads")
+
         logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ КОНВЕРСИЙ ПОДПИСОК ===")
         conversions_created = await create_subscription_conversions_table()
         if conversions_created:
@@ -0,0 +1,444 @@
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Set, Tuple, Type
+
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.config import settings
+from app.database.models import PromoGroup, ServerSquad, Subscription, User
+from app.utils.cache import cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+# Поля, изменение которых не делает снимок устаревшим: last_activity обновляется
+# на каждом апдейте и иначе сбрасывал бы кеш постоянно.
+_VOLATILE_USER_FIELDS = frozenset({"last_activity"})
+
+_INVALIDATION_KEY = "user_cache_invalidate"
+_INVALIDATE_ALL_KEY = "user_cache_invalidate_all"
+
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__d__": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__dt__" in value and len(value) == 1:
+            return datetime.fromisoformat(value["__dt__"])
+        if "__d__" in value and len(value) == 1:
+            return date.fromisoformat(value["__d__"])
+    return value
+
+
+def _dump_columns(instance: Any) -> Dict[str, Any]:
+    state_dict = inspect(instance).dict
+    return {
+        attr.key: _encode_value(state_dict.get(attr.key))
+        for attr in inspect(type(instance)).column_attrs
+        if attr.key in state_dict
+    }
+
+
+def _is_loaded(instance: Any, key: str) -> bool:
+    return key in inspect(instance).dict
+
+
+def _referrer_is_collection() -> bool:
+    return inspect(User).relationships["referrer"].uselist
+
+
+def build_user_snapshot(user: User) -> Dict[str, Any]:
+    """Сериализует пользователя, подписку, промогруппу и реферера в компактный словарь."""
+
+    snapshot: Dict[str, Any] = {
+        "v": SNAPSHOT_VERSION,
+        "user": _dump_columns(user),
+    }
+
+    if _is_loaded(user, "subscription"):
+        subscription = user.subscription
+        snapshot["subscription"] = _dump_columns(subscription) if subscription else None
+
+    if _is_loaded(user, "promo_group"):
+        promo_group = user.promo_group
+        if promo_group is None:
+            snapshot["promo_group"] = None
+        else:
+            promo_data = _dump_columns(promo_group)
+            if _is_loaded(promo_group, "server_squads"):
+                promo_data["__server_squads__"] = [
+                    _dump_columns(server) for server in promo_group.server_squads
+                ]
+            snapshot["promo_group"] = promo_data
+
+    # Реферер нужен уведомлениям (format_referrer_info); без него ленивая
+    # загрузка в AsyncSession падает с MissingGreenlet
+    # загрузка в AsyncSession падает с MissingGreenlet. Связь объявлена как
+    # backref и в текущей схеме является коллекцией, поэтому учитываем uselist.
+    if _is_loaded(user, "referrer"):
+        referrer = user.referrer
+        if _referrer_is_collection():
+            snapshot["referrer"] = [_dump_columns(item) for item in referrer]
+        else:
+            snapshot["referrer"] = _dump_columns(referrer) if referrer else None
+
+    return snapshot
+
+
+def _attach(session: Session, model: Type[Any], data: Dict[str, Any]) -> Any:
+    instance = model(**{key: _decode_value(value) for key, value in data.items()})
+    make_transient_to_detached(instance)
+
+    existing = session.identity_map.get(inspect(instance).key)
+    if existing is not None:
+        return existing
+
+    session.add(instance)
+    return instance
+
+
+def restore_user_snapshot(session: Session, snapshot: Dict[str, Any]) -> Optional[User]:
+    """Присоединяет объекты из снимка к сессии без обращения к БД."""
+
+    if not snapshot or snapshot.get("v") != SNAPSHOT_VERSION:
+        return None
+
+    # JSON-поля (connected_squads, period_discounts) не должны разделяться с LRU
+    snapshot = copy.deepcopy(snapshot)
+    user_data = snapshot["user"]
+    identity_key = inspect(User).identity_key_from_primary_key((user_data.get("id"),))
+    user = session.identity_map.get(identity_key)
+    if user is None:
+        user = _attach(session, User, user_data)
+    # Если объект уже есть в сессии, его колонки свежее снимка; из снимка
+    # дополняем только незагруженные связи (например, у пользователя,
+    # пришедшего в сессию как элемент чужого referrer).
+
+    if "subscription" in snapshot and not _is_loaded(user, "subscription"):
+        subscription = None
+        if snapshot["subscription"] is not None:
+            subscription = _attach(session, Subscription, snapshot["subscription"])
+            set_committed_value(subscription, "user", user)
+        set_committed_value(user, "subscription", subscription)
+
+    if "promo_group" in snapshot and not _is_loaded(user, "promo_group"):
+        promo_group = None
+        promo_data = snapshot["promo_group"]
+        if promo_data is not None:
+            servers_data = promo_data.pop("__server_squads__", None)
+            promo_group = _attach(session, PromoGroup, promo_data)
+            if servers_data is not None and not _is_loaded(promo_group, "server_squads"):
+                servers = [_attach(session, ServerSquad, item) for item in servers_data]
+                set_committed_value(promo_group, "server_squads", servers)
+        set_committed_value(user, "promo_group", promo_group)
+
+    if "referrer" in snapshot and not _is_loaded(user, "referrer"):
+        referrer_data = snapshot["referrer"]
+        if _referrer_is_collection():
+            referrer = [_attach(session, User, item) for item in referrer_data or []]
+        else:
+            referrer = _attach(session, User, referrer_data) if referrer_data else None
+        set_committed_value(user, "referrer", referrer)
+
+    return user
+
+
+class _LocalLRU:
+    """Небольшой LRU в памяти процесса с коротким TTL записей."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class UserSnapshotCache:
+    """Read-through кеш снимков пользователя: LRU процесса перед Redis."""
+
+    SNAPSHOT_PREFIX = "user_cache:tg"
+    POINTER_PREFIX = "user_cache:id"
+    POINTER_TTL_SECONDS = 86400
+
+    def __init__(self) -> None:
+        self._local = _LocalLRU(settings.USER_CACHE_LOCAL_MAX_SIZE)
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.USER_CACHE_ENABLED)
+
+    def _snapshot_key(self, telegram_id: int) -> str:
+        return cache_key(self.SNAPSHOT_PREFIX, telegram_id)
+
+    def _pointer_key(self, user_id: int) -> str:
+        return cache_key(self.POINTER_PREFIX, user_id)
+
+    async def _read(self, key: str) -> Optional[Any]:
+        value = self._local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        value = await cache.get(key)
+        if value is not None:
+            self._local.set(key, value, settings.USER_CACHE_LOCAL_TTL_SECONDS)
+        return value
+
+    async def _resolve_telegram_id(self, user_id: int) -> Optional[int]:
+        value = await self._read(self._pointer_key(user_id))
+        return int(value) if value is not None else None
+
+    async def get_by_telegram_id(self, db: AsyncSession, telegram_id: int) -> Optional[User]:
+        snapshot = await self._read(self._snapshot_key(telegram_id))
+        if snapshot is None:
+            self.misses += 1
+            return None
+
+        try:
+            user = restore_user_snapshot(db.sync_session, snapshot)
+        except Exception as error:
+            logger.warning("⚠️ Не удалось восстановить снимок пользователя %s: %s", telegram_id, error)
+            await self.invalidate(telegram_ids=[telegram_id])
+            return None
+
+        if user is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return user
+
+    async def get_by_id(self, db: AsyncSession, user_id: int) -> Optional[User]:
+        telegram_id = await self._resolve_telegram_id(user_id)
+        if telegram_id is None:
+            self.misses += 1
+            return None
+        return await self.get_by_telegram_id(db, telegram_id)
+
+    async def store(self, user: User) -> None:
+        try:
+            snapshot = build_user_snapshot(user)
+        except Exception as error:
+            logger.debug("Не удалось построить снимок пользователя %s: %s", user.id, error)
+            return
+
+        snapshot_key = self._snapshot_key(user.telegram_id)
+        pointer_key = self._pointer_key(user.id)
+        self._local.set(snapshot_key, snapshot, settings.USER_CACHE_LOCAL_TTL_SECONDS)
+        self._local.set(pointer_key, user.telegram_id, settings.USER_CACHE_LOCAL_TTL_SECONDS)
+        await cache.set(snapshot_key, snapshot, settings.USER_CACHE_TTL_SECONDS)
+        await cache.set(pointer_key, user.telegram_id, self.POINTER_TTL_SECONDS)
+
+    async def invalidate(
+        self,
+        *,
+        user_ids: Iterable[int] = (),
+        telegram_ids: Iterable[int] = (),
+    ) -> None:
+        targets: Set[int] = {int(value) for value in telegram_ids if value is not None}
+
+        for user_id in user_ids:
+            if user_id is None:
+                continue
+            telegram_id = await self._resolve_telegram_id(user_id)
+            if telegram_id is not None:
+                targets.add(telegram_id)
+
+        keys = [self._snapshot_key(telegram_id) for telegram_id in targets]
+        for key in keys:
+            self._local.delete(key)
+        if keys:
+            await cache.delete_many(keys)
+
+        self.invalidations += len(targets)
+
+    async def invalidate_all(self) -> None:
+        self._local.clear()
+        await cache.delete_pattern(f"{self.SNAPSHOT_PREFIX}:*")
+        self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "local_size": len(self._local),
+        }
+
+
+user_snapshot_cache = UserSnapshotCache()
+
+
+def _collect_changed_users(session: Session) -> Tuple[Set[int], Set[int]]:
+    user_ids: Set[int] = set()
+    telegram_ids: Set[int] = set()
+
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User):
+            if instance in session.dirty and instance not in session.deleted:
+                state = inspect(instance)
+                changed = {
+                    attr.key
+                    for attr in state.attrs
+                    if attr.key in state.mapper.column_attrs and attr.history.has_changes()
+                }
+                if changed and changed <= _VOLATILE_USER_FIELDS:
+                    continue
+            telegram_id = inspect(instance).dict.get("telegram_id")
+            if telegram_id is not None:
+                telegram_ids.add(telegram_id)
+            elif instance.id is not None:
+                user_ids.add(instance.id)
+        elif isinstance(instance, Subscription):
+            user = inspect(instance).dict.get("user")
+            if user is not None and inspect(user).dict.get("telegram_id") is not None:
+                telegram_ids.add(user.telegram_id)
+            elif inspect(instance).dict.get("user_id") is not None:
+                user_ids.add(instance.user_id)
+
+    return user_ids, telegram_ids
+
+
+def mark_users_changed(
+    session: Any,
+    *,
+    user_ids: Iterable[Optional[int]] = (),
+    telegram_ids: Iterable[Optional[int]] = (),
+) -> None:
+    """Ставит снимки пользователей на сброс после коммита ``session``.
+
+    Нужна для изменений в обход ORM (UPDATE-выражения), которых after_flush не видит.
+    """
+
+    if not settings.USER_CACHE_ENABLED:
+        return
+
+    session = getattr(session, "sync_session", session)
+    pending = session.info.setdefault(_INVALIDATION_KEY, (set(), set()))
+    pending[0].update(user_id for user_id in user_ids if user_id is not None)
+    pending[1].update(telegram_id for telegram_id in telegram_ids if telegram_id is not None)
+
+
+def has_uncommitted_user_changes(session: Any, user: User) -> bool:
+    """Проверяет, менялся ли пользователь в ещё не закоммиченной транзакции ``session``.
+
+    Такой объект нельзя класть в кеш: после отката в снимке остались бы данные,
+    которых нет в БД, а сброс снимка при откате отменяется.
+    """
+
+    session = getattr(session, "sync_session", session)
+    if user in session.new or user in session.dirty:
+        return True
+    if session.info.get(_INVALIDATE_ALL_KEY):
+        return True
+
+    pending = session.info.get(_INVALIDATION_KEY)
+    if not pending:
+        return False
+    user_ids, telegram_ids = pending
+    return user.id in user_ids or user.telegram_id in telegram_ids
+
+
+@event.listens_for(Session, "after_flush")
+def _remember_changed_users(session: Session, flush_context) -> None:  # noqa: ANN001
+    if not settings.USER_CACHE_ENABLED:
+        return
+
+    # Промогруппа входит в снимки многих пользователей — проще сбросить весь кеш
+    if any(isinstance(instance, PromoGroup) for instance in list(session.dirty) + list(session.deleted)):
+        session.info[_INVALIDATE_ALL_KEY] = True
+
+    user_ids, telegram_ids = _collect_changed_users(session)
+    if not user_ids and not telegram_ids:
+        return
+
+    pending = session.info.setdefault(_INVALIDATION_KEY, (set(), set()))
+    pending[0].update(user_ids)
+    pending[1].update(telegram_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    invalidate_all = session.info.pop(_INVALIDATE_ALL_KEY, False)
+    pending = session.info.pop(_INVALIDATION_KEY, None)
+    if not pending and not invalidate_all:
+        return
+
+    user_ids, telegram_ids = pending or (set(), set())
+    if invalidate_all:
+        user_snapshot_cache._local.clear()
+    for telegram_id in telegram_ids:
+        user_snapshot_cache._local.delete(user_snapshot_cache._snapshot_key(telegram_id))
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    if invalidate_all:
+        coroutine = user_snapshot_cache.invalidate_all()
+    else:
+        coroutine = user_snapshot_cache.invalidate(
+            user_ids=list(user_ids),
+            telegram_ids=list(telegram_ids),
+        )
+
+    task = loop.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session: Session) -> None:
+    session.info.pop(_INVALIDATION_KEY, None)
+    session.info.pop(_INVALIDATE_ALL_KEY, None)
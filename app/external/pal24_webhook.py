@@ -1,17 +1,13 @@
-"""Flask webhook server for PayPalych postbacks."""
+"""Aiohttp webhook server for PayPalych postbacks."""
 
 from __future__ import annotations
 
 import asyncio
-from concurrent.futures import TimeoutError as FuturesTimeoutError
 import json
 import logging
-import threading
-from asyncio import AbstractEventLoop
-from typing import Any, Dict, Optional
+from typing import Dict, Optional
 
-from flask import Flask, jsonify, request
-from werkzeug.serving import make_server
+from aiohttp import web
 
 from app.config import settings
 from app.database.database import AsyncSessionLocal
@@ -21,142 +17,143 @@ from app.services.payment_service import PaymentService
 logger = logging.getLogger(__name__)
 
 
-def _normalize_payload() -> Dict[str, str]:
-    if request.is_json:
-        payload = request.get_json(silent=True) or {}
+async def _normalize_payload(request: web.Request) -> Dict[str, str]:
+    raw_body = await request.read()
+
+    if request.content_type == "application/json":
+        try:
+            payload = json.loads(raw_body or b"{}")
+        except json.JSONDecodeError:
+            payload = None
         if isinstance(payload, dict):
             return {k: str(v) for k, v in payload.items()}
         logger.warning("Pal24 webhook JSON payload не является объектом: %s", payload)
         return {}
 
-    if request.form:
-        return {k: v for k, v in request.form.items()}
+    if request.content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        form = await request.post()
+        if form:
+            return {k: str(v) for k, v in form.items()}
 
     try:
-        raw_body = request.data.decode("utf-8")
-        if raw_body:
-            payload = json.loads(raw_body)
+        body = raw_body.decode("utf-8")
+        if body:
+            payload = json.loads(body)
             if isinstance(payload, dict):
                 return {k: str(v) for k, v in payload.items()}
-    except json.JSONDecodeError:
+    except (UnicodeDecodeError, json.JSONDecodeError):
         logger.debug("Pal24 webhook body не удалось распарсить как JSON")
 
     return {}
 
 
-def create_pal24_flask_app(
-    payment_service: PaymentService,
-    loop: AbstractEventLoop,
-) -> Flask:
-    pal24_service = Pal24Service()
-    app = Flask(__name__)
+class Pal24WebhookHandler:
+
+    def __init__(self, payment_service: PaymentService) -> None:
+        self.payment_service = payment_service
+        self.pal24_service = Pal24Service()
 
-    @app.route(settings.PAL24_WEBHOOK_PATH, methods=["POST"])
-    def pal24_webhook() -> tuple:
-        if not pal24_service.is_configured:
+    async def _process(self, parsed_payload: Dict[str, str]) -> bool:
+        async with AsyncSessionLocal() as db:
+            try:
+                return await self.payment_service.process_pal24_postback(db, parsed_payload)
+            except Exception:
+                await db.rollback()
+                raise
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        if not self.pal24_service.is_configured:
             logger.error("Pal24 webhook получен, но сервис не настроен")
-            return jsonify({"status": "error", "reason": "service_not_configured"}), 503
+            return web.json_response({"status": "error", "reason": "service_not_configured"}, status=503)
 
         logger.debug("Получен Pal24 webhook: headers=%s", dict(request.headers))
 
-        payload = _normalize_payload()
+        payload = await _normalize_payload(request)
         if not payload:
             logger.warning("Пустой Pal24 webhook")
-            return jsonify({"status": "error", "reason": "empty_payload"}), 400
+            return web.json_response({"status": "error", "reason": "empty_payload"}, status=400)
 
         try:
-            parsed_payload = pal24_service.parse_postback(payload)
+            parsed_payload = self.pal24_service.parse_postback(payload)
         except Pal24APIError as error:
             logger.error("Ошибка валидации Pal24 webhook: %s", error)
-            return jsonify({"status": "error", "reason": str(error)}), 400
-
-        async def process() -> bool:
-            async with AsyncSessionLocal() as db:
-                try:
-                    return await payment_service.process_pal24_postback(db, parsed_payload)
-                except Exception:
-                    await db.rollback()
-                    raise
+            return web.json_response({"status": "error", "reason": str(error)}, status=400)
 
+        # Обработка продолжается и после таймаута ответа, как и раньше: транзакцию не обрываем
+        task = asyncio.ensure_future(self._process(parsed_payload))
         try:
-            future = asyncio.run_coroutine_threadsafe(process(), loop)
-            processed = future.result(timeout=settings.PAL24_REQUEST_TIMEOUT)
-        except FuturesTimeoutError:
+            processed = await asyncio.wait_for(asyncio.shield(task), timeout=settings.PAL24_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
             logger.error("Обработка Pal24 webhook превысила таймаут %sс", settings.PAL24_REQUEST_TIMEOUT)
-            return jsonify({"status": "error", "reason": "timeout"}), 504
-        except Exception as error:  # pragma: no cover - defensive
+            return web.json_response({"status": "error", "reason": "timeout"}, status=504)
+        except Exception as error:
             logger.exception("Критическая ошибка обработки Pal24 webhook: %s", error)
-            return jsonify({"status": "error", "reason": "internal_error"}), 500
+            return web.json_response({"status": "error", "reason": "internal_error"}, status=500)
 
         if processed:
-            return jsonify({"status": "ok"}), 200
-        return jsonify({"status": "error", "reason": "not_processed"}), 400
+            return web.json_response({"status": "ok"})
+        return web.json_response({"status": "error", "reason": "not_processed"}, status=400)
 
-    @app.route(settings.PAL24_WEBHOOK_PATH, methods=["GET"])
-    def pal24_health() -> tuple:
-        return jsonify({
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
             "status": "ok",
             "service": "pal24_webhook",
             "enabled": settings.is_pal24_enabled(),
-        }), 200
+        })
 
-    @app.route("/pal24/health", methods=["GET"])
-    def pal24_additional_health() -> tuple:
-        return jsonify({
+    async def handle_additional_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
             "status": "ok",
             "service": "pal24_webhook",
             "path": settings.PAL24_WEBHOOK_PATH,
-        }), 200
+        })
+
+    def setup_routes(self, app: web.Application) -> None:
+        app.router.add_post(settings.PAL24_WEBHOOK_PATH, self.handle_webhook)
+        app.router.add_get(settings.PAL24_WEBHOOK_PATH, self.handle_health)
+        app.router.add_get("/pal24/health", self.handle_additional_health)
 
+
+def create_pal24_webhook_app(payment_service: PaymentService) -> web.Application:
+    app = web.Application()
+    Pal24WebhookHandler(payment_service).setup_routes(app)
     return app
 
 
 class Pal24WebhookServer:
-    """Threaded Flask server for Pal24 postbacks."""
+    """Aiohttp server for Pal24 postbacks running on the bot event loop."""
 
-    def __init__(self, payment_service: PaymentService, loop: AbstractEventLoop) -> None:
-        self.app = create_pal24_flask_app(payment_service, loop)
-        self._server: Optional[Any] = None
-        self._thread: Optional[threading.Thread] = None
+    def __init__(self, payment_service: PaymentService) -> None:
+        self.app = create_pal24_webhook_app(payment_service)
+        self._runner: Optional[web.AppRunner] = None
+        self._site: Optional[web.TCPSite] = None
 
-    def start(self) -> None:
-        if self._server:
+    async def start(self) -> None:
+        if self._runner:
             logger.warning("Pal24 webhook server уже запущен")
             return
 
-        self._server = make_server(
-            host="0.0.0.0",
-            port=settings.PAL24_WEBHOOK_PORT,
-            app=self.app,
-            threaded=True,
-        )
-
-        def _serve() -> None:
-            logger.info(
-                "Pal24 webhook сервер запущен на %s:%s%s",
-                "0.0.0.0",
-                settings.PAL24_WEBHOOK_PORT,
-                settings.PAL24_WEBHOOK_PATH,
-            )
-            self._server.serve_forever()
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, host="0.0.0.0", port=settings.PAL24_WEBHOOK_PORT)
+        await self._site.start()
 
-        self._thread = threading.Thread(target=_serve, daemon=True)
-        self._thread.start()
+        logger.info(
+            "Pal24 webhook сервер запущен на %s:%s%s",
+            "0.0.0.0",
+            settings.PAL24_WEBHOOK_PORT,
+            settings.PAL24_WEBHOOK_PATH,
+        )
 
-    def stop(self) -> None:
-        if self._server:
+    async def stop(self) -> None:
+        if self._runner:
             logger.info("Останавливаем Pal24 webhook сервер")
-            self._server.shutdown()
-            self._server = None
-
-        if self._thread and self._thread.is_alive():
-            self._thread.join(timeout=5)
-            self._thread = None
+            await self._runner.cleanup()
+            self._runner = None
+            self._site = None
 
 
 async def start_pal24_webhook_server(payment_service: PaymentService) -> Pal24WebhookServer:
-    loop = asyncio.get_running_loop()
-    server = Pal24WebhookServer(payment_service, loop)
-    await loop.run_in_executor(None, server.start)
+    server = Pal24WebhookServer(payment_service)
+    await server.start()
     return server
-
@@ -0,0 +1,575 @@
+"""Единый aiohttp-шлюз платёжных webhook'ов с общими middleware."""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+from app.config import settings
+from app.utils.cache import cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+BodyHook = Callable[[web.Request, bytes], Awaitable[Any]]
+
+_BODY_KEY = "payment_webhook_body"
+_EVENT_KEY = "payment_webhook_event"
+
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+YOOKASSA_QUEUED_EVENTS = ("payment.succeeded", "payment.waiting_for_capture")
+
+
+@dataclass
+class WebhookRoute:
+    """Маршрут провайдера: обработчик и хуки общих middleware."""
+
+    provider: str
+    path: str
+    handler: Handler
+    # Возвращает False, если подпись не прошла проверку (ответ 401 до обработчика)
+    verify_signature: Optional[BodyHook] = None
+    # Возвращает идентификатор события платежа для защиты от повторной доставки
+    idempotency_key: Optional[BodyHook] = None
+    # Возвращает (ключ упорядочивания, payload) для записи в очередь событий;
+    # None — запрос обрабатывается обработчиком маршрута как раньше
+    inbox_event: Optional[BodyHook] = None
+    extra_methods: Dict[str, Handler] = field(default_factory=dict)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными границами корзин в миллисекундах."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.statuses: Dict[int, int] = {}
+
+    def observe(self, duration_ms: float, status: int) -> None:
+        self.counts[bisect.bisect_left(self.buckets, duration_ms)] += 1
+        self.total += 1
+        self.sum_ms += duration_ms
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.total:
+            return None
+        threshold = q * self.total
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= threshold:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bucket:g}" for bucket in self.buckets] + ["le_inf"]
+        return {
+            "count": self.total,
+            "avg_ms": round(self.sum_ms / self.total, 2) if self.total else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+            "statuses": dict(self.statuses),
+        }
+
+
+class IdempotencyGuard:
+    """Помнит успешно обработанные события и склеивает одновременные повторы.
+
+    Локальная TTL-память дублируется в Redis, чтобы повторы после рестарта
+    тоже не доходили до базы.
+    """
+
+    CACHE_PREFIX = "payment_webhook_done"
+
+    def __init__(self, ttl_seconds: int, max_entries: int = 10000) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._done: "OrderedDict[str, Tuple[float, int, bytes]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def _cache_key(self, key: str) -> str:
+        return cache_key(self.CACHE_PREFIX, key)
+
+    async def lookup(self, key: str) -> Optional[Tuple[int, bytes]]:
+        entry = self._done.get(key)
+        if entry is not None:
+            expires_at, status, body = entry
+            if expires_at > time.monotonic():
+                return status, body
+            self._done.pop(key, None)
+
+        cached = await cache.get(self._cache_key(key))
+        if cached:
+            result = (int(cached["status"]), cached["body"].encode("utf-8"))
+            self._remember(key, *result)
+            return result
+        return None
+
+    def _remember(self, key: str, status: int, body: bytes) -> None:
+        self._done[key] = (time.monotonic() + self.ttl_seconds, status, body)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    async def store(self, key: str, status: int, body: bytes) -> None:
+        self._remember(key, status, body)
+        await cache.set(
+            self._cache_key(key),
+            {"status": status, "body": body.decode("utf-8", "replace")},
+            self.ttl_seconds,
+        )
+
+    def in_flight(self, key: str) -> Optional[asyncio.Future]:
+        return self._in_flight.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return future
+
+    def finish(self, key: str, future: asyncio.Future, result: Optional[Tuple[int, bytes]]) -> None:
+        self._in_flight.pop(key, None)
+        if not future.done():
+            future.set_result(result)
+
+
+class PaymentWebhookGateway:
+    """Один aiohttp-сервер для всех платёжных провайдеров."""
+
+    def __init__(
+        self,
+        routes: Iterable[WebhookRoute],
+        *,
+        max_body_bytes: Optional[int] = None,
+        idempotency_ttl_seconds: Optional[int] = None,
+        inbox=None,
+    ) -> None:
+        self.routes: List[WebhookRoute] = list(routes)
+        self._routes_by_provider = {route.provider: route for route in self.routes}
+        self.max_body_bytes = max_body_bytes or settings.PAYMENT_WEBHOOK_MAX_BODY_BYTES
+        self.idempotency = IdempotencyGuard(
+            idempotency_ttl_seconds or settings.PAYMENT_WEBHOOK_IDEMPOTENCY_TTL_SECONDS
+        )
+        self.inbox = inbox
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.duplicates: Dict[str, int] = {}
+        self.app = self.create_app()
+        self._runner: Optional[web.AppRunner] = None
+        self._sites: List[web.TCPSite] = []
+
+    def create_app(self) -> web.Application:
+        app = web.Application(
+            client_max_size=self.max_body_bytes,
+            middlewares=[
+                self._metrics_middleware,
+                self._body_limit_middleware,
+                self._signature_middleware,
+                self._idempotency_middleware,
+                self._inbox_middleware,
+            ],
+        )
+
+        for route in self.routes:
+            resource = app.router.add_resource(route.path, name=route.provider)
+            resource.add_route("POST", route.handler)
+            for method, handler in route.extra_methods.items():
+                resource.add_route(method, handler)
+
+        app.router.add_get("/health", self._health_check)
+        return app
+
+    def _resolve_route(self, request: web.Request) -> Optional[WebhookRoute]:
+        if request.method != "POST":
+            return None
+        resource = request.match_info.route.resource
+        return self._routes_by_provider.get(resource.name) if resource is not None else None
+
+    @staticmethod
+    async def _body(request: web.Request) -> bytes:
+        body = request.get(_BODY_KEY)
+        if body is None:
+            body = await request.read()
+            request[_BODY_KEY] = body
+        return body
+
+    @web.middleware
+    async def _metrics_middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        route = self._resolve_route(request)
+        if route is None:
+            return await handler(request)
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as error:
+            status = error.status
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self.histograms.setdefault(route.provider, LatencyHistogram()).observe(duration_ms, status)
+            logger.info(
+                "📥 Webhook %s: статус=%s, %.1f мс, размер=%s байт, событие=%s",
+                route.provider,
+                status,
+                duration_ms,
+                len(request.get(_BODY_KEY) or b""),
+                request.get(_EVENT_KEY) or "-",
+                extra={
+                    "webhook_provider": route.provider,
+                    "webhook_status": status,
+                    "webhook_duration_ms": round(duration_ms, 2),
+                    "webhook_event": request.get(_EVENT_KEY),
+                },
+            )
+
+    @web.middleware
+    async def _body_limit_middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        if self._resolve_route(request) is None:
+            return await handler(request)
+
+        if request.content_length is not None and request.content_length > self.max_body_bytes:
+            return web.json_response({"status": "error", "reason": "body_too_large"}, status=413)
+        try:
+            await self._body(request)
+        except web.HTTPRequestEntityTooLarge:
+            return web.json_response({"status": "error", "reason": "body_too_large"}, status=413)
+        return await handler(request)
+
+    @web.middleware
+    async def _signature_middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        route = self._resolve_route(request)
+        if route is None or route.verify_signature is None:
+            return await handler(request)
+
+        if not await route.verify_signature(request, await self._body(request)):
+            logger.warning("❌ Неверная подпись webhook %s", route.provider)
+            return web.json_response({"status": "error", "reason": "invalid_signature"}, status=401)
+        return await handler(request)
+
+    @web.middleware
+    async def _idempotency_middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        route = self._resolve_route(request)
+        if route is None or route.idempotency_key is None:
+            return await handler(request)
+
+        try:
+            event_id = await route.idempotency_key(request, await self._body(request))
+        except Exception as error:
+            logger.debug("Не удалось извлечь идентификатор события %s: %s", route.provider, error)
+            event_id = None
+        if not event_id:
+            return await handler(request)
+
+        request[_EVENT_KEY] = event_id
+        key = f"{route.provider}:{event_id}"
+
+        pending = self.idempotency.in_flight(key)
+        if pending is not None:
+            previous = await asyncio.shield(pending)
+            if previous is not None:
+                return self._duplicate_response(route, previous)
+        else:
+            previous = await self.idempotency.lookup(key)
+            if previous is not None:
+                return self._duplicate_response(route, previous)
+
+        future = self.idempotency.begin(key)
+        result: Optional[Tuple[int, bytes]] = None
+        try:
+            response = await handler(request)
+            if 200 <= response.status < 300 and isinstance(response, web.Response):
+                result = (response.status, response.body or b"")
+                await self.idempotency.store(key, *result)
+            return response
+        finally:
+            self.idempotency.finish(key, future, result)
+
+    @web.middleware
+    async def _inbox_middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        route = self._resolve_route(request)
+        if (
+            route is None
+            or route.inbox_event is None
+            or self.inbox is None
+            or not self.inbox.is_enabled()
+        ):
+            return await handler(request)
+
+        body = await self._body(request)
+        try:
+            inbox_event = await route.inbox_event(request, body)
+        except Exception as error:
+            logger.debug("Событие %s не подходит для очереди: %s", route.provider, error)
+            inbox_event = None
+        if inbox_event is None:
+            return await handler(request)
+
+        ordering_key, payload = inbox_event
+        event_key = request.get(_EVENT_KEY) or hashlib.sha256(body).hexdigest()
+        await self.inbox.enqueue(route.provider, event_key, str(ordering_key), payload)
+        return web.json_response({"status": "ok", "queued": True})
+
+    def _duplicate_response(self, route: WebhookRoute, previous: Tuple[int, bytes]) -> web.Response:
+        self.duplicates[route.provider] = self.duplicates.get(route.provider, 0) + 1
+        status, body = previous
+        logger.info("♻️ Повторный webhook %s обработан без обращения к базе", route.provider)
+        return web.Response(status=status, body=body, content_type="application/json")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            provider: {**histogram.as_dict(), "duplicates": self.duplicates.get(provider, 0)}
+            for provider, histogram in self.histograms.items()
+        }
+
+    async def _health_check(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "service": "payment_webhooks",
+            "providers": {route.provider: route.path for route in self.routes},
+            "metrics": self.get_stats(),
+        })
+
+    async def start(self, host: str, ports: Iterable[int]) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        for port in sorted(set(ports)):
+            site = web.TCPSite(self._runner, host=host, port=port)
+            await site.start()
+            self._sites.append(site)
+            logger.info("✅ Платёжный webhook-шлюз слушает %s:%s", host, port)
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+            self._sites = []
+            logger.info("✅ Платёжный webhook-шлюз остановлен")
+
+
+def _json_body(body: bytes) -> Dict[str, Any]:
+    payload = json.loads(body.decode("utf-8"))
+    return payload if isinstance(payload, dict) else {}
+
+
+async def _tribute_event_id(request: web.Request, body: bytes) -> Optional[str]:
+    payload = _json_body(body)
+    data = payload.get("payload") if isinstance(payload.get("payload"), dict) else {}
+    event_id = (
+        payload.get("id")
+        or payload.get("payment_id")
+        or data.get("id")
+        or data.get("payment_id")
+        or data.get("donation_request_id")
+    )
+    if not event_id:
+        return None
+    status = payload.get("status") or data.get("status") or ""
+    return f"{payload.get('name') or 'payment'}:{event_id}:{status}"
+
+
+async def _verify_tribute_signature(request: web.Request, body: bytes) -> bool:
+    signature = request.headers.get("trbt-signature")
+    if not signature:
+        return False
+    if not settings.TRIBUTE_API_KEY:
+        return True
+    from app.external.tribute import TributeService as TributeAPI
+
+    return TributeAPI().verify_webhook_signature(body.decode("utf-8"), signature)
+
+
+async def _cryptobot_event_id(request: web.Request, body: bytes) -> Optional[str]:
+    payload = _json_body(body)
+    update_id = payload.get("update_id")
+    return str(update_id) if update_id is not None else None
+
+
+async def _verify_cryptobot_signature(request: web.Request, body: bytes) -> bool:
+    signature = request.headers.get("Crypto-Pay-API-Signature")
+    if not signature or not settings.CRYPTOBOT_WEBHOOK_SECRET:
+        return True
+    from app.external.cryptobot import CryptoBotService
+
+    return CryptoBotService().verify_webhook_signature(body.decode("utf-8"), signature)
+
+
+async def _mulenpay_event_id(request: web.Request, body: bytes) -> Optional[str]:
+    payload = _json_body(body)
+    payment_id = payload.get("uuid") or payload.get("id")
+    status = payload.get("payment_status")
+    return f"{payment_id}:{status}" if payment_id and status else None
+
+
+async def _yookassa_event_id(request: web.Request, body: bytes) -> Optional[str]:
+    payload = _json_body(body)
+    payment = payload.get("object") if isinstance(payload.get("object"), dict) else {}
+    if not payload.get("event") or not payment.get("id"):
+        return None
+    return f"{payload['event']}:{payment['id']}"
+
+
+async def _pal24_event_id(request: web.Request, body: bytes) -> Optional[str]:
+    from app.external.pal24_webhook import _normalize_payload
+
+    payload = await _normalize_payload(request)
+    if not payload.get("InvId") or not payload.get("Status"):
+        return None
+    return f"{payload['InvId']}:{payload['Status']}:{payload.get('TrsId') or ''}"
+
+
+async def _tribute_inbox_event(request: web.Request, body: bytes) -> Optional[Tuple[str, Dict[str, Any]]]:
+    payload = _json_body(body)
+    data = payload.get("payload") if isinstance(payload.get("payload"), dict) else {}
+    ordering_key = (
+        payload.get("id")
+        or payload.get("payment_id")
+        or data.get("id")
+        or data.get("payment_id")
+        or data.get("donation_request_id")
+    )
+    return (ordering_key, payload) if ordering_key else None
+
+
+async def _cryptobot_inbox_event(request: web.Request, body: bytes) -> Optional[Tuple[str, Dict[str, Any]]]:
+    payload = _json_body(body)
+    invoice = payload.get("payload") if isinstance(payload.get("payload"), dict) else {}
+    if not invoice.get("invoice_id"):
+        return None
+    return invoice["invoice_id"], payload
+
+
+async def _mulenpay_inbox_event(request: web.Request, body: bytes) -> Optional[Tuple[str, Dict[str, Any]]]:
+    payload = _json_body(body)
+    ordering_key = payload.get("uuid") or payload.get("id")
+    return (ordering_key, payload) if ordering_key else None
+
+
+async def _yookassa_inbox_event(request: web.Request, body: bytes) -> Optional[Tuple[str, Dict[str, Any]]]:
+    payload = _json_body(body)
+    payment = payload.get("object") if isinstance(payload.get("object"), dict) else {}
+    # Неподдерживаемые события обработчик подтверждает сам, не занимая очередь
+    if payload.get("event") not in YOOKASSA_QUEUED_EVENTS or not payment.get("id"):
+        return None
+    return payment["id"], payload
+
+
+async def _pal24_inbox_event(request: web.Request, body: bytes) -> Optional[Tuple[str, Dict[str, Any]]]:
+    from app.external.pal24_webhook import _normalize_payload
+    from app.services.pal24_service import Pal24Service
+
+    payload = await _normalize_payload(request)
+    if not payload:
+        return None
+    # Невалидный postback (подпись, поля) отклоняет обработчик с ответом 400
+    parsed = Pal24Service.parse_postback(payload)
+    return parsed["InvId"], parsed
+
+
+def build_payment_webhook_routes(bot, payment_service) -> List[WebhookRoute]:
+    """Таблица маршрутов для провайдеров, включённых в настройках."""
+
+    from app.external.pal24_webhook import Pal24WebhookHandler
+    from app.external.webhook_server import WebhookServer
+    from app.external.yookassa_webhook import YooKassaWebhookHandler
+
+    legacy = WebhookServer(bot)
+    routes: List[WebhookRoute] = []
+
+    if settings.TRIBUTE_ENABLED:
+        routes.append(WebhookRoute(
+            provider="tribute",
+            path=settings.TRIBUTE_WEBHOOK_PATH,
+            handler=legacy._tribute_webhook_handler,
+            verify_signature=_verify_tribute_signature,
+            idempotency_key=_tribute_event_id,
+            inbox_event=_tribute_inbox_event,
+            extra_methods={"OPTIONS": legacy._options_handler},
+        ))
+
+    if settings.is_mulenpay_enabled():
+        routes.append(WebhookRoute(
+            provider="mulenpay",
+            path=settings.MULENPAY_WEBHOOK_PATH,
+            handler=legacy._mulenpay_webhook_handler,
+            idempotency_key=_mulenpay_event_id,
+            inbox_event=_mulenpay_inbox_event,
+            extra_methods={"OPTIONS": legacy._options_handler},
+        ))
+
+    if settings.is_cryptobot_enabled():
+        routes.append(WebhookRoute(
+            provider="cryptobot",
+            path=settings.CRYPTOBOT_WEBHOOK_PATH,
+            handler=legacy._cryptobot_webhook_handler,
+            verify_signature=_verify_cryptobot_signature,
+            idempotency_key=_cryptobot_event_id,
+            inbox_event=_cryptobot_inbox_event,
+            extra_methods={"OPTIONS": legacy._options_handler},
+        ))
+
+    if settings.is_yookassa_enabled():
+        yookassa = YooKassaWebhookHandler(payment_service)
+        routes.append(WebhookRoute(
+            provider="yookassa",
+            path=settings.YOOKASSA_WEBHOOK_PATH,
+            handler=yookassa.handle_webhook,
+            idempotency_key=_yookassa_event_id,
+            inbox_event=_yookassa_inbox_event,
+            extra_methods={"GET": yookassa._get_handler, "OPTIONS": yookassa._options_handler},
+        ))
+
+    if settings.is_pal24_enabled():
+        pal24 = Pal24WebhookHandler(payment_service)
+        routes.append(WebhookRoute(
+            provider="pal24",
+            path=settings.PAL24_WEBHOOK_PATH,
+            handler=pal24.handle_webhook,
+            idempotency_key=_pal24_event_id,
+            inbox_event=_pal24_inbox_event,
+            extra_methods={"GET": pal24.handle_health},
+        ))
+
+    return routes
+
+
+def get_payment_webhook_ports() -> List[int]:
+    ports = {settings.PAYMENT_WEBHOOK_GATEWAY_PORT}
+    if settings.PAYMENT_WEBHOOK_LEGACY_PORTS_ENABLED:
+        if settings.TRIBUTE_ENABLED or settings.is_mulenpay_enabled() or settings.is_cryptobot_enabled():
+            ports.add(settings.TRIBUTE_WEBHOOK_PORT)
+        if settings.is_yookassa_enabled():
+            ports.add(settings.YOOKASSA_WEBHOOK_PORT)
+        if settings.is_pal24_enabled():
+            ports.add(settings.PAL24_WEBHOOK_PORT)
+    return sorted(ports)
+
+
+async def start_payment_webhook_gateway(
+    bot,
+    payment_service,
+    inbox=None,
+) -> Optional[PaymentWebhookGateway]:
+    routes = build_payment_webhook_routes(bot, payment_service)
+    if not routes:
+        logger.info("ℹ️ Платёжные провайдеры с webhook отключены, шлюз не запускается")
+        return None
+
+    gateway = PaymentWebhookGateway(routes, inbox=inbox)
+    await gateway.start(settings.PAYMENT_WEBHOOK_GATEWAY_HOST, get_payment_webhook_ports())
+    return gateway
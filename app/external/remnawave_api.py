@@ -1,15 +1,19 @@
 import asyncio
+import copy
 import json
 import ssl
+import time
 import base64 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union, Any
+from typing import Any, Dict, List, Optional, Tuple, Union
 import aiohttp
 import logging
 from dataclasses import dataclass
 from enum import Enum
 from urllib.parse import urlparse, urljoin
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
 
@@ -105,6 +109,165 @@ class RemnaWaveAPIError(Exception):
         super().__init__(self.message)
 
 
+class RemnaWaveSessionPool:
+    """Долгоживущие aiohttp-сессии к панели: одна на параметры подключения и event loop.
+
+    Сессия держит keep-alive соединения и кэш DNS, поэтому повторные вызовы
+    API не проходят заново TCP/TLS-рукопожатие. Закрывается при остановке бота.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[tuple, tuple] = {}
+        self.created = 0
+        self.leases = 0
+
+    def acquire(self, key: tuple, factory) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(key)
+        if entry is not None:
+            session, session_loop = entry
+            if not session.closed and session_loop is loop:
+                self.leases += 1
+                return session
+
+        session = factory()
+        self._sessions[key] = (session, loop)
+        self.created += 1
+        self.leases += 1
+        return session
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+
+        for session, session_loop in sessions:
+            if session.closed or session_loop is not loop:
+                continue
+            try:
+                await session.close()
+            except Exception as error:
+                logger.warning(f"Ошибка закрытия сессии RemnaWave API: {error}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "sessions": sum(1 for session, _ in self._sessions.values() if not session.closed),
+            "created": self.created,
+            "leases": self.leases,
+        }
+
+
+remnawave_session_pool = RemnaWaveSessionPool()
+
+
+async def close_remnawave_sessions() -> None:
+    await remnawave_session_pool.close()
+
+
+class RemnaWaveReadCoalescer:
+    """Склеивает одинаковые одновременные GET-запросы к панели и кратко кэширует ответы.
+
+    Участвуют только чтения, явно переданные через ``RemnaWaveAPI._cached_get``;
+    срок жизни задаётся группой эндпоинта. Запись пользователя, сквада или ноды
+    сбрасывает кэш по тегу, а ответ, полученный во время такой записи, не сохраняется.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[tuple, tuple] = {}
+        self._inflight: Dict[tuple, Tuple[asyncio.Future, tuple]] = {}
+        self._tag_keys: Dict[tuple, set] = {}
+        self._generations: Dict[tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def group_ttl(group: str) -> float:
+        ttls = {
+            "users": settings.REMNAWAVE_READ_CACHE_USER_TTL_SECONDS,
+            "devices": settings.REMNAWAVE_READ_CACHE_DEVICES_TTL_SECONDS,
+            "squads": settings.REMNAWAVE_READ_CACHE_SQUADS_TTL_SECONDS,
+            "nodes": settings.REMNAWAVE_READ_CACHE_NODES_TTL_SECONDS,
+        }
+        return float(ttls.get(group, 0))
+
+    def _generation(self, tags: tuple) -> tuple:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    async def get(self, key: tuple, tags: tuple, ttl: float, fetch) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return copy.deepcopy(value)
+            self._entries.pop(key, None)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            future = pending[0]
+            self.coalesced += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                # Отменили владельца запроса, а не нас — запрашиваем сами
+                if not future.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (future, tags)
+        generation = self._generation(tags)
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Ошибку получат ожидающие; без них future не должен ругаться в лог
+            future.exception()
+            raise
+        else:
+            if ttl > 0 and self._generation(tags) == generation:
+                self._entries[key] = (time.monotonic() + ttl, value)
+                for tag in tags:
+                    self._tag_keys.setdefault(tag, set()).add(key)
+            future.set_result(value)
+            return copy.deepcopy(value)
+        finally:
+            if self._inflight.get(key, (None,))[0] is future:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, *tags: tuple) -> None:
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in self._tag_keys.pop(tag, set()):
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+            # Новые чтения не должны присоединяться к запросу, начатому до записи
+            for key in [key for key, (_, key_tags) in self._inflight.items() if tag in key_tags]:
+                self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tag_keys.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+        }
+
+
+remnawave_read_coalescer = RemnaWaveReadCoalescer()
+
+
 class RemnaWaveAPI:
     
     def __init__(self, base_url: str, api_key: str, secret_key: Optional[str] = None, 
@@ -116,6 +279,7 @@ class RemnaWaveAPI:
         self.password = password
         self.session: Optional[aiohttp.ClientSession] = None
         self.authenticated = False
+        self._leases = 0
         
     def _detect_connection_type(self) -> str:
         parsed = urlparse(self.base_url)
@@ -160,7 +324,7 @@ class RemnaWaveAPI:
         
         return headers
         
-    async def __aenter__(self):
+    def _create_session(self) -> aiohttp.ClientSession:
         conn_type = self._detect_connection_type()
         
         logger.info(f"Подключение к Remnawave: {self.base_url} (тип: {conn_type})")
@@ -197,7 +361,13 @@ class RemnaWaveAPI:
             logger.debug("Используют внешнее подключение с полной SSL проверкой")
             pass
             
-        connector = aiohttp.TCPConnector(**connector_kwargs)
+        connector = aiohttp.TCPConnector(
+            limit=settings.REMNAWAVE_API_POOL_SIZE,
+            limit_per_host=settings.REMNAWAVE_API_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=settings.REMNAWAVE_API_KEEPALIVE_SECONDS,
+            ttl_dns_cache=settings.REMNAWAVE_API_DNS_CACHE_SECONDS,
+            **connector_kwargs,
+        )
         
         session_kwargs = {
             'timeout': aiohttp.ClientTimeout(total=30),
@@ -208,15 +378,23 @@ class RemnaWaveAPI:
         if cookies:
             session_kwargs['cookies'] = cookies
             
-        self.session = aiohttp.ClientSession(**session_kwargs)
-        self.authenticated = True 
-                
+        return aiohttp.ClientSession(**session_kwargs)
+
+    def _pool_key(self) -> tuple:
+        return (self.base_url, self.api_key, self.secret_key, self.username, self.password)
+
+    async def __aenter__(self):
+        self.session = remnawave_session_pool.acquire(self._pool_key(), self._create_session)
+        self.authenticated = True
+        self._leases += 1
         return self
-        
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
-            
+        # Сессия общая для процесса и закрывается в close_remnawave_sessions()
+        self._leases = max(0, self._leases - 1)
+        if not self._leases:
+            self.session = None
+
     async def _make_request(
         self, 
         method: str, 
@@ -226,7 +404,24 @@ class RemnaWaveAPI:
     ) -> Dict:
         if not self.session:
             raise RemnaWaveAPIError("Session not initialized. Use async context manager.")
-            
+
+        if method != 'GET':
+            # Сбрасываем и до, и после записи: чтение, начатое во время записи, не попадёт в кэш
+            self._invalidate_after_write(endpoint, data)
+            try:
+                return await self._send_request(method, endpoint, data, params)
+            finally:
+                self._invalidate_after_write(endpoint, data)
+
+        return await self._send_request(method, endpoint, data, params)
+
+    async def _send_request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict],
+        params: Optional[Dict],
+    ) -> Dict:
         url = f"{self.base_url}{endpoint}"
         
         try:
@@ -263,6 +458,56 @@ class RemnaWaveAPI:
             raise RemnaWaveAPIError(f"Request failed: {str(e)}")
     
     
+    async def _cached_get(
+        self,
+        endpoint: str,
+        group: str,
+        *,
+        user_uuid: Optional[str] = None,
+        params: Optional[Dict] = None,
+    ) -> Dict:
+        if not settings.REMNAWAVE_READ_CACHE_ENABLED:
+            return await self._make_request('GET', endpoint, params=params)
+
+        key = (self.base_url, endpoint, tuple(sorted((params or {}).items())))
+        tags: tuple = ((self.base_url, group),)
+        if user_uuid:
+            tags += ((self.base_url, "user", user_uuid),)
+
+        return await remnawave_read_coalescer.get(
+            key,
+            tags,
+            remnawave_read_coalescer.group_ttl(group),
+            lambda: self._make_request('GET', endpoint, params=params),
+        )
+
+    def _invalidate_after_write(self, endpoint: str, data: Optional[Dict]) -> None:
+        """Сбрасывает кэш чтений, которые могла изменить запись в ``endpoint``."""
+
+        parts = endpoint.strip('/').split('/')
+        resource = parts[1] if len(parts) > 1 else ''
+        tags = []
+
+        if resource == 'users':
+            uuid = parts[2] if len(parts) > 2 else (data or {}).get('uuid')
+            if uuid == 'bulk':
+                # Bulk-операции затрагивают произвольный набор пользователей
+                uuid = None
+            tags.append((self.base_url, "user", uuid) if uuid else (self.base_url, "users"))
+        elif resource == 'hwid':
+            user_uuid = (data or {}).get('userUuid')
+            tags.append((self.base_url, "user", user_uuid) if user_uuid else (self.base_url, "devices"))
+        elif resource == 'internal-squads':
+            tags.append((self.base_url, "squads"))
+            if 'bulk-actions' in parts:
+                # Массовые операции меняют сквады у всех пользователей
+                tags.append((self.base_url, "users"))
+        elif resource == 'nodes':
+            tags.append((self.base_url, "nodes"))
+
+        if tags:
+            remnawave_read_coalescer.invalidate(*tags)
+
     async def create_user(
         self,
         username: str,
@@ -303,7 +548,7 @@ class RemnaWaveAPI:
     
     async def get_user_by_uuid(self, uuid: str) -> Optional[RemnaWaveUser]:
         try:
-            response = await self._make_request('GET', f'/api/users/{uuid}')
+            response = await self._cached_get(f'/api/users/{uuid}', "users", user_uuid=uuid)
             return self._parse_user(response['response'])
         except RemnaWaveAPIError as e:
             if e.status_code == 404:
@@ -395,6 +640,16 @@ class RemnaWaveAPI:
         response = await self._make_request('POST', f'/api/users/{uuid}/actions/revoke', data)
         return self._parse_user(response['response'])
     
+    async def bulk_update_users(self, uuids: List[str], fields: Dict[str, Any]) -> int:
+        data = {'uuids': uuids, 'fields': fields}
+        response = await self._make_request('POST', '/api/users/bulk/update', data)
+        return int(response.get('response', {}).get('affectedRows', 0))
+
+    async def bulk_update_users_squads(self, uuids: List[str], active_internal_squads: List[str]) -> int:
+        data = {'uuids': uuids, 'activeInternalSquads': active_internal_squads}
+        response = await self._make_request('POST', '/api/users/bulk/update-squads', data)
+        return int(response.get('response', {}).get('affectedRows', 0))
+
     async def get_all_users(self, start: int = 0, size: int = 100) -> Dict[str, Any]:
         params = {'start': start, 'size': size}
         response = await self._make_request('GET', '/api/users', params=params)
@@ -406,7 +661,7 @@ class RemnaWaveAPI:
     
     
     async def get_internal_squads(self) -> List[RemnaWaveInternalSquad]:
-        response = await self._make_request('GET', '/api/internal-squads')
+        response = await self._cached_get('/api/internal-squads', "squads")
         return [self._parse_internal_squad(squad) for squad in response['response']['internalSquads']]
     
     async def get_internal_squad_by_uuid(self, uuid: str) -> Optional[RemnaWaveInternalSquad]:
@@ -447,7 +702,7 @@ class RemnaWaveAPI:
     
     
     async def get_all_nodes(self) -> List[RemnaWaveNode]:
-        response = await self._make_request('GET', '/api/nodes')
+        response = await self._cached_get('/api/nodes', "nodes")
         return [self._parse_node(node) for node in response['response']]
     
     async def get_node_by_uuid(self, uuid: str) -> Optional[RemnaWaveNode]:
@@ -538,7 +793,11 @@ class RemnaWaveAPI:
     
     async def get_user_devices(self, user_uuid: str) -> Dict[str, Any]:
         try:
-            response = await self._make_request('GET', f'/api/hwid/devices/{user_uuid}')
+            response = await self._cached_get(
+                f'/api/hwid/devices/{user_uuid}',
+                "devices",
+                user_uuid=user_uuid,
+            )
             return response['response']
         except RemnaWaveAPIError as e:
             if e.status_code == 404:
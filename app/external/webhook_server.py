@@ -326,7 +326,14 @@ class WebhookServer:
                     )
 
             result = await self.tribute_service.process_webhook(payload)
-            
+
+            if result and result.get("status") == "error":
+                logger.error(f"Tribute webhook не применён: {result}")
+                return web.json_response(
+                    {"status": "error", "reason": result.get("reason", "processing_failed")},
+                    status=500
+                )
+
             if result:
                 logger.info(f"Tribute webhook обработан успешно: {result}")
                 return web.json_response({"status": "ok", "result": result}, status=200)
@@ -10,7 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database.models import User
-from app.services.backup_service import backup_service
+from app.services.backup_service import RestoreProgress, RestoreProgressCallback, backup_service
 from app.utils.decorators import admin_required, error_handler
 
 logger = logging.getLogger(__name__)
@@ -21,6 +21,23 @@ class BackupStates(StatesGroup):
     waiting_settings_update = State()
 
 
+def _restore_progress(message: types.Message, filename: str) -> RestoreProgressCallback:
+    """Обновляет сообщение админа по мере восстановления пачек."""
+
+    async def report(progress: RestoreProgress) -> None:
+        percent = min(100, progress.done * 100 // progress.total) if progress.total else 0
+        await message.edit_text(
+            f"📥 <b>Восстановление из бекапа...</b>\n\n"
+            f"📄 Файл: <code>{filename}</code>\n"
+            f"📊 Таблица: {progress.table or '—'} (готово таблиц: {progress.tables_done})\n"
+            f"📈 Записей: {progress.done:,} из {progress.total:,} ({percent}%)\n"
+            f"⚡ Скорость: {progress.records_per_second:,.0f} записей/с",
+            parse_mode="HTML"
+        )
+
+    return report
+
+
 def get_backup_main_keyboard(language: str = "ru"):
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -375,7 +392,7 @@ async def restore_backup_start(
     else:
         text = """📥 <b>Восстановление из бекапа</b>
 
-📎 Отправьте файл бекапа (.json или .json.gz)
+📎 Отправьте файл бекапа (.ndjson.gz, .ndjson, .json или .json.gz)
 
 ⚠️ <b>ВАЖНО:</b>
 • Файл должен быть создан этой системой бекапов
@@ -432,7 +449,8 @@ async def restore_backup_execute(
     
     success, message = await backup_service.restore_backup(
         str(backup_path),
-        clear_existing=clear_existing
+        clear_existing=clear_existing,
+        progress=_restore_progress(progress_msg, filename),
     )
     
     if success:
@@ -459,7 +477,7 @@ async def handle_backup_file_upload(
 ):
     if not message.document:
         await message.answer(
-            "❌ Пожалуйста, отправьте файл бекапа (.json или .json.gz)",
+            "❌ Пожалуйста, отправьте файл бекапа (.ndjson.gz, .ndjson, .json или .json.gz)",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="◀️ Отмена", callback_data="backup_panel")]
             ])
@@ -468,9 +486,9 @@ async def handle_backup_file_upload(
     
     document = message.document
     
-    if not (document.file_name.endswith('.json') or document.file_name.endswith('.json.gz')):
+    if not document.file_name.endswith(('.json', '.json.gz', '.ndjson', '.ndjson.gz')):
         await message.answer(
-            "❌ Неподдерживаемый формат файла. Загрузите .json или .json.gz файл",
+            "❌ Неподдерживаемый формат файла. Загрузите .ndjson.gz, .ndjson, .json или .json.gz файл",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="◀️ Отмена", callback_data="backup_panel")]
             ])
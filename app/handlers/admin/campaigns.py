@@ -12,7 +12,6 @@ from app.database.crud.campaign import (
     delete_campaign,
     get_campaign_by_id,
     get_campaign_by_start_parameter,
-    get_campaign_statistics,
     get_campaigns_count,
     get_campaigns_list,
     get_campaigns_overview,
@@ -29,6 +28,7 @@ from app.keyboards.admin import (
     get_confirmation_keyboard,
 )
 from app.localization.texts import get_texts
+from app.services.statistics_service import statistics_service
 from app.states import AdminStates
 from app.utils.decorators import admin_required, error_handler
 
@@ -321,7 +321,7 @@ async def show_campaign_detail(
         return
 
     texts = get_texts(db_user.language)
-    stats = await get_campaign_statistics(db, campaign_id)
+    stats = await statistics_service.get_campaign_statistics(db, campaign_id)
     deep_link = await _get_bot_deep_link(callback, campaign.start_parameter)
 
     text = ["📣 <b>Управление кампанией</b>\n"]
@@ -1198,7 +1198,7 @@ async def show_campaign_stats(
         return
 
     texts = get_texts(db_user.language)
-    stats = await get_campaign_statistics(db, campaign_id)
+    stats = await statistics_service.get_campaign_statistics(db, campaign_id)
 
     text = ["📊 <b>Статистика кампании</b>\n"]
     text.append(_format_campaign_summary(campaign, texts))
@@ -1,7 +1,6 @@
 import logging
-import asyncio
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import AsyncIterator, Optional, Tuple
 from aiogram import Dispatcher, types, F
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -25,8 +24,6 @@ from app.keyboards.admin import (
     get_broadcast_button_config, get_broadcast_button_labels
 )
 from app.localization.texts import get_texts
-from app.database.crud.user import get_users_list
-from app.database.crud.subscription import get_expiring_subscriptions
 from app.utils.decorators import admin_required, error_handler
 from app.utils.miniapp_buttons import build_miniapp_or_callback_button
 
@@ -736,11 +733,12 @@ async def confirm_broadcast(
         parse_mode="HTML" 
     )
     
-    if target.startswith('custom_'):
-        users = await get_custom_users(db, target.replace('custom_', ''))
-    else:
-        users = await get_target_users(db, target)
-    
+    from app.services.broadcast_service import (
+        BroadcastConfig,
+        BroadcastMediaConfig,
+        broadcast_service,
+    )
+
     broadcast_history = BroadcastHistory(
         target_type=target,
         message_text=message_text,
@@ -748,70 +746,44 @@ async def confirm_broadcast(
         media_type=media_type,
         media_file_id=media_file_id,
         media_caption=media_caption,
-        total_count=len(users),
+        total_count=0,
         sent_count=0,
         failed_count=0,
+        selected_buttons=list(selected_buttons),
         admin_id=db_user.id,
         admin_name=db_user.full_name,
-        status="in_progress"
+        status="queued"
     )
     db.add(broadcast_history)
     await db.commit()
     await db.refresh(broadcast_history)
-    
-    sent_count = 0
-    failed_count = 0
-    
-    broadcast_keyboard = create_broadcast_keyboard(selected_buttons, db_user.language)
-    
-    for user in users:
-        try:
-            if has_media and media_file_id:
-                if media_type == "photo":
-                    await callback.bot.send_photo(
-                        chat_id=user.telegram_id,
-                        photo=media_file_id,
-                        caption=message_text,
-                        parse_mode="HTML",
-                        reply_markup=broadcast_keyboard
-                    )
-                elif media_type == "video":
-                    await callback.bot.send_video(
-                        chat_id=user.telegram_id,
-                        video=media_file_id,
-                        caption=message_text,
-                        parse_mode="HTML",
-                        reply_markup=broadcast_keyboard
-                    )
-                elif media_type == "document":
-                    await callback.bot.send_document(
-                        chat_id=user.telegram_id,
-                        document=media_file_id,
-                        caption=message_text,
-                        parse_mode="HTML",
-                        reply_markup=broadcast_keyboard
-                    )
-            else:
-                await callback.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=message_text,
-                    parse_mode="HTML",
-                    reply_markup=broadcast_keyboard
-                )
-            sent_count += 1
-            
-            if sent_count % 20 == 0:
-                await asyncio.sleep(1)
-                
-        except Exception as e:
-            failed_count += 1
-            logger.error(f"Ошибка отправки рассылки пользователю {user.telegram_id}: {e}")
-    
-    broadcast_history.sent_count = sent_count
-    broadcast_history.failed_count = failed_count
-    broadcast_history.status = "completed" if failed_count == 0 else "partial"
-    broadcast_history.completed_at = datetime.utcnow()
-    await db.commit()
+
+    media_config = None
+    if has_media and media_file_id:
+        media_config = BroadcastMediaConfig(
+            type=media_type,
+            file_id=media_file_id,
+            caption=message_text,
+        )
+
+    await broadcast_service.start_broadcast(
+        broadcast_history.id,
+        BroadcastConfig(
+            target=target,
+            message_text=message_text,
+            selected_buttons=list(selected_buttons),
+            media=media_config,
+            initiator_name=db_user.full_name,
+            language=db_user.language,
+        ),
+    )
+    await broadcast_service.wait_for(broadcast_history.id)
+    await db.refresh(broadcast_history)
+
+    sent_count = broadcast_history.sent_count or 0
+    failed_count = broadcast_history.failed_count or 0
+    blocked_count = broadcast_history.blocked_count or 0
+    total_count = broadcast_history.total_count or 0
     
     media_info = ""
     if has_media:
@@ -822,9 +794,9 @@ async def confirm_broadcast(
 
 📊 <b>Результат:</b>
 - Отправлено: {sent_count}
-- Не доставлено: {failed_count}
-- Всего пользователей: {len(users)}
-- Успешность: {round(sent_count / len(users) * 100, 1) if users else 0}%{media_info}
+- Не доставлено: {failed_count} (заблокировали бота: {blocked_count})
+- Всего пользователей: {total_count}
+- Успешность: {round(sent_count / total_count * 100, 1) if total_count else 0}%{media_info}
 
 <b>Администратор:</b> {db_user.full_name}
 """
@@ -838,150 +810,180 @@ async def confirm_broadcast(
     )
     
     await state.clear()
-    logger.info(f"Рассылка выполнена админом {db_user.telegram_id}: {sent_count}/{len(users)} (медиа: {has_media})")
+    logger.info(f"Рассылка выполнена админом {db_user.telegram_id}: {sent_count}/{total_count} (медиа: {has_media})")
 
 
-async def get_target_users_count(db: AsyncSession, target: str) -> int:
-    users = await get_target_users(db, target)
-    return len(users)
+BROADCAST_RECIPIENTS_BATCH_SIZE = 1000
+
+
+def _active_subscription_condition(now: datetime):
+    return and_(
+        Subscription.status == SubscriptionStatus.ACTIVE.value,
+        Subscription.end_date > now,
+    )
+
+
+def _zero_traffic_condition():
+    return func.coalesce(Subscription.traffic_used_gb, 0) <= 0
 
 
-async def get_target_users(db: AsyncSession, target: str) -> list:
-    users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE)
+def _target_condition(target: str, now: datetime):
+    """SQL-предикат аудитории рассылки; None — неизвестная аудитория."""
+
+    active_user = User.status == UserStatus.ACTIVE.value
 
     if target == "all":
-        return users
+        return active_user
 
     if target == "active":
-        return [
-            user
-            for user in users
-            if user.subscription
-            and user.subscription.is_active
-            and not user.subscription.is_trial
-        ]
+        return and_(active_user, _active_subscription_condition(now), Subscription.is_trial.isnot(True))
 
     if target == "trial":
-        return [
-            user
-            for user in users
-            if user.subscription and user.subscription.is_trial
-        ]
+        return and_(active_user, Subscription.is_trial.is_(True))
 
     if target == "no":
-        return [
-            user
-            for user in users
-            if not user.subscription or not user.subscription.is_active
-        ]
+        return and_(
+            active_user,
+            or_(Subscription.id.is_(None), ~_active_subscription_condition(now)),
+        )
 
     if target == "expiring":
-        expiring_subs = await get_expiring_subscriptions(db, 3)
-        return [sub.user for sub in expiring_subs if sub.user]
+        return and_(
+            _active_subscription_condition(now),
+            Subscription.end_date <= now + timedelta(days=3),
+        )
 
     if target == "expired":
-        now = datetime.utcnow()
-        expired_statuses = {
-            SubscriptionStatus.EXPIRED.value,
-            SubscriptionStatus.DISABLED.value,
-        }
-        expired_users = []
-        for user in users:
-            subscription = user.subscription
-            if subscription:
-                if subscription.status in expired_statuses:
-                    expired_users.append(user)
-                    continue
-                if subscription.end_date <= now and not subscription.is_active:
-                    expired_users.append(user)
-                    continue
-            elif user.has_had_paid_subscription:
-                expired_users.append(user)
-        return expired_users
+        return and_(
+            active_user,
+            or_(
+                Subscription.status.in_([
+                    SubscriptionStatus.EXPIRED.value,
+                    SubscriptionStatus.DISABLED.value,
+                ]),
+                Subscription.end_date <= now,
+                and_(Subscription.id.is_(None), User.has_had_paid_subscription.is_(True)),
+            ),
+        )
 
     if target == "active_zero":
-        return [
-            user
-            for user in users
-            if user.subscription
-            and not user.subscription.is_trial
-            and user.subscription.is_active
-            and (user.subscription.traffic_used_gb or 0) <= 0
-        ]
+        return and_(
+            active_user,
+            Subscription.is_trial.isnot(True),
+            _active_subscription_condition(now),
+            _zero_traffic_condition(),
+        )
 
     if target == "trial_zero":
-        return [
-            user
-            for user in users
-            if user.subscription
-            and user.subscription.is_trial
-            and user.subscription.is_active
-            and (user.subscription.traffic_used_gb or 0) <= 0
-        ]
+        return and_(
+            active_user,
+            Subscription.is_trial.is_(True),
+            _active_subscription_condition(now),
+            _zero_traffic_condition(),
+        )
 
     if target == "zero":
-        return [
-            user
-            for user in users
-            if user.subscription
-            and user.subscription.is_active
-            and (user.subscription.traffic_used_gb or 0) <= 0
-        ]
-
-    return []
-
+        return and_(active_user, _active_subscription_condition(now), _zero_traffic_condition())
 
-async def get_custom_users_count(db: AsyncSession, criteria: str) -> int:
-    users = await get_custom_users(db, criteria)
-    return len(users)
+    return None
 
 
-async def get_custom_users(db: AsyncSession, criteria: str) -> list:
-    now = datetime.utcnow()
+def _custom_condition(criteria: str, now: datetime):
     today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     week_ago = now - timedelta(days=7)
     month_ago = now - timedelta(days=30)
-    
-    if criteria == "today":
-        stmt = select(User).where(
-            and_(User.status == "active", User.created_at >= today)
-        )
-    elif criteria == "week":
-        stmt = select(User).where(
-            and_(User.status == "active", User.created_at >= week_ago)
-        )
-    elif criteria == "month":
-        stmt = select(User).where(
-            and_(User.status == "active", User.created_at >= month_ago)
-        )
-    elif criteria == "active_today":
-        stmt = select(User).where(
-            and_(User.status == "active", User.last_activity >= today)
-        )
-    elif criteria == "inactive_week":
-        stmt = select(User).where(
-            and_(User.status == "active", User.last_activity < week_ago)
-        )
-    elif criteria == "inactive_month":
-        stmt = select(User).where(
-            and_(User.status == "active", User.last_activity < month_ago)
-        )
-    elif criteria == "referrals":
-        stmt = select(User).where(
-            and_(User.status == "active", User.referred_by_id.isnot(None))
-        )
-    elif criteria == "direct":
-        stmt = select(User).where(
-            and_(
-                User.status == "active", 
-                User.referred_by_id.is_(None)
-            )
-        )
+
+    conditions = {
+        "today": User.created_at >= today,
+        "week": User.created_at >= week_ago,
+        "month": User.created_at >= month_ago,
+        "active_today": User.last_activity >= today,
+        "inactive_week": User.last_activity < week_ago,
+        "inactive_month": User.last_activity < month_ago,
+        "referrals": User.referred_by_id.isnot(None),
+        "direct": User.referred_by_id.is_(None),
+    }
+    condition = conditions.get(criteria)
+    if condition is None:
+        return None
+    return and_(User.status == UserStatus.ACTIVE.value, condition)
+
+
+def _reachable_condition():
+    # Заблокировавшие бота снова попадают в рассылки после любой активности
+    return or_(
+        User.broadcast_unreachable_at.is_(None),
+        User.last_activity > User.broadcast_unreachable_at,
+    )
+
+
+def build_broadcast_condition(target: str, *, reachable_only: bool = True):
+    now = datetime.utcnow()
+    if target.startswith("custom_"):
+        condition = _custom_condition(target[len("custom_"):], now)
     else:
-        return []
-    
-    result = await db.execute(stmt)
-    return result.scalars().all()
+        condition = _target_condition(target, now)
+
+    if condition is None:
+        return None
+    if reachable_only:
+        condition = and_(condition, _reachable_condition())
+    return condition
+
+
+def _with_subscription(stmt):
+    return stmt.select_from(User).outerjoin(Subscription, Subscription.user_id == User.id)
+
+
+async def count_broadcast_recipients(db: AsyncSession, target: str) -> int:
+    condition = build_broadcast_condition(target)
+    if condition is None:
+        return 0
+    return await db.scalar(_with_subscription(select(func.count(User.id))).where(condition)) or 0
+
+
+async def iter_broadcast_recipients(
+    session_factory,
+    target: str,
+    *,
+    after_user_id: Optional[int] = None,
+    batch_size: int = BROADCAST_RECIPIENTS_BATCH_SIZE,
+) -> AsyncIterator[Tuple[int, int]]:
+    """Отдаёт пары (user_id, telegram_id) страницами по id без OFFSET.
+
+    Каждая страница читается в своей короткой сессии, поэтому соединение
+    не удерживается на всё время рассылки, а память не зависит от аудитории.
+    """
+
+    condition = build_broadcast_condition(target)
+    if condition is None:
+        return
+
+    last_id = after_user_id or 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                _with_subscription(select(User.id, User.telegram_id))
+                .where(condition, User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+
+        for user_id, telegram_id in rows:
+            yield user_id, telegram_id
+
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+async def get_target_users_count(db: AsyncSession, target: str) -> int:
+    return await count_broadcast_recipients(db, target)
+
+
+async def get_custom_users_count(db: AsyncSession, criteria: str) -> int:
+    return await count_broadcast_recipients(db, f"custom_{criteria}")
 
 
 async def get_users_statistics(db: AsyncSession) -> dict:
@@ -8,13 +8,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
 from app.config import settings
-from app.database.database import get_db
+from app.database.database import get_db, get_pool_statistics
+from app.database.query_counter import update_query_statistics
+from app.database.user_cache import user_snapshot_cache
 from app.services.monitoring_service import monitoring_service
 from app.utils.decorators import admin_required
 from app.utils.pagination import paginate_list
 from app.keyboards.admin import get_monitoring_keyboard, get_admin_main_keyboard
 from app.localization.texts import get_texts
 from app.services.notification_settings_service import NotificationSettingsService
+from app.services.statistics_service import statistics_service
 from app.states import AdminStates
 
 logger = logging.getLogger(__name__)
@@ -25,6 +28,49 @@ def _format_toggle(enabled: bool) -> str:
     return "🟢 Вкл" if enabled else "🔴 Выкл"
 
 
+_POOL_ROLE_TITLES = {
+    "bot": "Бот",
+    "web_api": "Веб-API",
+    "background": "Фоновые задачи",
+}
+
+
+def _format_pool_statistics() -> str:
+    lines = []
+    for role, stats in get_pool_statistics().items():
+        title = _POOL_ROLE_TITLES.get(role, role)
+        if stats.get("mode") != "queue":
+            lines.append(f"• {title}: без пула (NullPool)")
+            continue
+        saturation = round(stats.get("saturation", 0) * 100)
+        lines.append(
+            f"• {title}: {stats['checked_out']}/{stats['capacity']} ({saturation}%), "
+            f"ожиданий {stats['waits']}, таймаутов {stats['timeouts']}, "
+            f"выдача ~{stats['avg_checkout_ms']} мс (p95 {stats['p95_checkout_ms']} мс)"
+        )
+    return "\n".join(lines)
+
+
+def _format_query_statistics() -> str:
+    stats = update_query_statistics.snapshot()
+    return (
+        f"• Апдейтов: {stats['updates']}\n"
+        f"• SQL-запросов на апдейт: ~{stats['avg_queries_per_update']} "
+        f"(макс. {stats['max_queries_per_update']})"
+    )
+
+
+def _format_user_cache_statistics() -> str:
+    stats = user_snapshot_cache.get_stats()
+    if not stats["enabled"]:
+        return "• Выключен"
+    return (
+        f"• Попаданий: {stats['hits']} (локально: {stats['local_hits']})\n"
+        f"• Промахов: {stats['misses']}, hit rate: {stats['hit_rate']}%\n"
+        f"• Инвалидаций: {stats['invalidations']}"
+    )
+
+
 def _build_notification_settings_view(language: str):
     texts = get_texts(language)
     config = NotificationSettingsService.get_config()
@@ -874,8 +920,7 @@ async def test_notifications_callback(callback: CallbackQuery):
 async def monitoring_statistics_callback(callback: CallbackQuery):
     try:
         async for db in get_db():
-            from app.database.crud.subscription import get_subscriptions_statistics
-            sub_stats = await get_subscriptions_statistics(db)
+            sub_stats = await statistics_service.get_subscriptions_statistics(db)
             
             mon_status = await monitoring_service.get_monitoring_status(db)
             
@@ -910,6 +955,15 @@ async def monitoring_statistics_callback(callback: CallbackQuery):
 • Интервал: {settings.MONITORING_INTERVAL} мин
 • Уведомления: {'🟢 Вкл' if getattr(settings, 'ENABLE_NOTIFICATIONS', True) else '🔴 Выкл'}
 • Автооплата: {', '.join(map(str, settings.get_autopay_warning_days()))} дней
+
+🗄️ <b>Пулы соединений БД:</b>
+{_format_pool_statistics()}
+
+🧮 <b>Запросы к БД:</b>
+{_format_query_statistics()}
+
+👤 <b>Кеш пользователей:</b>
+{_format_user_cache_statistics()}
 """
             
             from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
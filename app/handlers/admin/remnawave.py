@@ -27,6 +27,7 @@ from app.keyboards.admin import (
 )
 from app.localization.texts import get_texts
 from app.services.remnawave_service import RemnaWaveService, RemnaWaveConfigurationError
+from app.services.remnawave_write_pipeline import ProgressCallback, WriteProgress
 from app.services.remnawave_sync_service import (
     RemnaWaveAutoSyncStatus,
     remnawave_sync_service,
@@ -55,6 +56,19 @@ def _format_duration(seconds: float) -> str:
     return f"{sec} с"
 
 
+def _panel_write_progress(message: types.Message, title: str) -> ProgressCallback:
+    """Обновляет сообщение админа по мере пакетной записи в панель."""
+
+    async def report(progress: WriteProgress) -> None:
+        await message.edit_text(
+            f"{title}\n\n"
+            f"⏳ Панель: {progress.done} из {progress.total} "
+            f"(ошибок: {progress.failed}, {_format_duration(progress.elapsed)})"
+        )
+
+    return report
+
+
 def _format_user_stats(stats: Optional[Dict[str, Any]]) -> str:
     if not stats:
         return "—"
@@ -770,6 +784,10 @@ async def confirm_squad_migration(
             db,
             source_uuid=source_uuid,
             target_uuid=target_uuid,
+            progress=_panel_write_progress(
+                callback.message,
+                texts.t("ADMIN_SQUAD_MIGRATION_IN_PROGRESS", "Запускаю переезд..."),
+            ),
         )
     except RemnaWaveConfigurationError as error:
         message = texts.t(
@@ -1127,13 +1145,10 @@ async def show_traffic_stats(
     remnawave_service = RemnaWaveService()
     
     try:
-        async with remnawave_service.get_api_client() as api:
-            bandwidth_stats = await api.get_bandwidth_stats()
-            
-            realtime_usage = await api.get_nodes_realtime_usage()
-            
-            nodes_stats = await api.get_nodes_statistics()
-            
+        sources = await remnawave_service.get_statistics_sources()
+        bandwidth_stats = sources["bandwidth_stats"]
+        realtime_usage = sources["realtime_usage"]
+        nodes_stats = sources["nodes_stats"]
     except Exception as e:
         await callback.message.edit_text(
             f"❌ Ошибка получения статистики трафика: {str(e)}",
@@ -2733,7 +2748,10 @@ async def validate_subscriptions(
     )
     
     remnawave_service = RemnaWaveService()
-    stats = await remnawave_service.validate_and_fix_subscriptions(db)
+    stats = await remnawave_service.validate_and_fix_subscriptions(
+        db,
+        progress=_panel_write_progress(callback.message, "🔍 Выполняется валидация подписок..."),
+    )
     
     if stats['errors'] == 0:
         status_emoji = "✅"
@@ -2788,7 +2806,10 @@ async def cleanup_subscriptions(
     )
     
     remnawave_service = RemnaWaveService()
-    stats = await remnawave_service.cleanup_orphaned_subscriptions(db)
+    stats = await remnawave_service.cleanup_orphaned_subscriptions(
+        db,
+        progress=_panel_write_progress(callback.message, "🧹 Выполняется очистка неактуальных подписок..."),
+    )
     
     if stats['errors'] == 0:
         status_emoji = "✅"
@@ -2845,7 +2866,10 @@ async def force_cleanup_all_orphaned_users(
     )
     
     remnawave_service = RemnaWaveService()
-    stats = await remnawave_service.cleanup_orphaned_subscriptions(db)
+    stats = await remnawave_service.cleanup_orphaned_subscriptions(
+        db,
+        progress=_panel_write_progress(callback.message, "🗑️ Выполняется принудительная очистка..."),
+    )
     
     if stats['errors'] == 0:
         status_emoji = "✅"
@@ -21,7 +21,7 @@ from app.database.crud.server_squad import (
 from app.database.crud.promo_group import get_promo_groups_with_counts
 from app.services.remnawave_service import RemnaWaveService
 from app.utils.decorators import admin_required, error_handler
-from app.utils.cache import cache
+from app.utils.cache import AVAILABLE_COUNTRIES_CACHE_TAG, cache
 
 logger = logging.getLogger(__name__)
 
@@ -294,7 +294,7 @@ async def sync_servers_with_remnawave(
         
         created, updated, removed = await sync_with_remnawave(db, squads)
         
-        await cache.delete_pattern("available_countries*")
+        await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         
         text = f"""
 ✅ <b>Синхронизация завершена</b>
@@ -520,7 +520,7 @@ async def toggle_server_availability(
     new_status = not server.is_available
     await update_server_squad(db, server_id, is_available=new_status)
     
-    await cache.delete_pattern("available_countries*")
+    await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
     
     status_text = "включен" if new_status else "отключен"
     await callback.answer(f"✅ Сервер {status_text}!")
@@ -631,7 +631,7 @@ async def process_server_price_edit(
         if server:
             await state.clear()
             
-            await cache.delete_pattern("available_countries*")
+            await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
             
             price_text = f"{int(price_rubles)} ₽" if price_kopeks > 0 else "Бесплатно"
             await message.answer(
@@ -706,7 +706,7 @@ async def process_server_name_edit(
     if server:
         await state.clear()
         
-        await cache.delete_pattern("available_countries*")
+        await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         
         await message.answer(
             f"✅ Название сервера изменено на: <b>{new_name}</b>",
@@ -779,7 +779,7 @@ async def delete_server_execute(
     success = await delete_server_squad(db, server_id)
     
     if success:
-        await cache.delete_pattern("available_countries*")
+        await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         
         await callback.message.edit_text(
             f"✅ Сервер <b>{server.display_name}</b> успешно удален!",
@@ -910,7 +910,7 @@ async def process_server_country_edit(
     if server:
         await state.clear()
         
-        await cache.delete_pattern("available_countries*")
+        await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         
         country_text = new_country or "Удален"
         await message.answer(
@@ -1061,7 +1061,7 @@ async def process_server_description_edit(
         await state.clear()
 
         desc_text = new_description or "Удалено"
-        await cache.delete_pattern("available_countries*")
+        await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         await message.answer(
             f"✅ Описание сервера изменено:\n\n<i>{desc_text}</i>",
             reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
@@ -1200,7 +1200,7 @@ async def save_server_promo_groups(
         await callback.answer("❌ Сервер не найден", show_alert=True)
         return
 
-    await cache.delete_pattern("available_countries*")
+    await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
     await state.clear()
 
     text, keyboard = _build_server_edit_view(server)
@@ -7,9 +7,8 @@ from app.config import settings
 from app.database.models import User
 from app.keyboards.admin import get_admin_statistics_keyboard, get_period_selection_keyboard
 from app.localization.texts import get_texts
+from app.services.statistics_service import statistics_service
 from app.services.user_service import UserService
-from app.database.crud.subscription import get_subscriptions_statistics
-from app.database.crud.transaction import get_transactions_statistics, get_revenue_by_period
 from app.database.crud.referral import get_referral_statistics
 from app.utils.decorators import admin_required, error_handler
 from app.utils.formatters import format_datetime, format_percentage
@@ -98,7 +97,7 @@ async def show_subscriptions_statistics(
     db_user: User,
     db: AsyncSession
 ):
-    stats = await get_subscriptions_statistics(db)
+    stats = await statistics_service.get_subscriptions_statistics(db)
     
     total_subs = stats['total_subscriptions']
     conversion_rate = format_percentage(stats['paid_subscriptions'] / total_subs * 100 if total_subs > 0 else 0)
@@ -151,8 +150,8 @@ async def show_revenue_statistics(
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    month_stats = await get_transactions_statistics(db, month_start, now)
-    all_time_stats = await get_transactions_statistics(db)
+    month_stats = await statistics_service.get_transactions_statistics(db, month_start)
+    all_time_stats = await statistics_service.get_transactions_statistics(db)
     current_time = format_datetime(datetime.utcnow())
     
     text = f"""
@@ -267,11 +266,8 @@ async def show_summary_statistics(
 ):
     user_service = UserService()
     user_stats = await user_service.get_user_statistics(db)
-    sub_stats = await get_subscriptions_statistics(db)
-    
-    now = datetime.utcnow()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    revenue_stats = await get_transactions_statistics(db, month_start, now)
+    sub_stats = await statistics_service.get_subscriptions_statistics(db)
+    revenue_stats = await statistics_service.get_transactions_statistics(db)
     current_time = format_datetime(datetime.utcnow())
     
     conversion_rate = 0
@@ -340,7 +336,7 @@ async def show_revenue_by_period(
     }
     
     days = period_map.get(period, 30)
-    revenue_data = await get_revenue_by_period(db, days)
+    revenue_data = await statistics_service.get_revenue_by_period(db, days)
     
     if period == "yesterday":
         yesterday = datetime.utcnow().date() - timedelta(days=1)
@@ -9,10 +9,11 @@ from app.database.models import User
 from app.keyboards.admin import get_admin_subscriptions_keyboard
 from app.localization.texts import get_texts
 from app.database.crud.subscription import (
-    get_expiring_subscriptions, get_subscriptions_statistics, get_expired_subscriptions,
+    get_expiring_subscriptions, get_expired_subscriptions,
     get_all_subscriptions
 )
 from app.services.subscription_service import SubscriptionService
+from app.services.statistics_service import statistics_service
 from app.utils.decorators import admin_required, error_handler
 from app.utils.formatters import format_datetime, format_time_ago
 
@@ -60,7 +61,7 @@ async def show_subscriptions_menu(
     db_user: User,
     db: AsyncSession
 ):
-    stats = await get_subscriptions_statistics(db)
+    stats = await statistics_service.get_subscriptions_statistics(db)
     
     text = f"""
 📱 <b>Управление подписками</b>
@@ -221,7 +222,7 @@ async def show_subscriptions_stats(
     db: AsyncSession
 ):
     
-    stats = await get_subscriptions_statistics(db)
+    stats = await statistics_service.get_subscriptions_statistics(db)
     
     expiring_3d = await get_expiring_subscriptions(db, 3)
     expiring_7d = await get_expiring_subscriptions(db, 7)
@@ -10,10 +10,7 @@ from app.config import settings
 from app.states import AdminStates
 from app.database.models import User, UserStatus, Subscription, SubscriptionStatus, TransactionType 
 from app.database.crud.user import get_user_by_id
-from app.database.crud.campaign import (
-    get_campaign_registration_by_user,
-    get_campaign_statistics,
-)
+from app.database.crud.campaign import get_campaign_registration_by_user
 from app.keyboards.admin import (
     get_admin_users_keyboard, get_user_management_keyboard,
     get_admin_pagination_keyboard, get_confirmation_keyboard,
@@ -34,6 +31,7 @@ from app.database.crud.server_squad import (
     get_server_ids_by_uuids,
 )
 from app.services.subscription_service import SubscriptionService
+from app.services.statistics_service import statistics_service
 
 logger = logging.getLogger(__name__)
 
@@ -1881,7 +1879,7 @@ async def show_user_statistics(
     campaign_registration = await get_campaign_registration_by_user(db, user.id)
     campaign_stats = None
     if campaign_registration:
-        campaign_stats = await get_campaign_statistics(db, campaign_registration.campaign_id)
+        campaign_stats = await statistics_service.get_campaign_statistics(db, campaign_registration.campaign_id)
     
     text = f"📊 <b>Статистика пользователя</b>\n\n"
     text += f"👤 {user.full_name} (ID: <code>{user.telegram_id}</code>)\n\n"
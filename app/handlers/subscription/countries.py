@@ -599,7 +599,7 @@ async def countries_continue(
     await callback.answer()
 
 async def _get_available_countries(promo_group_id: Optional[int] = None):
-    from app.utils.cache import cache, cache_key
+    from app.utils.cache import AVAILABLE_COUNTRIES_CACHE_TAG, cache, cache_key
     from app.database.database import AsyncSessionLocal
     from app.database.crud.server_squad import get_available_server_squads
 
@@ -619,7 +619,7 @@ async def _get_available_countries(promo_group_id: Optional[int] = None):
                 "Промогруппа %s не имеет доступных серверов, возврат пустого списка",
                 promo_group_id,
             )
-            await cache.set(cache_key_value, [], 60)
+            await cache.set(cache_key_value, [], 60, tags=[AVAILABLE_COUNTRIES_CACHE_TAG])
             return []
 
         countries = []
@@ -661,7 +661,7 @@ async def _get_available_countries(promo_group_id: Optional[int] = None):
                     "is_available": True
                 })
 
-        await cache.set(cache_key_value, countries, 300)
+        await cache.set(cache_key_value, countries, 300, tags=[AVAILABLE_COUNTRIES_CACHE_TAG])
         return countries
 
     except Exception as e:
@@ -670,7 +670,7 @@ async def _get_available_countries(promo_group_id: Optional[int] = None):
             {"uuid": "default-free", "name": "🆓 Бесплатный сервер", "price_kopeks": 0, "is_available": True},
         ]
 
-        await cache.set(cache_key_value, fallback_countries, 60)
+        await cache.set(cache_key_value, fallback_countries, 60, tags=[AVAILABLE_COUNTRIES_CACHE_TAG])
         return fallback_countries
 
 async def _get_countries_info(squad_uuids):
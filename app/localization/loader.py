@@ -7,7 +7,7 @@ import shutil
 import tempfile
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List
 
 from app.config import settings
 
@@ -15,6 +15,8 @@ _logger = logging.getLogger(__name__)
 
 _FALLBACK_LANGUAGE = "ru"
 
+_cache_listeners: List[Callable[[], None]] = []
+
 _BASE_DIR = Path(__file__).resolve().parent
 _DEFAULT_LOCALES_DIR = _BASE_DIR / "locales"
 
@@ -317,5 +319,13 @@ def load_locale(language: str) -> Dict[str, Any]:
     return merged
 
 
+def add_locale_cache_listener(callback: Callable[[], None]) -> None:
+    """Регистрирует функцию, вызываемую после сброса кэша локалей."""
+
+    _cache_listeners.append(callback)
+
+
 def clear_locale_cache() -> None:
     load_locale.cache_clear()
+    for callback in _cache_listeners:
+        callback()
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, Dict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
 
 from app.config import settings
 from app.localization.loader import (
     DEFAULT_LANGUAGE,
+    add_locale_cache_listener,
     clear_locale_cache,
     load_locale,
 )
@@ -15,6 +17,10 @@ _logger = logging.getLogger(__name__)
 
 _cached_rules: Dict[str, str] = {}
 
+# Собранные наборы текстов по языкам; сбрасываются вместе с кэшем локалей
+# и при изменении цен (см. ``clear_texts_cache``)
+_texts_cache: Dict[str, "Texts"] = {}
+
 
 def _get_cached_rules_value(language: str) -> str:
     if language in _cached_rules:
@@ -81,26 +87,36 @@ def _build_dynamic_values(language: str) -> Dict[str, Any]:
     return {}
 
 
+def _compile_values(language: str) -> Mapping[str, Any]:
+    values: Dict[str, Any] = {}
+    if language != DEFAULT_LANGUAGE:
+        values.update(load_locale(DEFAULT_LANGUAGE))
+    values.update(load_locale(language))
+    values.update(_build_dynamic_values(language))
+    return MappingProxyType(values)
+
+
 class Texts:
-    def __init__(self, language: str = DEFAULT_LANGUAGE):
-        self.language = language or DEFAULT_LANGUAGE
-        raw_data = load_locale(self.language)
-        self._values = {key: value for key, value in raw_data.items()}
+    """Неизменяемый набор текстов одного языка.
 
-        if self.language != DEFAULT_LANGUAGE:
-            fallback_data = load_locale(DEFAULT_LANGUAGE)
-        else:
-            fallback_data = self._values
+    Значения языка, запасного языка и цены собираются один раз при создании;
+    экземпляры переиспользуются через :func:`get_texts`.
+    """
 
-        self._fallback_values = {
-            key: value for key, value in fallback_data.items() if key not in self._values
-        }
+    __slots__ = ("language", "_values")
+
+    def __init__(self, language: str = DEFAULT_LANGUAGE):
+        language = language or DEFAULT_LANGUAGE
+        object.__setattr__(self, "language", language)
+        object.__setattr__(self, "_values", _compile_values(language))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Texts is read-only: {name}")
 
-        self._values.update(_build_dynamic_values(self.language))
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"Texts is read-only: {name}")
 
     def __getattr__(self, item: str) -> Any:
-        if item == "language":
-            return super().__getattribute__(item)
         try:
             return self._get_value(item)
         except KeyError as error:
@@ -127,11 +143,10 @@ class Texts:
         if item == "RULES_TEXT":
             return _get_cached_rules_value(self.language)
 
-        if item in self._values:
+        try:
             return self._values[item]
-
-        if item in self._fallback_values:
-            return self._fallback_values[item]
+        except KeyError:
+            pass
 
         _logger.warning(
             "Missing localization key '%s' for language '%s'",
@@ -154,7 +169,21 @@ class Texts:
 
 
 def get_texts(language: str = DEFAULT_LANGUAGE) -> Texts:
-    return Texts(language)
+    language = language or DEFAULT_LANGUAGE
+    texts = _texts_cache.get(language)
+    if texts is None:
+        texts = Texts(language)
+        _texts_cache[language] = texts
+    return texts
+
+
+def clear_texts_cache() -> None:
+    """Сбрасывает собранные наборы текстов (например, после смены цен)."""
+
+    _texts_cache.clear()
+
+
+add_locale_cache_listener(clear_texts_cache)
 
 
 async def get_rules_from_db(language: str = DEFAULT_LANGUAGE) -> str:
@@ -217,4 +246,5 @@ def clear_rules_cache() -> None:
 
 
 def reload_locales() -> None:
+    # Вместе с кэшем локалей сбрасываются и наборы текстов
     clear_locale_cache()
@@ -5,15 +5,17 @@ from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.types import TelegramObject, Update, Message, CallbackQuery
 from aiogram.enums import ChatMemberStatus
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database.database import get_db
 from app.database.crud.subscription import deactivate_subscription
 from app.database.crud.user import get_user_by_telegram_id
-from app.database.models import SubscriptionStatus
+from app.database.models import SubscriptionStatus, User
 from app.keyboards.inline import get_channel_sub_keyboard
 from app.localization.loader import DEFAULT_LANGUAGE
 from app.localization.texts import get_texts
+from app.middlewares.user_context import UserContext, get_user_context
 from app.utils.check_reg_process import is_registration_process
 from app.services.subscription_service import SubscriptionService
 
@@ -102,7 +104,10 @@ class ChannelCheckerMiddleware(BaseMiddleware):
                 logger.info(f"❌ Пользователь {telegram_id} не подписан на канал (статус: {member.status})")
 
                 if telegram_id:
-                    await self._deactivate_trial_subscription(telegram_id)
+                    await self._deactivate_trial_subscription(
+                        telegram_id,
+                        get_user_context(data, telegram_id),
+                    )
 
                 await self._capture_start_payload(state, event)
 
@@ -166,44 +171,27 @@ class ChannelCheckerMiddleware(BaseMiddleware):
         await state.set_data(data)
         logger.debug("💾 Сохранен start payload %s для последующей обработки", payload)
 
-    async def _deactivate_trial_subscription(self, telegram_id: int) -> None:
-        async for db in get_db():
+    async def _deactivate_trial_subscription(
+        self,
+        telegram_id: int,
+        context: Optional[UserContext] = None,
+    ) -> None:
+        if context is not None:
             try:
-                user = await get_user_by_telegram_id(db, telegram_id)
-                if not user or not user.subscription:
-                    logger.debug(
-                        "⚠️ Пользователь %s отсутствует или не имеет подписки — пропускаем деактивацию",
-                        telegram_id,
-                    )
-                    break
-
-                subscription = user.subscription
-                if (not subscription.is_trial or
-                        subscription.status != SubscriptionStatus.ACTIVE.value):
-                    logger.debug(
-                        "ℹ️ Подписка пользователя %s не требует деактивации (trial=%s, status=%s)",
-                        telegram_id,
-                        subscription.is_trial,
-                        subscription.status,
-                    )
-                    break
-
-                await deactivate_subscription(db, subscription)
-                logger.info(
-                    "🚫 Триальная подписка пользователя %s отключена после отписки от канала",
+                await self._deactivate_user_trial(context.db, context.user, telegram_id)
+            except Exception as db_error:
+                await context.db.rollback()
+                logger.error(
+                    "❌ Ошибка деактивации подписки пользователя %s после отписки: %s",
                     telegram_id,
+                    db_error,
                 )
+            return
 
-                if user.remnawave_uuid:
-                    service = SubscriptionService()
-                    try:
-                        await service.disable_remnawave_user(user.remnawave_uuid)
-                    except Exception as api_error:
-                        logger.error(
-                            "❌ Не удалось отключить пользователя RemnaWave %s: %s",
-                            user.remnawave_uuid,
-                            api_error,
-                        )
+        async for db in get_db():
+            try:
+                user = await get_user_by_telegram_id(db, telegram_id)
+                await self._deactivate_user_trial(db, user, telegram_id)
             except Exception as db_error:
                 logger.error(
                     "❌ Ошибка деактивации подписки пользователя %s после отписки: %s",
@@ -213,6 +201,43 @@ class ChannelCheckerMiddleware(BaseMiddleware):
             finally:
                 break
 
+    @staticmethod
+    async def _deactivate_user_trial(db: AsyncSession, user: Optional[User], telegram_id: int) -> None:
+        if not user or not user.subscription:
+            logger.debug(
+                "⚠️ Пользователь %s отсутствует или не имеет подписки — пропускаем деактивацию",
+                telegram_id,
+            )
+            return
+
+        subscription = user.subscription
+        if (not subscription.is_trial or
+                subscription.status != SubscriptionStatus.ACTIVE.value):
+            logger.debug(
+                "ℹ️ Подписка пользователя %s не требует деактивации (trial=%s, status=%s)",
+                telegram_id,
+                subscription.is_trial,
+                subscription.status,
+            )
+            return
+
+        await deactivate_subscription(db, subscription)
+        logger.info(
+            "🚫 Триальная подписка пользователя %s отключена после отписки от канала",
+            telegram_id,
+        )
+
+        if user.remnawave_uuid:
+            service = SubscriptionService()
+            try:
+                await service.disable_remnawave_user(user.remnawave_uuid)
+            except Exception as api_error:
+                logger.error(
+                    "❌ Не удалось отключить пользователя RemnaWave %s: %s",
+                    user.remnawave_uuid,
+                    api_error,
+                )
+
     @staticmethod
     async def _deny_message(event: TelegramObject, bot: Bot, channel_link: str):
         logger.debug("🚫 Отправляем сообщение о необходимости подписки")
@@ -1,12 +1,14 @@
 import logging
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional
 from datetime import datetime
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Update, Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.database import get_db
 from app.database.crud.user import get_user_by_telegram_id
-from app.database.models import SubscriptionStatus
+from app.database.models import SubscriptionStatus, User
+from app.middlewares.user_context import get_user_context
 
 logger = logging.getLogger(__name__)
 
@@ -30,24 +32,36 @@ class SubscriptionStatusMiddleware(BaseMiddleware):
                 telegram_id = event.callback_query.from_user.id
         
         if telegram_id:
+            context = get_user_context(data, telegram_id)
             try:
-                async for db in get_db():
-                    user = await get_user_by_telegram_id(db, telegram_id)
-                    if user and user.subscription:
-                        current_time = datetime.utcnow()
-                        subscription = user.subscription
-                        
-                        if (subscription.status == SubscriptionStatus.ACTIVE.value and 
-                            subscription.end_date <= current_time):
-                            
-                            subscription.status = SubscriptionStatus.EXPIRED.value
-                            subscription.updated_at = current_time
-                            await db.commit()
-                            
-                            logger.info(f"⏰ Middleware: Статус подписки пользователя {user.id} изменен на 'expired' (время истекло)")
-                    break
+                if context is not None:
+                    await self._expire_if_needed(context.db, context.user)
+                else:
+                    async for db in get_db():
+                        user = await get_user_by_telegram_id(db, telegram_id)
+                        await self._expire_if_needed(db, user)
+                        break
                     
             except Exception as e:
                 logger.error(f"Ошибка проверки статуса подписки для пользователя {telegram_id}: {e}")
+                if context is not None:
+                    await context.db.rollback()
         
         return await handler(event, data)
+
+    @staticmethod
+    async def _expire_if_needed(db: AsyncSession, user: Optional[User]) -> None:
+        if not user or not user.subscription:
+            return
+
+        current_time = datetime.utcnow()
+        subscription = user.subscription
+        
+        if (subscription.status == SubscriptionStatus.ACTIVE.value and 
+            subscription.end_date <= current_time):
+            
+            subscription.status = SubscriptionStatus.EXPIRED.value
+            subscription.updated_at = current_time
+            await db.commit()
+            
+            logger.info(f"⏰ Middleware: Статус подписки пользователя {user.id} изменен на 'expired' (время истекло)")
@@ -1,19 +1,28 @@
-import asyncio
 import logging
-import time
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 from aiogram.fsm.context import FSMContext
 
+from app.utils.rate_limiter import ThrottlingPolicy, create_rate_limiter
+
 logger = logging.getLogger(__name__)
 
 
 class ThrottlingMiddleware(BaseMiddleware):
     
-    def __init__(self, rate_limit: float = 0.5):
-        self.rate_limit = rate_limit
-        self.user_buckets: Dict[int, float] = {}
+    def __init__(self, limiter=None, policy: Optional[ThrottlingPolicy] = None):
+        self.limiter = limiter or create_rate_limiter()
+        self.policy = policy or ThrottlingPolicy.from_settings()
+
+    @staticmethod
+    def _describe_event(event: TelegramObject) -> Tuple[str, Optional[str]]:
+        if isinstance(event, CallbackQuery):
+            return "callback", event.data
+        if isinstance(event, Message) and event.text and event.text.startswith("/"):
+            command = event.text.split(maxsplit=1)[0]
+            return "message", command.split("@", 1)[0]
+        return "message", None
     
     async def __call__(
         self,
@@ -29,11 +38,14 @@ class ThrottlingMiddleware(BaseMiddleware):
         if not user_id:
             return await handler(event, data)
         
-        now = time.time()
-        last_call = self.user_buckets.get(user_id, 0)
+        event_type, route = self._describe_event(event)
+        bucket, rule = self.policy.resolve(event_type, route)
+        decision = await self.limiter.hit(f"{bucket}:{user_id}", rule)
         
-        if now - last_call < self.rate_limit:
-            logger.warning(f"🚫 Throttling для пользователя {user_id}")
+        if not decision.allowed:
+            logger.warning(
+                f"🚫 Throttling для пользователя {user_id} ({bucket}), повтор через {decision.retry_after:.2f}s"
+            )
 
             # Для сообщений: молчим только если это состояние работы с тикетами; иначе показываем блок
             if isinstance(event, Message):
@@ -60,13 +72,4 @@ class ThrottlingMiddleware(BaseMiddleware):
                 await event.answer("⏳ Слишком быстро! Подождите немного.", show_alert=True)
                 return
         
-        self.user_buckets[user_id] = now
-        
-        cleanup_threshold = now - 60
-        self.user_buckets = {
-            uid: timestamp 
-            for uid, timestamp in self.user_buckets.items() 
-            if timestamp > cleanup_threshold
-        }
-        
         return await handler(event, data)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Awaitable, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery, TelegramObject, User as TgUser
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.database import AsyncSessionLocal
+from app.database.crud.user import get_user_by_telegram_id
+from app.database.models import PromoGroup, Subscription, User
+from app.database.query_counter import (
+    start_query_counter,
+    stop_query_counter,
+    update_query_statistics,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UserContext:
+    """Пользователь и сессия БД, загруженные один раз на апдейт."""
+
+    telegram_id: int
+    db: AsyncSession
+    user: Optional[User]
+
+    @property
+    def subscription(self) -> Optional[Subscription]:
+        return self.user.subscription if self.user else None
+
+    @property
+    def promo_group(self) -> Optional[PromoGroup]:
+        return self.user.promo_group if self.user else None
+
+
+def get_user_context(data: Dict[str, Any], telegram_id: int) -> Optional[UserContext]:
+    context = data.get("user_context")
+    if isinstance(context, UserContext) and context.telegram_id == telegram_id:
+        return context
+    return None
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Открывает одну сессию на апдейт и загружает пользователя для остальных middleware."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+
+        user: TgUser = None
+        if isinstance(event, (Message, CallbackQuery)):
+            user = event.from_user
+
+        if not user or user.is_bot or "user_context" in data:
+            return await handler(event, data)
+
+        counter, counter_token = start_query_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                try:
+                    db_user = await get_user_by_telegram_id(db, user.id)
+                    data['db'] = db
+                    data['user_context'] = UserContext(
+                        telegram_id=user.id,
+                        db=db,
+                        user=db_user,
+                    )
+                    return await handler(event, data)
+                except Exception:
+                    await db.rollback()
+                    raise
+        finally:
+            stop_query_counter(counter_token)
+            update_query_statistics.record(counter)
+            logger.debug(
+                "🧮 Апдейт пользователя %s: %s SQL-запросов за %.3fs",
+                user.id,
+                counter.queries,
+                counter.elapsed,
+            )
@@ -0,0 +1,306 @@
+"""Фоновая очередь уведомлений в админский чат и топик тикетов.
+
+Платёжные и пользовательские сценарии только ставят уведомление в очередь и
+сразу продолжают работу; отправку выполняет пул воркеров с общим лимитом
+скорости и паузой на ``RetryAfter``. Однотипные события, пришедшие подряд
+(например, пачка пополнений), сворачиваются в одну сводку.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot, types
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from app.config import settings
+from app.services.broadcast_delivery import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_LIMIT = 4096
+_DIGEST_MAX_LINES = 30
+_DRAIN_TIMEOUT_SECONDS = 10.0
+_RETRY_BACKOFF_SECONDS = 1.0
+_RETRY_BACKOFF_MAX_SECONDS = 30.0
+
+DIGEST_TITLES: Dict[str, str] = {
+    "balance_topup": "💰 Пополнения баланса",
+    "subscription_purchase": "💎 Покупки подписок",
+    "trial_activation": "🎯 Активации триалов",
+}
+
+_CoalesceKey = Tuple[Union[int, str], Optional[int], str]
+
+
+@dataclass(slots=True)
+class AdminNotification:
+    bot: Bot
+    chat_id: Union[int, str]
+    text: str
+    thread_id: Optional[int] = None
+    reply_markup: Optional[types.InlineKeyboardMarkup] = None
+    # События с одинаковым ключом в пределах окна сворачиваются в сводку
+    coalesce_key: Optional[str] = None
+    digest_line: Optional[str] = None
+
+    def to_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "chat_id": self.chat_id,
+            "text": self.text,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True,
+        }
+        if self.thread_id:
+            kwargs["message_thread_id"] = self.thread_id
+        if self.reply_markup is not None:
+            kwargs["reply_markup"] = self.reply_markup
+        return kwargs
+
+    def summary_line(self) -> str:
+        if self.digest_line:
+            return self.digest_line
+        return next((line.strip() for line in self.text.splitlines() if line.strip()), "")
+
+
+@dataclass(slots=True)
+class _CoalesceWindow:
+    task: Optional[asyncio.Task] = None
+    pending: List[AdminNotification] = field(default_factory=list)
+
+
+def build_digest(notifications: List[AdminNotification], window_seconds: float) -> AdminNotification:
+    """Собирает одну сводку из накопленных в окне уведомлений."""
+
+    first = notifications[0]
+    if len(notifications) == 1:
+        return first
+
+    title = DIGEST_TITLES.get(first.coalesce_key or "", "🔔 Уведомления")
+    lines = [
+        f"📦 <b>Сводка: {title}</b>",
+        "",
+        f"Событий за последние {int(window_seconds)} сек.: <b>{len(notifications)}</b>",
+        "",
+    ]
+    shown = notifications[:_DIGEST_MAX_LINES]
+    lines.extend(f"• {notification.summary_line()}" for notification in shown)
+    if len(notifications) > len(shown):
+        lines.append(f"… и ещё {len(notifications) - len(shown)}")
+    lines.extend(["", f"⏰ <i>{datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</i>"])
+
+    text = "\n".join(lines)
+    while len(text) > _MESSAGE_LIMIT and len(shown) > 1:
+        # Не режем HTML посередине тега: убираем строки целиком
+        shown = shown[:-1]
+        lines = lines[: 4 + len(shown)] + [
+            f"… и ещё {len(notifications) - len(shown)}",
+            "",
+            lines[-1],
+        ]
+        text = "\n".join(lines)
+
+    return AdminNotification(
+        bot=first.bot,
+        chat_id=first.chat_id,
+        text=text,
+        thread_id=first.thread_id,
+    )
+
+
+class AdminNotificationDispatcher:
+    """Очередь админских уведомлений с ограниченным числом воркеров и сводками."""
+
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._bucket: Optional[AsyncTokenBucket] = None
+        self._windows: Dict[_CoalesceKey, _CoalesceWindow] = {}
+        self._window_seconds = 0.0
+        self._max_attempts = 1
+        self._enqueued = 0
+        self._sent = 0
+        self._failed = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._digests = 0
+        self._retries = 0
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return settings.ADMIN_NOTIFICATIONS_QUEUE_ENABLED
+
+    def is_running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    async def start(self) -> None:
+        await self.stop()
+
+        if not self.is_enabled():
+            logger.info("Очередь админских уведомлений отключена настройками")
+            return
+
+        workers = max(1, settings.ADMIN_NOTIFICATIONS_QUEUE_WORKERS)
+        self._queue = asyncio.Queue(maxsize=max(0, settings.ADMIN_NOTIFICATIONS_QUEUE_MAX_SIZE))
+        self._bucket = AsyncTokenBucket(settings.ADMIN_NOTIFICATIONS_QUEUE_RATE_PER_SECOND, burst=workers)
+        self._window_seconds = max(0.0, settings.ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS)
+        self._max_attempts = max(1, settings.ADMIN_NOTIFICATIONS_QUEUE_MAX_ATTEMPTS)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        logger.info(
+            "📣 Очередь админских уведомлений запущена: воркеров %s, окно сводок %s сек.",
+            workers,
+            self._window_seconds,
+        )
+
+    async def stop(self) -> None:
+        if not self._workers:
+            return
+
+        # Накопленные сводки отправляются до остановки, а не теряются
+        windows, self._windows = self._windows, {}
+        for window in windows.values():
+            if window.task and not window.task.done():
+                window.task.cancel()
+            if window.pending:
+                self._flush(window.pending)
+
+        if self._queue is not None and self.is_running():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=_DRAIN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Очередь админских уведомлений не успела опустеть: осталось %s",
+                    self._queue.qsize(),
+                )
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def enqueue(self, notification: AdminNotification) -> bool:
+        """Ставит уведомление в очередь без ожидания Telegram."""
+
+        if not self.is_running():
+            return False
+
+        if notification.coalesce_key and self._window_seconds > 0:
+            return self._coalesce(notification)
+        return self._put(notification)
+
+    def _put(self, notification: AdminNotification) -> bool:
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            logger.warning(
+                "Очередь админских уведомлений переполнена (%s), уведомление отброшено",
+                self._queue.maxsize,
+            )
+            return False
+        self._enqueued += 1
+        return True
+
+    def _coalesce(self, notification: AdminNotification) -> bool:
+        key = (notification.chat_id, notification.thread_id, notification.coalesce_key)
+        window = self._windows.get(key)
+        if window is not None:
+            window.pending.append(notification)
+            self._coalesced += 1
+            return True
+
+        # Первое событие серии уходит сразу, последующие копятся до конца окна
+        window = _CoalesceWindow()
+        window.task = asyncio.create_task(self._run_window(key, window))
+        self._windows[key] = window
+        return self._put(notification)
+
+    async def _run_window(self, key: _CoalesceKey, window: _CoalesceWindow) -> None:
+        while True:
+            await asyncio.sleep(self._window_seconds)
+            if self._windows.get(key) is not window:
+                return
+            if not window.pending:
+                del self._windows[key]
+                return
+
+            pending, window.pending = window.pending, []
+            self._flush(pending)
+
+    def _flush(self, pending: List[AdminNotification]) -> None:
+        if len(pending) > 1:
+            self._digests += 1
+        self._put(build_digest(pending, self._window_seconds))
+
+    async def _worker(self) -> None:
+        while True:
+            notification = await self._queue.get()
+            try:
+                await self._deliver(notification)
+            except Exception as error:
+                self._failed += 1
+                logger.error("Ошибка отправки админского уведомления: %s", error, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, notification: AdminNotification) -> bool:
+        for attempt in range(1, self._max_attempts + 1):
+            await self._bucket.acquire()
+            try:
+                await notification.bot.send_message(**notification.to_kwargs())
+                self._sent += 1
+                return True
+            except TelegramRetryAfter as error:
+                # Пауза общая: остальные воркеры тоже ждут, а не ловят новый RetryAfter
+                self._bucket.pause(error.retry_after)
+                self._retries += 1
+                logger.warning("RetryAfter %s сек. для админских уведомлений", error.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as error:
+                self._retries += 1
+                delay = min(_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), _RETRY_BACKOFF_MAX_SECONDS)
+                logger.warning("Временная ошибка отправки админского уведомления: %s", error)
+                await asyncio.sleep(delay)
+            except TelegramForbiddenError:
+                self._failed += 1
+                logger.error("Бот не имеет прав для отправки в чат %s", notification.chat_id)
+                return False
+            except TelegramBadRequest as error:
+                self._failed += 1
+                logger.error("Ошибка отправки уведомления в чат %s: %s", notification.chat_id, error)
+                return False
+
+        self._failed += 1
+        logger.error(
+            "Уведомление в чат %s не отправлено после %s попыток",
+            notification.chat_id,
+            self._max_attempts,
+        )
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running(),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "enqueued": self._enqueued,
+            "sent": self._sent,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "coalesced": self._coalesced,
+            "digests": self._digests,
+            "retries": self._retries,
+            "open_windows": len(self._windows),
+        }
+
+
+admin_notification_dispatcher = AdminNotificationDispatcher()
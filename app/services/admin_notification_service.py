@@ -19,6 +19,10 @@ from app.database.models import (
     TransactionType,
     User,
 )
+from app.services.admin_notification_dispatcher import (
+    AdminNotification,
+    admin_notification_dispatcher,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -206,7 +210,11 @@ class AdminNotificationService:
 
 ⏰ <i>{datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</i>"""
             
-            return await self._send_message(message)
+            return await self._send_message(
+                message,
+                coalesce_key="trial_activation",
+                digest_line=self._format_digest_line(user, user_status),
+            )
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о триале: {e}")
@@ -266,7 +274,16 @@ class AdminNotificationService:
 
 ⏰ <i>{datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</i>"""
             
-            return await self._send_message(message)
+            return await self._send_message(
+                message,
+                coalesce_key="subscription_purchase",
+                digest_line=self._format_digest_line(
+                    user,
+                    settings.format_price(transaction.amount_kopeks),
+                    f"{period_days} дней",
+                    payment_method,
+                ),
+            )
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о покупке: {e}")
@@ -508,7 +525,15 @@ class AdminNotificationService:
                 return False
 
         try:
-            return await self._send_message(message)
+            return await self._send_message(
+                message,
+                coalesce_key="balance_topup",
+                digest_line=self._format_digest_line(
+                    user,
+                    f"+{settings.format_price(transaction.amount_kopeks)}",
+                    self._get_payment_method_display(transaction.payment_method),
+                ),
+            )
         except Exception as e:
             logger.error(
                 f"Ошибка отправки уведомления о пополнении: {e}",
@@ -756,31 +781,41 @@ class AdminNotificationService:
             logger.error(f"Ошибка отправки уведомления о смене промогруппы: {e}")
             return False
 
-    async def _send_message(self, text: str, reply_markup: types.InlineKeyboardMarkup | None = None, *, ticket_event: bool = False) -> bool:
+    async def _send_message(
+        self,
+        text: str,
+        reply_markup: types.InlineKeyboardMarkup | None = None,
+        *,
+        ticket_event: bool = False,
+        coalesce_key: str | None = None,
+        digest_line: str | None = None,
+    ) -> bool:
         if not self.chat_id:
             logger.warning("ADMIN_NOTIFICATIONS_CHAT_ID не настроен")
             return False
-        
+
+        # route to ticket-specific topic if provided
+        thread_id = None
+        if ticket_event and self.ticket_topic_id:
+            thread_id = self.ticket_topic_id
+        elif self.topic_id:
+            thread_id = self.topic_id
+
+        notification = AdminNotification(
+            bot=self.bot,
+            chat_id=self.chat_id,
+            text=text,
+            thread_id=thread_id,
+            reply_markup=reply_markup,
+            coalesce_key=coalesce_key,
+            digest_line=digest_line,
+        )
+
+        if admin_notification_dispatcher.is_running():
+            return admin_notification_dispatcher.enqueue(notification)
+
         try:
-            message_kwargs = {
-                'chat_id': self.chat_id,
-                'text': text,
-                'parse_mode': 'HTML',
-                'disable_web_page_preview': True
-            }
-            
-            # route to ticket-specific topic if provided
-            thread_id = None
-            if ticket_event and self.ticket_topic_id:
-                thread_id = self.ticket_topic_id
-            elif self.topic_id:
-                thread_id = self.topic_id
-            if thread_id:
-                message_kwargs['message_thread_id'] = thread_id
-            if reply_markup is not None:
-                message_kwargs['reply_markup'] = reply_markup
-            
-            await self.bot.send_message(**message_kwargs)
+            await self.bot.send_message(**notification.to_kwargs())
             logger.info(f"Уведомление отправлено в чат {self.chat_id}")
             return True
             
@@ -794,6 +829,11 @@ class AdminNotificationService:
             logger.error(f"Неожиданная ошибка при отправке уведомления: {e}")
             return False
     
+    @staticmethod
+    def _format_digest_line(user: User, *details: str) -> str:
+        parts = [f"{user.full_name} (<code>{user.telegram_id}</code>)", *details]
+        return " · ".join(part for part in parts if part)
+
     def _is_enabled(self) -> bool:
         return self.enabled and bool(self.chat_id)
     
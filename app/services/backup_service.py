@@ -1,22 +1,31 @@
 import asyncio
+import hashlib
 import json as json_lib
 import logging
 import gzip
 import os
 import tempfile
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
-from dataclasses import dataclass, asdict
+from typing import IO, Awaitable, Callable, Dict, Any, Iterable, Iterator, Optional, List, Sequence, Tuple
+from dataclasses import dataclass, asdict, field
 import aiofiles
 from aiogram.types import FSInputFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, inspect
+from sqlalchemy import Integer, bindparam, select, text, inspect, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
 
 from app.config import settings
+from app.database.crud.statistics_rollup import rebuild_statistics_rollups
+from app.database.crud.subscription_squad import rebuild_subscription_squads
 from app.database.database import get_db, engine
+from app.database.user_cache import user_snapshot_cache
 from app.database.models import (
     User, Subscription, Transaction, PromoCode, PromoCodeUse,
     ReferralEarning, Squad, ServiceRule, SystemSetting, MonitoringLog,
@@ -30,11 +39,16 @@ from app.database.models import (
 
 logger = logging.getLogger(__name__)
 
+BACKUP_FORMAT_VERSION = "2.0"
+_BACKUP_FILE_PATTERNS = ("backup_*.json", "backup_*.json.gz", "backup_*.ndjson", "backup_*.ndjson.gz")
+_EXPORT_BATCH_SIZE = 1000
+_GZIP_LEVEL = 6
+
 
 @dataclass
 class BackupMetadata:
     timestamp: str
-    version: str = "1.2"
+    version: str = BACKUP_FORMAT_VERSION
     database_type: str = "postgresql"
     backup_type: str = "full"
     tables_count: int = 0
@@ -44,6 +58,322 @@ class BackupMetadata:
     created_by: Optional[int] = None
 
 
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+def _encode_line(payload: Any) -> bytes:
+    return (
+        json_lib.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+        + "\n"
+    ).encode("utf-8")
+
+
+class BackupStreamWriter:
+    """Потоковая запись бекапа в формате NDJSON.
+
+    Файл состоит из строки-заголовка, секций таблиц (строка описания с
+    колонками, затем по строке-массиву значений на запись и строка итога с
+    числом записей и SHA-256) и завершающего манифеста. Методы синхронные и
+    вызываются из рабочего потока; в памяти держится только текущая пачка.
+    """
+
+    def __init__(self, path: Path, compress: bool) -> None:
+        self.path = path
+        self.compress = compress
+        self.data_bytes = 0
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self._digest = hashlib.sha256()
+        self._raw: Optional[IO[bytes]] = None
+        self._stream: Optional[IO[bytes]] = None
+        self._table: Optional[str] = None
+        self._table_digest = None
+
+    def open(self) -> None:
+        self._raw = open(self.path, "wb")
+        if self.compress:
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=_GZIP_LEVEL)
+        else:
+            self._stream = self._raw
+
+    def _write(self, line: bytes) -> None:
+        self._stream.write(line)
+        self._digest.update(line)
+        self.data_bytes += len(line)
+
+    def write_object(self, payload: Dict[str, Any]) -> None:
+        self._write(_encode_line(payload))
+
+    def begin_table(self, name: str, kind: str, columns: Sequence[str]) -> None:
+        self._table = name
+        self._table_digest = hashlib.sha256()
+        self.tables[name] = {"kind": kind, "records": 0, "sha256": None}
+        self.write_object({"type": "table", "name": name, "kind": kind, "columns": list(columns)})
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> int:
+        written = 0
+        for row in rows:
+            line = _encode_line(list(row))
+            self._table_digest.update(line)
+            self._write(line)
+            written += 1
+        self.tables[self._table]["records"] += written
+        return written
+
+    def end_table(self) -> None:
+        info = self.tables[self._table]
+        info["sha256"] = self._table_digest.hexdigest()
+        self.write_object({"type": "table_end", "name": self._table, **info})
+        self._table = None
+        self._table_digest = None
+
+    def write_manifest(self, metadata: Dict[str, Any]) -> None:
+        manifest = {
+            "type": "manifest",
+            "metadata": metadata,
+            "tables": self.tables,
+            "data_bytes": self.data_bytes,
+            "sha256": self._digest.hexdigest(),
+        }
+        self._stream.write(_encode_line(manifest))
+
+    def close(self) -> None:
+        if self._stream is not None and self._stream is not self._raw:
+            self._stream.close()
+        if self._raw is not None:
+            self._raw.close()
+        self._stream = None
+        self._raw = None
+
+
+class BackupFormatError(ValueError):
+    """Файл бекапа повреждён или не соответствует формату."""
+
+
+def _open_backup(path: Path) -> IO[bytes]:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _is_stream_backup(path: Path) -> bool:
+    with _open_backup(path) as handle:
+        first_line = handle.readline().strip()
+    if not first_line:
+        return False
+    try:
+        header = json_lib.loads(first_line)
+    except ValueError:
+        return False
+    return isinstance(header, dict) and header.get("type") == "header"
+
+
+def read_backup_structure(path: Path) -> Dict[str, Any]:
+    """Читает бекап любого формата в структуру ``metadata/data/associations/files``.
+
+    Для потокового формата проверяются число записей и контрольные суммы
+    каждой таблицы.
+    """
+
+    if not _is_stream_backup(path):
+        with _open_backup(path) as handle:
+            return json_lib.loads(handle.read().decode("utf-8"))
+
+    structure: Dict[str, Any] = {"metadata": {}, "data": {}, "associations": {}, "files": {}, "config": {}}
+    table: Optional[Dict[str, Any]] = None
+    manifest: Optional[Dict[str, Any]] = None
+
+    with _open_backup(path) as handle:
+        for line in handle:
+            if table is not None and line.startswith(b"["):
+                table["digest"].update(line)
+                table["records"].append(dict(zip(table["columns"], json_lib.loads(line))))
+                continue
+
+            if not line.strip():
+                continue
+
+            entry = json_lib.loads(line)
+            entry_type = entry.get("type")
+
+            if entry_type == "header":
+                structure["metadata"] = entry.get("metadata", {})
+            elif entry_type == "table":
+                target = "associations" if entry.get("kind") == "association" else "data"
+                records: List[Dict[str, Any]] = []
+                structure[target][entry["name"]] = records
+                table = {
+                    "name": entry["name"],
+                    "columns": entry["columns"],
+                    "records": records,
+                    "digest": hashlib.sha256(),
+                }
+            elif entry_type == "table_end":
+                if table is None or entry.get("name") != table["name"]:
+                    raise BackupFormatError(f"Неожиданный конец таблицы {entry.get('name')}")
+                if entry.get("records") != len(table["records"]) or (
+                    entry.get("sha256") != table["digest"].hexdigest()
+                ):
+                    raise BackupFormatError(f"Контрольная сумма таблицы {table['name']} не совпадает")
+                table = None
+            elif entry_type == "files":
+                structure["files"] = entry.get("files", {})
+            elif entry_type == "config":
+                structure["config"] = entry.get("config", {})
+            elif entry_type == "manifest":
+                manifest = entry
+
+    if manifest is None:
+        raise BackupFormatError("Бекап не завершён: отсутствует манифест")
+
+    structure["metadata"] = manifest.get("metadata", structure["metadata"])
+    return structure
+
+
+def read_backup_metadata(path: Path) -> Dict[str, Any]:
+    """Метаданные бекапа без загрузки данных таблиц в память."""
+
+    if not _is_stream_backup(path):
+        return read_backup_structure(path).get("metadata", {})
+
+    metadata: Dict[str, Any] = {}
+    with _open_backup(path) as handle:
+        for line in handle:
+            if not line.startswith(b"{"):
+                continue
+            entry = json_lib.loads(line)
+            if entry.get("type") == "header" and not metadata:
+                metadata = entry.get("metadata", {})
+            elif entry.get("type") == "manifest":
+                metadata = entry.get("metadata", metadata)
+    return metadata
+
+
+BackupChunk = Tuple[str, Optional[str], Any]
+
+
+def _iter_stream_backup(path: Path, batch_size: int) -> Iterator[BackupChunk]:
+    table: Optional[Dict[str, Any]] = None
+    batch: List[Dict[str, Any]] = []
+    manifest_seen = False
+
+    with _open_backup(path) as handle:
+        for line in handle:
+            if table is not None and line.startswith(b"["):
+                table["digest"].update(line)
+                table["records"] += 1
+                batch.append(dict(zip(table["columns"], json_lib.loads(line))))
+                if len(batch) >= batch_size:
+                    yield table["kind"], table["name"], batch
+                    batch = []
+                continue
+
+            if not line.strip():
+                continue
+
+            entry = json_lib.loads(line)
+            entry_type = entry.get("type")
+
+            if entry_type == "table":
+                table = {
+                    "name": entry["name"],
+                    "kind": entry.get("kind", "data"),
+                    "columns": entry["columns"],
+                    "records": 0,
+                    "digest": hashlib.sha256(),
+                }
+            elif entry_type == "table_end":
+                if table is None or entry.get("name") != table["name"]:
+                    raise BackupFormatError(f"Неожиданный конец таблицы {entry.get('name')}")
+                if entry.get("records") != table["records"] or (
+                    entry.get("sha256") != table["digest"].hexdigest()
+                ):
+                    raise BackupFormatError(f"Контрольная сумма таблицы {table['name']} не совпадает")
+                if batch:
+                    yield table["kind"], table["name"], batch
+                    batch = []
+                table = None
+            elif entry_type == "files":
+                yield "files", None, entry.get("files", {})
+            elif entry_type == "manifest":
+                manifest_seen = True
+
+    if not manifest_seen:
+        raise BackupFormatError("Бекап не завершён: отсутствует манифест")
+
+
+def iter_backup_records(
+    path: Path,
+    batch_size: int,
+    table_order: Sequence[str] = (),
+) -> Iterator[BackupChunk]:
+    """Отдаёт содержимое бекапа порциями ``(раздел, таблица, данные)``.
+
+    Первой идёт пара ``("metadata", None, метаданные)`` с итоговым числом
+    записей, затем пачки ``("data" | "association", таблица, записи)`` и
+    ``("files", None, снимки)``. Потоковый формат читается построчно с
+    проверкой контрольных сумм; старый JSON загружается целиком, а его таблицы
+    выдаются в порядке ``table_order``.
+    """
+
+    if _is_stream_backup(path):
+        yield "metadata", None, read_backup_metadata(path)
+        yield from _iter_stream_backup(path, batch_size)
+        return
+
+    structure = read_backup_structure(path)
+    data = structure.get("data", {})
+    metadata = dict(structure.get("metadata", {}))
+    metadata.setdefault("total_records", sum(len(records) for records in data.values()))
+    yield "metadata", None, metadata
+
+    ordered = [name for name in dict.fromkeys(table_order) if name in data]
+    ordered.extend(name for name in data if name not in ordered)
+    for section, tables, names in (
+        ("data", data, ordered),
+        ("association", structure.get("associations", {}), None),
+    ):
+        for name in names or list(tables):
+            records = tables.get(name) or []
+            for offset in range(0, len(records), batch_size):
+                yield section, name, records[offset:offset + batch_size]
+
+    if structure.get("files"):
+        yield "files", None, structure["files"]
+
+
+@dataclass
+class RestoreProgress:
+    total: int
+    done: int = 0
+    table: Optional[str] = None
+    tables_done: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started_at, 0.0)
+
+    @property
+    def records_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+
+RestoreProgressCallback = Callable[[RestoreProgress], Awaitable[None]]
+
+
+@lru_cache(maxsize=None)
+def _column_type_name(column) -> str:
+    return str(column.type).upper()
+
+
 @dataclass
 class BackupSettings:
     auto_backup_enabled: bool = True
@@ -178,114 +508,66 @@ class BackupService:
             elif include_logs and MonitoringLog not in models_to_backup:
                 models_to_backup.append(MonitoringLog)
             
-            backup_data = {}
-            association_data = {}
-            total_records = 0
-            
-            async for db in get_db():
-                try:
-                    for model in models_to_backup:
-                        table_name = model.__tablename__
-                        logger.info(f"📊 Экспортируем таблицу: {table_name}")
-                        
-                        query = select(model)
-                        
-                        if model == User:
-                            query = query.options(selectinload(User.subscription))
-                        elif model == Subscription:
-                            query = query.options(selectinload(Subscription.user))
-                        elif model == Transaction:
-                            query = query.options(selectinload(Transaction.user))
-                        
-                        result = await db.execute(query)
-                        records = result.scalars().all()
-                        
-                        table_data = []
-                        for record in records:
-                            record_dict = {}
-                            for column in model.__table__.columns:
-                                value = getattr(record, column.name)
-                                
-                                if value is None:
-                                    record_dict[column.name] = None
-                                elif isinstance(value, datetime):
-                                    record_dict[column.name] = value.isoformat()
-                                elif isinstance(value, (list, dict)):
-                                    record_dict[column.name] = json_lib.dumps(value) if value else None
-                                elif hasattr(value, '__dict__'):
-                                    record_dict[column.name] = str(value)
-                                else:
-                                    record_dict[column.name] = value
-                            
-                            table_data.append(record_dict)
-                        
-                        backup_data[table_name] = table_data
-                        total_records += len(table_data)
-                        
-                        logger.info(f"✅ Экспортировано {len(table_data)} записей из {table_name}")
-
-                    association_data = await self._export_association_tables(db)
-                    for records in association_data.values():
-                        total_records += len(records)
+            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            filename = f"backup_{timestamp}.ndjson"
+            if compress:
+                filename += ".gz"
+
+            backup_path = self.backup_dir / filename
+            partial_path = backup_path.with_name(backup_path.name + ".partial")
 
-                    break
-                except Exception as e:
-                    logger.error(f"Ошибка при экспорте данных: {e}")
-                    raise e
-                finally:
-                    await db.close()
-            
             metadata = BackupMetadata(
                 timestamp=datetime.utcnow().isoformat(),
                 database_type="postgresql" if settings.is_postgresql() else "sqlite",
                 backup_type="full",
-                tables_count=len(models_to_backup) + len(association_data),
-                total_records=total_records,
                 compressed=compress,
                 created_by=created_by,
-                file_size_bytes=0
             )
-            
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            filename = f"backup_{timestamp}.json"
-            if compress:
-                filename += ".gz"
-            
-            backup_path = self.backup_dir / filename
 
-            file_snapshots = await self._collect_file_snapshots()
+            writer = BackupStreamWriter(partial_path, compress)
+            await asyncio.to_thread(writer.open)
 
-            backup_structure = {
-                "metadata": asdict(metadata),
-                "data": backup_data,
-                "associations": association_data,
-                "files": file_snapshots,
-                "config": {
-                    "backup_settings": asdict(self._settings)
-                }
-            }
-            
-            if compress:
-                backup_json_str = json_lib.dumps(backup_structure, ensure_ascii=False, indent=2)
-                async with aiofiles.open(backup_path, 'wb') as f:
-                    compressed_data = gzip.compress(backup_json_str.encode('utf-8'))
-                    await f.write(compressed_data)
-            else:
-                async with aiofiles.open(backup_path, 'w', encoding='utf-8') as f:
-                    await f.write(json_lib.dumps(backup_structure, ensure_ascii=False, indent=2))
-            
+            try:
+                await asyncio.to_thread(writer.write_object, {"type": "header", "metadata": asdict(metadata)})
+
+                async for db in get_db():
+                    try:
+                        for model in models_to_backup:
+                            await self._export_table(db, writer, model.__tablename__, model.__table__, "data")
+
+                        for table_name, table_obj in self.association_tables.items():
+                            await self._export_table(db, writer, table_name, table_obj, "association")
+
+                        break
+                    except Exception as e:
+                        logger.error(f"Ошибка при экспорте данных: {e}")
+                        raise e
+                    finally:
+                        await db.close()
+
+                file_snapshots = await self._collect_file_snapshots()
+                await asyncio.to_thread(writer.write_object, {"type": "files", "files": file_snapshots})
+                await asyncio.to_thread(
+                    writer.write_object,
+                    {"type": "config", "config": {"backup_settings": asdict(self._settings)}},
+                )
+
+                total_records = sum(info["records"] for info in writer.tables.values())
+                metadata.tables_count = len(writer.tables)
+                metadata.total_records = total_records
+                # Размер несжатых данных до манифеста; размер файла берётся из ФС
+                metadata.file_size_bytes = writer.data_bytes
+
+                await asyncio.to_thread(writer.write_manifest, asdict(metadata))
+            except BaseException:
+                await asyncio.to_thread(writer.close)
+                partial_path.unlink(missing_ok=True)
+                raise
+
+            await asyncio.to_thread(writer.close)
+            os.replace(partial_path, backup_path)
             file_size = backup_path.stat().st_size
-            backup_structure["metadata"]["file_size_bytes"] = file_size
-            
-            if compress:
-                backup_json_str = json_lib.dumps(backup_structure, ensure_ascii=False, indent=2)
-                async with aiofiles.open(backup_path, 'wb') as f:
-                    compressed_data = gzip.compress(backup_json_str.encode('utf-8'))
-                    await f.write(compressed_data)
-            else:
-                async with aiofiles.open(backup_path, 'w', encoding='utf-8') as f:
-                    await f.write(json_lib.dumps(backup_structure, ensure_ascii=False, indent=2))
-            
+
             await self._cleanup_old_backups()
             
             size_mb = file_size / 1024 / 1024
@@ -318,7 +600,8 @@ class BackupService:
     async def restore_backup(
         self, 
         backup_file_path: str,
-        clear_existing: bool = False
+        clear_existing: bool = False,
+        progress: Optional[RestoreProgressCallback] = None,
     ) -> Tuple[bool, str]:
         try:
             logger.info(f"📄 Начинаем восстановление из {backup_file_path}")
@@ -326,87 +609,91 @@ class BackupService:
             backup_path = Path(backup_file_path)
             if not backup_path.exists():
                 return False, f"❌ Файл бекапа не найден: {backup_file_path}"
-            
-            if backup_path.suffix == '.gz':
-                async with aiofiles.open(backup_path, 'rb') as f:
-                    compressed_data = await f.read()
-                    uncompressed_data = gzip.decompress(compressed_data).decode('utf-8')
-                    backup_structure = json_lib.loads(uncompressed_data)
-            else:
-                async with aiofiles.open(backup_path, 'r', encoding='utf-8') as f:
-                    file_content = await f.read()
-                    backup_structure = json_lib.loads(file_content)
-            
-            metadata = backup_structure.get("metadata", {})
-            backup_data = backup_structure.get("data", {})
-            association_data = backup_structure.get("associations", {})
-            file_snapshots = backup_structure.get("files", {})
-            
-            if not backup_data:
+
+            models_by_table = {model.__tablename__: model for model in self.backup_models_ordered}
+            # Старый формат хранит таблицы без порядка: промогруппы и пользователи идут первыми
+            table_order = ["promo_groups", "users", *models_by_table]
+            chunks = iter_backup_records(
+                backup_path,
+                max(1, settings.BACKUP_RESTORE_BATCH_SIZE),
+                table_order,
+            )
+
+            _, _, metadata = await asyncio.to_thread(next, chunks)
+            total_records = int(metadata.get("total_records") or 0)
+            if not total_records:
                 return False, "❌ Файл бекапа не содержит данных"
             
             logger.info(f"📊 Загружен бекап от {metadata.get('timestamp')}")
-            logger.info(f"📈 Содержит {metadata.get('total_records', 0)} записей")
+            logger.info(f"📈 Содержит {total_records} записей")
             
             restored_records = 0
-            restored_tables = 0
+            restored_tables = set()
+            file_snapshots = {}
+            report = RestoreProgress(total=total_records)
+            last_report_at = 0.0
             
             async for db in get_db():
                 try:
+                    dialect_name = db.get_bind().dialect.name
+                    await self._defer_constraints(db, dialect_name)
+
                     if clear_existing:
                         logger.warning("🗑️ Очищаем существующие данные...")
                         await self._clear_database_tables(db)
-                    
-                    models_by_table = {model.__tablename__: model for model in self.backup_models_ordered}
 
-                    pre_restore_tables = {"promo_groups"}
-                    for table_name in pre_restore_tables:
-                        model = models_by_table.get(table_name)
-                        if not model:
-                            continue
+                    referrals: Dict[int, int] = {}
 
-                        records = backup_data.get(table_name, [])
-                        if not records:
-                            continue
+                    while True:
+                        chunk = await asyncio.to_thread(next, chunks, None)
+                        if chunk is None:
+                            break
 
-                        logger.info(f"🔥 Восстанавливаем таблицу {table_name} ({len(records)} записей)")
-                        restored = await self._restore_table_records(db, model, table_name, records, clear_existing)
-                        restored_records += restored
-
-                        if restored:
-                            restored_tables += 1
-                            logger.info(f"✅ Таблица {table_name} восстановлена")
-
-                    await self._restore_users_without_referrals(db, backup_data, models_by_table)
-
-                    for model in self.backup_models_ordered:
-                        table_name = model.__tablename__
-
-                        if table_name == "users" or table_name in pre_restore_tables:
+                        section, table_name, payload = chunk
+                        if section == "files":
+                            file_snapshots = payload
                             continue
 
-                        records = backup_data.get(table_name, [])
-                        if not records:
+                        if section == "association":
+                            _, restored = await self._restore_association_tables(
+                                db,
+                                {table_name: payload},
+                                clear_existing
+                            )
+                        elif table_name in models_by_table:
+                            if table_name == "users":
+                                payload = self._detach_user_referrals(payload, referrals)
+                            restored = await self._restore_table_records(
+                                db, models_by_table[table_name], table_name, payload, clear_existing
+                            )
+                        else:
+                            logger.debug(f"Таблица {table_name} не восстанавливается")
                             continue
 
-                        logger.info(f"🔥 Восстанавливаем таблицу {table_name} ({len(records)} записей)")
-                        restored = await self._restore_table_records(db, model, table_name, records, clear_existing)
                         restored_records += restored
+                        if restored and table_name not in restored_tables:
+                            restored_tables.add(table_name)
+                            logger.info(f"🔥 Восстанавливаем таблицу {table_name}")
 
-                        if restored:
-                            restored_tables += 1
-                            logger.info(f"✅ Таблица {table_name} восстановлена")
+                        report.done += len(payload)
+                        report.table = table_name
+                        report.tables_done = len(restored_tables)
+                        now = time.monotonic()
+                        if progress and now - last_report_at >= settings.BACKUP_RESTORE_PROGRESS_INTERVAL_SECONDS:
+                            last_report_at = now
+                            await self._report_restore_progress(progress, report)
 
-                    await self._update_user_referrals(db, backup_data)
+                    if not restored_tables:
+                        raise BackupFormatError("Файл бекапа не содержит данных")
 
-                    assoc_tables, assoc_records = await self._restore_association_tables(
-                        db,
-                        association_data,
-                        clear_existing
-                    )
-                    restored_tables += assoc_tables
-                    restored_records += assoc_records
+                    await self._update_user_referrals(db, referrals)
+
+                    # Корзины статистики не входят в бекап и пересчитываются по восстановленной истории
+                    await rebuild_statistics_rollups(db)
+                    await self._resync_sequences(db, dialect_name, restored_tables)
 
+                    # Записи шли мимо ORM, поэтому членство в сквадах строим заново; функция коммитит
+                    await rebuild_subscription_squads(db)
                     await db.commit()
                     
                     break
@@ -417,10 +704,16 @@ class BackupService:
                     raise e
                 finally:
                     await db.close()
-            
+
+            await user_snapshot_cache.invalidate_all()
+            if progress:
+                await self._report_restore_progress(progress, report)
+
             message = (f"✅ Восстановление завершено!\n"
-                      f"📊 Таблиц: {restored_tables}\n"
+                      f"📊 Таблиц: {len(restored_tables)}\n"
                       f"📈 Записей: {restored_records:,}\n"
+                      f"⚡ Скорость: {report.records_per_second:,.0f} записей/с "
+                      f"({report.elapsed:.1f} с)\n"
                       f"📅 Дата бекапа: {metadata.get('timestamp', 'неизвестно')}")
             
             logger.info(message)
@@ -444,82 +737,102 @@ class BackupService:
             
             return False, error_msg
 
-    async def _restore_users_without_referrals(self, db: AsyncSession, backup_data: dict, models_by_table: dict):
-        users_data = backup_data.get("users", [])
-        if not users_data:
-            return
-        
-        logger.info(f"👥 Восстанавливаем {len(users_data)} пользователей без реферальных связей")
-        
-        User = models_by_table["users"]
-        
-        for user_data in users_data:
-            try:
-                processed_data = self._process_record_data(user_data, User, "users")
-                processed_data['referred_by_id'] = None 
-                
-                if 'id' in processed_data:
-                    existing_user = await db.execute(
-                        select(User).where(User.id == processed_data['id'])
-                    )
-                    existing = existing_user.scalar_one_or_none()
-                    
-                    if existing:
-                        for key, value in processed_data.items():
-                            if key != 'id':
-                                setattr(existing, key, value)
-                    else:
-                        instance = User(**processed_data)
-                        db.add(instance)
-                else:
-                    instance = User(**processed_data)
-                    db.add(instance)
-                
-            except Exception as e:
-                logger.error(f"Ошибка при восстановлении пользователя: {e}")
-                await db.rollback()
-                raise e
-        
-        await db.commit()
-        logger.info("✅ Пользователи без реферальных связей восстановлены")
+    @staticmethod
+    async def _report_restore_progress(
+        progress: RestoreProgressCallback,
+        report: RestoreProgress,
+    ) -> None:
+        try:
+            await progress(report)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс восстановления: {e}")
+
+    async def _defer_constraints(self, db: AsyncSession, dialect_name: str) -> None:
+        """Откладывает проверку внешних ключей до коммита, где это поддерживается.
+
+        В PostgreSQL это касается только DEFERRABLE-ограничений, остальные
+        соблюдаются порядком таблиц в бекапе.
+        """
 
-    async def _update_user_referrals(self, db: AsyncSession, backup_data: dict):
-        users_data = backup_data.get("users", [])
-        if not users_data:
+        if dialect_name == "postgresql":
+            await db.execute(text("SET CONSTRAINTS ALL DEFERRED"))
+        elif dialect_name == "sqlite":
+            await db.execute(text("PRAGMA defer_foreign_keys = ON"))
+
+    @staticmethod
+    def _detach_user_referrals(
+        records: List[Dict[str, Any]],
+        referrals: Dict[int, int],
+    ) -> List[Dict[str, Any]]:
+        """Убирает ссылки на реферера: пользователи ссылаются друг на друга и
+        восстанавливаются без них, а связи проставляются в конце."""
+
+        detached = []
+        for record in records:
+            referred_by_id = record.get("referred_by_id")
+            if referred_by_id and record.get("id"):
+                referrals[record["id"]] = referred_by_id
+            detached.append({**record, "referred_by_id": None})
+        return detached
+
+    async def _update_user_referrals(self, db: AsyncSession, referrals: Dict[int, int]):
+        if not referrals:
             return
         
         logger.info("🔗 Обновляем реферальные связи пользователей")
-        
-        for user_data in users_data:
-            try:
-                referred_by_id = user_data.get('referred_by_id')
-                user_id = user_data.get('id')
-                
-                if referred_by_id and user_id:
-                    referrer_result = await db.execute(
-                        select(User).where(User.id == referred_by_id)
-                    )
-                    referrer = referrer_result.scalar_one_or_none()
-                    
-                    if referrer:
-                        user_result = await db.execute(
-                            select(User).where(User.id == user_id)
-                        )
-                        user = user_result.scalar_one_or_none()
-                        
-                        if user:
-                            user.referred_by_id = referred_by_id
-                        else:
-                            logger.warning(f"Пользователь {user_id} не найден для обновления реферальной связи")
-                    else:
-                        logger.warning(f"Реферер {referred_by_id} не найден для пользователя {user_id}")
-                        
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении реферальной связи: {e}")
+
+        batch_size = max(1, settings.BACKUP_RESTORE_BATCH_SIZE)
+        referrer_ids = list(set(referrals.values()))
+        existing: set = set()
+        for offset in range(0, len(referrer_ids), batch_size):
+            result = await db.execute(
+                select(User.id).where(User.id.in_(referrer_ids[offset:offset + batch_size]))
+            )
+            existing.update(result.scalars().all())
+
+        rows = []
+        for user_id, referred_by_id in referrals.items():
+            if referred_by_id in existing:
+                rows.append({"b_user_id": user_id, "b_referred_by_id": referred_by_id})
+            else:
+                logger.warning(f"Реферер {referred_by_id} не найден для пользователя {user_id}")
+
+        users_table = User.__table__
+        statement = (
+            update(users_table)
+            .where(users_table.c.id == bindparam("b_user_id"))
+            .values(referred_by_id=bindparam("b_referred_by_id"))
+        )
+        for offset in range(0, len(rows), batch_size):
+            await db.execute(statement, rows[offset:offset + batch_size])
+
+        logger.info(f"✅ Реферальные связи обновлены: {len(rows)}")
+
+    async def _resync_sequences(self, db: AsyncSession, dialect_name: str, table_names: Iterable[str]) -> None:
+        """Сдвигает последовательности PostgreSQL за максимальный восстановленный id."""
+
+        if dialect_name != "postgresql":
+            return
+
+        for table_name in table_names:
+            table = Base.metadata.tables.get(table_name)
+            if table is None:
                 continue
-        
-        await db.commit()
-        logger.info("✅ Реферальные связи обновлены")
+            primary_key = list(table.primary_key.columns)
+            if (
+                len(primary_key) != 1
+                or not isinstance(primary_key[0].type, Integer)
+                or primary_key[0].autoincrement is False
+            ):
+                continue
+            column = primary_key[0].name
+            await db.execute(
+                text(
+                    f'SELECT setval(pg_get_serial_sequence(:table_name, :column_name), '
+                    f'COALESCE(MAX("{column}"), 0) + 1, false) FROM "{table_name}"'
+                ),
+                {"table_name": table_name, "column_name": column},
+            )
 
     def _process_record_data(self, record_data: dict, model, table_name: str) -> dict:
         processed_data = {}
@@ -534,7 +847,7 @@ class BackupService:
                 logger.warning(f"Колонка {key} не найдена в модели {table_name}")
                 continue
             
-            column_type_str = str(column.type).upper()
+            column_type_str = _column_type_name(column)
             
             if ('DATETIME' in column_type_str or 'TIMESTAMP' in column_type_str) and isinstance(value, str):
                 try:
@@ -578,22 +891,33 @@ class BackupService:
                 return col.name
         return None
 
-    async def _export_association_tables(self, db: AsyncSession) -> Dict[str, List[Dict[str, Any]]]:
-        association_data: Dict[str, List[Dict[str, Any]]] = {}
+    async def _export_table(
+        self,
+        db: AsyncSession,
+        writer: BackupStreamWriter,
+        table_name: str,
+        table,
+        kind: str,
+    ) -> int:
+        """Выгружает таблицу пачками через серверный курсор, не держа её целиком в памяти."""
 
-        for table_name, table_obj in self.association_tables.items():
-            try:
-                logger.info(f"📊 Экспортируем таблицу связей: {table_name}")
-                result = await db.execute(select(table_obj))
-                rows = result.mappings().all()
-                association_data[table_name] = [dict(row) for row in rows]
-                logger.info(
-                    f"✅ Экспортировано {len(rows)} связей из {table_name}"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка экспорта таблицы связей {table_name}: {e}")
+        logger.info(f"📊 Экспортируем таблицу: {table_name}")
+        columns = list(table.columns)
+        query = select(*columns).execution_options(yield_per=_EXPORT_BATCH_SIZE)
+        primary_key = [column for column in columns if column.primary_key]
+        if primary_key:
+            query = query.order_by(*primary_key)
+
+        await asyncio.to_thread(writer.begin_table, table_name, kind, [column.name for column in columns])
 
-        return association_data
+        exported = 0
+        result = await db.stream(query)
+        async for rows in result.partitions(_EXPORT_BATCH_SIZE):
+            exported += await asyncio.to_thread(writer.write_rows, [tuple(row) for row in rows])
+
+        await asyncio.to_thread(writer.end_table)
+        logger.info(f"✅ Экспортировано {exported} записей из {table_name}")
+        return exported
 
     async def _restore_association_tables(
         self,
@@ -627,11 +951,7 @@ class BackupService:
         if not records:
             return 0
 
-        if clear_existing:
-            await db.execute(server_squad_promo_groups.delete())
-
-        restored = 0
-
+        rows = []
         for record in records:
             server_id = record.get("server_squad_id")
             promo_id = record.get("promo_group_id")
@@ -643,31 +963,21 @@ class BackupService:
                 )
                 continue
 
-            try:
-                await db.execute(
-                    server_squad_promo_groups.insert().values(
-                        server_squad_id=server_id,
-                        promo_group_id=promo_id
-                    )
-                )
-                restored += 1
-            except IntegrityError:
-                logger.debug(
-                    "Запись server_squad_promo_groups (%s, %s) уже существует",
-                    server_id,
-                    promo_id
-                )
-            except Exception as e:
-                logger.error(
-                    "Ошибка при восстановлении связи server_squad_promo_groups (%s, %s): %s",
-                    server_id,
-                    promo_id,
-                    e
-                )
-                await db.rollback()
-                raise e
+            rows.append({"server_squad_id": server_id, "promo_group_id": promo_id})
 
-        return restored
+        if not rows:
+            return 0
+
+        # Таблица очищается вместе с остальными в _clear_database_tables
+        statement = self._insert_statement(db, server_squad_promo_groups).on_conflict_do_nothing()
+        await db.execute(statement, rows)
+        return len(rows)
+
+    @staticmethod
+    def _insert_statement(db: AsyncSession, table):
+        if db.get_bind().dialect.name == "postgresql":
+            return postgresql_insert(table)
+        return sqlite_insert(table)
 
     async def _restore_table_records(
         self,
@@ -677,41 +987,41 @@ class BackupService:
         records: List[Dict[str, Any]],
         clear_existing: bool
     ) -> int:
-        restored_count = 0
+        """Пишет пачку записей одним INSERT на каждый набор колонок.
 
-        for record_data in records:
-            try:
-                processed_data = self._process_record_data(record_data, model, table_name)
+        Без очистки существующие записи обновляются через ON CONFLICT по
+        первичному ключу, после очистки таблица пуста и хватает обычной вставки.
+        """
 
-                primary_key_col = self._get_primary_key_column(model)
+        table = model.__table__
+        primary_key = [column.name for column in table.primary_key.columns]
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
 
-                if primary_key_col and primary_key_col in processed_data:
-                    existing_record = await db.execute(
-                        select(model).where(
-                            getattr(model, primary_key_col) == processed_data[primary_key_col]
-                        )
-                    )
-                    existing = existing_record.scalar_one_or_none()
+        for record_data in records:
+            processed_data = self._process_record_data(record_data, model, table_name)
+            groups.setdefault(tuple(processed_data), []).append(processed_data)
 
-                    if existing and not clear_existing:
-                        for key, value in processed_data.items():
-                            if key != primary_key_col:
-                                setattr(existing, key, value)
-                    else:
-                        instance = model(**processed_data)
-                        db.add(instance)
+        restored_count = 0
+        for columns, rows in groups.items():
+            statement = self._insert_statement(db, table)
+            if not clear_existing and primary_key and set(primary_key) <= set(columns):
+                update_columns = [name for name in columns if name not in primary_key]
+                if update_columns:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=primary_key,
+                        set_={name: statement.excluded[name] for name in update_columns},
+                    )
                 else:
-                    instance = model(**processed_data)
-                    db.add(instance)
-
-                restored_count += 1
+                    statement = statement.on_conflict_do_nothing(index_elements=primary_key)
 
+            try:
+                await db.execute(statement, rows)
             except Exception as e:
-                logger.error(f"Ошибка восстановления записи в {table_name}: {e}")
-                logger.error(f"Проблемные данные: {record_data}")
-                await db.rollback()
+                logger.error(f"Ошибка восстановления пачки из {len(rows)} записей в {table_name}: {e}")
                 raise e
 
+            restored_count += len(rows)
+
         return restored_count
 
     async def _clear_database_tables(self, db: AsyncSession):
@@ -719,7 +1029,7 @@ class BackupService:
             "server_squad_promo_groups",
             "ticket_messages", "tickets", "support_audit_logs",
             "advertising_campaign_registrations", "advertising_campaigns",
-            "subscription_servers", "sent_notifications",
+            "subscription_servers", "subscription_squads", "sent_notifications",
             "discount_offers", "user_messages", "broadcast_history", "subscription_conversions",
             "referral_earnings", "promocode_uses",
             "yookassa_payments", "cryptobot_payments",
@@ -792,16 +1102,12 @@ class BackupService:
         backups = []
         
         try:
-            for backup_file in sorted(self.backup_dir.glob("backup_*.json*"), reverse=True):
+            backup_files = {
+                path for pattern in _BACKUP_FILE_PATTERNS for path in self.backup_dir.glob(pattern)
+            }
+            for backup_file in sorted(backup_files, reverse=True):
                 try:
-                    if backup_file.suffix == '.gz':
-                        with gzip.open(backup_file, 'rt', encoding='utf-8') as f:
-                            backup_structure = json_lib.load(f)
-                    else:
-                        with open(backup_file, 'r', encoding='utf-8') as f:
-                            backup_structure = json_lib.load(f)
-                    
-                    metadata = backup_structure.get("metadata", {})
+                    metadata = await asyncio.to_thread(read_backup_metadata, backup_file)
                     file_stats = backup_file.stat()
                     
                     backup_info = {
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+_UNREACHABLE_MARKERS = (
+    "chat not found",
+    "user is deactivated",
+    "bot was blocked by the user",
+    "bot can't initiate conversation",
+    "can't initiate conversation",
+    "user not found",
+    "peer id invalid",
+)
+
+
+def is_unreachable_error(error: Exception) -> bool:
+    """Ошибки, после которых повторять отправку этому пользователю бессмысленно."""
+
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        message = str(error).lower()
+        return any(marker in message for marker in _UNREACHABLE_MARKERS)
+    return False
+
+
+class DeliveryStatus(str, Enum):
+    SENT = "sent"
+    BLOCKED = "blocked"
+    FAILED = "failed"
+
+
+@dataclass(slots=True, frozen=True)
+class BroadcastRecipient:
+    user_id: int
+    telegram_id: int
+
+
+@dataclass(slots=True)
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    cancelled: bool = False
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 0.0)
+
+    @property
+    def messages_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+
+@dataclass(slots=True)
+class DeliveryCheckpoint:
+    stats: DeliveryStats
+    # Все получатели с user_id <= watermark уже обработаны
+    watermark: Optional[int]
+    blocked_user_ids: list[int]
+
+
+class AsyncTokenBucket:
+    """Общий для всех воркеров token bucket с глобальной паузой на RetryAfter."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated_at = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        resume_at = self._clock() + max(seconds, 0.0)
+        if resume_at > self._paused_until:
+            self._paused_until = resume_at
+            # После паузы Telegram не ждёт от нас накопленного всплеска
+            self._tokens = 0.0
+            self._updated_at = resume_at
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await self._sleep(self._paused_until - now)
+                    continue
+
+                elapsed = max(now - self._updated_at, 0.0)
+                self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await self._sleep((1 - self._tokens) / self.rate)
+
+
+class _Watermark:
+    """Отслеживает наибольший user_id, до которого все получатели обработаны."""
+
+    def __init__(self) -> None:
+        self._pending: deque[int] = deque()
+        self._done: set[int] = set()
+        self.value: Optional[int] = None
+
+    def dispatch(self, user_id: int) -> None:
+        self._pending.append(user_id)
+
+    def complete(self, user_id: int) -> None:
+        self._done.add(user_id)
+        while self._pending and self._pending[0] in self._done:
+            self.value = self._pending.popleft()
+            self._done.discard(self.value)
+
+
+Recipients = Union[Iterable[BroadcastRecipient], AsyncIterable[BroadcastRecipient]]
+SendCallable = Callable[[int], Awaitable[Any]]
+CheckpointCallable = Callable[[DeliveryCheckpoint], Awaitable[None]]
+
+
+class BroadcastDeliveryEngine:
+    """Рассылает сообщения пулом воркеров в рамках глобального лимита Telegram."""
+
+    def __init__(
+        self,
+        send: SendCallable,
+        *,
+        workers: int = 10,
+        rate: float = 25.0,
+        burst: int = 5,
+        max_retries: int = 3,
+        checkpoint_interval: float = 5.0,
+        on_checkpoint: Optional[CheckpointCallable] = None,
+        bucket: Optional[AsyncTokenBucket] = None,
+    ) -> None:
+        self._send = send
+        self.workers = max(1, workers)
+        self.max_retries = max(0, max_retries)
+        self.checkpoint_interval = checkpoint_interval
+        self._on_checkpoint = on_checkpoint
+        self._bucket = bucket or AsyncTokenBucket(rate, burst)
+
+    async def run(
+        self,
+        recipients: Recipients,
+        cancel_event: Optional[asyncio.Event] = None,
+    ) -> DeliveryStats:
+        cancel_event = cancel_event or asyncio.Event()
+        stats = DeliveryStats()
+        watermark = _Watermark()
+        blocked_user_ids: list[int] = []
+        queue: asyncio.Queue[Optional[BroadcastRecipient]] = asyncio.Queue(maxsize=self.workers * 2)
+        last_checkpoint = time.monotonic()
+
+        async def flush_checkpoint() -> None:
+            nonlocal last_checkpoint
+            last_checkpoint = time.monotonic()
+            if self._on_checkpoint is None:
+                blocked_user_ids.clear()
+                return
+            batch = list(blocked_user_ids)
+            blocked_user_ids.clear()
+            try:
+                await self._on_checkpoint(DeliveryCheckpoint(stats, watermark.value, batch))
+            except Exception as error:  # noqa: BLE001
+                logger.error("Не удалось сохранить прогресс рассылки: %s", error)
+
+        async def worker() -> None:
+            while True:
+                recipient = await queue.get()
+                try:
+                    if recipient is None:
+                        return
+                    if cancel_event.is_set():
+                        continue
+
+                    status = await self._deliver(recipient, stats)
+                    if status is DeliveryStatus.SENT:
+                        stats.sent += 1
+                    elif status is DeliveryStatus.BLOCKED:
+                        stats.blocked += 1
+                        blocked_user_ids.append(recipient.user_id)
+                    else:
+                        stats.failed += 1
+                    watermark.complete(recipient.user_id)
+
+                    if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                        await flush_checkpoint()
+                finally:
+                    queue.task_done()
+
+        worker_tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            async for recipient in _iterate(recipients):
+                if cancel_event.is_set():
+                    break
+                watermark.dispatch(recipient.user_id)
+                await queue.put(recipient)
+        except BaseException:
+            for task in worker_tasks:
+                task.cancel()
+            await asyncio.gather(*worker_tasks, return_exceptions=True)
+            raise
+
+        for _ in worker_tasks:
+            await queue.put(None)
+        await asyncio.gather(*worker_tasks, return_exceptions=True)
+
+        stats.cancelled = cancel_event.is_set()
+        stats.finished_at = time.monotonic()
+        await flush_checkpoint()
+        return stats
+
+    async def _deliver(self, recipient: BroadcastRecipient, stats: DeliveryStats) -> DeliveryStatus:
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                await self._send(recipient.telegram_id)
+                return DeliveryStatus.SENT
+            except TelegramRetryAfter as error:
+                self._bucket.pause(error.retry_after)
+                logger.warning(
+                    "⏳ Telegram просит подождать %s с перед отправкой рассылки",
+                    error.retry_after,
+                )
+            except (TelegramNetworkError, TelegramServerError) as error:
+                logger.warning(
+                    "Временная ошибка отправки рассылки пользователю %s: %s",
+                    recipient.telegram_id,
+                    error,
+                )
+                await asyncio.sleep(min(2 ** attempt, 10))
+            except Exception as error:  # noqa: BLE001
+                if is_unreachable_error(error):
+                    logger.info(
+                        "Пользователь %s недоступен для рассылки: %s",
+                        recipient.telegram_id,
+                        error,
+                    )
+                    return DeliveryStatus.BLOCKED
+                logger.error(
+                    "Ошибка отправки рассылки пользователю %s: %s",
+                    recipient.telegram_id,
+                    error,
+                )
+                return DeliveryStatus.FAILED
+
+            attempt += 1
+            stats.retries += 1
+            if attempt > self.max_retries:
+                return DeliveryStatus.FAILED
+
+
+async def _iterate(recipients: Recipients):
+    if hasattr(recipients, "__aiter__"):
+        async for item in recipients:
+            yield item
+    else:
+        for item in recipients:
+            yield item
@@ -4,17 +4,26 @@ import asyncio
 import logging
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import select, update
 
-from app.database.database import AsyncSessionLocal
-from app.database.models import BroadcastHistory
+from app.config import settings
+from app.database.database import BackgroundSessionLocal
+from app.database.models import BroadcastHistory, User
+from app.database.user_cache import user_snapshot_cache
 from app.handlers.admin.messages import (
     create_broadcast_keyboard,
-    get_custom_users,
-    get_target_users,
+    count_broadcast_recipients,
+    iter_broadcast_recipients,
+)
+from app.services.broadcast_delivery import (
+    BroadcastDeliveryEngine,
+    BroadcastRecipient,
+    DeliveryCheckpoint,
+    DeliveryStats,
 )
 
 
@@ -38,6 +47,7 @@ class BroadcastConfig:
     selected_buttons: list[str]
     media: Optional[BroadcastMediaConfig] = None
     initiator_name: Optional[str] = None
+    language: Optional[str] = None
 
 
 @dataclass(slots=True)
@@ -46,6 +56,26 @@ class _BroadcastTask:
     cancel_event: asyncio.Event
 
 
+@dataclass(slots=True)
+class _BroadcastProgress:
+    """Счётчики, сохранённые до текущего запуска (при возобновлении)."""
+
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+
+    def merged(self, stats: DeliveryStats) -> "_BroadcastProgress":
+        return _BroadcastProgress(
+            sent=self.sent + stats.sent,
+            failed=self.failed + stats.failed,
+            blocked=self.blocked + stats.blocked,
+        )
+
+    @property
+    def undelivered(self) -> int:
+        return self.failed + self.blocked
+
+
 class BroadcastService:
     """Handles broadcast execution triggered from the admin web API."""
 
@@ -61,7 +91,13 @@ class BroadcastService:
         task_entry = self._tasks.get(broadcast_id)
         return bool(task_entry and not task_entry.task.done())
 
-    async def start_broadcast(self, broadcast_id: int, config: BroadcastConfig) -> None:
+    async def start_broadcast(
+        self,
+        broadcast_id: int,
+        config: BroadcastConfig,
+        *,
+        resume: bool = False,
+    ) -> None:
         if self._bot is None:
             logger.error("Невозможно запустить рассылку %s: бот не инициализирован", broadcast_id)
             await self._mark_failed(broadcast_id)
@@ -75,12 +111,66 @@ class BroadcastService:
                 return
 
             task = asyncio.create_task(
-                self._run_broadcast(broadcast_id, config, cancel_event),
+                self._run_broadcast(broadcast_id, config, cancel_event, resume=resume),
                 name=f"broadcast-{broadcast_id}",
             )
             self._tasks[broadcast_id] = _BroadcastTask(task=task, cancel_event=cancel_event)
             task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
 
+    async def wait_for(self, broadcast_id: int) -> None:
+        task_entry = self._tasks.get(broadcast_id)
+        if task_entry:
+            await asyncio.gather(task_entry.task, return_exceptions=True)
+
+    async def resume_interrupted(self) -> int:
+        """Возобновляет рассылки, прерванные перезапуском бота, с последней контрольной точки."""
+
+        if self._bot is None:
+            return 0
+
+        async with BackgroundSessionLocal() as session:
+            result = await session.execute(
+                select(BroadcastHistory).where(
+                    BroadcastHistory.status.in_(["queued", "in_progress", "cancelling"])
+                )
+            )
+            broadcasts = result.scalars().all()
+
+            to_resume: list[tuple[int, BroadcastConfig]] = []
+            for broadcast in broadcasts:
+                if self.is_running(broadcast.id):
+                    continue
+                if broadcast.status == "cancelling":
+                    broadcast.status = "cancelled"
+                    broadcast.completed_at = datetime.utcnow()
+                    continue
+                to_resume.append((broadcast.id, self._config_from_history(broadcast)))
+
+            await session.commit()
+
+        for broadcast_id, config in to_resume:
+            logger.info("🔁 Возобновление рассылки %s после перезапуска", broadcast_id)
+            await self.start_broadcast(broadcast_id, config, resume=True)
+
+        return len(to_resume)
+
+    @staticmethod
+    def _config_from_history(broadcast: BroadcastHistory) -> BroadcastConfig:
+        media = None
+        if broadcast.has_media and broadcast.media_type and broadcast.media_file_id:
+            media = BroadcastMediaConfig(
+                type=broadcast.media_type,
+                file_id=broadcast.media_file_id,
+                caption=broadcast.media_caption,
+            )
+        return BroadcastConfig(
+            target=broadcast.target_type,
+            message_text=broadcast.message_text,
+            selected_buttons=list(broadcast.selected_buttons or []),
+            media=media,
+            initiator_name=broadcast.admin_name,
+        )
+
     async def request_stop(self, broadcast_id: int) -> bool:
         async with self._lock:
             task_entry = self._tasks.get(broadcast_id)
@@ -95,92 +185,163 @@ class BroadcastService:
         broadcast_id: int,
         config: BroadcastConfig,
         cancel_event: asyncio.Event,
+        *,
+        resume: bool = False,
     ) -> None:
-        sent_count = 0
-        failed_count = 0
+        progress = _BroadcastProgress()
 
         try:
             if cancel_event.is_set():
-                await self._mark_cancelled(broadcast_id, sent_count, failed_count)
+                await self._mark_cancelled(broadcast_id)
                 return
 
-            async with AsyncSessionLocal() as session:
+            async with BackgroundSessionLocal() as session:
                 broadcast = await session.get(BroadcastHistory, broadcast_id)
                 if not broadcast:
                     logger.error("Запись рассылки %s не найдена в БД", broadcast_id)
                     return
 
+                checkpoint_user_id = None
+                if resume and broadcast.status == "in_progress":
+                    checkpoint_user_id = broadcast.last_processed_user_id
+                    progress = _BroadcastProgress(
+                        sent=broadcast.sent_count or 0,
+                        failed=max((broadcast.failed_count or 0) - (broadcast.blocked_count or 0), 0),
+                        blocked=broadcast.blocked_count or 0,
+                    )
+                else:
+                    broadcast.sent_count = 0
+                    broadcast.failed_count = 0
+                    broadcast.blocked_count = 0
+                    broadcast.last_processed_user_id = None
+
                 broadcast.status = "in_progress"
-                broadcast.sent_count = 0
-                broadcast.failed_count = 0
+                broadcast.selected_buttons = list(config.selected_buttons or [])
                 await session.commit()
 
-            recipients = await self._fetch_recipients(config.target)
-
-            async with AsyncSessionLocal() as session:
+            async with BackgroundSessionLocal() as session:
                 broadcast = await session.get(BroadcastHistory, broadcast_id)
                 if not broadcast:
                     logger.error("Запись рассылки %s удалена до запуска", broadcast_id)
                     return
 
-                broadcast.total_count = len(recipients)
+                if checkpoint_user_id is None:
+                    broadcast.total_count = await count_broadcast_recipients(session, config.target)
+                total_count = broadcast.total_count or 0
                 await session.commit()
 
+            if checkpoint_user_id is not None:
+                logger.info(
+                    "Рассылка %s продолжается после пользователя #%s",
+                    broadcast_id,
+                    checkpoint_user_id,
+                )
+
             if cancel_event.is_set():
-                await self._mark_cancelled(broadcast_id, sent_count, failed_count)
+                await self._mark_cancelled(broadcast_id)
                 return
 
-            if not recipients:
+            if not total_count:
                 logger.info("Рассылка %s: получатели не найдены", broadcast_id)
-                await self._mark_finished(broadcast_id, sent_count, failed_count, cancelled=False)
+                await self._mark_finished(broadcast_id, progress, cancelled=False)
                 return
 
-            keyboard = self._build_keyboard(config.selected_buttons)
-
-            for index, user in enumerate(recipients, start=1):
-                if cancel_event.is_set():
-                    await self._mark_cancelled(broadcast_id, sent_count, failed_count)
-                    return
+            keyboard = self._build_keyboard(config.selected_buttons, config.language)
 
-                telegram_id = getattr(user, "telegram_id", None)
-                if telegram_id is None:
-                    failed_count += 1
-                    continue
+            async def send(telegram_id: int) -> None:
+                await self._deliver_message(telegram_id, config, keyboard)
 
-                try:
-                    await self._deliver_message(telegram_id, config, keyboard)
-                    sent_count += 1
-                except Exception as exc:  # noqa: BLE001
-                    failed_count += 1
-                    logger.error(
-                        "Ошибка отправки рассылки %s пользователю %s: %s",
-                        broadcast_id,
-                        telegram_id,
-                        exc,
-                    )
+            async def save_checkpoint(checkpoint: DeliveryCheckpoint) -> None:
+                await self._save_checkpoint(broadcast_id, progress.merged(checkpoint.stats), checkpoint)
 
-                if index % 20 == 0:
-                    await asyncio.sleep(1)
+            engine = BroadcastDeliveryEngine(
+                send,
+                workers=settings.BROADCAST_WORKERS,
+                rate=settings.BROADCAST_RATE_LIMIT,
+                burst=settings.BROADCAST_RATE_BURST,
+                max_retries=settings.BROADCAST_MAX_RETRIES,
+                checkpoint_interval=settings.BROADCAST_CHECKPOINT_INTERVAL_SECONDS,
+                on_checkpoint=save_checkpoint,
+            )
+            stats = await engine.run(
+                self._stream_recipients(config.target, checkpoint_user_id),
+                cancel_event,
+            )
+            progress = progress.merged(stats)
+
+            logger.info(
+                "Рассылка %s: отправлено %s, недоступны %s, ошибок %s за %.1fs (%.1f сообщ./с)",
+                broadcast_id,
+                stats.sent,
+                stats.blocked,
+                stats.failed,
+                stats.elapsed,
+                stats.messages_per_second,
+            )
 
-            await self._mark_finished(broadcast_id, sent_count, failed_count, cancelled=False)
+            await self._mark_finished(broadcast_id, progress, cancelled=stats.cancelled)
 
         except asyncio.CancelledError:
-            await self._mark_cancelled(broadcast_id, sent_count, failed_count)
+            if cancel_event.is_set():
+                await self._mark_cancelled(broadcast_id)
+            else:
+                # Задачу отменил не администратор (остановка бота): запись остаётся
+                # in_progress с последней контрольной точкой и будет возобновлена
+                logger.warning("Рассылка %s прервана, будет возобновлена с контрольной точки", broadcast_id)
             raise
         except Exception as exc:  # noqa: BLE001
             logger.exception("Критическая ошибка при выполнении рассылки %s: %s", broadcast_id, exc)
-            await self._mark_failed(broadcast_id, sent_count, failed_count)
+            await self._mark_failed(broadcast_id, progress)
 
-    async def _fetch_recipients(self, target: str):
-        async with AsyncSessionLocal() as session:
-            if target.startswith("custom_"):
-                criteria = target[len("custom_"):]
-                return await get_custom_users(session, criteria)
-            return await get_target_users(session, target)
+    async def _stream_recipients(
+        self,
+        target: str,
+        after_user_id: Optional[int] = None,
+    ) -> AsyncIterator[BroadcastRecipient]:
+        # Порядок по id нужен для возобновления с контрольной точки
+        async for user_id, telegram_id in iter_broadcast_recipients(
+            BackgroundSessionLocal,
+            target,
+            after_user_id=after_user_id,
+        ):
+            yield BroadcastRecipient(user_id=user_id, telegram_id=telegram_id)
+
+    async def _save_checkpoint(
+        self,
+        broadcast_id: int,
+        progress: _BroadcastProgress,
+        checkpoint: DeliveryCheckpoint,
+    ) -> None:
+        async with BackgroundSessionLocal() as session:
+            broadcast = await session.get(BroadcastHistory, broadcast_id)
+            if broadcast:
+                broadcast.sent_count = progress.sent
+                broadcast.failed_count = progress.undelivered
+                broadcast.blocked_count = progress.blocked
+                if checkpoint.watermark is not None:
+                    broadcast.last_processed_user_id = checkpoint.watermark
+
+            if checkpoint.blocked_user_ids:
+                await session.execute(
+                    update(User)
+                    .where(User.id.in_(checkpoint.blocked_user_ids))
+                    .values(broadcast_unreachable_at=datetime.utcnow())
+                )
+
+            await session.commit()
+
+        if checkpoint.blocked_user_ids:
+            await user_snapshot_cache.invalidate(user_ids=checkpoint.blocked_user_ids)
 
-    def _build_keyboard(self, selected_buttons: Optional[list[str]]) -> Optional[InlineKeyboardMarkup]:
+    def _build_keyboard(
+        self,
+        selected_buttons: Optional[list[str]],
+        language: Optional[str] = None,
+    ) -> Optional[InlineKeyboardMarkup]:
         if selected_buttons is None:
             selected_buttons = []
+        if language:
+            return create_broadcast_keyboard(selected_buttons, language)
         return create_broadcast_keyboard(selected_buttons)
 
     async def _deliver_message(
@@ -226,50 +387,49 @@ class BroadcastService:
     async def _mark_finished(
         self,
         broadcast_id: int,
-        sent_count: int,
-        failed_count: int,
+        progress: _BroadcastProgress,
         *,
         cancelled: bool,
     ) -> None:
-        async with AsyncSessionLocal() as session:
+        async with BackgroundSessionLocal() as session:
             broadcast = await session.get(BroadcastHistory, broadcast_id)
             if not broadcast:
                 return
 
-            broadcast.sent_count = sent_count
-            broadcast.failed_count = failed_count
+            broadcast.sent_count = progress.sent
+            broadcast.failed_count = progress.undelivered
+            broadcast.blocked_count = progress.blocked
             broadcast.status = "cancelled" if cancelled else (
-                "completed" if failed_count == 0 else "partial"
+                "completed" if progress.undelivered == 0 else "partial"
             )
             broadcast.completed_at = datetime.utcnow()
             await session.commit()
 
-    async def _mark_cancelled(
-        self,
-        broadcast_id: int,
-        sent_count: int,
-        failed_count: int,
-    ) -> None:
-        await self._mark_finished(
-            broadcast_id,
-            sent_count,
-            failed_count,
-            cancelled=True,
-        )
+    async def _mark_cancelled(self, broadcast_id: int) -> None:
+        # Счётчики не трогаем: в БД уже лежит последняя контрольная точка
+        async with BackgroundSessionLocal() as session:
+            broadcast = await session.get(BroadcastHistory, broadcast_id)
+            if not broadcast:
+                return
+
+            broadcast.status = "cancelled"
+            broadcast.completed_at = datetime.utcnow()
+            await session.commit()
 
     async def _mark_failed(
         self,
         broadcast_id: int,
-        sent_count: int = 0,
-        failed_count: int = 0,
+        progress: Optional[_BroadcastProgress] = None,
     ) -> None:
-        async with AsyncSessionLocal() as session:
+        progress = progress or _BroadcastProgress()
+        async with BackgroundSessionLocal() as session:
             broadcast = await session.get(BroadcastHistory, broadcast_id)
             if not broadcast:
                 return
 
-            broadcast.sent_count = sent_count
-            broadcast.failed_count = failed_count or broadcast.failed_count
+            broadcast.sent_count = progress.sent
+            broadcast.failed_count = progress.undelivered or broadcast.failed_count
+            broadcast.blocked_count = progress.blocked
             broadcast.status = "failed"
             broadcast.completed_at = datetime.utcnow()
             await session.commit()
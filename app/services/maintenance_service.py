@@ -6,6 +6,7 @@ from dataclasses import dataclass
 
 from app.config import settings
 from app.external.remnawave_api import RemnaWaveAPI, test_api_connection
+from app.services.admin_notification_dispatcher import AdminNotification, admin_notification_dispatcher
 from app.utils.cache import cache
 
 logger = logging.getLogger(__name__)
@@ -120,18 +121,25 @@ class MaintenanceService:
         formatted_message = f"{emoji} <b>Maintenance Service</b>\n\n{message}"
         
         success_count = 0
-        for admin_id in admin_ids:
-            try:
-                await self._bot.send_message(
-                    chat_id=admin_id,
-                    text=formatted_message,
-                    parse_mode="HTML"
-                )
-                success_count += 1
-                await asyncio.sleep(0.1) 
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
+        if admin_notification_dispatcher.is_running():
+            # Рассылку по админам ведёт очередь уведомлений с общим лимитом скорости
+            for admin_id in admin_ids:
+                notification = AdminNotification(bot=self._bot, chat_id=admin_id, text=formatted_message)
+                if admin_notification_dispatcher.enqueue(notification):
+                    success_count += 1
+        else:
+            for admin_id in admin_ids:
+                try:
+                    await self._bot.send_message(
+                        chat_id=admin_id,
+                        text=formatted_message,
+                        parse_mode="HTML"
+                    )
+                    success_count += 1
+                    await asyncio.sleep(0.1) 
+                    
+                except Exception as e:
+                    logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
         
         if success_count > 0:
             logger.info(f"Уведомление отправлено {success_count} администраторам")
@@ -1,8 +1,12 @@
 import asyncio
 import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Set
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Sequence, Set, Tuple
 
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.enums import ChatMemberStatus
@@ -12,7 +16,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.config import settings
-from app.database.database import get_db
+from app.database.database import BackgroundSessionLocal, get_background_db
 from app.database.crud.discount_offer import (
     deactivate_expired_offers,
     get_latest_claimed_offer_for_user,
@@ -21,8 +25,10 @@ from app.database.crud.discount_offer import (
 from app.database.crud.promo_offer_log import log_promo_offer_action
 from app.database.crud.notification import (
     clear_notification_by_type,
+    get_sent_notification_keys,
     notification_sent,
     record_notification,
+    record_notifications,
 )
 from app.database.crud.subscription import (
     deactivate_subscription,
@@ -44,8 +50,10 @@ from app.services.notification_settings_service import NotificationSettingsServi
 from app.services.payment_service import PaymentService
 from app.services.subscription_service import SubscriptionService
 from app.services.promo_offer_service import promo_offer_service
+from app.services.remnawave_service import RemnaWaveService
 from app.utils.pricing_utils import apply_percentage_discount
 from app.utils.miniapp_buttons import build_miniapp_or_callback_button
+from app.utils.concurrency import gather_bounded
 
 from app.external.remnawave_api import (
     RemnaWaveAPIError,
@@ -60,6 +68,29 @@ logger = logging.getLogger(__name__)
 LOGO_PATH = Path(settings.LOGO_FILE)
 
 
+@dataclass(frozen=True)
+class MonitoringStage:
+    name: str
+    handler: Callable[[AsyncSession], Awaitable[Optional[int]]]
+
+
+@dataclass
+class MonitoringStageResult:
+    name: str
+    duration: float
+    rows: int = 0
+    error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "duration_ms": round(self.duration * 1000, 1),
+            "rows": self.rows,
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
 class MonitoringService:
     
     def __init__(self, bot=None):
@@ -176,52 +207,115 @@ class MonitoringService:
         except Exception:
             pass
     
+    def _build_stage_phases(self) -> List[List[MonitoringStage]]:
+        """Этапы одной фазы независимы и выполняются параллельно, фазы — по очереди.
+
+        Автоплатежи идут после пометки истёкших подписок, а удаление неактивных
+        пользователей — отдельной фазой, чтобы не пересекаться с остальными.
+        """
+        return [
+            [
+                MonitoringStage("housekeeping", self._run_housekeeping),
+                MonitoringStage("expired_subscriptions", self._check_expired_subscriptions),
+                MonitoringStage("trial_expiring_soon", self._check_trial_expiring_soon),
+                MonitoringStage("trial_inactivity", self._check_trial_inactivity_notifications),
+                MonitoringStage("remnawave_stats", self._sync_with_remnawave),
+            ],
+            [
+                MonitoringStage("expiring_subscriptions", self._check_expiring_subscriptions),
+                MonitoringStage("trial_channel", self._check_trial_channel_subscriptions),
+                MonitoringStage("expired_followups", self._check_expired_subscription_followups),
+                MonitoringStage("autopayments", self._process_autopayments),
+            ],
+            [
+                MonitoringStage("inactive_users_cleanup", self._cleanup_inactive_users),
+            ],
+        ]
+
+    async def _run_stage(self, stage: MonitoringStage) -> MonitoringStageResult:
+        started = time.perf_counter()
+        rows = 0
+        error = None
+
+        try:
+            async with BackgroundSessionLocal() as db:
+                rows = await stage.handler(db) or 0
+                await db.commit()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Ошибка этапа мониторинга {stage.name}: {e}")
+
+        duration = time.perf_counter() - started
+        if duration >= settings.MONITORING_SLOW_STAGE_SECONDS:
+            logger.warning(
+                "🐢 Этап мониторинга %s выполнялся %.1f с (строк: %s)",
+                stage.name,
+                duration,
+                rows,
+            )
+        return MonitoringStageResult(stage.name, duration, rows, error)
+
     async def _monitoring_cycle(self):
-        async for db in get_db():
-            try:
-                await self._cleanup_notification_cache()
+        await self._cleanup_notification_cache()
 
-                expired_offers = await deactivate_expired_offers(db)
-                if expired_offers:
-                    logger.info(f"🧹 Деактивировано {expired_offers} просроченных скидочных предложений")
+        started = time.perf_counter()
+        results: List[MonitoringStageResult] = []
+        for phase in self._build_stage_phases():
+            results.extend(
+                await gather_bounded(self._run_stage, phase, settings.MONITORING_STAGE_CONCURRENCY)
+            )
+        duration = time.perf_counter() - started
 
-                expired_active_discounts = await cleanup_expired_promo_offer_discounts(db)
-                if expired_active_discounts:
-                    logger.info(
-                        "🧹 Сброшено %s активных скидок промо-предложений с истекшим сроком",
-                        expired_active_discounts,
-                    )
+        failed = [result.name for result in results if result.error]
+        data = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "stages": {result.name: result.as_dict() for result in results},
+        }
 
-                cleaned_test_access = await promo_offer_service.cleanup_expired_test_access(db)
-                if cleaned_test_access:
-                    logger.info(f"🧹 Отозвано {cleaned_test_access} истекших тестовых доступов к сквадам")
-
-                await self._check_expired_subscriptions(db)
-                await self._check_expiring_subscriptions(db)
-                await self._check_trial_expiring_soon(db)
-                await self._check_trial_inactivity_notifications(db)
-                await self._check_trial_channel_subscriptions(db)
-                await self._check_expired_subscription_followups(db)
-                await self._process_autopayments(db)
-                await self._cleanup_inactive_users(db)
-                await self._sync_with_remnawave(db)
-                
+        async with BackgroundSessionLocal() as db:
+            if failed:
                 await self._log_monitoring_event(
-                    db, "monitoring_cycle_completed", 
-                    "Цикл мониторинга успешно завершен", 
-                    {"timestamp": datetime.utcnow().isoformat()}
+                    db, "monitoring_cycle_error",
+                    f"Ошибка в цикле мониторинга, этапы: {', '.join(failed)}",
+                    data,
+                    is_success=False
                 )
-                
-            except Exception as e:
-                logger.error(f"Ошибка в цикле мониторинга: {e}")
+            else:
                 await self._log_monitoring_event(
-                    db, "monitoring_cycle_error", 
-                    f"Ошибка в цикле мониторинга: {str(e)}", 
-                    {"error": str(e)},
-                    is_success=False
+                    db, "monitoring_cycle_completed",
+                    f"Цикл мониторинга успешно завершен за {duration:.1f} с",
+                    data
                 )
-            finally:
-                break 
+
+    async def _run_housekeeping(self, db: AsyncSession) -> int:
+        expired_offers = await deactivate_expired_offers(db)
+        if expired_offers:
+            logger.info(f"🧹 Деактивировано {expired_offers} просроченных скидочных предложений")
+
+        expired_active_discounts = await cleanup_expired_promo_offer_discounts(db)
+        if expired_active_discounts:
+            logger.info(
+                "🧹 Сброшено %s активных скидок промо-предложений с истекшим сроком",
+                expired_active_discounts,
+            )
+
+        cleaned_test_access = await promo_offer_service.cleanup_expired_test_access(db)
+        if cleaned_test_access:
+            logger.info(f"🧹 Отозвано {cleaned_test_access} истекших тестовых доступов к сквадам")
+
+        return (expired_offers or 0) + (expired_active_discounts or 0) + (cleaned_test_access or 0)
+
+    async def _deliver_notifications(
+        self,
+        items: Sequence[Any],
+        sender: Callable[[Any], Awaitable[bool]],
+    ) -> List[Any]:
+        """Рассылает уведомления с ограниченным параллелизмом, возвращает доставленные элементы."""
+        if not items:
+            return []
+        results = await gather_bounded(sender, items, settings.MONITORING_NOTIFICATION_CONCURRENCY)
+        return [item for item, delivered in zip(items, results) if delivered]
     
     async def _cleanup_notification_cache(self):
         current_time = datetime.utcnow()
@@ -232,32 +326,39 @@ class MonitoringService:
             self._last_cleanup = current_time
             logger.info(f"🧹 Очищен кеш уведомлений ({old_count} записей)")
     
-    async def _check_expired_subscriptions(self, db: AsyncSession):
+    async def _check_expired_subscriptions(self, db: AsyncSession) -> int:
         try:
             expired_subscriptions = await get_expired_subscriptions(db)
-            
+            if not expired_subscriptions:
+                return 0
+
+            now = datetime.utcnow()
             for subscription in expired_subscriptions:
-                from app.database.crud.subscription import expire_subscription
-                await expire_subscription(db, subscription)
-                
-                user = await get_user_by_id(db, subscription.user_id)
-                if user and user.remnawave_uuid:
-                    await self.subscription_service.disable_remnawave_user(user.remnawave_uuid)
-                
-                if user and self.bot:
-                    await self._send_subscription_expired_notification(user)
-                
-                logger.info(f"🔴 Подписка пользователя {subscription.user_id} истекла и статус изменен на 'expired'")
-            
-            if expired_subscriptions:
-                await self._log_monitoring_event(
-                    db, "expired_subscriptions_processed",
-                    f"Обработано {len(expired_subscriptions)} истёкших подписок",
-                    {"count": len(expired_subscriptions)}
-                )
+                subscription.status = SubscriptionStatus.EXPIRED.value
+                subscription.updated_at = now
+            # Один flush — пакетный UPDATE по первичным ключам вместо коммита на каждую подписку
+            await db.commit()
+
+            users = [subscription.user for subscription in expired_subscriptions if subscription.user]
+            remnawave_uuids = [user.remnawave_uuid for user in users if user.remnawave_uuid]
+            if remnawave_uuids:
+                await self.subscription_service.disable_remnawave_users(remnawave_uuids)
+
+            if self.bot:
+                await self._deliver_notifications(users, self._send_subscription_expired_notification)
+
+            logger.info(f"🔴 Подписки {len(expired_subscriptions)} пользователей истекли, статус изменен на 'expired'")
+
+            await self._log_monitoring_event(
+                db, "expired_subscriptions_processed",
+                f"Обработано {len(expired_subscriptions)} истёкших подписок",
+                {"count": len(expired_subscriptions)}
+            )
+            return len(expired_subscriptions)
                 
         except Exception as e:
             logger.error(f"Ошибка проверки истёкших подписок: {e}")
+            raise
 
     async def update_remnawave_user(
         self,
@@ -313,60 +414,70 @@ class MonitoringService:
             logger.error(f"Ошибка обновления RemnaWave пользователя: {e}")
             return None
     
-    async def _check_expiring_subscriptions(self, db: AsyncSession):
+    async def _check_expiring_subscriptions(self, db: AsyncSession) -> int:
         try:
-            warning_days = settings.get_autopay_warning_days()
-            all_processed_users = set() 
-            
-            for days in warning_days:
-                expiring_subscriptions = await self._get_expiring_paid_subscriptions(db, days)
-                sent_count = 0
-                
-                for subscription in expiring_subscriptions:
-                    user = await get_user_by_id(db, subscription.user_id)
-                    if not user:
-                        continue
-
-                    user_key = f"user_{user.telegram_id}_today"
-
-                    if (await notification_sent(db, user.id, subscription.id, "expiring", days) or
-                        user_key in all_processed_users):
-                        logger.debug(f"🔄 Пропускаем дублирование для пользователя {user.telegram_id} на {days} дней")
-                        continue
-
-                    should_send = True
-                    for other_days in warning_days:
-                        if other_days < days:
-                            other_subs = await self._get_expiring_paid_subscriptions(db, other_days)
-                            if any(s.user_id == user.id for s in other_subs):
-                                should_send = False
-                                logger.debug(f"🎯 Пропускаем уведомление на {days} дней для пользователя {user.telegram_id}, есть более срочное на {other_days} дней")
-                                break
-
-                    if not should_send:
-                        continue
+            warning_days = sorted(set(settings.get_autopay_warning_days()))
+            if not warning_days:
+                return 0
 
-                    if self.bot:
-                        success = await self._send_subscription_expiring_notification(user, subscription, days)
-                        if success:
-                            await record_notification(db, user.id, subscription.id, "expiring", days)
-                            all_processed_users.add(user_key)
-                            sent_count += 1
-                            logger.info(f"✅ Пользователю {user.telegram_id} отправлено уведомление об истечении подписки через {days} дней")
-                        else:
-                            logger.warning(f"❌ Не удалось отправить уведомление пользователю {user.telegram_id}")
-                
-                if sent_count > 0:
-                    await self._log_monitoring_event(
-                        db, "expiring_notifications_sent",
-                        f"Отправлено {sent_count} уведомлений об истечении через {days} дней",
-                        {"days": days, "count": sent_count}
-                    )
+            # Одна выборка по самому широкому окну; каждой подписке достаётся самое срочное окно
+            subscriptions = await self._get_expiring_paid_subscriptions(db, warning_days[-1])
+            now = datetime.utcnow()
+
+            candidates: List[Tuple[Subscription, int]] = []
+            for subscription in subscriptions:
+                if not subscription.user:
+                    continue
+                days = next(
+                    (value for value in warning_days if subscription.end_date <= now + timedelta(days=value)),
+                    None,
+                )
+                if days is not None:
+                    candidates.append((subscription, days))
+
+            sent_keys = await get_sent_notification_keys(
+                db, [subscription.id for subscription, _ in candidates], ["expiring"]
+            )
+            pending = [
+                (subscription, days)
+                for subscription, days in candidates
+                if (subscription.id, "expiring", days) not in sent_keys
+            ]
+
+            if not self.bot or not pending:
+                return len(subscriptions)
+
+            delivered = await self._deliver_notifications(
+                pending,
+                lambda item: self._send_subscription_expiring_notification(item[0].user, item[0], item[1]),
+            )
+            await record_notifications(
+                db,
+                [(subscription.user_id, subscription.id, "expiring", days) for subscription, days in delivered],
+            )
+
+            delivered_ids = {subscription.id for subscription, _ in delivered}
+            for subscription, days in pending:
+                if subscription.id in delivered_ids:
+                    logger.info(f"✅ Пользователю {subscription.user.telegram_id} отправлено уведомление об истечении подписки через {days} дней")
+                else:
+                    logger.warning(f"❌ Не удалось отправить уведомление пользователю {subscription.user.telegram_id}")
+
+            sent_by_days = Counter(days for _, days in delivered)
+            for days, sent_count in sorted(sent_by_days.items()):
+                await self._log_monitoring_event(
+                    db, "expiring_notifications_sent",
+                    f"Отправлено {sent_count} уведомлений об истечении через {days} дней",
+                    {"days": days, "count": sent_count}
+                )
+
+            return len(subscriptions)
                     
         except Exception as e:
             logger.error(f"Ошибка проверки истекающих подписок: {e}")
+            raise
     
-    async def _check_trial_expiring_soon(self, db: AsyncSession):
+    async def _check_trial_expiring_soon(self, db: AsyncSession) -> int:
         try:
             threshold_time = datetime.utcnow() + timedelta(hours=2)
 
@@ -382,37 +493,48 @@ class MonitoringService:
                     )
                 )
             )
-            trial_expiring = result.scalars().all()
-            
-            for subscription in trial_expiring:
-                user = subscription.user
-                if not user:
-                    continue
+            trial_expiring = [subscription for subscription in result.scalars().all() if subscription.user]
+            if not trial_expiring or not self.bot:
+                return len(trial_expiring)
 
-                if await notification_sent(db, user.id, subscription.id, "trial_2h"):
-                    continue
+            sent_keys = await get_sent_notification_keys(
+                db, [subscription.id for subscription in trial_expiring], ["trial_2h"]
+            )
+            pending = [
+                subscription
+                for subscription in trial_expiring
+                if (subscription.id, "trial_2h", None) not in sent_keys
+            ]
 
-                if self.bot:
-                    success = await self._send_trial_ending_notification(user, subscription)
-                    if success:
-                        await record_notification(db, user.id, subscription.id, "trial_2h")
-                        logger.info(f"🎁 Пользователю {user.telegram_id} отправлено уведомление об окончании тестовой подписки через 2 часа")
-            
-            if trial_expiring:
+            delivered = await self._deliver_notifications(
+                pending,
+                lambda subscription: self._send_trial_ending_notification(subscription.user, subscription),
+            )
+            await record_notifications(
+                db,
+                [(subscription.user_id, subscription.id, "trial_2h", None) for subscription in delivered],
+            )
+            for subscription in delivered:
+                logger.info(f"🎁 Пользователю {subscription.user.telegram_id} отправлено уведомление об окончании тестовой подписки через 2 часа")
+
+            if delivered:
                 await self._log_monitoring_event(
                     db, "trial_expiring_notifications_sent",
-                    f"Отправлено {len(trial_expiring)} уведомлений об окончании тестовых подписок",
-                    {"count": len(trial_expiring)}
+                    f"Отправлено {len(delivered)} уведомлений об окончании тестовых подписок",
+                    {"count": len(delivered)}
                 )
+
+            return len(trial_expiring)
                 
         except Exception as e:
             logger.error(f"Ошибка проверки истекающих тестовых подписок: {e}")
+            raise
 
-    async def _check_trial_inactivity_notifications(self, db: AsyncSession):
+    async def _check_trial_inactivity_notifications(self, db: AsyncSession) -> int:
         if not NotificationSettingsService.are_notifications_globally_enabled():
-            return
+            return 0
         if not self.bot:
-            return
+            return 0
 
         try:
             now = datetime.utcnow()
@@ -433,9 +555,13 @@ class MonitoringService:
             )
 
             subscriptions = result.scalars().all()
-            sent_1h = 0
-            sent_24h = 0
+            sent_keys = await get_sent_notification_keys(
+                db,
+                [subscription.id for subscription in subscriptions],
+                ["trial_inactive_1h", "trial_inactive_24h"],
+            )
 
+            pending: List[Tuple[Subscription, int, str]] = []
             for subscription in subscriptions:
                 user = subscription.user
                 if not user:
@@ -452,18 +578,27 @@ class MonitoringService:
 
                 if (NotificationSettingsService.is_trial_inactive_1h_enabled()
                         and timedelta(hours=1) <= time_since_start < timedelta(hours=24)):
-                    if not await notification_sent(db, user.id, subscription.id, "trial_inactive_1h"):
-                        success = await self._send_trial_inactive_notification(user, subscription, 1)
-                        if success:
-                            await record_notification(db, user.id, subscription.id, "trial_inactive_1h")
-                            sent_1h += 1
+                    if (subscription.id, "trial_inactive_1h", None) not in sent_keys:
+                        pending.append((subscription, 1, "trial_inactive_1h"))
 
                 if NotificationSettingsService.is_trial_inactive_24h_enabled() and time_since_start >= timedelta(hours=24):
-                    if not await notification_sent(db, user.id, subscription.id, "trial_inactive_24h"):
-                        success = await self._send_trial_inactive_notification(user, subscription, 24)
-                        if success:
-                            await record_notification(db, user.id, subscription.id, "trial_inactive_24h")
-                            sent_24h += 1
+                    if (subscription.id, "trial_inactive_24h", None) not in sent_keys:
+                        pending.append((subscription, 24, "trial_inactive_24h"))
+
+            delivered = await self._deliver_notifications(
+                pending,
+                lambda item: self._send_trial_inactive_notification(item[0].user, item[0], item[1]),
+            )
+            await record_notifications(
+                db,
+                [
+                    (subscription.user_id, subscription.id, notification_type, None)
+                    for subscription, _, notification_type in delivered
+                ],
+            )
+
+            sent_1h = sum(1 for _, hours, _ in delivered if hours == 1)
+            sent_24h = sum(1 for _, hours, _ in delivered if hours == 24)
 
             if sent_1h or sent_24h:
                 await self._log_monitoring_event(
@@ -473,20 +608,23 @@ class MonitoringService:
                     {"sent_1h": sent_1h, "sent_24h": sent_24h},
                 )
 
+            return len(subscriptions)
+
         except Exception as e:
             logger.error(f"Ошибка проверки неактивных тестовых подписок: {e}")
+            raise
 
-    async def _check_trial_channel_subscriptions(self, db: AsyncSession):
+    async def _check_trial_channel_subscriptions(self, db: AsyncSession) -> int:
         if not settings.CHANNEL_IS_REQUIRED_SUB:
-            return
+            return 0
 
         channel_id = settings.CHANNEL_SUB_ID
         if not channel_id:
-            return
+            return 0
 
         if not self.bot:
             logger.debug("⚠️ Пропускаем проверку подписки на канал — бот недоступен")
-            return
+            return 0
 
         try:
             now = datetime.utcnow()
@@ -513,46 +651,26 @@ class MonitoringService:
 
             subscriptions = result.scalars().all()
             if not subscriptions:
-                return
+                return 0
+
+            candidates = [
+                subscription
+                for subscription in subscriptions
+                if subscription.user and subscription.user.telegram_id
+            ]
+            memberships = await gather_bounded(
+                partial(self._get_channel_membership, channel_id),
+                [subscription.user for subscription in candidates],
+                settings.MONITORING_NOTIFICATION_CONCURRENCY,
+            )
 
             disabled_count = 0
             restored_count = 0
 
-            for subscription in subscriptions:
-                user = subscription.user
-                if not user or not user.telegram_id:
-                    continue
-
-                try:
-                    member = await self.bot.get_chat_member(channel_id, user.telegram_id)
-                    member_status = member.status
-                    is_member = member_status in (
-                        ChatMemberStatus.MEMBER,
-                        ChatMemberStatus.ADMINISTRATOR,
-                        ChatMemberStatus.CREATOR,
-                    )
-                except TelegramForbiddenError as error:
-                    logger.error(
-                        "❌ Не удалось проверить подписку пользователя %s на канал %s: бот заблокирован (%s)",
-                        user.telegram_id,
-                        channel_id,
-                        error,
-                    )
-                    continue
-                except TelegramBadRequest as error:
-                    logger.error(
-                        "❌ Ошибка Telegram при проверке подписки пользователя %s: %s",
-                        user.telegram_id,
-                        error,
-                    )
-                    continue
-                except Exception as error:
-                    logger.error(
-                        "❌ Неожиданная ошибка при проверке подписки пользователя %s: %s",
-                        user.telegram_id,
-                        error,
-                    )
+            for subscription, is_member in zip(candidates, memberships):
+                if is_member is None:
                     continue
+                user = subscription.user
 
                 if subscription.status == SubscriptionStatus.ACTIVE.value and not is_member:
                     subscription = await deactivate_subscription(db, subscription)
@@ -638,14 +756,49 @@ class MonitoringService:
                     },
                 )
 
+            return len(subscriptions)
+
         except Exception as error:
             logger.error(f"Ошибка проверки подписки на канал для триальных пользователей: {error}")
+            raise
 
-    async def _check_expired_subscription_followups(self, db: AsyncSession):
+    async def _get_channel_membership(self, channel_id, user: User) -> Optional[bool]:
+        try:
+            member = await self.bot.get_chat_member(channel_id, user.telegram_id)
+        except TelegramForbiddenError as error:
+            logger.error(
+                "❌ Не удалось проверить подписку пользователя %s на канал %s: бот заблокирован (%s)",
+                user.telegram_id,
+                channel_id,
+                error,
+            )
+            return None
+        except TelegramBadRequest as error:
+            logger.error(
+                "❌ Ошибка Telegram при проверке подписки пользователя %s: %s",
+                user.telegram_id,
+                error,
+            )
+            return None
+        except Exception as error:
+            logger.error(
+                "❌ Неожиданная ошибка при проверке подписки пользователя %s: %s",
+                user.telegram_id,
+                error,
+            )
+            return None
+
+        return member.status in (
+            ChatMemberStatus.MEMBER,
+            ChatMemberStatus.ADMINISTRATOR,
+            ChatMemberStatus.CREATOR,
+        )
+
+    async def _check_expired_subscription_followups(self, db: AsyncSession) -> int:
         if not NotificationSettingsService.are_notifications_globally_enabled():
-            return
+            return 0
         if not self.bot:
-            return
+            return 0
 
         try:
             now = datetime.utcnow()
@@ -662,9 +815,15 @@ class MonitoringService:
             )
 
             subscriptions = result.scalars().all()
-            sent_day1 = 0
-            sent_wave2 = 0
-            sent_wave3 = 0
+            sent_keys = await get_sent_notification_keys(
+                db,
+                [subscription.id for subscription in subscriptions],
+                ["expired_1d", "expired_discount_wave2", "expired_discount_wave3"],
+            )
+
+            # Скидочные предложения создаются последовательно в этой сессии,
+            # а сами сообщения отправляются параллельно
+            pending: List[Tuple[Subscription, str, Callable[[], Awaitable[bool]]]] = []
 
             for subscription in subscriptions:
                 user = subscription.user
@@ -682,15 +841,16 @@ class MonitoringService:
 
                 # Day 1 reminder
                 if NotificationSettingsService.is_expired_1d_enabled() and 1 <= days_since < 2:
-                    if not await notification_sent(db, user.id, subscription.id, "expired_1d"):
-                        success = await self._send_expired_day1_notification(user, subscription)
-                        if success:
-                            await record_notification(db, user.id, subscription.id, "expired_1d")
-                            sent_day1 += 1
+                    if (subscription.id, "expired_1d", None) not in sent_keys:
+                        pending.append((
+                            subscription,
+                            "expired_1d",
+                            partial(self._send_expired_day1_notification, user, subscription),
+                        ))
 
                 # Second wave (2-3 days) discount
                 if NotificationSettingsService.is_second_wave_enabled() and 2 <= days_since < 4:
-                    if not await notification_sent(db, user.id, subscription.id, "expired_discount_wave2"):
+                    if (subscription.id, "expired_discount_wave2", None) not in sent_keys:
                         percent = NotificationSettingsService.get_second_wave_discount_percent()
                         valid_hours = NotificationSettingsService.get_second_wave_valid_hours()
                         offer = await upsert_discount_offer(
@@ -703,23 +863,25 @@ class MonitoringService:
                             valid_hours=valid_hours,
                             effect_type="percent_discount",
                         )
-                        success = await self._send_expired_discount_notification(
-                            user,
+                        pending.append((
                             subscription,
-                            percent,
-                            offer.expires_at,
-                            offer.id,
-                            "second",
-                        )
-                        if success:
-                            await record_notification(db, user.id, subscription.id, "expired_discount_wave2")
-                            sent_wave2 += 1
+                            "expired_discount_wave2",
+                            partial(
+                                self._send_expired_discount_notification,
+                                user,
+                                subscription,
+                                percent,
+                                offer.expires_at,
+                                offer.id,
+                                "second",
+                            ),
+                        ))
 
                 # Third wave (N days) discount
                 if NotificationSettingsService.is_third_wave_enabled():
                     trigger_days = NotificationSettingsService.get_third_wave_trigger_days()
                     if trigger_days <= days_since < trigger_days + 1:
-                        if not await notification_sent(db, user.id, subscription.id, "expired_discount_wave3"):
+                        if (subscription.id, "expired_discount_wave3", None) not in sent_keys:
                             percent = NotificationSettingsService.get_third_wave_discount_percent()
                             valid_hours = NotificationSettingsService.get_third_wave_valid_hours()
                             offer = await upsert_discount_offer(
@@ -732,18 +894,34 @@ class MonitoringService:
                                 valid_hours=valid_hours,
                                 effect_type="percent_discount",
                             )
-                            success = await self._send_expired_discount_notification(
-                                user,
+                            pending.append((
                                 subscription,
-                                percent,
-                                offer.expires_at,
-                                offer.id,
-                                "third",
-                                trigger_days=trigger_days,
-                            )
-                            if success:
-                                await record_notification(db, user.id, subscription.id, "expired_discount_wave3")
-                                sent_wave3 += 1
+                                "expired_discount_wave3",
+                                partial(
+                                    self._send_expired_discount_notification,
+                                    user,
+                                    subscription,
+                                    percent,
+                                    offer.expires_at,
+                                    offer.id,
+                                    "third",
+                                    trigger_days=trigger_days,
+                                ),
+                            ))
+
+            delivered = await self._deliver_notifications(pending, lambda item: item[2]())
+            await record_notifications(
+                db,
+                [
+                    (subscription.user_id, subscription.id, notification_type, None)
+                    for subscription, notification_type, _ in delivered
+                ],
+            )
+
+            sent = Counter(notification_type for _, notification_type, _ in delivered)
+            sent_day1 = sent["expired_1d"]
+            sent_wave2 = sent["expired_discount_wave2"]
+            sent_wave3 = sent["expired_discount_wave3"]
 
             if sent_day1 or sent_wave2 or sent_wave3:
                 await self._log_monitoring_event(
@@ -763,8 +941,11 @@ class MonitoringService:
                     },
                 )
 
+            return len(subscriptions)
+
         except Exception as e:
             logger.error(f"Ошибка проверки напоминаний об истекшей подписке: {e}")
+            raise
 
     async def _get_expiring_paid_subscriptions(self, db: AsyncSession, days_before: int) -> List[Subscription]:
         current_time = datetime.utcnow()
@@ -871,7 +1052,7 @@ class MonitoringService:
                     rollback_error,
                 )
 
-    async def _process_autopayments(self, db: AsyncSession):
+    async def _process_autopayments(self, db: AsyncSession) -> int:
         try:
             current_time = datetime.utcnow()
             
@@ -963,9 +1144,12 @@ class MonitoringService:
                     f"Автоплатежи: успешно {processed_count}, неудачно {failed_count}",
                     {"processed": processed_count, "failed": failed_count}
                 )
+
+            return len(autopay_subscriptions)
                 
         except Exception as e:
             logger.error(f"Ошибка обработки автоплатежей: {e}")
+            raise
     
     async def _send_subscription_expired_notification(self, user: User) -> bool:
         try:
@@ -1441,11 +1625,11 @@ class MonitoringService:
                 e,
             )
     
-    async def _cleanup_inactive_users(self, db: AsyncSession):
+    async def _cleanup_inactive_users(self, db: AsyncSession) -> int:
         try:
             now = datetime.utcnow()
             if now.hour != 3: 
-                return
+                return 0
             
             inactive_users = await get_inactive_users(db, settings.INACTIVE_USER_DELETE_MONTHS)
             deleted_count = 0
@@ -1463,24 +1647,28 @@ class MonitoringService:
                     {"deleted_count": deleted_count}
                 )
                 logger.info(f"🗑️ Удалено {deleted_count} неактивных пользователей")
+
+            return len(inactive_users)
                 
         except Exception as e:
             logger.error(f"Ошибка очистки неактивных пользователей: {e}")
+            raise
     
-    async def _sync_with_remnawave(self, db: AsyncSession):
+    async def _sync_with_remnawave(self, db: AsyncSession) -> int:
         try:
             now = datetime.utcnow()
             if now.minute != 0:
-                return
+                return 0
             
-            async with self.subscription_service.api as api:
-                system_stats = await api.get_system_stats()
-                
-                await self._log_monitoring_event(
-                    db, "remnawave_sync",
-                    "Синхронизация с RemnaWave завершена",
-                    {"stats": system_stats}
-                )
+            # Общий с админкой и веб-API кэш статистики панели
+            sources = await RemnaWaveService().get_statistics_sources()
+
+            await self._log_monitoring_event(
+                db, "remnawave_sync",
+                "Синхронизация с RemnaWave завершена",
+                {"stats": sources["system_stats"]}
+            )
+            return 1
                 
         except Exception as e:
             logger.error(f"Ошибка синхронизации с RemnaWave: {e}")
@@ -1490,6 +1678,7 @@ class MonitoringService:
                 {"error": str(e)},
                 is_success=False
             )
+            return 0
     
     async def _check_ticket_sla(self, db: AsyncSession):
         try:
@@ -1588,7 +1777,7 @@ class MonitoringService:
             interval_seconds = 60
         while self.is_running:
             try:
-                async for db in get_db():
+                async for db in get_background_db():
                     try:
                         await self._check_ticket_sla(db)
                     finally:
@@ -10,7 +10,7 @@ from typing import Any, Dict, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.models import PaymentMethod, TransactionType
+from app.database.models import PaymentMethod
 from app.utils.currency_converter import currency_converter
 from app.utils.user_utils import format_referrer_info
 
@@ -175,24 +175,6 @@ class CryptoBotPaymentMixin:
                     return False
 
                 payment_service_module = import_module("app.services.payment_service")
-                transaction = await payment_service_module.create_transaction(
-                    db,
-                    user_id=updated_payment.user_id,
-                    type=TransactionType.DEPOSIT,
-                    amount_kopeks=amount_kopeks,
-                    description=(
-                        "Пополнение через CryptoBot "
-                        f"({updated_payment.amount} {updated_payment.asset} → {amount_rubles:.2f}₽)"
-                    ),
-                    payment_method=PaymentMethod.CRYPTOBOT,
-                    external_id=invoice_id,
-                    is_completed=True,
-                )
-
-                await cryptobot_crud.link_cryptobot_payment_to_transaction(
-                    db, invoice_id, transaction.id
-                )
-
                 get_user_by_id = payment_service_module.get_user_by_id
                 user = await get_user_by_id(db, updated_payment.user_id)
                 if not user:
@@ -205,9 +187,6 @@ class CryptoBotPaymentMixin:
                 old_balance = user.balance_kopeks
                 was_first_topup = not user.has_made_first_topup
 
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-
                 promo_group = getattr(user, "promo_group", None)
                 subscription = getattr(user, "subscription", None)
                 referrer_info = format_referrer_info(user)
@@ -215,7 +194,29 @@ class CryptoBotPaymentMixin:
                     "🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение"
                 )
 
-                await db.commit()
+                # Баланс и транзакция фиксируются одним коммитом
+                transaction = await payment_service_module.credit_user_balance(
+                    db,
+                    user,
+                    amount_kopeks,
+                    (
+                        "Пополнение через CryptoBot "
+                        f"({updated_payment.amount} {updated_payment.asset} → {amount_rubles:.2f}₽)"
+                    ),
+                    payment_method=PaymentMethod.CRYPTOBOT,
+                    external_id=invoice_id,
+                )
+                if transaction is None:
+                    logger.error(
+                        "Не удалось начислить баланс пользователю %s по CryptoBot платежу %s",
+                        updated_payment.user_id,
+                        invoice_id,
+                    )
+                    return False
+
+                await cryptobot_crud.link_cryptobot_payment_to_transaction(
+                    db, invoice_id, transaction.id
+                )
 
                 try:
                     from app.services.referral_service import process_referral_topup
@@ -10,7 +10,7 @@ from typing import Any, Dict, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.models import PaymentMethod, TransactionType
+from app.database.models import PaymentMethod
 from app.utils.user_utils import format_referrer_info
 
 logger = logging.getLogger(__name__)
@@ -194,23 +194,6 @@ class MulenPayPaymentMixin:
                     f"платеж {payment.uuid}",
                 )
 
-                transaction = await payment_module.create_transaction(
-                    db,
-                    user_id=payment.user_id,
-                    type=TransactionType.DEPOSIT,
-                    amount_kopeks=payment.amount_kopeks,
-                    description=f"Пополнение через MulenPay: {payment_description}",
-                    payment_method=PaymentMethod.MULENPAY,
-                    external_id=payment.uuid,
-                    is_completed=True,
-                )
-
-                await payment_module.link_mulenpay_payment_to_transaction(
-                    db=db,
-                    payment=payment,
-                    transaction_id=transaction.id,
-                )
-
                 user = await payment_module.get_user_by_id(db, payment.user_id)
                 if not user:
                     logger.error(
@@ -222,11 +205,27 @@ class MulenPayPaymentMixin:
                 old_balance = user.balance_kopeks
                 was_first_topup = not user.has_made_first_topup
 
-                await payment_module.add_user_balance(
+                # Баланс и транзакция фиксируются одним коммитом
+                transaction = await payment_module.credit_user_balance(
                     db,
                     user,
                     payment.amount_kopeks,
-                    f"Пополнение MulenPay: {payment.amount_kopeks // 100}₽",
+                    f"Пополнение через MulenPay: {payment_description}",
+                    payment_method=PaymentMethod.MULENPAY,
+                    external_id=payment.uuid,
+                )
+                if transaction is None:
+                    logger.error(
+                        "Не удалось начислить баланс пользователю %s по MulenPay платежу %s",
+                        payment.user_id,
+                        payment.uuid,
+                    )
+                    return False
+
+                await payment_module.link_mulenpay_payment_to_transaction(
+                    db=db,
+                    payment=payment,
+                    transaction_id=transaction.id,
                 )
 
                 if was_first_topup and not user.has_made_first_topup:
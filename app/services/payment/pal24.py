@@ -11,7 +11,7 @@ from typing import Any, Dict, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.models import PaymentMethod, TransactionType
+from app.database.models import PaymentMethod
 from app.services.pal24_service import Pal24APIError
 from app.utils.user_utils import format_referrer_info
 
@@ -279,25 +279,9 @@ class Pal24PaymentMixin:
                     )
                     return True
 
-                transaction = await payment_module.create_transaction(
-                    db,
-                    user_id=payment.user_id,
-                    type=TransactionType.DEPOSIT,
-                    amount_kopeks=payment.amount_kopeks,
-                    description=f"Пополнение через Pal24 ({payment_id})",
-                    payment_method=PaymentMethod.PAL24,
-                    external_id=str(payment_id) if payment_id else payment.bill_id,
-                    is_completed=True,
-                )
-
-                await payment_module.link_pal24_payment_to_transaction(db, payment, transaction.id)
-
                 old_balance = user.balance_kopeks
                 was_first_topup = not user.has_made_first_topup
 
-                user.balance_kopeks += payment.amount_kopeks
-                user.updated_at = datetime.utcnow()
-
                 promo_group = getattr(user, "promo_group", None)
                 subscription = getattr(user, "subscription", None)
                 referrer_info = format_referrer_info(user)
@@ -305,7 +289,24 @@ class Pal24PaymentMixin:
                     "🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение"
                 )
 
-                await db.commit()
+                # Баланс и транзакция фиксируются одним коммитом
+                transaction = await payment_module.credit_user_balance(
+                    db,
+                    user,
+                    payment.amount_kopeks,
+                    f"Пополнение через Pal24 ({payment_id})",
+                    payment_method=PaymentMethod.PAL24,
+                    external_id=str(payment_id) if payment_id else payment.bill_id,
+                )
+                if transaction is None:
+                    logger.error(
+                        "Не удалось начислить баланс пользователю %s по Pal24 платежу %s",
+                        payment.user_id,
+                        payment.bill_id,
+                    )
+                    return False
+
+                await payment_module.link_pal24_payment_to_transaction(db, payment, transaction.id)
 
                 try:
                     from app.services.referral_service import process_referral_topup
@@ -7,7 +7,6 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime
 from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
 from typing import Optional
 
@@ -15,9 +14,8 @@ from aiogram.types import LabeledPrice
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.crud.transaction import create_transaction
-from app.database.crud.user import get_user_by_id
-from app.database.models import PaymentMethod, TransactionType
+from app.database.crud.user import credit_user_balance, get_user_by_id
+from app.database.models import PaymentMethod
 from app.external.telegram_stars import TelegramStarsService
 from app.utils.user_utils import format_referrer_info
 
@@ -96,17 +94,6 @@ class TelegramStarsMixin:
                 )
             )
 
-            transaction = await create_transaction(
-                db=db,
-                user_id=user_id,
-                type=TransactionType.DEPOSIT,
-                amount_kopeks=amount_kopeks,
-                description=f"Пополнение через Telegram Stars ({stars_amount} ⭐)",
-                payment_method=PaymentMethod.TELEGRAM_STARS,
-                external_id=telegram_payment_charge_id,
-                is_completed=True,
-            )
-
             user = await get_user_by_id(db, user_id)
             if not user:
                 logger.error(
@@ -119,10 +106,6 @@ class TelegramStarsMixin:
             old_balance = user.balance_kopeks
             was_first_topup = not user.has_made_first_topup
 
-            # Обновляем баланс в БД.
-            user.balance_kopeks += amount_kopeks
-            user.updated_at = datetime.utcnow()
-
             promo_group = getattr(user, "promo_group", None)
             subscription = getattr(user, "subscription", None)
             referrer_info = format_referrer_info(user)
@@ -130,7 +113,21 @@ class TelegramStarsMixin:
                 "🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение"
             )
 
-            await db.commit()
+            # Баланс и транзакция фиксируются одним коммитом.
+            transaction = await credit_user_balance(
+                db,
+                user,
+                amount_kopeks,
+                f"Пополнение через Telegram Stars ({stars_amount} ⭐)",
+                payment_method=PaymentMethod.TELEGRAM_STARS,
+                external_id=telegram_payment_charge_id,
+            )
+            if transaction is None:
+                logger.error(
+                    "Не удалось начислить баланс пользователю %s за Stars платеж",
+                    user_id,
+                )
+                return False
 
             description_for_referral = (
                 f"Пополнение Stars: {settings.format_price(amount_kopeks)} ({stars_amount} ⭐)"
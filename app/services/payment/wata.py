@@ -4,14 +4,13 @@ from __future__ import annotations
 
 import logging
 import uuid
-from datetime import datetime
 from importlib import import_module
 from typing import Any, Dict, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.models import PaymentMethod, TransactionType
+from app.database.models import PaymentMethod
 from app.services.wata_service import WataAPIError, WataService
 from app.utils.user_utils import format_referrer_info
 
@@ -230,25 +229,23 @@ class WataPaymentMixin:
         transaction_external_id = str(transaction_payload.get("id") or transaction_payload.get("transactionId") or "")
         description = f"Пополнение через WATA ({payment.payment_link_id})"
 
-        transaction = await payment_module.create_transaction(
+        old_balance = user.balance_kopeks
+        was_first_topup = not user.has_made_first_topup
+
+        # Баланс и транзакция фиксируются одним коммитом
+        transaction = await payment_module.credit_user_balance(
             db,
-            user_id=payment.user_id,
-            type=TransactionType.DEPOSIT,
-            amount_kopeks=payment.amount_kopeks,
-            description=description,
+            user,
+            payment.amount_kopeks,
+            description,
             payment_method=PaymentMethod.WATA,
             external_id=transaction_external_id or payment.payment_link_id,
-            is_completed=True,
         )
+        if transaction is None:
+            logger.error("Не удалось начислить баланс пользователю %s по WATA платежу", payment.user_id)
+            return payment
 
         await payment_module.link_wata_payment_to_transaction(db, payment, transaction.id)
-
-        old_balance = user.balance_kopeks
-        was_first_topup = not user.has_made_first_topup
-
-        user.balance_kopeks += payment.amount_kopeks
-        user.updated_at = datetime.utcnow()
-        await db.commit()
         await db.refresh(user)
 
         promo_group = getattr(user, "promo_group", None)
@@ -14,7 +14,7 @@ from typing import Any, Dict, Optional, TYPE_CHECKING
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.models import PaymentMethod, TransactionType
+from app.database.models import PaymentMethod
 from app.utils.user_utils import format_referrer_info
 
 logger = logging.getLogger(__name__)
@@ -216,16 +216,38 @@ class YooKassaPaymentMixin:
 
             payment_description = getattr(payment, "description", "YooKassa платеж")
 
-            transaction = await payment_module.create_transaction(
-                db=db,
-                user_id=payment.user_id,
-                type=TransactionType.DEPOSIT,
-                amount_kopeks=payment.amount_kopeks,
-                description=f"Пополнение через YooKassa: {payment_description}",
+            user = await payment_module.get_user_by_id(db, payment.user_id)
+            if not user:
+                logger.error(
+                    "Пользователь %s не найден при обработке YooKassa",
+                    payment.user_id,
+                )
+                return False
+
+            old_balance = getattr(user, "balance_kopeks", 0)
+            was_first_topup = not getattr(user, "has_made_first_topup", False)
+
+            promo_group = getattr(user, "promo_group", None)
+            subscription = getattr(user, "subscription", None)
+            referrer_info = format_referrer_info(user)
+            topup_status = ("🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение")
+
+            # Баланс и транзакция фиксируются одним коммитом
+            transaction = await payment_module.credit_user_balance(
+                db,
+                user,
+                payment.amount_kopeks,
+                f"Пополнение через YooKassa: {payment_description}",
                 payment_method=PaymentMethod.YOOKASSA,
                 external_id=payment.yookassa_payment_id,
-                is_completed=True,
             )
+            if transaction is None:
+                logger.error(
+                    "Не удалось начислить баланс пользователю %s по платежу YooKassa %s",
+                    payment.user_id,
+                    payment.yookassa_payment_id,
+                )
+                return False
 
             await payment_module.link_yookassa_payment_to_transaction(
                 db,
@@ -233,131 +255,116 @@ class YooKassaPaymentMixin:
                 transaction.id,
             )
 
-            user = await payment_module.get_user_by_id(db, payment.user_id)
-            if user:
-                old_balance = getattr(user, "balance_kopeks", 0)
-                was_first_topup = not getattr(user, "has_made_first_topup", False)
+            try:
+                from app.services.referral_service import process_referral_topup
 
-                user.balance_kopeks += payment.amount_kopeks
-                user.updated_at = datetime.utcnow()
-
-                promo_group = getattr(user, "promo_group", None)
-                subscription = getattr(user, "subscription", None)
-                referrer_info = format_referrer_info(user)
-                topup_status = ("🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение")
+                await process_referral_topup(
+                    db,
+                    user.id,
+                    payment.amount_kopeks,
+                    getattr(self, "bot", None),
+                )
+            except Exception as error:
+                logger.error(
+                    "Ошибка обработки реферального пополнения YooKassa: %s",
+                    error,
+                )
 
+            if was_first_topup and not getattr(user, "has_made_first_topup", False):
+                user.has_made_first_topup = True
                 await db.commit()
 
+            await db.refresh(user)
+
+            # Отправляем уведомления админам
+            if getattr(self, "bot", None):
                 try:
-                    from app.services.referral_service import process_referral_topup
+                    from app.services.admin_notification_service import (
+                        AdminNotificationService,
+                    )
 
-                    await process_referral_topup(
-                        db,
-                        user.id,
-                        payment.amount_kopeks,
-                        getattr(self, "bot", None),
+                    notification_service = AdminNotificationService(self.bot)
+                    await notification_service.send_balance_topup_notification(
+                        user,
+                        transaction,
+                        old_balance,
+                        topup_status=topup_status,
+                        referrer_info=referrer_info,
+                        subscription=subscription,
+                        promo_group=promo_group,
+                        db=db,
                     )
+                    logger.info("Уведомление админам о пополнении отправлено успешно")
                 except Exception as error:
                     logger.error(
-                        "Ошибка обработки реферального пополнения YooKassa: %s",
+                        "Ошибка отправки уведомления админам о YooKassa пополнении: %s",
                         error,
+                        exc_info=True  # Добавляем полный стек вызовов для отладки
                     )
 
-                if was_first_topup and not getattr(user, "has_made_first_topup", False):
-                    user.has_made_first_topup = True
-                    await db.commit()
-
-                await db.refresh(user)
-
-                # Отправляем уведомления админам
-                if getattr(self, "bot", None):
-                    try:
-                        from app.services.admin_notification_service import (
-                            AdminNotificationService,
-                        )
-
-                        notification_service = AdminNotificationService(self.bot)
-                        await notification_service.send_balance_topup_notification(
-                            user,
-                            transaction,
-                            old_balance,
-                            topup_status=topup_status,
-                            referrer_info=referrer_info,
-                            subscription=subscription,
-                            promo_group=promo_group,
-                            db=db,
-                        )
-                        logger.info("Уведомление админам о пополнении отправлено успешно")
-                    except Exception as error:
-                        logger.error(
-                            "Ошибка отправки уведомления админам о YooKassa пополнении: %s",
-                            error,
-                            exc_info=True  # Добавляем полный стек вызовов для отладки
-                        )
-
-                # Отправляем уведомление пользователю
-                if getattr(self, "bot", None):
-                    try:
-                        # Передаем только простые данные, чтобы избежать проблем с ленивой загрузкой
-                        await self._send_payment_success_notification(
-                            user.telegram_id,
-                            payment.amount_kopeks,
-                            user=None,  # Передаем None, чтобы _ensure_user_snapshot загрузил данные сам
-                            db=db,
-                            payment_method_title="Банковская карта (YooKassa)",
-                        )
-                        logger.info("Уведомление пользователю о платеже отправлено успешно")
-                    except Exception as error:
-                        logger.error(
-                            "Ошибка отправки уведомления о платеже: %s", 
-                            error,
-                            exc_info=True  # Добавляем полный стек вызовов для отладки
-                        )
-
-                # Проверяем наличие сохраненной корзины для возврата к оформлению подписки
-                # ВАЖНО: этот код должен выполняться даже при ошибках в уведомлениях
-                logger.info(f"Проверяем наличие сохраненной корзины для пользователя {user.id}")
-                from app.services.user_cart_service import user_cart_service
+            # Отправляем уведомление пользователю
+            if getattr(self, "bot", None):
                 try:
-                    has_saved_cart = await user_cart_service.has_user_cart(user.id)
-                    logger.info(f"Результат проверки корзины для пользователя {user.id}: {has_saved_cart}")
-                    if has_saved_cart and getattr(self, "bot", None):
-                        # Если у пользователя есть сохраненная корзина, 
-                        # отправляем ему уведомление с кнопкой вернуться к оформлению
-                        from app.localization.texts import get_texts
-                        from aiogram import types
-                        
-                        texts = get_texts(user.language)
-                        cart_message = texts.BALANCE_TOPUP_CART_REMINDER_DETAILED.format(
-                            total_amount=settings.format_price(payment.amount_kopeks)
-                        )
-                        
-                        # Создаем клавиатуру с кнопками
-                        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-                            [types.InlineKeyboardButton(
-                                text=texts.RETURN_TO_SUBSCRIPTION_CHECKOUT,
-                                callback_data="subscription_resume_checkout"
-                            )],
-                            [types.InlineKeyboardButton(
-                                text="💰 Мой баланс",
-                                callback_data="menu_balance"
-                            )],
-                            [types.InlineKeyboardButton(
-                                text="🏠 Главное меню",
-                                callback_data="back_to_menu"
-                            )]
-                        ])
-                        
-                        await self.bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=f"✅ Баланс пополнен на {settings.format_price(payment.amount_kopeks)}!\n\n{cart_message}",
-                            reply_markup=keyboard
-                        )
-                        logger.info(f"Отправлено уведомление с кнопкой возврата к оформлению подписки пользователю {user.id}")
-                    else:
-                        logger.info(f"У пользователя {user.id} нет сохраненной корзины или бот недоступен")
-                except Exception as e:
-                    logger.error(f"Критическая ошибка при работе с сохраненной корзиной для пользователя {user.id}: {e}", exc_info=True)
+                    # Передаем только простые данные, чтобы избежать проблем с ленивой загрузкой
+                    await self._send_payment_success_notification(
+                        user.telegram_id,
+                        payment.amount_kopeks,
+                        user=None,  # Передаем None, чтобы _ensure_user_snapshot загрузил данные сам
+                        db=db,
+                        payment_method_title="Банковская карта (YooKassa)",
+                    )
+                    logger.info("Уведомление пользователю о платеже отправлено успешно")
+                except Exception as error:
+                    logger.error(
+                        "Ошибка отправки уведомления о платеже: %s", 
+                        error,
+                        exc_info=True  # Добавляем полный стек вызовов для отладки
+                    )
+
+            # Проверяем наличие сохраненной корзины для возврата к оформлению подписки
+            # ВАЖНО: этот код должен выполняться даже при ошибках в уведомлениях
+            logger.info(f"Проверяем наличие сохраненной корзины для пользователя {user.id}")
+            from app.services.user_cart_service import user_cart_service
+            try:
+                has_saved_cart = await user_cart_service.has_user_cart(user.id)
+                logger.info(f"Результат проверки корзины для пользователя {user.id}: {has_saved_cart}")
+                if has_saved_cart and getattr(self, "bot", None):
+                    # Если у пользователя есть сохраненная корзина, 
+                    # отправляем ему уведомление с кнопкой вернуться к оформлению
+                    from app.localization.texts import get_texts
+                    from aiogram import types
+                    
+                    texts = get_texts(user.language)
+                    cart_message = texts.BALANCE_TOPUP_CART_REMINDER_DETAILED.format(
+                        total_amount=settings.format_price(payment.amount_kopeks)
+                    )
+                    
+                    # Создаем клавиатуру с кнопками
+                    keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+                        [types.InlineKeyboardButton(
+                            text=texts.RETURN_TO_SUBSCRIPTION_CHECKOUT,
+                            callback_data="subscription_resume_checkout"
+                        )],
+                        [types.InlineKeyboardButton(
+                            text="💰 Мой баланс",
+                            callback_data="menu_balance"
+                        )],
+                        [types.InlineKeyboardButton(
+                            text="🏠 Главное меню",
+                            callback_data="back_to_menu"
+                        )]
+                    ])
+                    
+                    await self.bot.send_message(
+                        chat_id=user.telegram_id,
+                        text=f"✅ Баланс пополнен на {settings.format_price(payment.amount_kopeks)}!\n\n{cart_message}",
+                        reply_markup=keyboard
+                    )
+                    logger.info(f"Отправлено уведомление с кнопкой возврата к оформлению подписки пользователю {user.id}")
+                else:
+                    logger.info(f"У пользователя {user.id} нет сохраненной корзины или бот недоступен")
+            except Exception as e:
+                logger.error(f"Критическая ошибка при работе с сохраненной корзиной для пользователя {user.id}: {e}", exc_info=True)
 
             logger.info(
                 "Успешно обработан платеж YooKassa %s: пользователь %s получил %s₽",
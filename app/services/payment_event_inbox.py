@@ -0,0 +1,278 @@
+"""Входящая очередь платёжных событий и воркеры её обработки.
+
+Webhook-шлюз только проверяет запрос и записывает сырое событие в таблицу
+``payment_events``; начисление баланса, транзакции, реферальные бонусы и
+уведомления выполняются здесь, вне HTTP-запроса провайдера.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.crud.payment_event import (
+    claim_due_payment_events,
+    complete_payment_event,
+    enqueue_payment_event,
+    fail_payment_event,
+    get_payment_event_stats,
+    requeue_stale_payment_events,
+)
+from app.database.database import AsyncSessionLocal, BackgroundSessionLocal
+from app.database.models import PaymentEvent
+from app.utils.concurrency import gather_bounded
+
+logger = logging.getLogger(__name__)
+
+EventProcessor = Callable[["PaymentEventInbox", AsyncSession, Dict[str, Any]], Awaitable[bool]]
+
+
+async def _process_yookassa(inbox: "PaymentEventInbox", db: AsyncSession, payload: Dict[str, Any]) -> bool:
+    return await inbox.payment_service.process_yookassa_webhook(db, payload)
+
+
+async def _process_cryptobot(inbox: "PaymentEventInbox", db: AsyncSession, payload: Dict[str, Any]) -> bool:
+    return await inbox.payment_service.process_cryptobot_webhook(db, payload)
+
+
+async def _process_mulenpay(inbox: "PaymentEventInbox", db: AsyncSession, payload: Dict[str, Any]) -> bool:
+    return await inbox.payment_service.process_mulenpay_callback(db, payload)
+
+
+async def _process_pal24(inbox: "PaymentEventInbox", db: AsyncSession, payload: Dict[str, Any]) -> bool:
+    return await inbox.payment_service.process_pal24_postback(db, payload)
+
+
+async def _process_tribute(inbox: "PaymentEventInbox", db: AsyncSession, payload: Dict[str, Any]) -> bool:
+    from app.services.tribute_service import TributeService
+
+    result = await TributeService(inbox.bot).process_webhook(json.dumps(payload, ensure_ascii=False))
+    return bool(result) and result.get("status") != "error"
+
+
+PROCESSORS: Dict[str, EventProcessor] = {
+    "yookassa": _process_yookassa,
+    "cryptobot": _process_cryptobot,
+    "mulenpay": _process_mulenpay,
+    "pal24": _process_pal24,
+    "tribute": _process_tribute,
+}
+
+
+class PaymentEventInbox:
+    """Пул воркеров, обрабатывающих события из ``payment_events`` с повторами и dead-letter."""
+
+    def __init__(self) -> None:
+        self.bot = None
+        self.payment_service = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._started_at: Optional[float] = None
+        self._next_requeue_at = 0.0
+        self._processed = 0
+        self._failed = 0
+        self._dead_lettered = 0
+        self._processing_ms_total = 0.0
+
+    def set_payment_service(self, payment_service, bot=None) -> None:
+        self.payment_service = payment_service
+        self.bot = bot if bot is not None else getattr(payment_service, "bot", None)
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return settings.PAYMENT_INBOX_ENABLED
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def enqueue(
+        self,
+        provider: str,
+        event_key: str,
+        ordering_key: str,
+        payload: Dict[str, Any],
+    ) -> bool:
+        async with AsyncSessionLocal() as db:
+            event, created = await enqueue_payment_event(
+                db,
+                provider=provider,
+                event_key=event_key,
+                ordering_key=ordering_key,
+                payload=payload,
+            )
+
+        if created:
+            logger.info("📨 Событие %s #%s поставлено в очередь (%s)", provider, event.id, event_key)
+        else:
+            logger.info("♻️ Событие %s %s уже в очереди (#%s)", provider, event_key, event.id)
+        self._wakeup.set()
+        return created
+
+    async def start(self) -> None:
+        await self.stop()
+
+        if not self.is_enabled():
+            logger.info("Очередь платёжных событий отключена настройками")
+            return
+
+        if self.payment_service is None:
+            logger.warning("Невозможно запустить очередь платёжных событий без PaymentService")
+            return
+
+        await self.requeue_expired()
+
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(
+            "📬 Очередь платёжных событий запущена: воркеров %s, пакет %s",
+            settings.PAYMENT_INBOX_WORKERS,
+            settings.PAYMENT_INBOX_BATCH_SIZE,
+        )
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def requeue_expired(self) -> int:
+        """Возвращает в очередь события, захват которых истёк (реплика упала во время обработки)."""
+
+        lease_seconds = max(1, settings.PAYMENT_INBOX_LEASE_SECONDS)
+        self._next_requeue_at = time.monotonic() + lease_seconds
+        async with BackgroundSessionLocal() as db:
+            requeued = await requeue_stale_payment_events(db, lease_seconds)
+        if requeued:
+            logger.warning("🔁 Возвращено в очередь %s платёжных событий с истёкшим захватом", requeued)
+        return requeued
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if time.monotonic() >= self._next_requeue_at:
+                    await self.requeue_expired()
+                handled = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.error("Ошибка цикла очереди платёжных событий: %s", error, exc_info=True)
+                handled = 0
+
+            if handled:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=settings.PAYMENT_INBOX_POLL_INTERVAL_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Забирает пакет готовых событий и обрабатывает его пулом воркеров."""
+
+        async with BackgroundSessionLocal() as db:
+            events = await claim_due_payment_events(db, settings.PAYMENT_INBOX_BATCH_SIZE)
+
+        if not events:
+            return 0
+
+        await gather_bounded(self._process_event, events, settings.PAYMENT_INBOX_WORKERS)
+        return len(events)
+
+    async def _process_event(self, event: PaymentEvent) -> None:
+        processor = PROCESSORS.get(event.provider)
+        started = time.perf_counter()
+        error: Optional[str] = None
+
+        if processor is None:
+            error = f"Неизвестный провайдер {event.provider}"
+        else:
+            try:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        if not await processor(self, db, event.payload):
+                            error = "Обработчик вернул отказ"
+                    except Exception:
+                        await db.rollback()
+                        raise
+            except Exception as exc:
+                logger.error(
+                    "Ошибка обработки платёжного события %s #%s: %s",
+                    event.provider,
+                    event.id,
+                    exc,
+                    exc_info=True,
+                )
+                error = f"{type(exc).__name__}: {exc}"
+
+        self._processing_ms_total += (time.perf_counter() - started) * 1000
+
+        async with BackgroundSessionLocal() as db:
+            if error is None:
+                await complete_payment_event(db, event.id)
+                self._processed += 1
+                return
+
+            self._failed += 1
+            retry_at = self._next_attempt_at(event.attempts) if processor else None
+            await fail_payment_event(db, event.id, error, retry_at=retry_at)
+
+        if retry_at is None:
+            self._dead_lettered += 1
+            logger.error(
+                "☠️ Платёжное событие %s #%s перенесено в dead-letter после %s попыток: %s",
+                event.provider,
+                event.id,
+                event.attempts,
+                error,
+            )
+        else:
+            logger.warning(
+                "⏳ Платёжное событие %s #%s будет повторено в %s (попытка %s): %s",
+                event.provider,
+                event.id,
+                retry_at.strftime("%H:%M:%S"),
+                event.attempts,
+                error,
+            )
+
+    @staticmethod
+    def _next_attempt_at(attempts: int) -> Optional[datetime]:
+        if attempts >= settings.PAYMENT_INBOX_MAX_ATTEMPTS:
+            return None
+        delay = min(
+            settings.PAYMENT_INBOX_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)),
+            settings.PAYMENT_INBOX_RETRY_MAX_SECONDS,
+        )
+        return datetime.utcnow() + timedelta(seconds=delay)
+
+    async def get_metrics(self, db: AsyncSession) -> Dict[str, Any]:
+        stats = await get_payment_event_stats(db)
+        handled = self._processed + self._failed
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            **stats,
+            "running": self.is_running(),
+            "workers": settings.PAYMENT_INBOX_WORKERS,
+            "processed": self._processed,
+            "failed_attempts": self._failed,
+            "dead_lettered": self._dead_lettered,
+            "avg_processing_ms": round(self._processing_ms_total / handled, 2) if handled else 0.0,
+            "throughput_per_minute": round(self._processed / uptime * 60, 2) if uptime else 0.0,
+        }
+
+
+payment_event_inbox = PaymentEventInbox()
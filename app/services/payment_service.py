@@ -58,6 +58,11 @@ async def add_user_balance(*args, **kwargs):
     return await user_crud.add_user_balance(*args, **kwargs)
 
 
+async def credit_user_balance(*args, **kwargs):
+    user_crud = import_module("app.database.crud.user")
+    return await user_crud.credit_user_balance(*args, **kwargs)
+
+
 async def get_user_by_id(*args, **kwargs):
     user_crud = import_module("app.database.crud.user")
     return await user_crud.get_user_by_id(*args, **kwargs)
@@ -1,9 +1,12 @@
+import asyncio
+import copy
 import logging
 import os
 import re
+import time
 from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from zoneinfo import ZoneInfo
 
@@ -12,7 +15,7 @@ from app.external.remnawave_api import (
     RemnaWaveAPI, RemnaWaveUser, RemnaWaveInternalSquad,
     RemnaWaveNode, UserStatus, TrafficLimitStrategy, RemnaWaveAPIError
 )
-from sqlalchemy import and_, cast, delete, func, select, update, String
+from sqlalchemy import and_, delete, func, select, update
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database.crud.user import get_users_list, get_user_by_telegram_id, update_user
@@ -22,6 +25,7 @@ from app.database.crud.subscription import (
     decrement_subscription_server_counts,
 )
 from app.database.crud.server_squad import get_server_squad_by_uuid
+from app.database.crud.subscription_squad import subscription_ids_for_squads
 from app.database.models import (
     User,
     Subscription,
@@ -32,6 +36,7 @@ from app.database.models import (
     SubscriptionStatus,
     ServerSquad,
 )
+from app.services.remnawave_write_pipeline import ProgressCallback, RemnaWaveWritePipeline
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +47,17 @@ class RemnaWaveConfigurationError(Exception):
 
 class RemnaWaveService:
 
+    STATISTICS_SOURCES = (
+        ("system_stats", "get_system_stats", dict),
+        ("bandwidth_stats", "get_bandwidth_stats", dict),
+        ("realtime_usage", "get_nodes_realtime_usage", list),
+        ("nodes_stats", "get_nodes_statistics", dict),
+    )
+
+    # Общие для процесса: сервис создаётся заново в каждом обработчике
+    _statistics_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    _statistics_inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+
     def __init__(self):
         auth_params = settings.get_remnawave_auth_params()
         base_url = (auth_params.get("base_url") or "").strip()
@@ -133,156 +149,207 @@ class RemnaWaveService:
             logger.warning(f"⚠️ Не удалось распарсить дату '{date_str}': {e}. Используем дефолтную дату.")
             return self._now_in_panel_timezone() + timedelta(days=30)
     
-    async def get_system_statistics(self) -> Dict[str, Any]:
-            try:
-                async with self.get_api_client() as api:
-                    logger.info("Получение системной статистики RemnaWave...")
-                
-                    try:
-                        system_stats = await api.get_system_stats()
-                        logger.info(f"Системная статистика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения системной статистики: {e}")
-                        system_stats = {}
-                 
-                    try:
-                        bandwidth_stats = await api.get_bandwidth_stats()
-                        logger.info(f"Статистика трафика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения статистики трафика: {e}")
-                        bandwidth_stats = {}
-                
-                    try:
-                        realtime_usage = await api.get_nodes_realtime_usage()
-                        logger.info(f"Реалтайм статистика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения реалтайм статистики: {e}")
-                        realtime_usage = []
-                
-                    try:
-                        nodes_stats = await api.get_nodes_statistics()
-                    except Exception as e:
-                        logger.error(f"Ошибка получения статистики нод: {e}")
-                        nodes_stats = {}
-                
-                
-                    total_download = sum(node.get('downloadBytes', 0) for node in realtime_usage)
-                    total_upload = sum(node.get('uploadBytes', 0) for node in realtime_usage)
-                    total_realtime_traffic = total_download + total_upload
-                
-                    total_user_traffic = int(system_stats.get('users', {}).get('totalTrafficBytes', '0'))
-                
-                    nodes_weekly_data = []
-                    if nodes_stats.get('lastSevenDays'):
-                        nodes_by_name = {}
-                        for day_data in nodes_stats['lastSevenDays']:
-                            node_name = day_data['nodeName']
-                            if node_name not in nodes_by_name:
-                                nodes_by_name[node_name] = {
-                                    'name': node_name,
-                                    'total_bytes': 0,
-                                    'days_data': []
-                                }
-                        
-                            daily_bytes = int(day_data['totalBytes'])
-                            nodes_by_name[node_name]['total_bytes'] += daily_bytes
-                            nodes_by_name[node_name]['days_data'].append({
-                                'date': day_data['date'],
-                                'bytes': daily_bytes
-                            })
-                    
-                        nodes_weekly_data = list(nodes_by_name.values())
-                        nodes_weekly_data.sort(key=lambda x: x['total_bytes'], reverse=True)
-                
-                    result = {
-                        "system": {
-                            "users_online": system_stats.get('onlineStats', {}).get('onlineNow', 0),
-                            "total_users": system_stats.get('users', {}).get('totalUsers', 0),
-                            "active_connections": system_stats.get('onlineStats', {}).get('onlineNow', 0),
-                            "nodes_online": system_stats.get('nodes', {}).get('totalOnline', 0),
-                            "users_last_day": system_stats.get('onlineStats', {}).get('lastDay', 0),
-                            "users_last_week": system_stats.get('onlineStats', {}).get('lastWeek', 0),
-                            "users_never_online": system_stats.get('onlineStats', {}).get('neverOnline', 0),
-                            "total_user_traffic": total_user_traffic
-                        },
-                        "users_by_status": system_stats.get('users', {}).get('statusCounts', {}),
-                        "server_info": {
-                            "cpu_cores": system_stats.get('cpu', {}).get('cores', 0),
-                            "cpu_physical_cores": system_stats.get('cpu', {}).get('physicalCores', 0),
-                            "memory_total": system_stats.get('memory', {}).get('total', 0),
-                            "memory_used": system_stats.get('memory', {}).get('used', 0),
-                            "memory_free": system_stats.get('memory', {}).get('free', 0),
-                            "memory_available": system_stats.get('memory', {}).get('available', 0),
-                            "uptime_seconds": system_stats.get('uptime', 0)
-                        },
-                        "bandwidth": {
-                            "realtime_download": total_download,
-                            "realtime_upload": total_upload,
-                            "realtime_total": total_realtime_traffic
-                        },
-                        "traffic_periods": {
-                            "last_2_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastTwoDays', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastTwoDays', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLastTwoDays', {}).get('difference', '0 B')
-                            },
-                            "last_7_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastSevenDays', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastSevenDays', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLastSevenDays', {}).get('difference', '0 B')
-                            },
-                            "last_30_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLast30Days', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLast30Days', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLast30Days', {}).get('difference', '0 B')
-                            },
-                            "current_month": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCalendarMonth', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCalendarMonth', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthCalendarMonth', {}).get('difference', '0 B')
-                            },
-                            "current_year": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCurrentYear', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCurrentYear', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthCurrentYear', {}).get('difference', '0 B')
-                            }
-                        },
-                        "nodes_realtime": realtime_usage,
-                        "nodes_weekly": nodes_weekly_data,
-                        "last_updated": datetime.now()
+    async def get_statistics_sources(self, *, force_refresh: bool = False) -> Dict[str, Any]:
+        """Сырые ответы панели для экранов статистики.
+
+        Запросы выполняются параллельно с таймаутом на каждый, результат
+        кэшируется на ``REMNAWAVE_STATS_CACHE_TTL_SECONDS`` и общий для всех
+        экземпляров сервиса; одновременные вызовы ждут один и тот же запрос.
+        """
+
+        self._ensure_configured()
+        assert self.api is not None
+        cache_key = self.api.base_url
+
+        cached = RemnaWaveService._statistics_cache.get(cache_key)
+        if (
+            not force_refresh
+            and cached
+            and time.monotonic() - cached[0] < settings.REMNAWAVE_STATS_CACHE_TTL_SECONDS
+        ):
+            return copy.deepcopy(cached[1])
+
+        task = RemnaWaveService._statistics_inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_statistics_sources(cache_key))
+            RemnaWaveService._statistics_inflight[cache_key] = task
+
+            def _release(done: asyncio.Task) -> None:
+                if RemnaWaveService._statistics_inflight.get(cache_key) is done:
+                    RemnaWaveService._statistics_inflight.pop(cache_key, None)
+
+            task.add_done_callback(_release)
+
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _fetch_statistics_sources(self, cache_key: str) -> Dict[str, Any]:
+        async with self.get_api_client() as api:
+            results = await asyncio.gather(
+                *(
+                    self._fetch_statistics_source(api, method)
+                    for _, method, _ in self.STATISTICS_SOURCES
+                )
+            )
+
+        sources: Dict[str, Any] = {"fetched_at": datetime.now()}
+        complete = True
+        for (name, _, default), (ok, value) in zip(self.STATISTICS_SOURCES, results):
+            sources[name] = value if ok and value is not None else default()
+            complete = complete and ok
+
+        # Частичный результат не кэшируем, чтобы следующий запрос повторил упавшие вызовы
+        if complete:
+            RemnaWaveService._statistics_cache[cache_key] = (time.monotonic(), sources)
+        return sources
+
+    @staticmethod
+    async def _fetch_statistics_source(api: RemnaWaveAPI, method: str) -> Tuple[bool, Any]:
+        try:
+            return True, await asyncio.wait_for(
+                getattr(api, method)(),
+                timeout=settings.REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            logger.error(
+                "Таймаут %sс при вызове %s RemnaWave",
+                settings.REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS,
+                method,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка вызова {method} RemnaWave: {e}")
+        return False, None
+
+    async def get_system_statistics(self, *, force_refresh: bool = False) -> Dict[str, Any]:
+        try:
+            sources = await self.get_statistics_sources(force_refresh=force_refresh)
+            result = self._build_system_statistics(sources)
+        except RemnaWaveAPIError as e:
+            logger.error(f"Ошибка Remnawave API при получении статистики: {e}")
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Общая ошибка получения системной статистики: {e}")
+            return {"error": f"Внутренняя ошибка сервера: {str(e)}"}
+
+        logger.debug(
+            "Статистика сформирована: пользователи=%s, общий трафик=%s",
+            result["system"]["total_users"],
+            result["system"]["total_user_traffic"],
+        )
+        return result
+
+    def _build_system_statistics(self, sources: Dict[str, Any]) -> Dict[str, Any]:
+        system_stats = sources["system_stats"]
+        bandwidth_stats = sources["bandwidth_stats"]
+        realtime_usage = sources["realtime_usage"]
+        nodes_stats = sources["nodes_stats"]
+
+        total_download = sum(node.get('downloadBytes', 0) for node in realtime_usage)
+        total_upload = sum(node.get('uploadBytes', 0) for node in realtime_usage)
+        total_realtime_traffic = total_download + total_upload
+
+        total_user_traffic = int(system_stats.get('users', {}).get('totalTrafficBytes', '0'))
+
+        nodes_weekly_data = []
+        if nodes_stats.get('lastSevenDays'):
+            nodes_by_name = {}
+            for day_data in nodes_stats['lastSevenDays']:
+                node_name = day_data['nodeName']
+                if node_name not in nodes_by_name:
+                    nodes_by_name[node_name] = {
+                        'name': node_name,
+                        'total_bytes': 0,
+                        'days_data': []
                     }
-                    
-                    logger.info(f"Статистика сформирована: пользователи={result['system']['total_users']}, общий трафик={total_user_traffic}")
-                    return result
-                
-            except RemnaWaveAPIError as e:
-                logger.error(f"Ошибка Remnawave API при получении статистики: {e}")
-                return {"error": str(e)}
-            except Exception as e:
-                logger.error(f"Общая ошибка получения системной статистики: {e}")
-                return {"error": f"Внутренняя ошибка сервера: {str(e)}"}
 
-    
+                daily_bytes = int(day_data['totalBytes'])
+                nodes_by_name[node_name]['total_bytes'] += daily_bytes
+                nodes_by_name[node_name]['days_data'].append({
+                    'date': day_data['date'],
+                    'bytes': daily_bytes
+                })
+
+            nodes_weekly_data = list(nodes_by_name.values())
+            nodes_weekly_data.sort(key=lambda x: x['total_bytes'], reverse=True)
+
+        result = {
+            "system": {
+                "users_online": system_stats.get('onlineStats', {}).get('onlineNow', 0),
+                "total_users": system_stats.get('users', {}).get('totalUsers', 0),
+                "active_connections": system_stats.get('onlineStats', {}).get('onlineNow', 0),
+                "nodes_online": system_stats.get('nodes', {}).get('totalOnline', 0),
+                "users_last_day": system_stats.get('onlineStats', {}).get('lastDay', 0),
+                "users_last_week": system_stats.get('onlineStats', {}).get('lastWeek', 0),
+                "users_never_online": system_stats.get('onlineStats', {}).get('neverOnline', 0),
+                "total_user_traffic": total_user_traffic
+            },
+            "users_by_status": system_stats.get('users', {}).get('statusCounts', {}),
+            "server_info": {
+                "cpu_cores": system_stats.get('cpu', {}).get('cores', 0),
+                "cpu_physical_cores": system_stats.get('cpu', {}).get('physicalCores', 0),
+                "memory_total": system_stats.get('memory', {}).get('total', 0),
+                "memory_used": system_stats.get('memory', {}).get('used', 0),
+                "memory_free": system_stats.get('memory', {}).get('free', 0),
+                "memory_available": system_stats.get('memory', {}).get('available', 0),
+                "uptime_seconds": system_stats.get('uptime', 0)
+            },
+            "bandwidth": {
+                "realtime_download": total_download,
+                "realtime_upload": total_upload,
+                "realtime_total": total_realtime_traffic
+            },
+            "traffic_periods": {
+                "last_2_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastTwoDays', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastTwoDays', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLastTwoDays', {}).get('difference', '0 B')
+                },
+                "last_7_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastSevenDays', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastSevenDays', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLastSevenDays', {}).get('difference', '0 B')
+                },
+                "last_30_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLast30Days', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLast30Days', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLast30Days', {}).get('difference', '0 B')
+                },
+                "current_month": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCalendarMonth', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCalendarMonth', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthCalendarMonth', {}).get('difference', '0 B')
+                },
+                "current_year": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCurrentYear', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCurrentYear', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthCurrentYear', {}).get('difference', '0 B')
+                }
+            },
+            "nodes_realtime": realtime_usage,
+            "nodes_weekly": nodes_weekly_data,
+            "last_updated": sources["fetched_at"]
+        }
+        return result
+
     def _parse_bandwidth_string(self, bandwidth_str: str) -> int:
             try:
                 if not bandwidth_str or bandwidth_str == '0 B' or bandwidth_str == '0':
@@ -504,8 +571,13 @@ class RemnaWaveService:
         db: AsyncSession,
         source_uuid: str,
         target_uuid: str,
+        progress: Optional[ProgressCallback] = None,
     ) -> Dict[str, Any]:
-        """Переносит активных подписок с одного сквада на другой."""
+        """Переносит активных подписок с одного сквада на другой.
+
+        Сквады в панели обновляются пакетно через :class:`RemnaWaveWritePipeline`;
+        локальные данные меняются только для подписок, успешно обновлённых в панели.
+        """
 
         if source_uuid == target_uuid:
             return {
@@ -537,9 +609,7 @@ class RemnaWaveService:
                         SubscriptionStatus.TRIAL.value,
                     ]
                 ),
-                cast(Subscription.connected_squads, String).like(
-                    f'%"{source_uuid}"%'
-                ),
+                Subscription.id.in_(subscription_ids_for_squads([source_uuid])),
             )
         )
 
@@ -578,6 +648,7 @@ class RemnaWaveService:
             if needs_panel_update:
                 api = await exit_stack.enter_async_context(self.get_api_client())
 
+            plans = []
             for subscription in subscriptions:
                 current_squads = list(subscription.connected_squads or [])
                 if source_uuid not in current_squads:
@@ -589,9 +660,20 @@ class RemnaWaveService:
                 ]
                 if not had_target_before:
                     new_squads.append(target_uuid)
+                plans.append((subscription, new_squads, had_target_before))
+
+            panel_results = {}
+            if api is not None:
+                pipeline = RemnaWaveWritePipeline(api, progress=progress)
+                for subscription, new_squads, _ in plans:
+                    if subscription.user and subscription.user.remnawave_uuid:
+                        pipeline.set_squads(subscription.id, subscription.user.remnawave_uuid, new_squads)
+                panel_results = (await pipeline.run()).results
 
+            for subscription, new_squads, had_target_before in plans:
                 if subscription.user and subscription.user.remnawave_uuid:
-                    if api is None:
+                    panel_result = panel_results.get(subscription.id)
+                    if panel_result is None:
                         panel_failed += 1
                         logger.error(
                             "❌ RemnaWave API недоступен для обновления пользователя %s",
@@ -599,21 +681,17 @@ class RemnaWaveService:
                         )
                         continue
 
-                    try:
-                        await api.update_user(
-                            uuid=subscription.user.remnawave_uuid,
-                            active_internal_squads=new_squads,
-                        )
-                        panel_updated += 1
-                    except Exception as error:
+                    if not panel_result.success:
                         panel_failed += 1
                         logger.error(
                             "❌ Ошибка обновления сквадов пользователя %s: %s",
                             subscription.user.telegram_id,
-                            error,
+                            panel_result.error,
                         )
                         continue
 
+                    panel_updated += 1
+
                 subscription.connected_squads = new_squads
                 subscription.updated_at = datetime.utcnow()
 
@@ -720,181 +798,91 @@ class RemnaWaveService:
         finally:
             await exit_stack.aclose()
 
-    async def sync_users_from_panel(self, db: AsyncSession, sync_type: str = "all") -> Dict[str, int]:
+    async def sync_users_from_panel(self, db: AsyncSession, sync_type: str = "all") -> Dict[str, Any]:
+        from app.database.user_cache import user_snapshot_cache
+        from app.services.remnawave_user_sync import (
+            UserSyncApplier,
+            UserSyncReport,
+            build_sync_plan,
+            fetch_panel_users,
+            load_local_snapshot,
+            reset_devices,
+        )
+
+        report = UserSyncReport()
+
         try:
-            stats = {"created": 0, "updated": 0, "errors": 0, "deleted": 0}
-            
             logger.info(f"🔄 Начинаем синхронизацию типа: {sync_type}")
-            
+
+            started = time.perf_counter()
             async with self.get_api_client() as api:
-                panel_users = []
-                start = 0
-                size = 100 
-                
-                while True:
-                    logger.info(f"📥 Загружаем пользователей: start={start}, size={size}")
-                    
-                    response = await api.get_all_users(start=start, size=size)
-                    users_batch = response['users']
-                    total_users = response['total']
-                    
-                    logger.info(f"📊 Получено {len(users_batch)} пользователей из {total_users}")
-                    
-                    for user_obj in users_batch:
-                        user_dict = {
-                            'uuid': user_obj.uuid,
-                            'shortUuid': user_obj.short_uuid,
-                            'username': user_obj.username,
-                            'status': user_obj.status.value,
-                            'telegramId': user_obj.telegram_id,
-                            'expireAt': user_obj.expire_at.isoformat() + 'Z',
-                            'trafficLimitBytes': user_obj.traffic_limit_bytes,
-                            'usedTrafficBytes': user_obj.used_traffic_bytes,
-                            'hwidDeviceLimit': user_obj.hwid_device_limit,
-                            'subscriptionUrl': user_obj.subscription_url,
-                            'subscriptionCryptoLink': user_obj.happ_crypto_link,
-                            'activeInternalSquads': user_obj.active_internal_squads
-                        }
-                        panel_users.append(user_dict)
-                    
-                    if len(users_batch) < size:
-                        break
-                        
-                    start += size
-                    
-                    if start > total_users:
-                        break
-                
-                logger.info(f"✅ Всего загружено пользователей из панели: {len(panel_users)}")
-            
-            bot_users = await get_users_list(db, offset=0, limit=10000)
-            bot_users_by_telegram_id = {user.telegram_id: user for user in bot_users}
-            
-            logger.info(f"📊 Пользователей в боте: {len(bot_users)}")
-            
-            panel_users_with_tg = [
-                user for user in panel_users 
-                if user.get('telegramId') is not None
-            ]
-            
-            logger.info(f"📊 Пользователей в панели с Telegram ID: {len(panel_users_with_tg)}")
-            
-            panel_telegram_ids = set()
-            
-            for i, panel_user in enumerate(panel_users_with_tg):
+                panel_users = await fetch_panel_users(
+                    api,
+                    self._panel_timezone,
+                    page_size=settings.REMNAWAVE_SYNC_PAGE_SIZE,
+                    concurrency=settings.REMNAWAVE_SYNC_CONCURRENCY,
+                )
+            report.panel_users = len(panel_users)
+            report.fetch_seconds = time.perf_counter() - started
+            logger.info(
+                "📥 Загружено %s пользователей панели с Telegram ID за %.2f с",
+                report.panel_users,
+                report.fetch_seconds,
+            )
+
+            started = time.perf_counter()
+            local_users = await load_local_snapshot(db)
+            now = self._now_in_panel_timezone()
+            plan = build_sync_plan(panel_users, local_users, sync_type, now)
+            report.local_users = len(local_users)
+            report.diff_seconds = time.perf_counter() - started
+            del panel_users, local_users
+            logger.info(
+                "📊 План синхронизации: создать %s, обновить %s, деактивировать %s (%.2f с)",
+                len(plan.creates),
+                plan.update_count,
+                len(plan.deactivations),
+                report.diff_seconds,
+            )
+
+            started = time.perf_counter()
+            applier = UserSyncApplier(db, chunk_size=settings.REMNAWAVE_SYNC_BATCH_SIZE, now=now)
+            await applier.apply(plan, report)
+
+            hwid_uuids = [row.remnawave_uuid for row in plan.deactivations if row.remnawave_uuid]
+            if hwid_uuids:
                 try:
-                    telegram_id = panel_user.get('telegramId')
-                    if not telegram_id:
-                        continue
-                    
-                    panel_telegram_ids.add(telegram_id)
-                    
-                    if (i + 1) % 10 == 0: 
-                        logger.info(f"🔄 Обрабатываем пользователя {i+1}/{len(panel_users_with_tg)}: {telegram_id}")
-                    
-                    db_user = bot_users_by_telegram_id.get(telegram_id)
-                    
-                    if not db_user:
-                        if sync_type in ["new_only", "all"]:
-                            logger.info(f"🆕 Создание пользователя для telegram_id {telegram_id}")
-                            
-                            from app.database.crud.user import create_user
-                            
-                            db_user = await create_user(
-                                db=db,
-                                telegram_id=telegram_id,
-                                username=panel_user.get('username') or f"user_{telegram_id}",
-                                first_name=f"Panel User {telegram_id}",
-                                language="ru"
-                            )
-                            
-                            await update_user(db, db_user, remnawave_uuid=panel_user.get('uuid'))
-                            
-                            await self._create_subscription_from_panel_data(db, db_user, panel_user)
-                            
-                            stats["created"] += 1
-                            logger.info(f"✅ Создан пользователь {telegram_id} с подпиской")
-                    
-                    else:
-                        if sync_type in ["update_only", "all"]:
-                            logger.debug(f"🔄 Обновление пользователя {telegram_id}")
-                            
-                            if not db_user.remnawave_uuid:
-                                await update_user(db, db_user, remnawave_uuid=panel_user.get('uuid'))
-                            
-                            await self._update_subscription_from_panel_data(db, db_user, panel_user)
-                            
-                            stats["updated"] += 1
-                            logger.debug(f"✅ Обновлён пользователь {telegram_id}")
-                            
-                except Exception as user_error:
-                    logger.error(f"❌ Ошибка обработки пользователя {telegram_id}: {user_error}")
-                    stats["errors"] += 1
-                    continue
-            
-            if sync_type == "all":
-                logger.info("🗑️ Деактивация подписок пользователей, отсутствующих в панели...")
-                
-                for telegram_id, db_user in bot_users_by_telegram_id.items():
-                    if telegram_id not in panel_telegram_ids and db_user.subscription:
-                        try:
-                            logger.info(f"🗑️ Деактивация подписки пользователя {telegram_id} (нет в панели)")
-                            
-                            subscription = db_user.subscription
-                            
-                            if db_user.remnawave_uuid:
-                                try:
-                                    async with self.get_api_client() as api:
-                                        devices_reset = await api.reset_user_devices(db_user.remnawave_uuid)
-                                        if devices_reset:
-                                            logger.info(f"🔧 Сброшены HWID устройства для пользователя {telegram_id}")
-                                except Exception as hwid_error:
-                                    logger.error(f"❌ Ошибка сброса HWID устройств для {telegram_id}: {hwid_error}")
-                            
-                            try:
-                                from sqlalchemy import delete
-                                from app.database.models import SubscriptionServer
+                    async with self.get_api_client() as api:
+                        devices_reset = await reset_devices(
+                            api,
+                            hwid_uuids,
+                            concurrency=settings.REMNAWAVE_SYNC_CONCURRENCY,
+                        )
+                    logger.info(f"🔧 Сброшены HWID устройства для {devices_reset} пользователей")
+                except Exception as hwid_error:
+                    logger.error(f"❌ Ошибка сброса HWID устройств: {hwid_error}")
+            report.apply_seconds = time.perf_counter() - started
 
-                                await decrement_subscription_server_counts(db, subscription)
+            if report.changed_telegram_ids:
+                if len(report.changed_telegram_ids) > settings.REMNAWAVE_SYNC_BATCH_SIZE:
+                    await user_snapshot_cache.invalidate_all()
+                else:
+                    await user_snapshot_cache.invalidate(telegram_ids=report.changed_telegram_ids)
+
+            logger.info(
+                "🎯 Синхронизация завершена: создано %s, обновлено %s, деактивировано %s, ошибок %s; "
+                "fetch %.2f с, diff %.2f с, apply %.2f с, %.0f строк/с",
+                report.created,
+                report.updated,
+                report.deleted,
+                report.errors,
+                report.fetch_seconds,
+                report.diff_seconds,
+                report.apply_seconds,
+                report.rows_per_second,
+            )
+            return report.as_dict()
 
-                                await db.execute(
-                                    delete(SubscriptionServer).where(
-                                        SubscriptionServer.subscription_id == subscription.id
-                                    )
-                                )
-                                logger.info(f"🗑️ Удалены серверы подписки для {telegram_id}")
-                            except Exception as servers_error:
-                                logger.warning(f"⚠️ Не удалось удалить серверы подписки: {servers_error}")
-                            
-                            from app.database.models import SubscriptionStatus
-                            
-                            subscription.status = SubscriptionStatus.DISABLED.value
-                            subscription.is_trial = True 
-                            subscription.end_date = datetime.utcnow()
-                            subscription.traffic_limit_gb = 0
-                            subscription.traffic_used_gb = 0.0
-                            subscription.device_limit = 1
-                            subscription.connected_squads = []
-                            subscription.autopay_enabled = False
-                            subscription.remnawave_short_uuid = None
-                            subscription.subscription_url = ""
-                            subscription.subscription_crypto_link = ""
-                            
-                            db_user.remnawave_uuid = None
-                            
-                            await db.commit()
-                            
-                            stats["deleted"] += 1
-                            logger.info(f"✅ Деактивирована подписка пользователя {telegram_id} (сохранен баланс)")
-                            
-                        except Exception as delete_error:
-                            logger.error(f"❌ Ошибка деактивации подписки {telegram_id}: {delete_error}")
-                            stats["errors"] += 1
-                            await db.rollback()
-            
-            logger.info(f"🎯 Синхронизация завершена: создано {stats['created']}, обновлено {stats['updated']}, деактивировано {stats['deleted']}, ошибок {stats['errors']}")
-            return stats
-        
         except Exception as e:
             logger.error(f"❌ Критическая ошибка синхронизации пользователей: {e}")
             return {"created": 0, "updated": 0, "errors": 1, "deleted": 0}
@@ -1070,64 +1058,72 @@ class RemnaWaveService:
             logger.error(f"❌ Ошибка обновления подписки для пользователя {user.telegram_id}: {e}")
             await db.rollback()
     
-    async def sync_users_to_panel(self, db: AsyncSession) -> Dict[str, int]:
+    async def sync_users_to_panel(
+        self,
+        db: AsyncSession,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, int]:
         try:
             stats = {"created": 0, "updated": 0, "errors": 0}
             
             users = await get_users_list(db, offset=0, limit=10000)
+            users_by_id = {}
             
             async with self.get_api_client() as api:
+                pipeline = RemnaWaveWritePipeline(api, progress=progress)
+
                 for user in users:
                     if not user.subscription:
                         continue
                     
-                    try:
-                        subscription = user.subscription
-                        
-                        if user.remnawave_uuid:
-                            await api.update_user(
-                                uuid=user.remnawave_uuid,
-                                status=UserStatus.ACTIVE if subscription.is_active else UserStatus.EXPIRED,
-                                expire_at=subscription.end_date,
-                                traffic_limit_bytes=subscription.traffic_limit_gb * (1024**3) if subscription.traffic_limit_gb > 0 else 0,
-                                traffic_limit_strategy=TrafficLimitStrategy.MONTH,
-                                hwid_device_limit=subscription.device_limit,
-                                description=settings.format_remnawave_user_description(
-                                    full_name=user.full_name,
-                                    username=user.username,
-                                    telegram_id=user.telegram_id
-                                ),
-                                active_internal_squads=subscription.connected_squads
-                            )
-                            stats["updated"] += 1
-                        else:
-                            username = f"user_{user.telegram_id}"
-                            
-                            new_user = await api.create_user(
-                                username=username,
-                                expire_at=subscription.end_date,
-                                status=UserStatus.ACTIVE if subscription.is_active else UserStatus.EXPIRED,
-                                traffic_limit_bytes=subscription.traffic_limit_gb * (1024**3) if subscription.traffic_limit_gb > 0 else 0,
-                                traffic_limit_strategy=TrafficLimitStrategy.MONTH,
-                                telegram_id=user.telegram_id,
-                                hwid_device_limit=subscription.device_limit,
-                                description=settings.format_remnawave_user_description(
-                                    full_name=user.full_name,
-                                    username=user.username,
-                                    telegram_id=user.telegram_id
-                                ),
-                                active_internal_squads=subscription.connected_squads
-                            )
-                            
-                            await update_user(db, user, remnawave_uuid=new_user.uuid)
-                            subscription.remnawave_short_uuid = new_user.short_uuid
-                            await db.commit()
-                            
-                            stats["created"] += 1
-                            
-                    except Exception as e:
-                        logger.error(f"Ошибка синхронизации пользователя {user.telegram_id} в панель: {e}")
-                        stats["errors"] += 1
+                    subscription = user.subscription
+                    users_by_id[user.id] = user
+                    fields = dict(
+                        status=UserStatus.ACTIVE if subscription.is_active else UserStatus.EXPIRED,
+                        expire_at=subscription.end_date,
+                        traffic_limit_bytes=subscription.traffic_limit_gb * (1024**3) if subscription.traffic_limit_gb > 0 else 0,
+                        traffic_limit_strategy=TrafficLimitStrategy.MONTH,
+                        hwid_device_limit=subscription.device_limit,
+                        description=settings.format_remnawave_user_description(
+                            full_name=user.full_name,
+                            username=user.username,
+                            telegram_id=user.telegram_id
+                        ),
+                        active_internal_squads=subscription.connected_squads
+                    )
+                    
+                    if user.remnawave_uuid:
+                        pipeline.update_user(user.id, user.remnawave_uuid, **fields)
+                    else:
+                        pipeline.create_user(
+                            user.id,
+                            username=f"user_{user.telegram_id}",
+                            telegram_id=user.telegram_id,
+                            **fields
+                        )
+                
+                report = await pipeline.run()
+            
+            for user_id, result in report.results.items():
+                user = users_by_id[user_id]
+                if not result.success:
+                    logger.error(f"Ошибка синхронизации пользователя {user.telegram_id} в панель: {result.error}")
+                    stats["errors"] += 1
+                    continue
+                
+                if user.remnawave_uuid:
+                    stats["updated"] += 1
+                    continue
+                
+                try:
+                    new_user = result.value
+                    await update_user(db, user, remnawave_uuid=new_user.uuid)
+                    user.subscription.remnawave_short_uuid = new_user.short_uuid
+                    await db.commit()
+                    stats["created"] += 1
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения пользователя {user.telegram_id} после создания в панели: {e}")
+                    stats["errors"] += 1
             
             logger.info(f"✅ Синхронизация в панель завершена: создано {stats['created']}, обновлено {stats['updated']}, ошибок {stats['errors']}")
             return stats
@@ -1351,11 +1347,16 @@ class RemnaWaveService:
             logger.error(f"Ошибка валидации данных пользователя: {e}")
             return False
 
-    async def force_cleanup_user_data(self, db: AsyncSession, user: User) -> bool:
+    async def force_cleanup_user_data(
+        self,
+        db: AsyncSession,
+        user: User,
+        reset_devices: bool = True,
+    ) -> bool:
         try:
             logger.info(f"🗑️ ПРИНУДИТЕЛЬНАЯ полная очистка данных пользователя {user.telegram_id}")
             
-            if user.remnawave_uuid:
+            if reset_devices and user.remnawave_uuid:
                 try:
                     async with self.get_api_client() as api:
                         devices_reset = await api.reset_user_devices(user.remnawave_uuid)
@@ -1440,7 +1441,11 @@ class RemnaWaveService:
             await db.rollback()
             return False
 
-    async def cleanup_orphaned_subscriptions(self, db: AsyncSession) -> Dict[str, int]:
+    async def cleanup_orphaned_subscriptions(
+        self,
+        db: AsyncSession,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, int]:
         try:
             stats = {"deactivated": 0, "errors": 0, "checked": 0}
         
@@ -1463,6 +1468,7 @@ class RemnaWaveService:
         
             page = 1
             limit = 100
+            orphaned_users = []
         
             while True:
                 subscriptions, total_count = await get_all_subscriptions(db, page, limit)
@@ -1471,30 +1477,42 @@ class RemnaWaveService:
                     break
             
                 for subscription in subscriptions:
-                    try:
-                        stats["checked"] += 1
-                        user = subscription.user
-                    
-                        if subscription.status == SubscriptionStatus.DISABLED.value:
-                            continue
-                    
-                        if user.telegram_id not in panel_telegram_ids:
-                            logger.info(f"🗑️ ПОЛНАЯ деактивация подписки пользователя {user.telegram_id} (отсутствует в панели)")
-                            
-                            cleanup_success = await self.force_cleanup_user_data(db, user)
-                            
-                            if cleanup_success:
-                                stats["deactivated"] += 1
-                            else:
-                                stats["errors"] += 1
-                        
-                    except Exception as sub_error:
-                        logger.error(f"❌ Ошибка обработки подписки {subscription.id}: {sub_error}")
-                        stats["errors"] += 1
+                    stats["checked"] += 1
+                    user = subscription.user
+                
+                    if subscription.status == SubscriptionStatus.DISABLED.value:
+                        continue
+                
+                    if user.telegram_id not in panel_telegram_ids:
+                        orphaned_users.append(user)
             
                 page += 1
                 if len(subscriptions) < limit:
                     break
+            
+            # HWID-устройства всех отсутствующих пользователей сбрасываются одним пакетом
+            panel_users_to_reset = [user for user in orphaned_users if user.remnawave_uuid]
+            if panel_users_to_reset:
+                async with self.get_api_client() as api:
+                    pipeline = RemnaWaveWritePipeline(api, progress=progress)
+                    for user in panel_users_to_reset:
+                        pipeline.reset_devices(user.id, user.remnawave_uuid)
+                    await pipeline.run()
+            
+            for user in orphaned_users:
+                try:
+                    logger.info(f"🗑️ ПОЛНАЯ деактивация подписки пользователя {user.telegram_id} (отсутствует в панели)")
+                    
+                    cleanup_success = await self.force_cleanup_user_data(db, user, reset_devices=False)
+                    
+                    if cleanup_success:
+                        stats["deactivated"] += 1
+                    else:
+                        stats["errors"] += 1
+                    
+                except Exception as sub_error:
+                    logger.error(f"❌ Ошибка обработки подписки пользователя {user.telegram_id}: {sub_error}")
+                    stats["errors"] += 1
         
             logger.info(f"🧹 Усиленная очистка завершена: проверено {stats['checked']}, деактивировано {stats['deactivated']}, ошибок {stats['errors']}")
             return stats
@@ -1568,7 +1586,11 @@ class RemnaWaveService:
             return {"updated": 0, "errors": 1, "checked": 0}
 
 
-    async def validate_and_fix_subscriptions(self, db: AsyncSession) -> Dict[str, int]:
+    async def validate_and_fix_subscriptions(
+        self,
+        db: AsyncSession,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, int]:
         try:
             stats = {"fixed": 0, "errors": 0, "checked": 0, "issues_found": 0}
         
@@ -1586,6 +1608,8 @@ class RemnaWaveService:
                 if not subscriptions:
                     break
             
+                panel_users = await self._fetch_missing_panel_users(subscriptions, progress)
+            
                 for subscription in subscriptions:
                     try:
                         stats["checked"] += 1
@@ -1598,18 +1622,13 @@ class RemnaWaveService:
                             subscription.status = SubscriptionStatus.EXPIRED.value
                             issues_fixed += 1
                 
-                        if not subscription.remnawave_short_uuid and user.remnawave_uuid:
-                            try:
-                                async with self.get_api_client() as api:
-                                    rw_user = await api.get_user_by_uuid(user.remnawave_uuid)
-                                    if rw_user:
-                                        subscription.remnawave_short_uuid = rw_user.short_uuid
-                                        subscription.subscription_url = rw_user.subscription_url
-                                        subscription.subscription_crypto_link = rw_user.happ_crypto_link
-                                        logger.info(f"🔧 Восстановлены данные Remnawave для {user.telegram_id}")
-                                        issues_fixed += 1
-                            except Exception as rw_error:
-                                logger.warning(f"⚠️ Не удалось получить данные Remnawave для {user.telegram_id}: {rw_error}")
+                        rw_user = panel_users.get(subscription.id)
+                        if rw_user:
+                            subscription.remnawave_short_uuid = rw_user.short_uuid
+                            subscription.subscription_url = rw_user.subscription_url
+                            subscription.subscription_crypto_link = rw_user.happ_crypto_link
+                            logger.info(f"🔧 Восстановлены данные Remnawave для {user.telegram_id}")
+                            issues_fixed += 1
                     
                         if subscription.traffic_limit_gb < 0:
                             subscription.traffic_limit_gb = 0
@@ -1653,6 +1672,43 @@ class RemnaWaveService:
             return {"fixed": 0, "errors": 1, "checked": 0, "issues_found": 0}
 
 
+    async def _fetch_missing_panel_users(
+        self,
+        subscriptions: List[Subscription],
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[int, RemnaWaveUser]:
+        """Параллельно загружает из панели пользователей подписок без ``remnawave_short_uuid``."""
+
+        missing = [
+            subscription
+            for subscription in subscriptions
+            if not subscription.remnawave_short_uuid and subscription.user.remnawave_uuid
+        ]
+        if not missing:
+            return {}
+
+        try:
+            async with self.get_api_client() as api:
+                pipeline = RemnaWaveWritePipeline(api, progress=progress)
+                for subscription in missing:
+                    pipeline.get_user(subscription.id, subscription.user.remnawave_uuid)
+                report = await pipeline.run()
+        except Exception as rw_error:
+            logger.warning(f"⚠️ Не удалось получить данные Remnawave: {rw_error}")
+            return {}
+
+        for subscription_id in report.failed():
+            logger.warning(
+                f"⚠️ Не удалось получить данные Remnawave для подписки {subscription_id}: "
+                f"{report.results[subscription_id].error}"
+            )
+
+        return {
+            subscription_id: result.value
+            for subscription_id, result in report.results.items()
+            if result.success and result.value
+        }
+
     async def get_sync_recommendations(self, db: AsyncSession) -> Dict[str, Any]:
         try:
             recommendations = {
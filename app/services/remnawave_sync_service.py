@@ -7,13 +7,13 @@ from typing import Any, Callable, Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database.database import AsyncSessionLocal
+from app.database.database import BackgroundSessionLocal
 from app.database.crud.server_squad import sync_with_remnawave
 from app.services.remnawave_service import (
     RemnaWaveConfigurationError,
     RemnaWaveService,
 )
-from app.utils.cache import cache
+from app.utils.cache import AVAILABLE_COUNTRIES_CACHE_TAG, cache
 
 
 logger = logging.getLogger(__name__)
@@ -228,7 +228,7 @@ class RemnaWaveAutoSyncService:
                 service.configuration_error or "RemnaWave API не настроен"
             )
 
-        async with AsyncSessionLocal() as session:
+        async with BackgroundSessionLocal() as session:
             user_stats = await service.sync_users_from_panel(session, "all")
             server_stats = await self._sync_servers(session, service)
 
@@ -248,7 +248,7 @@ class RemnaWaveAutoSyncService:
         created, updated, removed = await sync_with_remnawave(session, squads)
 
         try:
-            await cache.delete_pattern("available_countries*")
+            await cache.invalidate_tag(AVAILABLE_COUNTRIES_CACHE_TAG)
         except Exception as error:
             logger.warning("⚠️ Не удалось очистить кеш стран после автосинхронизации: %s", error)
 
@@ -0,0 +1,646 @@
+"""Пакетная синхронизация пользователей RemnaWave → бот.
+
+Синхронизация разбита на три фазы:
+
+* ``fetch`` — страницы панели загружаются параллельно и сразу сжимаются
+  до :class:`PanelUserRecord`;
+* ``diff`` — записи сравниваются со снимком локальных строк, индексированным
+  по ``telegram_id``, и превращаются в :class:`UserSyncPlan`;
+* ``apply`` — план применяется пакетными INSERT/UPDATE/DELETE, по одной
+  транзакции на чанк.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, tzinfo
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.crud.statistics_rollup import record_statistics_events
+from app.database.crud.subscription_squad import replace_subscription_squads
+from app.database.models import (
+    ServerSquad,
+    StatisticsMetric,
+    Subscription,
+    SubscriptionServer,
+    SubscriptionStatus,
+    User,
+)
+from app.utils.validators import sanitize_telegram_name
+
+logger = logging.getLogger(__name__)
+
+
+_BYTES_IN_GB = 1024 ** 3
+
+# Состояние подписки пользователя, которого больше нет в панели (баланс сохраняется)
+_DEACTIVATED_SUBSCRIPTION_VALUES: Dict[str, Any] = {
+    "status": SubscriptionStatus.DISABLED.value,
+    "is_trial": True,
+    "traffic_limit_gb": 0,
+    "traffic_used_gb": 0.0,
+    "device_limit": 1,
+    "connected_squads": [],
+    "autopay_enabled": False,
+    "remnawave_short_uuid": None,
+    "subscription_url": "",
+    "subscription_crypto_link": "",
+}
+
+
+@dataclass(slots=True, frozen=True)
+class PanelUserRecord:
+    """Сжатое представление пользователя панели — только поля, нужные синхронизации."""
+
+    uuid: str
+    short_uuid: Optional[str]
+    username: Optional[str]
+    telegram_id: int
+    status: str
+    expire_at: datetime
+    traffic_limit_gb: int
+    traffic_used_gb: float
+    device_limit: int
+    subscription_url: str
+    subscription_crypto_link: str
+    squads: Tuple[str, ...]
+
+    @classmethod
+    def from_api_user(cls, user: Any, panel_timezone: tzinfo) -> Optional["PanelUserRecord"]:
+        if not user.telegram_id:
+            return None
+
+        expire_at = user.expire_at
+        if expire_at.tzinfo is None:
+            expire_at = expire_at.replace(tzinfo=timezone.utc)
+        expire_at = expire_at.astimezone(panel_timezone).replace(tzinfo=None)
+
+        traffic_limit_bytes = user.traffic_limit_bytes or 0
+        squads: List[str] = []
+        for squad in user.active_internal_squads or []:
+            if isinstance(squad, dict) and "uuid" in squad:
+                squads.append(squad["uuid"])
+            elif isinstance(squad, str):
+                squads.append(squad)
+
+        return cls(
+            uuid=user.uuid,
+            short_uuid=user.short_uuid,
+            username=user.username,
+            telegram_id=int(user.telegram_id),
+            status=getattr(user.status, "value", user.status),
+            expire_at=expire_at,
+            traffic_limit_gb=traffic_limit_bytes // _BYTES_IN_GB if traffic_limit_bytes > 0 else 0,
+            traffic_used_gb=(user.used_traffic_bytes or 0) / _BYTES_IN_GB,
+            device_limit=user.hwid_device_limit or 1,
+            subscription_url=user.subscription_url or "",
+            subscription_crypto_link=user.happ_crypto_link or "",
+            squads=tuple(squads),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class LocalUserRow:
+    user_id: int
+    telegram_id: int
+    remnawave_uuid: Optional[str]
+    subscription_id: Optional[int] = None
+    status: Optional[str] = None
+    is_trial: Optional[bool] = None
+    end_date: Optional[datetime] = None
+    traffic_limit_gb: Optional[int] = None
+    traffic_used_gb: Optional[float] = None
+    device_limit: Optional[int] = None
+    connected_squads: Optional[List[str]] = None
+    autopay_enabled: Optional[bool] = None
+    remnawave_short_uuid: Optional[str] = None
+    subscription_url: Optional[str] = None
+    subscription_crypto_link: Optional[str] = None
+
+
+@dataclass(slots=True)
+class UserSyncPlan:
+    creates: List[PanelUserRecord] = field(default_factory=list)
+    # (user_id, telegram_id, remnawave_uuid) — привязка существующего пользователя к панели
+    uuid_links: List[Tuple[int, int, str]] = field(default_factory=list)
+    # (user_id, telegram_id, запись панели) — у пользователя ещё нет подписки
+    subscription_creates: List[Tuple[int, int, PanelUserRecord]] = field(default_factory=list)
+    # (telegram_id, {"id": subscription_id, <изменённые колонки>})
+    subscription_updates: List[Tuple[int, Dict[str, Any]]] = field(default_factory=list)
+    deactivations: List[LocalUserRow] = field(default_factory=list)
+
+    @property
+    def update_count(self) -> int:
+        telegram_ids = {telegram_id for _, telegram_id, _ in self.uuid_links}
+        telegram_ids.update(telegram_id for _, telegram_id, _ in self.subscription_creates)
+        telegram_ids.update(telegram_id for telegram_id, _ in self.subscription_updates)
+        return len(telegram_ids)
+
+
+@dataclass(slots=True)
+class UserSyncReport:
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    errors: int = 0
+    panel_users: int = 0
+    local_users: int = 0
+    fetch_seconds: float = 0.0
+    diff_seconds: float = 0.0
+    apply_seconds: float = 0.0
+    changed_telegram_ids: set = field(default_factory=set)
+
+    @property
+    def total_seconds(self) -> float:
+        return self.fetch_seconds + self.diff_seconds + self.apply_seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        total = self.total_seconds
+        return self.panel_users / total if total > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "errors": self.errors,
+            "deleted": self.deleted,
+            "panel_users": self.panel_users,
+            "local_users": self.local_users,
+            "fetch_seconds": round(self.fetch_seconds, 3),
+            "diff_seconds": round(self.diff_seconds, 3),
+            "apply_seconds": round(self.apply_seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+async def fetch_panel_users(
+    api: Any,
+    panel_timezone: tzinfo,
+    *,
+    page_size: int,
+    concurrency: int,
+) -> List[PanelUserRecord]:
+    """Загружает всех пользователей панели, запрашивая страницы параллельно."""
+
+    records: List[PanelUserRecord] = []
+
+    def collect(users: Iterable[Any]) -> None:
+        for user in users:
+            record = PanelUserRecord.from_api_user(user, panel_timezone)
+            if record is not None:
+                records.append(record)
+
+    first_page = await api.get_all_users(start=0, size=page_size)
+    first_users = first_page["users"]
+    total = int(first_page.get("total") or 0)
+    collect(first_users)
+
+    # Панель может ограничить размер страницы — ориентируемся на фактический
+    effective_size = min(page_size, len(first_users)) if first_users else page_size
+    if not first_users or total <= len(first_users):
+        return records
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def load_page(start: int) -> List[Any]:
+        async with semaphore:
+            response = await api.get_all_users(start=start, size=effective_size)
+            return response["users"]
+
+    pages = await asyncio.gather(
+        *(load_page(start) for start in range(effective_size, total, effective_size))
+    )
+    for users in pages:
+        collect(users)
+
+    return records
+
+
+async def load_local_snapshot(db: AsyncSession) -> Dict[int, LocalUserRow]:
+    """Одним запросом читает пользователей бота и их подписки без ограничения по количеству."""
+
+    result = await db.execute(
+        select(
+            User.id,
+            User.telegram_id,
+            User.remnawave_uuid,
+            Subscription.id,
+            Subscription.status,
+            Subscription.is_trial,
+            Subscription.end_date,
+            Subscription.traffic_limit_gb,
+            Subscription.traffic_used_gb,
+            Subscription.device_limit,
+            Subscription.connected_squads,
+            Subscription.autopay_enabled,
+            Subscription.remnawave_short_uuid,
+            Subscription.subscription_url,
+            Subscription.subscription_crypto_link,
+        )
+        .outerjoin(Subscription, Subscription.user_id == User.id)
+        .where(User.telegram_id.isnot(None))
+    )
+    return {row[1]: LocalUserRow(*row) for row in result}
+
+
+def _resolve_status(panel_status: str, end_date: datetime, now: datetime, current: Optional[str]) -> Optional[str]:
+    if panel_status == "ACTIVE" and end_date > now:
+        return SubscriptionStatus.ACTIVE.value
+    if end_date <= now:
+        return SubscriptionStatus.EXPIRED.value
+    if panel_status == "DISABLED":
+        return SubscriptionStatus.DISABLED.value
+    return current
+
+
+def _subscription_changes(local: LocalUserRow, record: PanelUserRecord, now: datetime) -> Dict[str, Any]:
+    changes: Dict[str, Any] = {}
+
+    end_date = local.end_date
+    if end_date is None or abs((end_date - record.expire_at).total_seconds()) > 60:
+        end_date = record.expire_at
+        changes["end_date"] = end_date
+
+    status = _resolve_status(record.status, end_date, now, local.status)
+    if status != local.status:
+        changes["status"] = status
+
+    if local.traffic_used_gb is None or abs(local.traffic_used_gb - record.traffic_used_gb) > 0.01:
+        changes["traffic_used_gb"] = record.traffic_used_gb
+
+    if local.traffic_limit_gb != record.traffic_limit_gb:
+        changes["traffic_limit_gb"] = record.traffic_limit_gb
+
+    if local.device_limit != record.device_limit:
+        changes["device_limit"] = record.device_limit
+
+    if not local.remnawave_short_uuid and record.short_uuid:
+        changes["remnawave_short_uuid"] = record.short_uuid
+
+    if local.subscription_url != record.subscription_url:
+        changes["subscription_url"] = record.subscription_url
+
+    if record.subscription_crypto_link and local.subscription_crypto_link != record.subscription_crypto_link:
+        changes["subscription_crypto_link"] = record.subscription_crypto_link
+
+    if set(local.connected_squads or []) != set(record.squads):
+        changes["connected_squads"] = list(record.squads)
+
+    return changes
+
+
+def _is_deactivated(local: LocalUserRow) -> bool:
+    if local.remnawave_uuid:
+        return False
+    return all(
+        (getattr(local, column) or None) == (value or None)
+        for column, value in _DEACTIVATED_SUBSCRIPTION_VALUES.items()
+    )
+
+
+def build_sync_plan(
+    panel_users: Iterable[PanelUserRecord],
+    local_users: Dict[int, LocalUserRow],
+    sync_type: str,
+    now: datetime,
+) -> UserSyncPlan:
+    """Сравнивает панель с локальным снимком; в план попадают только реально изменённые строки."""
+
+    plan = UserSyncPlan()
+    create_new = sync_type in ("new_only", "all")
+    update_existing = sync_type in ("update_only", "all")
+    panel_telegram_ids: set = set()
+
+    for record in panel_users:
+        if record.telegram_id in panel_telegram_ids:
+            logger.warning(
+                "⚠️ Telegram ID %s встречается в панели несколько раз, используется первая запись",
+                record.telegram_id,
+            )
+            continue
+        panel_telegram_ids.add(record.telegram_id)
+
+        local = local_users.get(record.telegram_id)
+        if local is None:
+            if create_new:
+                plan.creates.append(record)
+            continue
+
+        if not update_existing:
+            continue
+
+        if not local.remnawave_uuid and record.uuid:
+            plan.uuid_links.append((local.user_id, local.telegram_id, record.uuid))
+
+        if local.subscription_id is None:
+            plan.subscription_creates.append((local.user_id, local.telegram_id, record))
+            continue
+
+        changes = _subscription_changes(local, record, now)
+        if changes:
+            changes["id"] = local.subscription_id
+            plan.subscription_updates.append((local.telegram_id, changes))
+
+    if sync_type == "all":
+        plan.deactivations = [
+            local
+            for telegram_id, local in local_users.items()
+            if telegram_id not in panel_telegram_ids
+            and local.subscription_id is not None
+            and not _is_deactivated(local)
+        ]
+
+    return plan
+
+
+def _subscription_values(user_id: int, record: PanelUserRecord, now: datetime) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "status": _resolve_status(record.status, record.expire_at, now, SubscriptionStatus.DISABLED.value),
+        "is_trial": False,
+        "end_date": record.expire_at,
+        "traffic_limit_gb": record.traffic_limit_gb,
+        "traffic_used_gb": record.traffic_used_gb,
+        "device_limit": record.device_limit,
+        "connected_squads": list(record.squads),
+        "remnawave_short_uuid": record.short_uuid,
+        "subscription_url": record.subscription_url,
+        "subscription_crypto_link": record.subscription_crypto_link,
+        "autopay_enabled": settings.is_autopay_enabled_by_default(),
+        "autopay_days_before": settings.DEFAULT_AUTOPAY_DAYS_BEFORE,
+    }
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    size = max(1, size)
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+class UserSyncApplier:
+    """Применяет :class:`UserSyncPlan` пакетными запросами по ``chunk_size`` строк на транзакцию."""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        *,
+        chunk_size: int,
+        now: datetime,
+        referral_code_factory: Optional[Callable[[], str]] = None,
+    ) -> None:
+        self.db = db
+        self.chunk_size = max(1, chunk_size)
+        self.now = now
+        self._referral_code_factory = referral_code_factory
+
+    async def apply(self, plan: UserSyncPlan, report: UserSyncReport) -> None:
+        if plan.creates:
+            await self._run_chunks(plan.creates, self._create_users, report, "created")
+        await self._apply_updates(plan, report)
+        if plan.deactivations:
+            await self._run_chunks(plan.deactivations, self._deactivate, report, "deleted")
+
+    async def _run_chunks(
+        self,
+        items: Sequence[Any],
+        handler: Callable[[Sequence[Any], UserSyncReport], Awaitable[int]],
+        report: UserSyncReport,
+        counter: str,
+    ) -> None:
+        for chunk in _chunks(items, self.chunk_size):
+            try:
+                processed = await self._run_chunk(chunk, handler, report)
+            except Exception as error:
+                await self.db.rollback()
+                logger.error("❌ Ошибка пакетной синхронизации (%s, %s строк): %s", counter, len(chunk), error)
+                report.errors += len(chunk)
+                continue
+            setattr(report, counter, getattr(report, counter) + processed)
+
+    async def _run_chunk(
+        self,
+        chunk: Sequence[Any],
+        handler: Callable[[Sequence[Any], UserSyncReport], Awaitable[int]],
+        report: UserSyncReport,
+    ) -> int:
+        try:
+            processed = await handler(chunk, report)
+            await self.db.commit()
+            return processed
+        except IntegrityError as error:
+            if "users_pkey" not in str(getattr(error, "orig", error)):
+                raise
+            await self.db.rollback()
+
+        from app.database.crud.user import _sync_users_sequence
+
+        logger.warning("⚠️ Последовательность users_id_seq рассинхронизирована, выполняем синхронизацию")
+        await _sync_users_sequence(self.db)
+        processed = await handler(chunk, report)
+        await self.db.commit()
+        return processed
+
+    async def _generate_referral_codes(self, count: int) -> List[str]:
+        if self._referral_code_factory is None:
+            from app.database.crud.user import generate_referral_code
+
+            self._referral_code_factory = generate_referral_code
+
+        codes: List[str] = []
+        for _ in range(10):
+            candidates = {self._referral_code_factory() for _ in range(count - len(codes))} - set(codes)
+            result = await self.db.execute(
+                select(User.referral_code).where(User.referral_code.in_(candidates))
+            )
+            codes.extend(candidates - {row[0] for row in result})
+            if len(codes) >= count:
+                return codes[:count]
+
+        raise RuntimeError("Не удалось сгенерировать уникальные реферальные коды")
+
+    async def _create_users(self, records: Sequence[PanelUserRecord], report: UserSyncReport) -> int:
+        from app.database.crud.user import _get_or_create_default_promo_group
+
+        promo_group = await _get_or_create_default_promo_group(self.db)
+        codes = await self._generate_referral_codes(len(records))
+        rows = [
+            {
+                "telegram_id": record.telegram_id,
+                "username": record.username or f"user_{record.telegram_id}",
+                "first_name": sanitize_telegram_name(f"Panel User {record.telegram_id}"),
+                "language": "ru",
+                "referral_code": code,
+                "balance_kopeks": 0,
+                "has_had_paid_subscription": False,
+                "has_made_first_topup": False,
+                "promo_group_id": promo_group.id,
+                "remnawave_uuid": record.uuid,
+            }
+            for record, code in zip(records, codes)
+        ]
+
+        result = await self.db.execute(
+            insert(User).returning(User.id, User.telegram_id, User.created_at),
+            rows,
+        )
+        user_ids: Dict[int, int] = {}
+        events: List[Tuple[str, Optional[datetime]]] = []
+        for user_id, telegram_id, created_at in result:
+            user_ids[telegram_id] = user_id
+            events.append((StatisticsMetric.NEW_USER.value, created_at))
+
+        events.extend(
+            await self._insert_subscriptions(
+                [_subscription_values(user_ids[record.telegram_id], record, self.now) for record in records]
+            )
+        )
+        await record_statistics_events(self.db, events)
+        report.changed_telegram_ids.update(user_ids)
+        return len(records)
+
+    async def _apply_updates(self, plan: UserSyncPlan, report: UserSyncReport) -> None:
+        # Все изменения одного пользователя держим вместе: он считается обновлённым один раз
+        operations: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        for user_id, telegram_id, remnawave_uuid in plan.uuid_links:
+            operations.setdefault(telegram_id, {})["link"] = {"id": user_id, "remnawave_uuid": remnawave_uuid}
+        for user_id, telegram_id, record in plan.subscription_creates:
+            operations.setdefault(telegram_id, {})["create"] = _subscription_values(user_id, record, self.now)
+        for telegram_id, changes in plan.subscription_updates:
+            operations.setdefault(telegram_id, {})["update"] = {**changes, "updated_at": self.now}
+
+        async def handler(chunk: Sequence[Tuple[int, Dict[str, Dict[str, Any]]]], _: UserSyncReport) -> int:
+            links = [rows["link"] for _, rows in chunk if "link" in rows]
+            creates = [rows["create"] for _, rows in chunk if "create" in rows]
+            updates = [rows["update"] for _, rows in chunk if "update" in rows]
+
+            if links:
+                await self.db.execute(update(User), links)
+            if creates:
+                await record_statistics_events(self.db, await self._insert_subscriptions(creates))
+            if updates:
+                await self.db.execute(update(Subscription), updates)
+                await replace_subscription_squads(
+                    self.db,
+                    {row["id"]: row["connected_squads"] for row in updates if "connected_squads" in row},
+                )
+
+            report.changed_telegram_ids.update(telegram_id for telegram_id, _ in chunk)
+            return len(chunk)
+
+        await self._run_chunks(list(operations.items()), handler, report, "updated")
+
+    async def _insert_subscriptions(self, rows: List[Dict[str, Any]]) -> List[Tuple[str, Optional[datetime]]]:
+        """Вставляет подписки и возвращает события для корзин статистики.
+
+        Bulk INSERT обходит ORM-события и хуки статистики, поэтому членство в
+        сквадах пишем явно, а события отдаём вызывающему коду для одного upsert.
+        """
+
+        result = await self.db.execute(
+            insert(Subscription).returning(
+                Subscription.id,
+                Subscription.user_id,
+                Subscription.is_trial,
+                Subscription.created_at,
+            ),
+            rows,
+        )
+        squads_by_user = {row["user_id"]: row.get("connected_squads") for row in rows}
+        squads: Dict[int, Any] = {}
+        events: List[Tuple[str, Optional[datetime]]] = []
+        for subscription_id, user_id, is_trial, created_at in result:
+            squads[subscription_id] = squads_by_user[user_id]
+            metric = StatisticsMetric.TRIAL_SUBSCRIPTION if is_trial else StatisticsMetric.PAID_SUBSCRIPTION
+            events.append((metric.value, created_at))
+
+        await replace_subscription_squads(self.db, squads, fresh=True)
+        return events
+
+    async def _deactivate(self, rows: Sequence[LocalUserRow], report: UserSyncReport) -> int:
+        subscription_ids = [row.subscription_id for row in rows]
+
+        server_counts: Counter = Counter()
+        result = await self.db.execute(
+            select(SubscriptionServer.subscription_id, SubscriptionServer.server_squad_id)
+            .where(SubscriptionServer.subscription_id.in_(subscription_ids))
+        )
+        servers_by_subscription: Dict[int, set] = {}
+        for subscription_id, server_id in result:
+            if server_id is not None:
+                servers_by_subscription.setdefault(subscription_id, set()).add(server_id)
+
+        squad_uuids = {uuid for row in rows for uuid in (row.connected_squads or [])}
+        server_by_squad: Dict[str, int] = {}
+        if squad_uuids:
+            squads = await self.db.execute(
+                select(ServerSquad.squad_uuid, ServerSquad.id).where(ServerSquad.squad_uuid.in_(squad_uuids))
+            )
+            server_by_squad = {squad_uuid: server_id for squad_uuid, server_id in squads}
+
+        for row in rows:
+            server_ids = set(servers_by_subscription.get(row.subscription_id, ()))
+            server_ids.update(
+                server_by_squad[uuid] for uuid in (row.connected_squads or []) if uuid in server_by_squad
+            )
+            server_counts.update(server_ids)
+
+        for server_id, count in server_counts.items():
+            await self.db.execute(
+                update(ServerSquad)
+                .where(ServerSquad.id == server_id)
+                .values(
+                    current_users=case(
+                        (ServerSquad.current_users > count, ServerSquad.current_users - count),
+                        else_=0,
+                    )
+                )
+            )
+
+        await self.db.execute(
+            delete(SubscriptionServer).where(SubscriptionServer.subscription_id.in_(subscription_ids))
+        )
+        await replace_subscription_squads(self.db, {subscription_id: None for subscription_id in subscription_ids})
+        await self.db.execute(
+            update(Subscription)
+            .where(Subscription.id.in_(subscription_ids))
+            .values(end_date=self.now, updated_at=self.now, **_DEACTIVATED_SUBSCRIPTION_VALUES)
+        )
+        await self.db.execute(
+            update(User)
+            .where(User.id.in_([row.user_id for row in rows]))
+            .values(remnawave_uuid=None)
+        )
+
+        report.changed_telegram_ids.update(row.telegram_id for row in rows)
+        return len(rows)
+
+
+async def reset_devices(
+    api: Any,
+    remnawave_uuids: Sequence[str],
+    *,
+    concurrency: int,
+) -> int:
+    """Сбрасывает HWID-устройства через один клиент API с ограничением параллелизма."""
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def reset(remnawave_uuid: str) -> bool:
+        async with semaphore:
+            try:
+                return bool(await api.reset_user_devices(remnawave_uuid))
+            except Exception as error:
+                logger.error("❌ Ошибка сброса HWID устройств для %s: %s", remnawave_uuid, error)
+                return False
+
+    results = await asyncio.gather(*(reset(remnawave_uuid) for remnawave_uuid in remnawave_uuids))
+    return sum(results)
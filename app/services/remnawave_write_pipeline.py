@@ -0,0 +1,315 @@
+"""Пакетная запись пользователей в панель RemnaWave.
+
+Массовые операции не вызывают API по одному пользователю подряд, а собирают
+изменения в :class:`RemnaWaveWritePipeline`:
+
+* одинаковые изменения нескольких пользователей (набор сквадов, статус)
+  отправляются bulk-эндпоинтами панели чанками по ``REMNAWAVE_WRITE_BULK_SIZE``;
+* остальные записи уходят отдельными вызовами API, не больше
+  ``REMNAWAVE_WRITE_CONCURRENCY`` одновременно и не чаще
+  ``REMNAWAVE_WRITE_RATE_LIMIT`` запросов в секунду;
+* временные ошибки (сеть, 429, 5xx) повторяются с экспоненциальной паузой,
+  а каждая запись получает собственный :class:`UserWriteResult`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from app.config import settings
+from app.external.remnawave_api import RemnaWaveAPIError, UserStatus
+from app.services.broadcast_delivery import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class UserWrite:
+    """Одна запись в панель: вызов метода ``RemnaWaveAPI`` для ключа ``key``."""
+
+    key: Hashable
+    method: str
+    kwargs: Dict[str, Any]
+    # Записи с одинаковой группой можно отправить одним bulk-запросом
+    bulk_group: Optional[Tuple[str, Hashable]] = None
+    uuid: Optional[str] = None
+
+
+@dataclass(slots=True)
+class UserWriteResult:
+    key: Hashable
+    success: bool
+    value: Any = None
+    error: Optional[str] = None
+    attempts: int = 0
+    bulk: bool = False
+
+
+@dataclass(slots=True)
+class WriteProgress:
+    total: int
+    done: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    bulk_requests: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started_at, 0.0)
+
+    @property
+    def items_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+
+ProgressCallback = Callable[[WriteProgress], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class WriteReport:
+    results: Dict[Hashable, UserWriteResult]
+    progress: WriteProgress
+
+    def succeeded(self) -> List[Hashable]:
+        return [key for key, result in self.results.items() if result.success]
+
+    def failed(self) -> List[Hashable]:
+        return [key for key, result in self.results.items() if not result.success]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.progress.total,
+            "succeeded": self.progress.succeeded,
+            "failed": self.progress.failed,
+            "retries": self.progress.retries,
+            "bulk_requests": self.progress.bulk_requests,
+            "seconds": round(self.progress.elapsed, 3),
+        }
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Ошибки, после которых запись в панель имеет смысл повторить."""
+
+    if isinstance(error, RemnaWaveAPIError):
+        status = error.status_code
+        return status is None or status == 429 or status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, ConnectionError))
+
+
+class RemnaWaveWritePipeline:
+    """Собирает записи пользователей и отправляет их в панель пакетно.
+
+    ``api`` — уже открытый клиент ``RemnaWaveAPI``; все запросы идут через
+    его сессию.
+    """
+
+    def __init__(
+        self,
+        api: Any,
+        *,
+        concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        bulk_size: Optional[int] = None,
+        use_bulk: Optional[bool] = None,
+        max_attempts: Optional[int] = None,
+        retry_base_seconds: Optional[float] = None,
+        progress: Optional[ProgressCallback] = None,
+        progress_interval: Optional[float] = None,
+    ) -> None:
+        self.api = api
+        self.concurrency = max(1, concurrency or settings.REMNAWAVE_WRITE_CONCURRENCY)
+        rate = settings.REMNAWAVE_WRITE_RATE_LIMIT if rate_limit is None else rate_limit
+        self._bucket = AsyncTokenBucket(rate, burst=self.concurrency) if rate > 0 else None
+        self.bulk_size = max(1, bulk_size or settings.REMNAWAVE_WRITE_BULK_SIZE)
+        self.use_bulk = settings.REMNAWAVE_WRITE_BULK_ENABLED if use_bulk is None else use_bulk
+        self.max_attempts = max(1, max_attempts or settings.REMNAWAVE_WRITE_MAX_ATTEMPTS)
+        self.retry_base_seconds = (
+            settings.REMNAWAVE_WRITE_RETRY_BASE_SECONDS if retry_base_seconds is None else retry_base_seconds
+        )
+        self._progress_callback = progress
+        self._progress_interval = (
+            settings.REMNAWAVE_WRITE_PROGRESS_INTERVAL_SECONDS if progress_interval is None else progress_interval
+        )
+        self._last_progress_at = 0.0
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._writes: List[UserWrite] = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def add(self, write: UserWrite) -> None:
+        self._writes.append(write)
+
+    def create_user(self, key: Hashable, **fields: Any) -> None:
+        self.add(UserWrite(key, "create_user", fields))
+
+    def update_user(self, key: Hashable, uuid: str, **fields: Any) -> None:
+        self.add(UserWrite(key, "update_user", {"uuid": uuid, **fields}, uuid=uuid))
+
+    def set_squads(self, key: Hashable, uuid: str, squads: Sequence[str]) -> None:
+        squads = list(squads)
+        self.add(
+            UserWrite(
+                key,
+                "update_user",
+                {"uuid": uuid, "active_internal_squads": squads},
+                bulk_group=("squads", tuple(squads)),
+                uuid=uuid,
+            )
+        )
+
+    def disable_user(self, key: Hashable, uuid: str) -> None:
+        self.add(
+            UserWrite(
+                key,
+                "disable_user",
+                {"uuid": uuid},
+                bulk_group=("fields", (("status", UserStatus.DISABLED.value),)),
+                uuid=uuid,
+            )
+        )
+
+    def reset_devices(self, key: Hashable, uuid: str) -> None:
+        self.add(UserWrite(key, "reset_user_devices", {"user_uuid": uuid}, uuid=uuid))
+
+    def get_user(self, key: Hashable, uuid: str) -> None:
+        self.add(UserWrite(key, "get_user_by_uuid", {"uuid": uuid}, uuid=uuid))
+
+    async def run(self) -> WriteReport:
+        writes, self._writes = self._writes, []
+        progress = WriteProgress(total=len(writes))
+        results: Dict[Hashable, UserWriteResult] = {}
+
+        if not writes:
+            return WriteReport(results, progress)
+
+        jobs: List[Tuple[str, List[UserWrite]]] = []
+        groups: Dict[Tuple[str, Hashable], List[UserWrite]] = {}
+        for write in writes:
+            if self.use_bulk and write.bulk_group is not None:
+                groups.setdefault(write.bulk_group, []).append(write)
+            else:
+                jobs.append(("single", [write]))
+
+        for group_writes in groups.values():
+            if len(group_writes) == 1:
+                jobs.append(("single", group_writes))
+                continue
+            for start in range(0, len(group_writes), self.bulk_size):
+                jobs.append(("bulk", group_writes[start:start + self.bulk_size]))
+
+        async def run_job(job: Tuple[str, List[UserWrite]]) -> None:
+            kind, job_writes = job
+            if kind == "bulk":
+                job_results = await self._run_bulk(job_writes, progress)
+            else:
+                job_results = [await self._run_single(job_writes[0], progress)]
+
+            for result in job_results:
+                results[result.key] = result
+                progress.done += 1
+                if result.success:
+                    progress.succeeded += 1
+                else:
+                    progress.failed += 1
+            await self._notify(progress)
+
+        # Параллельность ограничивается на уровне HTTP-запросов в ``_call``
+        await asyncio.gather(*(run_job(job) for job in jobs))
+        await self._notify(progress, force=True)
+
+        logger.info(
+            "📤 Запись в панель: %s из %s успешно, ошибок %s, повторов %s, bulk-запросов %s за %.1f с",
+            progress.succeeded,
+            progress.total,
+            progress.failed,
+            progress.retries,
+            progress.bulk_requests,
+            progress.elapsed,
+        )
+        return WriteReport(results, progress)
+
+    async def _call(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        progress: WriteProgress,
+    ) -> Tuple[bool, Any, int]:
+        """Выполняет запрос с повторами. Возвращает (успех, результат или ошибка, попытки)."""
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._slots:
+                    if self._bucket is not None:
+                        await self._bucket.acquire()
+                    return True, await func(), attempt
+            except Exception as error:
+                if attempt >= self.max_attempts or not is_retryable_error(error):
+                    return False, error, attempt
+                progress.retries += 1
+                delay = self.retry_base_seconds * (2 ** (attempt - 1))
+                logger.warning(
+                    "⏳ Повтор записи в панель через %.1f с (попытка %s): %s",
+                    delay,
+                    attempt,
+                    error,
+                )
+                await asyncio.sleep(delay)
+
+    async def _run_single(self, write: UserWrite, progress: WriteProgress) -> UserWriteResult:
+        method = getattr(self.api, write.method)
+        success, value, attempts = await self._call(lambda: method(**write.kwargs), progress)
+        if not success:
+            logger.error("❌ Ошибка записи %s в панель для %s: %s", write.method, write.key, value)
+            return UserWriteResult(write.key, False, error=str(value), attempts=attempts)
+        return UserWriteResult(write.key, True, value=value, attempts=attempts)
+
+    async def _run_bulk(self, writes: List[UserWrite], progress: WriteProgress) -> List[UserWriteResult]:
+        kind, value = writes[0].bulk_group
+        uuids = [write.uuid for write in writes]
+
+        if kind == "squads":
+            call = lambda: self.api.bulk_update_users_squads(uuids, list(value))  # noqa: E731
+        else:
+            call = lambda: self.api.bulk_update_users(uuids, dict(value))  # noqa: E731
+
+        success, error, attempts = await self._call(call, progress)
+        if not success:
+            if isinstance(error, RemnaWaveAPIError) and error.status_code in (404, 405):
+                # Панель старой версии без bulk-эндпоинтов
+                logger.warning("Bulk-эндпоинты панели недоступны, запись по одному пользователю")
+                self.use_bulk = False
+            else:
+                logger.warning(
+                    "⚠️ Bulk-запись %s пользователей не удалась, повтор по одному: %s",
+                    len(writes),
+                    error,
+                )
+            return list(await asyncio.gather(*(self._run_single(write, progress) for write in writes)))
+
+        progress.bulk_requests += 1
+        return [UserWriteResult(write.key, True, attempts=attempts, bulk=True) for write in writes]
+
+    async def _notify(self, progress: WriteProgress, *, force: bool = False) -> None:
+        if self._progress_callback is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_progress_at < self._progress_interval:
+            return
+        self._last_progress_at = now
+
+        try:
+            await self._progress_callback(progress)
+        except Exception as error:
+            logger.warning("Не удалось обновить прогресс записи в панель: %s", error)
@@ -9,19 +9,10 @@ from zoneinfo import ZoneInfo
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
-from sqlalchemy import func, select
 
 from app.config import settings
-from app.database.crud.subscription import get_subscriptions_statistics
-from app.database.database import AsyncSessionLocal
-from app.database.models import (
-    Subscription,
-    SubscriptionConversion,
-    Ticket,
-    TicketStatus,
-    Transaction,
-    TransactionType,
-)
+from app.database.database import BackgroundSessionLocal
+from app.services.statistics_service import statistics_service
 
 
 logger = logging.getLogger(__name__)
@@ -184,7 +175,7 @@ class ReportingService:
         start_utc = period_range.start_msk.astimezone(timezone.utc).replace(tzinfo=None)
         end_utc = period_range.end_msk.astimezone(timezone.utc).replace(tzinfo=None)
 
-        async with AsyncSessionLocal() as session:
+        async with BackgroundSessionLocal() as session:
             totals = await self._collect_current_totals(session)
             period_stats = await self._collect_period_stats(session, start_utc, end_utc)
 
@@ -197,6 +188,9 @@ class ReportingService:
         lines = [
             header,
             "",
+            "👥 <b>Пользователи</b>",
+            f"• Новых за период: {period_stats['new_users']}",
+            "",
             "🎯 <b>Триалы</b>",
             f"• Активных сейчас: {totals['active_trials']}",
             f"• Новых за период: {period_stats['new_trials']}",
@@ -248,24 +242,7 @@ class ReportingService:
         return ReportPeriodRange(start, end, label)
 
     async def _collect_current_totals(self, session) -> dict:
-        stats = await get_subscriptions_statistics(session)
-        open_tickets_result = await session.execute(
-            select(func.count(Ticket.id)).where(
-                Ticket.status.in_(
-                    [
-                        TicketStatus.OPEN.value,
-                        TicketStatus.ANSWERED.value,
-                        TicketStatus.PENDING.value,
-                    ]
-                )
-            )
-        )
-        open_tickets = int(open_tickets_result.scalar() or 0)
-        return {
-            "active_trials": stats.get("trial_subscriptions", 0) or 0,
-            "active_paid": stats.get("paid_subscriptions", 0) or 0,
-            "open_tickets": open_tickets,
-        }
+        return await statistics_service.get_report_totals(session)
 
     async def _collect_period_stats(
         self,
@@ -273,86 +250,7 @@ class ReportingService:
         start_utc: datetime,
         end_utc: datetime,
     ) -> dict:
-        new_trials_result = await session.execute(
-            select(func.count(Subscription.id)).where(
-                Subscription.created_at >= start_utc,
-                Subscription.created_at < end_utc,
-                Subscription.is_trial == True,  # noqa: E712
-            )
-        )
-        new_trials = int(new_trials_result.scalar() or 0)
-
-        direct_paid_result = await session.execute(
-            select(func.count(Subscription.id)).where(
-                Subscription.created_at >= start_utc,
-                Subscription.created_at < end_utc,
-                Subscription.is_trial == False,  # noqa: E712
-            )
-        )
-        direct_paid = int(direct_paid_result.scalar() or 0)
-
-        conversions_result = await session.execute(
-            select(func.count(SubscriptionConversion.id)).where(
-                SubscriptionConversion.converted_at >= start_utc,
-                SubscriptionConversion.converted_at < end_utc,
-            )
-        )
-        conversions_count = int(conversions_result.scalar() or 0)
-
-        subscription_payments_row = (
-            await session.execute(
-                select(
-                    func.count(Transaction.id),
-                    func.coalesce(func.sum(Transaction.amount_kopeks), 0),
-                ).where(
-                    Transaction.type == TransactionType.SUBSCRIPTION_PAYMENT.value,
-                    Transaction.is_completed == True,  # noqa: E712
-                    Transaction.created_at >= start_utc,
-                    Transaction.created_at < end_utc,
-                )
-            )
-        ).one()
-
-        deposits_row = (
-            await session.execute(
-                select(
-                    func.count(Transaction.id),
-                    func.coalesce(func.sum(Transaction.amount_kopeks), 0),
-                ).where(
-                    Transaction.type == TransactionType.DEPOSIT.value,
-                    Transaction.is_completed == True,  # noqa: E712
-                    Transaction.created_at >= start_utc,
-                    Transaction.created_at < end_utc,
-                )
-            )
-        ).one()
-
-        subscription_payments_count = int(subscription_payments_row[0] or 0)
-        subscription_payments_amount = int(subscription_payments_row[1] or 0)
-        deposits_count = int(deposits_row[0] or 0)
-        deposits_amount = int(deposits_row[1] or 0)
-
-        total_payments_count = subscription_payments_count + deposits_count
-        total_payments_amount = subscription_payments_amount + deposits_amount
-        new_tickets_result = await session.execute(
-            select(func.count(Ticket.id)).where(
-                Ticket.created_at >= start_utc,
-                Ticket.created_at < end_utc,
-            )
-        )
-        new_tickets = int(new_tickets_result.scalar() or 0)
-
-        return {
-            "new_trials": new_trials,
-            "new_paid_subscriptions": direct_paid + conversions_count,
-            "subscription_payments_count": subscription_payments_count,
-            "subscription_payments_amount": subscription_payments_amount,
-            "deposits_count": deposits_count,
-            "deposits_amount": deposits_amount,
-            "total_payments_count": total_payments_count,
-            "total_payments_amount": total_payments_amount,
-            "new_tickets": new_tickets,
-        }
+        return await statistics_service.get_period_statistics(session, start_utc, end_utc)
 
     def _format_period_label(self, start: datetime, end: datetime) -> str:
         start_date = start.astimezone(self._moscow_tz).date()
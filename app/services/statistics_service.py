@@ -0,0 +1,455 @@
+"""Агрегаты для дашбордов статистики.
+
+Админские разделы ``statistics``, ежедневный отчёт и Web API берут данные
+отсюда. Каждый показатель считается одним запросом с условными агрегатами
+(``COUNT(*) FILTER``), а результат на ``STATISTICS_CACHE_TTL_SECONDS`` делится
+между всеми потребителями процесса.
+
+Показатели за период (платежи, выручка по дням, отчёт) при
+``STATISTICS_ROLLUPS_ENABLED`` читаются из часовых корзин ``statistics_rollups``
+и не зависят от объёма истории.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.crud.campaign import get_campaign_statistics
+from app.database.crud.statistics_rollup import (
+    get_daily_rollups,
+    get_transaction_rollups,
+    has_statistics_rollups,
+    rebuild_statistics_rollups,
+    sum_statistics_rollups,
+    transaction_metric,
+)
+from app.database.crud.subscription import get_subscriptions_statistics
+from app.database.crud.transaction import (
+    build_transactions_statistics,
+    get_revenue_by_period,
+    get_transactions_statistics,
+)
+from app.database.crud.user import get_users_statistics
+from app.database.models import (
+    StatisticsMetric,
+    Subscription,
+    SubscriptionConversion,
+    SubscriptionStatus,
+    Ticket,
+    TicketStatus,
+    Transaction,
+    TransactionType,
+    User,
+    UserStatus,
+)
+
+logger = logging.getLogger(__name__)
+
+_REPORT_OPEN_TICKET_STATUSES = (
+    TicketStatus.OPEN.value,
+    TicketStatus.ANSWERED.value,
+    TicketStatus.PENDING.value,
+)
+
+
+def _day_start(moment: datetime) -> datetime:
+    return datetime.combine(moment.date(), datetime.min.time())
+
+
+def _period_statistics(
+    *,
+    new_users: int,
+    new_trials: int,
+    new_paid: int,
+    subscription_payments: Tuple[int, int],
+    deposits: Tuple[int, int],
+    new_tickets: int,
+) -> Dict[str, int]:
+    subscription_payments_count, subscription_payments_amount = subscription_payments
+    deposits_count, deposits_amount = deposits
+    return {
+        "new_users": new_users,
+        "new_trials": new_trials,
+        "new_paid_subscriptions": new_paid,
+        "subscription_payments_count": subscription_payments_count,
+        "subscription_payments_amount": subscription_payments_amount,
+        "deposits_count": deposits_count,
+        "deposits_amount": deposits_amount,
+        "total_payments_count": subscription_payments_count + deposits_count,
+        "total_payments_amount": subscription_payments_amount + deposits_amount,
+        "new_tickets": new_tickets,
+    }
+
+
+class StatisticsService:
+    """Кэширующий фасад над агрегатными запросами статистики."""
+
+    def __init__(self) -> None:
+        self._cache: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+
+    async def _cached(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        *,
+        force_refresh: bool = False,
+    ) -> Any:
+        ttl = settings.STATISTICS_CACHE_TTL_SECONDS
+        now = time.monotonic()
+
+        if not force_refresh:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                return copy.deepcopy(cached[1])
+
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return copy.deepcopy(await asyncio.shield(pending))
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Ошибку получат ожидающие; без них future не должен ругаться в лог
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key, None)
+
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, value)
+        future.set_result(value)
+        return copy.deepcopy(value)
+
+    async def get_users_statistics(self, db: AsyncSession, *, force_refresh: bool = False) -> Dict[str, Any]:
+        return await self._cached(("users",), lambda: get_users_statistics(db), force_refresh=force_refresh)
+
+    async def get_subscriptions_statistics(
+        self,
+        db: AsyncSession,
+        *,
+        force_refresh: bool = False,
+    ) -> Dict[str, Any]:
+        return await self._cached(
+            ("subscriptions",),
+            lambda: get_subscriptions_statistics(db),
+            force_refresh=force_refresh,
+        )
+
+    async def get_transactions_statistics(
+        self,
+        db: AsyncSession,
+        start_date: Optional[datetime] = None,
+        *,
+        force_refresh: bool = False,
+    ) -> Dict[str, Any]:
+        """Платежи с ``start_date`` (по умолчанию — с начала месяца) до текущего момента."""
+
+        if start_date is None:
+            start_date = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        async def load() -> Dict[str, Any]:
+            if settings.STATISTICS_ROLLUPS_ENABLED:
+                return await self._load_transactions_from_rollups(db, start_date, datetime.utcnow())
+            return await get_transactions_statistics(db, start_date, datetime.utcnow())
+
+        return await self._cached(("transactions", start_date), load, force_refresh=force_refresh)
+
+    async def get_revenue_by_period(
+        self,
+        db: AsyncSession,
+        days: int = 30,
+        *,
+        force_refresh: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Пополнения по дням (UTC) за последние ``days`` дней."""
+
+        async def load() -> List[Dict[str, Any]]:
+            if not settings.STATISTICS_ROLLUPS_ENABLED:
+                return await get_revenue_by_period(db, days)
+
+            now = datetime.utcnow()
+            rows = await get_daily_rollups(
+                db,
+                transaction_metric(TransactionType.DEPOSIT.value),
+                now - timedelta(days=days),
+                now,
+            )
+            return [{"date": day, "amount_kopeks": amount} for day, _count, amount in rows]
+
+        return await self._cached(("revenue", days), load, force_refresh=force_refresh)
+
+    async def get_campaign_statistics(
+        self,
+        db: AsyncSession,
+        campaign_id: int,
+        *,
+        force_refresh: bool = False,
+    ) -> Dict[str, Any]:
+        return await self._cached(
+            ("campaign", campaign_id),
+            lambda: get_campaign_statistics(db, campaign_id),
+            force_refresh=force_refresh,
+        )
+
+    async def get_overview(self, db: AsyncSession, *, force_refresh: bool = False) -> Dict[str, int]:
+        return await self._cached(("overview",), lambda: self._load_overview(db), force_refresh=force_refresh)
+
+    async def get_report_totals(self, db: AsyncSession, *, force_refresh: bool = False) -> Dict[str, int]:
+        return await self._cached(
+            ("report_totals",),
+            lambda: self._load_report_totals(db),
+            force_refresh=force_refresh,
+        )
+
+    async def get_period_statistics(
+        self,
+        db: AsyncSession,
+        start_utc: datetime,
+        end_utc: datetime,
+        *,
+        force_refresh: bool = False,
+    ) -> Dict[str, int]:
+        if settings.STATISTICS_ROLLUPS_ENABLED:
+            loader = lambda: self._load_period_statistics_from_rollups(db, start_utc, end_utc)  # noqa: E731
+        else:
+            loader = lambda: self._load_period_statistics(db, start_utc, end_utc)  # noqa: E731
+        return await self._cached(("period", start_utc, end_utc), loader, force_refresh=force_refresh)
+
+    async def ensure_rollups(self, db: AsyncSession) -> int:
+        """Заполняет пустую таблицу корзин по существующей истории.
+
+        Возвращает число записанных корзин (0, если таблица уже заполнена).
+        """
+
+        if await has_statistics_rollups(db):
+            return 0
+
+        buckets = await rebuild_statistics_rollups(db)
+        await db.commit()
+        self.invalidate()
+        return buckets
+
+    @staticmethod
+    async def _load_overview(db: AsyncSession) -> Dict[str, int]:
+        today = _day_start(datetime.utcnow())
+
+        users = select(
+            func.count(User.id).label("total"),
+            func.count(User.id).filter(User.status == UserStatus.ACTIVE.value).label("active"),
+            func.count(User.id).filter(User.status == UserStatus.BLOCKED.value).label("blocked"),
+            func.coalesce(func.sum(User.balance_kopeks), 0).label("balance_kopeks"),
+        ).subquery()
+        subscriptions = select(
+            func.count(Subscription.id)
+            .filter(Subscription.status == SubscriptionStatus.ACTIVE.value)
+            .label("active"),
+            func.count(Subscription.id)
+            .filter(Subscription.status == SubscriptionStatus.EXPIRED.value)
+            .label("expired"),
+        ).subquery()
+        open_tickets = (
+            select(func.count(Ticket.id))
+            .where(Ticket.status.in_([TicketStatus.OPEN.value, TicketStatus.ANSWERED.value]))
+            .scalar_subquery()
+        )
+        deposits_today = (
+            select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
+            .where(
+                Transaction.created_at >= today,
+                Transaction.created_at < today + timedelta(days=1),
+                Transaction.type == TransactionType.DEPOSIT.value,
+            )
+            .scalar_subquery()
+        )
+
+        row = (
+            await db.execute(
+                select(
+                    users.c.total,
+                    users.c.active,
+                    users.c.blocked,
+                    users.c.balance_kopeks,
+                    subscriptions.c.active.label("active_subscriptions"),
+                    subscriptions.c.expired.label("expired_subscriptions"),
+                    open_tickets.label("open_tickets"),
+                    deposits_today.label("deposits_today"),
+                ).select_from(users.join(subscriptions, true()))
+            )
+        ).one()
+
+        return {
+            "total_users": row.total or 0,
+            "active_users": row.active or 0,
+            "blocked_users": row.blocked or 0,
+            "balance_kopeks": int(row.balance_kopeks or 0),
+            "active_subscriptions": row.active_subscriptions or 0,
+            "expired_subscriptions": row.expired_subscriptions or 0,
+            "open_tickets": row.open_tickets or 0,
+            "today_deposits_kopeks": int(row.deposits_today or 0),
+        }
+
+    @staticmethod
+    async def _load_report_totals(db: AsyncSession) -> Dict[str, int]:
+        open_tickets = (
+            select(func.count(Ticket.id))
+            .where(Ticket.status.in_(_REPORT_OPEN_TICKET_STATUSES))
+            .scalar_subquery()
+        )
+        row = (
+            await db.execute(
+                select(
+                    func.count(Subscription.id)
+                    .filter(Subscription.status == SubscriptionStatus.ACTIVE.value)
+                    .label("active"),
+                    func.count(Subscription.id)
+                    .filter(
+                        Subscription.status == SubscriptionStatus.ACTIVE.value,
+                        Subscription.is_trial.is_(True),
+                    )
+                    .label("active_trials"),
+                    open_tickets.label("open_tickets"),
+                )
+            )
+        ).one()
+
+        active = row.active or 0
+        active_trials = row.active_trials or 0
+        return {
+            "active_trials": active_trials,
+            "active_paid": active - active_trials,
+            "open_tickets": int(row.open_tickets or 0),
+        }
+
+    @staticmethod
+    async def _load_period_statistics(db: AsyncSession, start_utc: datetime, end_utc: datetime) -> Dict[str, int]:
+        subscriptions = (
+            select(
+                func.count(Subscription.id).filter(Subscription.is_trial.is_(True)).label("trials"),
+                func.count(Subscription.id).filter(Subscription.is_trial.is_(False)).label("paid"),
+            )
+            .where(Subscription.created_at >= start_utc, Subscription.created_at < end_utc)
+            .subquery()
+        )
+        is_subscription_payment = Transaction.type == TransactionType.SUBSCRIPTION_PAYMENT.value
+        is_deposit = Transaction.type == TransactionType.DEPOSIT.value
+        payments = (
+            select(
+                func.count(Transaction.id).filter(is_subscription_payment).label("subscription_count"),
+                func.coalesce(func.sum(Transaction.amount_kopeks).filter(is_subscription_payment), 0)
+                .label("subscription_amount"),
+                func.count(Transaction.id).filter(is_deposit).label("deposits_count"),
+                func.coalesce(func.sum(Transaction.amount_kopeks).filter(is_deposit), 0)
+                .label("deposits_amount"),
+            )
+            .where(
+                Transaction.is_completed.is_(True),
+                Transaction.created_at >= start_utc,
+                Transaction.created_at < end_utc,
+            )
+            .subquery()
+        )
+        conversions = (
+            select(func.count(SubscriptionConversion.id))
+            .where(
+                SubscriptionConversion.converted_at >= start_utc,
+                SubscriptionConversion.converted_at < end_utc,
+            )
+            .scalar_subquery()
+        )
+        new_tickets = (
+            select(func.count(Ticket.id))
+            .where(Ticket.created_at >= start_utc, Ticket.created_at < end_utc)
+            .scalar_subquery()
+        )
+        new_users = (
+            select(func.count(User.id))
+            .where(User.created_at >= start_utc, User.created_at < end_utc)
+            .scalar_subquery()
+        )
+
+        row = (
+            await db.execute(
+                select(
+                    subscriptions.c.trials,
+                    subscriptions.c.paid,
+                    payments.c.subscription_count,
+                    payments.c.subscription_amount,
+                    payments.c.deposits_count,
+                    payments.c.deposits_amount,
+                    conversions.label("conversions"),
+                    new_tickets.label("new_tickets"),
+                    new_users.label("new_users"),
+                ).select_from(subscriptions.join(payments, true()))
+            )
+        ).one()
+
+        return _period_statistics(
+            new_users=int(row.new_users or 0),
+            new_trials=int(row.trials or 0),
+            new_paid=int(row.paid or 0) + int(row.conversions or 0),
+            subscription_payments=(int(row.subscription_count or 0), int(row.subscription_amount or 0)),
+            deposits=(int(row.deposits_count or 0), int(row.deposits_amount or 0)),
+            new_tickets=int(row.new_tickets or 0),
+        )
+
+    @staticmethod
+    async def _load_period_statistics_from_rollups(
+        db: AsyncSession,
+        start_utc: datetime,
+        end_utc: datetime,
+    ) -> Dict[str, int]:
+        totals = await sum_statistics_rollups(db, start_utc, end_utc)
+
+        def metric_total(metric: str) -> Tuple[int, int]:
+            count = amount = 0
+            for (name, _dimension), (metric_count, metric_amount) in totals.items():
+                if name == metric:
+                    count += metric_count
+                    amount += metric_amount
+            return count, amount
+
+        return _period_statistics(
+            new_users=metric_total(StatisticsMetric.NEW_USER.value)[0],
+            new_trials=metric_total(StatisticsMetric.TRIAL_SUBSCRIPTION.value)[0],
+            new_paid=(
+                metric_total(StatisticsMetric.PAID_SUBSCRIPTION.value)[0]
+                + metric_total(StatisticsMetric.CONVERSION.value)[0]
+            ),
+            subscription_payments=metric_total(
+                transaction_metric(TransactionType.SUBSCRIPTION_PAYMENT.value)
+            ),
+            deposits=metric_total(transaction_metric(TransactionType.DEPOSIT.value)),
+            new_tickets=metric_total(StatisticsMetric.TICKET.value)[0],
+        )
+
+    @staticmethod
+    async def _load_transactions_from_rollups(
+        db: AsyncSession,
+        start_date: datetime,
+        end_date: datetime,
+    ) -> Dict[str, Any]:
+        rows = await get_transaction_rollups(db, start_date, end_date, _day_start(datetime.utcnow()))
+        return build_transactions_statistics(rows, start_date, end_date)
+
+
+statistics_service = StatisticsService()
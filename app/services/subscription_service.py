@@ -11,6 +11,7 @@ from app.external.remnawave_api import (
     TrafficLimitStrategy, RemnaWaveAPIError
 )
 from app.database.crud.user import get_user_by_id
+from app.services.remnawave_write_pipeline import RemnaWaveWritePipeline
 from app.utils.pricing_utils import (
     calculate_months_from_days,
     get_remaining_months,
@@ -354,6 +355,22 @@ class SubscriptionService:
         except Exception as e:
             logger.error(f"Ошибка отключения RemnaWave пользователя: {e}")
             return False
+
+    async def disable_remnawave_users(self, user_uuids: List[str]) -> int:
+        """Отключает пользователей в панели пакетно, возвращает число отключённых."""
+
+        try:
+            async with self.get_api_client() as api:
+                pipeline = RemnaWaveWritePipeline(api, concurrency=settings.MONITORING_PANEL_CONCURRENCY)
+                for user_uuid in user_uuids:
+                    pipeline.disable_user(user_uuid, user_uuid)
+                report = await pipeline.run()
+        except Exception as e:
+            logger.error(f"Ошибка пакетного отключения RemnaWave пользователей: {e}")
+            return 0
+
+        logger.info(f"✅ Отключено RemnaWave пользователей: {report.progress.succeeded} из {len(user_uuids)}")
+        return report.progress.succeeded
     
     async def revoke_subscription(
         self,
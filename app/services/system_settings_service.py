@@ -16,6 +16,7 @@ from app.database.crud.system_setting import (
 )
 from app.database.database import AsyncSessionLocal
 from app.database.models import SystemSetting
+from app.localization.texts import clear_texts_cache
 
 
 logger = logging.getLogger(__name__)
@@ -114,6 +115,7 @@ class BotConfigurationService:
         "LOG": "📝 Логирование",
         "DEBUG": "🧪 Режим разработки",
         "MODERATION": "🛡️ Модерация и фильтры",
+        "BROADCAST": "📨 Рассылки",
     }
 
     CATEGORY_DESCRIPTIONS: Dict[str, str] = {
@@ -164,6 +166,7 @@ class BotConfigurationService:
         "LOG": "Уровни логирования и ротация.",
         "DEBUG": "Отладочные функции и безопасный режим.",
         "MODERATION": "Настройки фильтров отображаемых имен и защиты от фишинга.",
+        "BROADCAST": "Скорость и параллельность доставки рассылок.",
     }
 
     CATEGORY_KEY_OVERRIDES: Dict[str, str] = {
@@ -217,6 +220,8 @@ class BotConfigurationService:
         "ADMIN_REPORTS_CHAT_ID": "ADMIN_REPORTS",
         "ADMIN_REPORTS_TOPIC_ID": "ADMIN_REPORTS",
         "ADMIN_REPORTS_SEND_TIME": "ADMIN_REPORTS",
+        "STATISTICS_CACHE_TTL_SECONDS": "ADMIN_REPORTS",
+        "STATISTICS_ROLLUPS_ENABLED": "ADMIN_REPORTS",
         "PAYMENT_SERVICE_NAME": "PAYMENT",
         "PAYMENT_BALANCE_DESCRIPTION": "PAYMENT",
         "PAYMENT_SUBSCRIPTION_DESCRIPTION": "PAYMENT",
@@ -228,6 +233,10 @@ class BotConfigurationService:
         "NOTIFICATION_CACHE_HOURS": "NOTIFICATIONS",
         "MONITORING_LOGS_RETENTION_DAYS": "MONITORING",
         "MONITORING_INTERVAL": "MONITORING",
+        "MONITORING_STAGE_CONCURRENCY": "MONITORING",
+        "MONITORING_NOTIFICATION_CONCURRENCY": "MONITORING",
+        "MONITORING_PANEL_CONCURRENCY": "MONITORING",
+        "MONITORING_SLOW_STAGE_SECONDS": "MONITORING",
         "ENABLE_LOGO_MODE": "INTERFACE_BRANDING",
         "LOGO_FILE": "INTERFACE_BRANDING",
         "HIDE_SUBSCRIPTION_LINK": "INTERFACE_SUBSCRIPTION",
@@ -250,6 +259,27 @@ class BotConfigurationService:
         "REMNAWAVE_USER_DESCRIPTION_TEMPLATE": "REMNAWAVE",
         "REMNAWAVE_AUTO_SYNC_ENABLED": "REMNAWAVE",
         "REMNAWAVE_AUTO_SYNC_TIMES": "REMNAWAVE",
+        "REMNAWAVE_SYNC_PAGE_SIZE": "REMNAWAVE",
+        "REMNAWAVE_SYNC_CONCURRENCY": "REMNAWAVE",
+        "REMNAWAVE_SYNC_BATCH_SIZE": "REMNAWAVE",
+        "REMNAWAVE_API_POOL_SIZE": "REMNAWAVE",
+        "REMNAWAVE_API_POOL_LIMIT_PER_HOST": "REMNAWAVE",
+        "REMNAWAVE_API_KEEPALIVE_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_API_DNS_CACHE_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_STATS_CACHE_TTL_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_READ_CACHE_ENABLED": "REMNAWAVE",
+        "REMNAWAVE_READ_CACHE_USER_TTL_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_READ_CACHE_DEVICES_TTL_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_READ_CACHE_SQUADS_TTL_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_READ_CACHE_NODES_TTL_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_WRITE_CONCURRENCY": "REMNAWAVE",
+        "REMNAWAVE_WRITE_RATE_LIMIT": "REMNAWAVE",
+        "REMNAWAVE_WRITE_BULK_ENABLED": "REMNAWAVE",
+        "REMNAWAVE_WRITE_BULK_SIZE": "REMNAWAVE",
+        "REMNAWAVE_WRITE_MAX_ATTEMPTS": "REMNAWAVE",
+        "REMNAWAVE_WRITE_RETRY_BASE_SECONDS": "REMNAWAVE",
+        "REMNAWAVE_WRITE_PROGRESS_INTERVAL_SECONDS": "REMNAWAVE",
     }
 
     CATEGORY_PREFIX_OVERRIDES: Dict[str, str] = {
@@ -260,6 +290,7 @@ class BotConfigurationService:
         "POSTGRES_": "POSTGRES",
         "SQLITE_": "SQLITE",
         "REDIS_": "REDIS",
+        "USER_CACHE_": "REDIS",
         "REMNAWAVE": "REMNAWAVE",
         "TRIAL_": "TRIAL",
         "TRAFFIC_PACKAGES": "TRAFFIC_PACKAGES",
@@ -291,6 +322,7 @@ class BotConfigurationService:
         "WEB_API_": "WEB_API",
         "DEBUG": "DEBUG",
         "DISPLAY_NAME_": "MODERATION",
+        "THROTTLING_": "MODERATION",
     }
 
     CHOICES: Dict[str, List[ChoiceOption]] = {
@@ -299,6 +331,15 @@ class BotConfigurationService:
             ChoiceOption("postgresql", "🐘 PostgreSQL"),
             ChoiceOption("sqlite", "💾 SQLite"),
         ],
+        "DATABASE_POOL_MODE": [
+            ChoiceOption("auto", "🤖 Авто"),
+            ChoiceOption("queue", "🏊 Пул соединений"),
+            ChoiceOption("null", "🚫 Без пула"),
+        ],
+        "THROTTLING_BACKEND": [
+            ChoiceOption("memory", "🧠 Память процесса"),
+            ChoiceOption("redis", "🔴 Redis (общий для реплик)"),
+        ],
         "REMNAWAVE_AUTH_TYPE": [
             ChoiceOption("api_key", "🔑 API Key"),
             ChoiceOption("basic_auth", "🧾 Basic Auth"),
@@ -978,8 +1019,10 @@ class BotConfigurationService:
                 "PRICE_360_DAYS",
             }:
                 refresh_period_prices()
+                clear_texts_cache()
             elif key.startswith("PRICE_TRAFFIC_") or key == "TRAFFIC_PACKAGES_CONFIG":
                 refresh_traffic_prices()
+                clear_texts_cache()
             elif key in {"REMNAWAVE_AUTO_SYNC_ENABLED", "REMNAWAVE_AUTO_SYNC_TIMES"}:
                 try:
                     from app.services.remnawave_sync_service import remnawave_sync_service
@@ -9,9 +9,9 @@ from app.config import settings
 from app.database.database import get_db
 from app.database.models import Transaction, TransactionType, PaymentMethod
 from app.database.crud.transaction import (
-    create_transaction, get_transaction_by_external_id, complete_transaction
+    get_transaction_by_external_id, complete_transaction, stage_transaction
 )
-from app.database.crud.user import get_user_by_telegram_id
+from app.database.crud.user import change_user_balance, credit_user_balance, get_user_by_telegram_id
 from app.external.tribute import TributeService as TributeAPI
 from app.services.payment_service import PaymentService
 from app.utils.user_utils import format_referrer_info
@@ -72,16 +72,21 @@ class TributeService:
         event_type = processed_data.get("event_type", "payment")
         status = processed_data.get("status")
         
+        handled = True
         if event_type == "payment" and status == "paid":
-            await self._handle_successful_payment(processed_data)
+            handled = await self._handle_successful_payment(processed_data)
         elif event_type == "payment" and status == "failed":
-            await self._handle_failed_payment(processed_data)
+            handled = await self._handle_failed_payment(processed_data)
         elif event_type == "refund":
-            await self._handle_refund(processed_data)
-        
+            handled = await self._handle_refund(processed_data)
+
+        if not handled:
+            # Очередь платёжных событий повторит такое событие или отправит его в dead-letter
+            return {"status": "error", "reason": "not_applied", "event": event_type}
+
         return {"status": "ok", "event": event_type}
     
-    async def _handle_successful_payment(self, payment_data: Dict[str, Any]):
+    async def _handle_successful_payment(self, payment_data: Dict[str, Any]) -> bool:
         try:
             user_telegram_id = payment_data["user_id"] 
             amount_kopeks = payment_data["amount_kopeks"]
@@ -93,7 +98,7 @@ class TributeService:
                 user = await get_user_by_telegram_id(session, user_telegram_id)
                 if not user:
                     logger.error(f"Пользователь {user_telegram_id} не найден")
-                    return
+                    return False
                 
                 logger.info(f"Найден пользователь {user.telegram_id}, текущий баланс: {user.balance_kopeks} коп")
                 
@@ -110,30 +115,30 @@ class TributeService:
                     logger.warning(f"   Created: {duplicate_transaction.created_at}")
                     logger.warning(f"   External ID: {duplicate_transaction.external_id}")
                     logger.warning(f"Платеж игнорирован - это дубликат свежего платежа")
-                    return
-                
-                from app.database.crud.transaction import create_unique_tribute_transaction
+                    return True
                 
-                transaction = await create_unique_tribute_transaction(
-                    db=session,
-                    user_id=user.id,
-                    payment_id=payment_id,
-                    amount_kopeks=amount_kopeks,
-                    description=f"Пополнение через Tribute: {amount_kopeks/100}₽ (ID: {payment_id})"
-                )
+                from app.database.crud.transaction import get_unique_tribute_external_id
 
                 old_balance = user.balance_kopeks
                 was_first_topup = not user.has_made_first_topup
 
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-
                 promo_group = getattr(user, "promo_group", None)
                 subscription = getattr(user, "subscription", None)
                 referrer_info = format_referrer_info(user)
                 topup_status = "🆕 Первое пополнение" if was_first_topup else "🔄 Пополнение"
 
-                await session.commit()
+                # Баланс и транзакция фиксируются одним коммитом
+                transaction = await credit_user_balance(
+                    session,
+                    user,
+                    amount_kopeks,
+                    f"Пополнение через Tribute: {amount_kopeks/100}₽ (ID: {payment_id})",
+                    payment_method=PaymentMethod.TRIBUTE,
+                    external_id=await get_unique_tribute_external_id(session, payment_id, amount_kopeks),
+                )
+                if transaction is None:
+                    logger.error(f"Не удалось начислить баланс пользователю {user_telegram_id}")
+                    return False
 
                 try:
                     from app.services.referral_service import process_referral_topup
@@ -175,12 +180,14 @@ class TributeService:
                 await self._send_success_notification(user_telegram_id, amount_kopeks)
                 
                 logger.info(f"🎉 Успешно обработан Tribute платеж: {amount_kopeks/100}₽ для пользователя {user_telegram_id}")
-                break
-                
+                return True
+
         except Exception as e:
             logger.error(f"⌘ Ошибка обработки успешного Tribute платежа: {e}", exc_info=True)
+
+        return False
     
-    async def _handle_failed_payment(self, payment_data: Dict[str, Any]):
+    async def _handle_failed_payment(self, payment_data: Dict[str, Any]) -> bool:
         
         try:
             user_id = payment_data["user_id"]
@@ -198,12 +205,14 @@ class TributeService:
                 await self._send_failure_notification(user_id)
                 
                 logger.info(f"Обработан неудачный Tribute платеж для пользователя {user_id}")
-                break
-                
+                return True
+
         except Exception as e:
             logger.error(f"Ошибка обработки неудачного Tribute платежа: {e}")
+
+        return False
     
-    async def _handle_refund(self, refund_data: Dict[str, Any]):
+    async def _handle_refund(self, refund_data: Dict[str, Any]) -> bool:
         
         try:
             user_id = refund_data["user_id"]
@@ -211,9 +220,14 @@ class TributeService:
             payment_id = refund_data["payment_id"]
             
             async for session in get_db():
-                await create_transaction(
+                user = await get_user_by_telegram_id(session, user_id)
+                if not user:
+                    logger.error(f"Пользователь {user_id} не найден для возврата Tribute")
+                    return False
+
+                await stage_transaction(
                     db=session,
-                    user_id=user_id,
+                    user_id=user.id,
                     type=TransactionType.REFUND,
                     amount_kopeks=-amount_kopeks, 
                     description=f"Возврат Tribute платежа {payment_id}",
@@ -221,19 +235,19 @@ class TributeService:
                     external_id=f"refund_{payment_id}",
                     is_completed=True
                 )
-                
-                user = await get_user_by_telegram_id(session, user_id)
-                if user and user.balance_kopeks >= amount_kopeks:
-                    user.balance_kopeks -= amount_kopeks
-                    await session.commit()
+                # Списываем, только если на балансе хватает средств; запись о возврате сохраняется в любом случае
+                await change_user_balance(session, user, -amount_kopeks, required_kopeks=amount_kopeks)
+                await session.commit()
                 
                 await self._send_refund_notification(user_id, amount_kopeks)
                 
                 logger.info(f"Обработан возврат Tribute: {amount_kopeks/100}₽ для пользователя {user_id}")
-                break
-                
+                return True
+
         except Exception as e:
             logger.error(f"Ошибка обработки возврата Tribute: {e}")
+
+        return False
     
 
     async def _send_success_notification(self, user_id: int, amount_kopeks: int):
@@ -378,22 +392,18 @@ class TributeService:
                 
                 external_id = f"force_donation_{payment_id}_{int(datetime.utcnow().timestamp())}"
                 
-                transaction = await create_transaction(
-                    db=session,
-                    user_id=user.id,
-                    type=TransactionType.DEPOSIT,
-                    amount_kopeks=amount_kopeks,
-                    description=description,
+                old_balance = user.balance_kopeks
+                transaction = await credit_user_balance(
+                    session,
+                    user,
+                    amount_kopeks,
+                    description,
                     payment_method=PaymentMethod.TRIBUTE,
                     external_id=external_id,
-                    is_completed=True
                 )
-                
-                old_balance = user.balance_kopeks
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-                
-                await session.commit()
+                if transaction is None:
+                    logger.error(f"⌘ Не удалось начислить баланс пользователю {user_id}")
+                    return False
                 
                 logger.info(f"💰 ПРИНУДИТЕЛЬНО обновлен баланс: {old_balance} -> {user.balance_kopeks} коп")
                 
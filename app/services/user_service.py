@@ -7,7 +7,7 @@ from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from app.database.crud.user import (
     get_user_by_id, get_user_by_telegram_id, get_users_list,
-    get_users_count, get_users_statistics, get_inactive_users,
+    get_users_count, get_inactive_users,
     add_user_balance, subtract_user_balance, update_user, delete_user,
     get_users_spending_stats
 )
@@ -25,6 +25,8 @@ from app.database.models import (
     AdvertisingCampaign, AdvertisingCampaignRegistration, PaymentMethod,
     TransactionType
 )
+from app.database.user_cache import mark_users_changed, user_snapshot_cache
+from app.services.statistics_service import statistics_service
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -596,9 +598,13 @@ class UserService:
                     update(User)
                     .where(User.referred_by_id == user_id)
                     .values(referred_by_id=None)
+                    .returning(User.telegram_id)
                 )
-                if referrals_result.rowcount > 0:
-                    logger.info(f"🔗 Очищены реферальные ссылки у {referrals_result.rowcount} рефералов")
+                referral_telegram_ids = referrals_result.scalars().all()
+                # UPDATE в обход ORM: снимки рефералов сбрасываются после коммита
+                mark_users_changed(db, telegram_ids=referral_telegram_ids)
+                if referral_telegram_ids:
+                    logger.info(f"🔗 Очищены реферальные ссылки у {len(referral_telegram_ids)} рефералов")
                 await db.flush()
             except Exception as e:
                 logger.error(f"❌ Ошибка очистки реферальных ссылок: {e}")
@@ -809,6 +815,8 @@ class UserService:
                     delete(User).where(User.id == user_id)
                 )
                 await db.commit()
+                # Массовые UPDATE/DELETE обходят события сессии, снимки сбрасываем явно
+                await user_snapshot_cache.invalidate_all()
                 logger.info(f"✅ Пользователь {user_id} окончательно удален из базы")
             except Exception as e:
                 logger.error(f"❌ Ошибка финального удаления пользователя: {e}")
@@ -825,8 +833,7 @@ class UserService:
     
     async def get_user_statistics(self, db: AsyncSession) -> Dict[str, Any]:
         try:
-            stats = await get_users_statistics(db)
-            return stats
+            return await statistics_service.get_users_statistics(db)
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики пользователей: {e}")
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Any, Optional, Union
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 
@@ -9,8 +9,24 @@ from app.config import settings
 logger = logging.getLogger(__name__)
 
 
+def _normalize_expire(expire: Union[int, timedelta, None]) -> Optional[int]:
+    if isinstance(expire, timedelta):
+        return int(expire.total_seconds())
+    return expire
+
+
+def _decode_key(key: Union[bytes, str]) -> str:
+    return key.decode() if isinstance(key, bytes) else key
+
+
 class CacheService:
-    
+
+    # Размер порции для SCAN/UNLINK: Redis общий с FSM aiogram и корзинами,
+    # поэтому шаблонные операции не должны блокировать его надолго
+    SCAN_BATCH_SIZE = 500
+    TAG_PREFIX = "cache_tag"
+    TAG_MIN_TTL_SECONDS = 3600
+
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
         self._connected = False
@@ -47,22 +63,75 @@ class CacheService:
         self, 
         key: str, 
         value: Any, 
-        expire: Union[int, timedelta] = None
+        expire: Union[int, timedelta] = None,
+        tags: Iterable[str] = (),
     ) -> bool:
         if not self._connected:
             return False
         
         try:
             serialized_value = json.dumps(value, default=str)
-            
-            if isinstance(expire, timedelta):
-                expire = int(expire.total_seconds())
-            
-            await self.redis_client.set(key, serialized_value, ex=expire)
+            expire = _normalize_expire(expire)
+            tags = list(tags)
+
+            if not tags:
+                await self.redis_client.set(key, serialized_value, ex=expire)
+                return True
+
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(key, serialized_value, ex=expire)
+                self._queue_tags(pipe, [key], tags, expire)
+                await pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Ошибка записи в кеш {key}: {e}")
             return False
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Читает несколько ключей за один запрос, возвращая только найденные."""
+
+        keys = list(keys)
+        if not self._connected or not keys:
+            return {}
+
+        try:
+            values = await self.redis_client.mget(keys)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного получения из кеша ({len(keys)} ключей): {e}")
+            return {}
+
+        result: Dict[str, Any] = {}
+        for key, value in zip(keys, values):
+            if not value:
+                continue
+            try:
+                result[key] = json.loads(value)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Ошибка разбора значения кеша {key}: {e}")
+        return result
+
+    async def set_many(
+        self,
+        mapping: Mapping[str, Any],
+        expire: Union[int, timedelta] = None,
+        tags: Iterable[str] = (),
+    ) -> bool:
+        """Записывает несколько ключей одним конвейером (pipeline)."""
+
+        if not self._connected or not mapping:
+            return False
+
+        try:
+            expire = _normalize_expire(expire)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, json.dumps(value, default=str), ex=expire)
+                self._queue_tags(pipe, list(mapping), list(tags), expire)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пакетной записи в кеш ({len(mapping)} ключей): {e}")
+            return False
     
     async def delete(self, key: str) -> bool:
         if not self._connected:
@@ -75,20 +144,59 @@ class CacheService:
             logger.error(f"Ошибка удаления из кеша {key}: {e}")
             return False
 
-    async def delete_pattern(self, pattern: str) -> int:
+    async def delete_many(self, keys: Iterable[str]) -> int:
         if not self._connected:
             return 0
 
         try:
-            keys = await self.redis_client.keys(pattern)
-            if not keys:
-                return 0
+            deleted = 0
+            for batch in self._chunks(list(keys)):
+                deleted += int(await self.redis_client.unlink(*batch))
+            return deleted
+        except Exception as e:
+            logger.error(f"Ошибка пакетного удаления из кеша: {e}")
+            return 0
+
+    async def delete_pattern(self, pattern: str) -> int:
+        if not self._connected:
+            return 0
 
-            deleted = await self.redis_client.delete(*keys)
-            return int(deleted)
+        try:
+            deleted = 0
+            async for batch in self._scan_batches(pattern):
+                deleted += int(await self.redis_client.unlink(*batch))
+            return deleted
         except Exception as e:
             logger.error(f"Ошибка удаления ключей по шаблону {pattern}: {e}")
             return 0
+
+    async def invalidate_tag(self, tag: str) -> int:
+        """Удаляет все ключи, записанные с тегом, без обхода пространства ключей.
+
+        Заодно вычищаются члены индекса, ключи которых уже истекли: UNLINK для
+        них ничего не делает, а сам индекс удаляется целиком.
+        """
+
+        if not self._connected:
+            return 0
+
+        tag_keys = self._tag_keys(tag)
+        try:
+            deleted = 0
+            batch: List[Union[bytes, str]] = []
+            for tag_key in tag_keys:
+                async for member in self.redis_client.sscan_iter(tag_key, count=self.SCAN_BATCH_SIZE):
+                    batch.append(member)
+                    if len(batch) >= self.SCAN_BATCH_SIZE:
+                        deleted += int(await self.redis_client.unlink(*batch))
+                        batch = []
+            if batch:
+                deleted += int(await self.redis_client.unlink(*batch))
+            await self.redis_client.unlink(*tag_keys)
+            return deleted
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации тега кеша {tag}: {e}")
+            return 0
     
     async def exists(self, key: str) -> bool:
         if not self._connected:
@@ -115,8 +223,10 @@ class CacheService:
             return []
         
         try:
-            keys = await self.redis_client.keys(pattern)
-            return [key.decode() if isinstance(key, bytes) else key for key in keys]
+            keys: List[str] = []
+            async for batch in self._scan_batches(pattern):
+                keys.extend(_decode_key(key) for key in batch)
+            return keys
         except Exception as e:
             logger.error(f"Ошибка получения ключей по паттерну {pattern}: {e}")
             return []
@@ -171,9 +281,47 @@ class CacheService:
             logger.error(f"Ошибка получения хеша {name}: {e}")
             return None
 
+    def _tag_keys(self, tag: str) -> Tuple[str, str]:
+        # Ключи без TTL индексируются отдельно, чтобы их индекс никогда не истекал
+        base = f"{self.TAG_PREFIX}:{tag}"
+        return base, f"{base}:persistent"
+
+    def _queue_tags(self, pipe, keys: List[str], tags: List[str], expire: Optional[int]) -> None:
+        # Только простые команды по ключу индекса (совместимо с Redis Cluster).
+        # TTL индекса не короче TTL его ключей: EXPIRE NX задаёт его новому
+        # индексу, EXPIRE GT только продлевает существующий (Redis >= 7.0).
+        if not tags or not keys:
+            return
+
+        ttl = max(int(expire), self.TAG_MIN_TTL_SECONDS) if expire else 0
+        for tag in tags:
+            volatile_key, persistent_key = self._tag_keys(tag)
+            tag_key = volatile_key if ttl else persistent_key
+            for batch in self._chunks(keys):
+                pipe.sadd(tag_key, *batch)
+            if ttl:
+                pipe.expire(tag_key, ttl, nx=True)
+                pipe.expire(tag_key, ttl, gt=True)
+
+    def _chunks(self, keys: List[Any]) -> Iterable[List[Any]]:
+        for start in range(0, len(keys), self.SCAN_BATCH_SIZE):
+            yield keys[start:start + self.SCAN_BATCH_SIZE]
+
+    async def _scan_batches(self, pattern: str) -> AsyncIterator[List[Union[bytes, str]]]:
+        batch: List[Union[bytes, str]] = []
+        async for key in self.redis_client.scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= self.SCAN_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
 
 cache = CacheService()
 
+AVAILABLE_COUNTRIES_CACHE_TAG = "available_countries"
+
 
 def cache_key(*parts) -> str:
     return ":".join(str(part) for part in parts)
@@ -0,0 +1,29 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def gather_bounded(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    limit: int,
+) -> List[R]:
+    """Выполняет ``func`` для каждого элемента, держа в полёте не больше ``limit`` вызовов.
+
+    Результаты возвращаются в порядке элементов. Исключение одного вызова
+    не отменяет остальные и пробрасывается после завершения всех.
+    """
+
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    results = await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
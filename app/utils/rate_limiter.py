@@ -0,0 +1,212 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Token bucket: ``rate`` токенов в секунду, не больше ``burst`` подряд.
+
+    ``rate`` ≤ 0 отключает ограничение.
+    """
+
+    rate: float
+    burst: int = 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0.0
+
+
+class InMemoryRateLimiter:
+    """Token bucket в памяти процесса с амортизированным O(1) вытеснением.
+
+    Корзины хранятся в OrderedDict в порядке последнего обращения. Корзина,
+    к которой не обращались дольше времени полного восполнения, эквивалентна
+    отсутствующей, поэтому при каждом вызове с головы снимаются только
+    такие записи — каждая удаляется ровно один раз.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        # key -> (tokens, updated_at, idle_until)
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            _, _, idle_until = next(iter(self._buckets.values()))
+            if idle_until > now:
+                break
+            self._buckets.popitem(last=False)
+
+    async def hit(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> RateLimitDecision:
+        if not rule.enabled:
+            return RateLimitDecision(True)
+
+        now = self._clock()
+        self._evict(now)
+
+        state = self._buckets.pop(key, None)
+        if state is None:
+            tokens = float(rule.burst)
+        else:
+            tokens, updated_at, _ = state
+            tokens = min(float(rule.burst), tokens + max(0.0, now - updated_at) * rule.rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            decision = RateLimitDecision(True)
+        else:
+            decision = RateLimitDecision(False, (cost - tokens) / rule.rate)
+
+        idle_until = now + (rule.burst - tokens) / rule.rate
+        self._buckets[key] = (tokens, now, idle_until)
+        return decision
+
+
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+if rate <= 0 then
+    return {1, '0'}
+end
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local updated_at = tonumber(state[2])
+if tokens == nil or updated_at == nil then
+    tokens = burst
+    updated_at = now
+end
+
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisRateLimiter:
+    """Token bucket в Redis: одно атомарное Lua-выполнение на событие, общее для всех реплик."""
+
+    KEY_PREFIX = "throttle"
+
+    def __init__(self, fallback: Optional[InMemoryRateLimiter] = None) -> None:
+        self._fallback = fallback or InMemoryRateLimiter()
+        self._script = None
+        self._script_client = None
+        self._fallback_logged = False
+
+    def _get_script(self):
+        client = cache.redis_client
+        if client is None or not cache._connected:
+            return None
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+            self._script_client = client
+        return self._script
+
+    async def hit(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> RateLimitDecision:
+        if not rule.enabled:
+            return RateLimitDecision(True)
+
+        script = self._get_script()
+        if script is not None:
+            try:
+                allowed, retry_after = await script(
+                    keys=[f"{self.KEY_PREFIX}:{key}"],
+                    args=[rule.rate, rule.burst, cost, time.time()],
+                )
+                self._fallback_logged = False
+                return RateLimitDecision(bool(int(allowed)), float(retry_after))
+            except Exception as error:
+                if not self._fallback_logged:
+                    logger.warning("⚠️ Redis-троттлинг недоступен, используется память процесса: %s", error)
+                    self._fallback_logged = True
+
+        return await self._fallback.hit(key, rule, cost)
+
+
+class ThrottlingPolicy:
+    """Подбирает правило по типу события и маршруту (префиксу callback_data или команде)."""
+
+    def __init__(
+        self,
+        message_rule: RateLimitRule,
+        callback_rule: RateLimitRule,
+        route_rules: Optional[List[Tuple[str, RateLimitRule]]] = None,
+    ) -> None:
+        self.message_rule = message_rule
+        self.callback_rule = callback_rule
+        self.route_rules = sorted(route_rules or [], key=lambda item: len(item[0]), reverse=True)
+
+    @staticmethod
+    def _rule_from_settings(name: str, rate: float, burst: int) -> RateLimitRule:
+        if rate <= 0:
+            logger.info("Троттлинг %s отключён: THROTTLING_%s_RATE=%s", name.lower(), name, rate)
+        if burst <= 0:
+            logger.warning("Некорректный THROTTLING_%s_BURST=%s, используется 1", name, burst)
+            burst = 1
+        return RateLimitRule(rate, burst)
+
+    @classmethod
+    def from_settings(cls) -> "ThrottlingPolicy":
+        return cls(
+            message_rule=cls._rule_from_settings(
+                "MESSAGE", settings.THROTTLING_MESSAGE_RATE, settings.THROTTLING_MESSAGE_BURST
+            ),
+            callback_rule=cls._rule_from_settings(
+                "CALLBACK", settings.THROTTLING_CALLBACK_RATE, settings.THROTTLING_CALLBACK_BURST
+            ),
+            route_rules=[
+                (prefix, RateLimitRule(rate, burst))
+                for prefix, rate, burst in settings.get_throttling_route_limits()
+            ],
+        )
+
+    def resolve(self, event_type: str, route: Optional[str]) -> Tuple[str, RateLimitRule]:
+        """Возвращает суффикс ключа корзины и правило для события."""
+
+        if route:
+            for prefix, rule in self.route_rules:
+                if route.startswith(prefix):
+                    return f"{event_type}:{prefix}", rule
+
+        if event_type == "callback":
+            return event_type, self.callback_rule
+        return event_type, self.message_rule
+
+
+def create_rate_limiter():
+    if settings.get_throttling_backend() == "redis":
+        return RedisRateLimiter()
+    return InMemoryRateLimiter()
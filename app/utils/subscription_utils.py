@@ -4,6 +4,7 @@ from typing import Optional
 from urllib.parse import quote, urlparse, urlunparse
 from sqlalchemy import select, delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.crud.statistics_rollup import record_subscription_created
 from app.database.models import Subscription, User
 from app.config import settings
 
@@ -81,6 +82,7 @@ async def update_or_create_subscription(
         )
         
         db.add(new_subscription)
+        await record_subscription_created(db, is_trial=bool(new_subscription.is_trial))
         await db.commit()
         await db.refresh(new_subscription)
         
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.database.models import User, ReferralEarning, Transaction, TransactionType
+from app.database.user_cache import user_snapshot_cache
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,7 @@ async def mark_user_as_had_paid_subscription(db: AsyncSession, user: User) -> bo
         )
         
         await db.commit()
+        await user_snapshot_cache.invalidate(user_ids=[user.id])
         logger.info(f"✅ Пользователь {user.id} отмечен как имевший платную подписку")
         return True
         
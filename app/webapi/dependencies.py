@@ -6,7 +6,7 @@ from fastapi import Depends, HTTPException, Request, Security, status
 from fastapi.security import APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.database import AsyncSessionLocal
+from app.database.database import WebApiSessionLocal
 from app.database.models import WebApiToken
 from app.services.web_api_token_service import web_api_token_service
 
@@ -15,7 +15,7 @@ api_key_header_scheme = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
+    async with WebApiSessionLocal() as session:
         try:
             yield session
         finally:
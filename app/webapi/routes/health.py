@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Security
+from fastapi import APIRouter, Depends, Security
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.database.database import get_pool_statistics
+from app.services.payment_event_inbox import payment_event_inbox
 from app.services.version_service import version_service
 
-from ..dependencies import require_api_token
-from ..schemas.health import HealthCheckResponse, HealthFeatureFlags
+from ..dependencies import get_db_session, require_api_token
+from ..schemas.health import (
+    DatabasePoolStats,
+    HealthCheckResponse,
+    HealthFeatureFlags,
+    PaymentInboxStats,
+)
 
 router = APIRouter()
 
@@ -23,4 +31,16 @@ async def health_check(_: object = Security(require_api_token)) -> HealthCheckRe
             reporting=True,
             webhooks=bool(settings.WEBHOOK_URL),
         ),
+        database_pools={
+            role: DatabasePoolStats(**stats)
+            for role, stats in get_pool_statistics().items()
+        },
     )
+
+
+@router.get("/health/payment-inbox", tags=["health"], response_model=PaymentInboxStats)
+async def payment_inbox_stats(
+    _: object = Security(require_api_token),
+    db: AsyncSession = Depends(get_db_session),
+) -> PaymentInboxStats:
+    return PaymentInboxStats(**await payment_event_inbox.get_metrics(db))
@@ -10,6 +10,7 @@ from app.database.crud.server_squad import (
     count_active_users_for_squad,
     get_server_squad_by_uuid,
 )
+from app.external.remnawave_api import remnawave_read_coalescer
 
 from ..dependencies import get_db_session, require_api_token
 from ..schemas.remnawave import (
@@ -123,6 +124,7 @@ async def get_remnawave_status(
         is_configured=service.is_configured,
         configuration_error=service.configuration_error,
         connection=connection_info,
+        read_cache=remnawave_read_coalescer.get_stats(),
     )
 
 
@@ -95,6 +95,7 @@ class BroadcastResponse(BaseModel):
     total_count: int
     sent_count: int
     failed_count: int
+    blocked_count: int = 0
     status: str
     admin_id: Optional[int] = None
     admin_name: Optional[str] = None
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class HealthFeatureFlags(BaseModel):
@@ -14,6 +16,28 @@ class HealthFeatureFlags(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
 
+class DatabasePoolStats(BaseModel):
+    """Состояние пула соединений с базой данных для одной роли."""
+
+    role: str
+    mode: str
+    size: int | None = None
+    max_overflow: int | None = None
+    capacity: int | None = None
+    checked_out: int | None = None
+    checked_in: int | None = None
+    overflow: int | None = None
+    saturation: float | None = None
+    checkouts: int = 0
+    waits: int = 0
+    timeouts: int = 0
+    avg_checkout_ms: float = 0.0
+    p95_checkout_ms: float = 0.0
+    max_checkout_ms: float = 0.0
+
+    model_config = ConfigDict(extra="forbid")
+
+
 class HealthCheckResponse(BaseModel):
     """Ответ на health-check административного API."""
 
@@ -21,5 +45,25 @@ class HealthCheckResponse(BaseModel):
     api_version: str
     bot_version: str | None
     features: HealthFeatureFlags
+    database_pools: dict[str, DatabasePoolStats] = Field(default_factory=dict)
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class PaymentInboxStats(BaseModel):
+    """Состояние очереди входящих платёжных событий."""
+
+    running: bool
+    workers: int
+    by_status: dict[str, int] = Field(default_factory=dict)
+    lag_seconds: float = 0.0
+    oldest_pending_at: datetime | None = None
+    processed_last_minute: int = 0
+    processed_last_hour: int = 0
+    processed: int = 0
+    failed_attempts: int = 0
+    dead_lettered: int = 0
+    avg_processing_ms: float = 0.0
+    throughput_per_minute: float = 0.0
 
     model_config = ConfigDict(extra="forbid")
@@ -18,6 +18,7 @@ class RemnaWaveStatusResponse(BaseModel):
     is_configured: bool
     configuration_error: Optional[str] = None
     connection: Optional[RemnaWaveConnectionStatus] = None
+    read_cache: Optional[Dict[str, int]] = None
 
 
 class RemnaWaveNode(BaseModel):
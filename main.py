@@ -9,17 +9,23 @@ sys.path.append(str(Path(__file__).parent))
 
 from app.bot import setup_bot
 from app.config import settings
-from app.database.database import init_db
+from app.database.database import BackgroundSessionLocal, init_db, close_db
 from app.services.monitoring_service import monitoring_service
 from app.services.maintenance_service import maintenance_service
 from app.services.payment_service import PaymentService
 from app.services.version_service import version_service
-from app.external.webhook_server import WebhookServer
-from app.external.yookassa_webhook import start_yookassa_webhook_server
-from app.external.pal24_webhook import start_pal24_webhook_server, Pal24WebhookServer
+from app.external.payment_gateway import (
+    PaymentWebhookGateway,
+    get_payment_webhook_ports,
+    start_payment_webhook_gateway,
+)
+from app.external.remnawave_api import close_remnawave_sessions
 from app.database.universal_migration import run_universal_migration
 from app.services.backup_service import backup_service
 from app.services.reporting_service import reporting_service
+from app.services.statistics_service import statistics_service
+from app.services.payment_event_inbox import payment_event_inbox
+from app.services.admin_notification_dispatcher import admin_notification_dispatcher
 from app.services.remnawave_sync_service import remnawave_sync_service
 from app.localization.loader import ensure_locale_templates
 from app.services.system_settings_service import bot_configuration_service
@@ -70,9 +76,7 @@ async def main():
     signal.signal(signal.SIGINT, killer.exit_gracefully)
     signal.signal(signal.SIGTERM, killer.exit_gracefully)
     
-    webhook_server = None
-    yookassa_server_task = None
-    pal24_server: Pal24WebhookServer | None = None
+    payment_gateway: PaymentWebhookGateway | None = None
     monitoring_task = None
     maintenance_task = None
     version_check_task = None
@@ -129,6 +133,22 @@ async def main():
                 stage.warning(f"Не удалось загрузить конфигурацию: {error}")
                 logger.error(f"❌ Не удалось загрузить конфигурацию: {error}")
 
+        async with timeline.stage(
+            "Корзины статистики",
+            "📈",
+            success_message="Корзины статистики готовы",
+        ) as stage:
+            try:
+                async with BackgroundSessionLocal() as session:
+                    buckets = await statistics_service.ensure_rollups(session)
+                if buckets:
+                    stage.log(f"Заполнено по истории: {buckets}")
+                else:
+                    stage.skip("Корзины уже заполнены")
+            except Exception as error:
+                stage.warning(f"Не удалось заполнить корзины статистики: {error}")
+                logger.error(f"❌ Не удалось заполнить корзины статистики: {error}")
+
         bot = None
         dp = None
         async with timeline.stage("Настройка бота", "🤖", success_message="Бот настроен") as stage:
@@ -139,6 +159,18 @@ async def main():
         maintenance_service.set_bot(bot)
         broadcast_service.set_bot(bot)
 
+        async with timeline.stage(
+            "Очередь админских уведомлений",
+            "📣",
+            success_message="Очередь уведомлений запущена",
+        ) as stage:
+            if settings.ADMIN_NOTIFICATIONS_QUEUE_ENABLED:
+                await admin_notification_dispatcher.start()
+                stage.log(f"Воркеров: {settings.ADMIN_NOTIFICATIONS_QUEUE_WORKERS}")
+                stage.log(f"Окно сводок: {settings.ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS} сек.")
+            else:
+                stage.skip("Уведомления отправляются синхронно")
+
         from app.services.admin_notification_service import AdminNotificationService
 
         async with timeline.stage(
@@ -151,6 +183,13 @@ async def main():
             version_service.set_notification_service(admin_notification_service)
             stage.log(f"Репозиторий версий: {version_service.repo}")
             stage.log(f"Текущая версия: {version_service.current_version}")
+            try:
+                resumed_broadcasts = await broadcast_service.resume_interrupted()
+                if resumed_broadcasts:
+                    stage.log(f"Возобновлено прерванных рассылок: {resumed_broadcasts}")
+            except Exception as error:
+                stage.warning(f"Не удалось возобновить рассылки: {error}")
+                logger.error(f"❌ Не удалось возобновить рассылки: {error}")
             stage.success("Мониторинг, уведомления и рассылки подключены")
 
         async with timeline.stage(
@@ -230,60 +269,33 @@ async def main():
                 stage.warning(f"Ошибка подготовки внешней админки: {error}")
                 logger.error("❌ Ошибка подготовки внешней админки: %s", error)
 
-        webhook_needed = (
-            settings.TRIBUTE_ENABLED
-            or settings.is_cryptobot_enabled()
-            or settings.is_mulenpay_enabled()
-        )
-
-        async with timeline.stage(
-            "Webhook сервисы",
-            "🌐",
-            success_message="Webhook сервера настроены",
-        ) as stage:
-            if webhook_needed:
-                enabled_services = []
-                if settings.TRIBUTE_ENABLED:
-                    enabled_services.append("Tribute")
-                if settings.is_mulenpay_enabled():
-                    enabled_services.append("Mulen Pay")
-                if settings.is_cryptobot_enabled():
-                    enabled_services.append("CryptoBot")
-
-                webhook_server = WebhookServer(bot)
-                await webhook_server.start()
-                stage.log(f"Активированы: {', '.join(enabled_services)}")
-                stage.success("Webhook сервера запущены")
-            else:
-                stage.skip("Tribute, Mulen Pay и CryptoBot отключены")
-
         async with timeline.stage(
-            "YooKassa webhook",
-            "💳",
-            success_message="YooKassa webhook запущен",
+            "Очередь платёжных событий",
+            "📬",
+            success_message="Воркеры платёжных событий запущены",
         ) as stage:
-            if settings.is_yookassa_enabled():
-                yookassa_server_task = asyncio.create_task(
-                    start_yookassa_webhook_server(payment_service)
-                )
-                stage.log(
-                    f"Endpoint: {settings.WEBHOOK_URL}:{settings.YOOKASSA_WEBHOOK_PORT}{settings.YOOKASSA_WEBHOOK_PATH}"
-                )
+            if settings.PAYMENT_INBOX_ENABLED:
+                payment_event_inbox.set_payment_service(payment_service, bot)
+                await payment_event_inbox.start()
+                stage.log(f"Воркеров: {settings.PAYMENT_INBOX_WORKERS}")
             else:
-                stage.skip("YooKassa отключена настройками")
+                stage.skip("Webhook обрабатываются синхронно в запросе")
 
         async with timeline.stage(
-            "PayPalych webhook",
-            "💳",
-            success_message="PayPalych webhook запущен",
+            "Платёжные webhook",
+            "🌐",
+            success_message="Платёжный webhook-шлюз запущен",
         ) as stage:
-            if settings.is_pal24_enabled():
-                pal24_server = await start_pal24_webhook_server(payment_service)
-                stage.log(
-                    f"Endpoint: {settings.WEBHOOK_URL}:{settings.PAL24_WEBHOOK_PORT}{settings.PAL24_WEBHOOK_PATH}"
-                )
+            payment_gateway = await start_payment_webhook_gateway(
+                bot,
+                payment_service,
+                inbox=payment_event_inbox,
+            )
+            if payment_gateway:
+                stage.log(f"Провайдеры: {', '.join(route.provider for route in payment_gateway.routes)}")
+                stage.log(f"Порты: {', '.join(str(port) for port in get_payment_webhook_ports())}")
             else:
-                stage.skip("PayPalych отключен настройками")
+                stage.skip("Платёжные провайдеры с webhook отключены")
 
         async with timeline.stage(
             "Служба мониторинга",
@@ -348,26 +360,10 @@ async def main():
             stage.log("skip_updates=True")
 
         webhook_lines = []
-        if webhook_needed:
-            if settings.TRIBUTE_ENABLED:
-                webhook_lines.append(
-                    f"Tribute: {settings.WEBHOOK_URL}:{settings.TRIBUTE_WEBHOOK_PORT}{settings.TRIBUTE_WEBHOOK_PATH}"
-                )
-            if settings.is_mulenpay_enabled():
-                webhook_lines.append(
-                    f"Mulen Pay: {settings.WEBHOOK_URL}:{settings.TRIBUTE_WEBHOOK_PORT}{settings.MULENPAY_WEBHOOK_PATH}"
-                )
-            if settings.is_cryptobot_enabled():
-                webhook_lines.append(
-                    f"CryptoBot: {settings.WEBHOOK_URL}:{settings.TRIBUTE_WEBHOOK_PORT}{settings.CRYPTOBOT_WEBHOOK_PATH}"
-                )
-        if settings.is_yookassa_enabled():
-            webhook_lines.append(
-                f"YooKassa: {settings.WEBHOOK_URL}:{settings.YOOKASSA_WEBHOOK_PORT}{settings.YOOKASSA_WEBHOOK_PATH}"
-            )
-        if settings.is_pal24_enabled():
-            webhook_lines.append(
-                f"PayPalych: {settings.WEBHOOK_URL}:{settings.PAL24_WEBHOOK_PORT}{settings.PAL24_WEBHOOK_PATH}"
+        if payment_gateway:
+            gateway_url = f"{settings.WEBHOOK_URL}:{settings.PAYMENT_WEBHOOK_GATEWAY_PORT}"
+            webhook_lines.extend(
+                f"{route.provider}: {gateway_url}{route.path}" for route in payment_gateway.routes
             )
 
         timeline.log_section(
@@ -381,6 +377,8 @@ async def main():
             f"Техработы: {'Включен' if maintenance_task else 'Отключен'}",
             f"Проверка версий: {'Включен' if version_check_task else 'Отключен'}",
             f"Отчеты: {'Включен' if reporting_service.is_running() else 'Отключен'}",
+            f"Очередь платежей: {'Включен' if payment_event_inbox.is_running() else 'Отключен'}",
+            f"Очередь уведомлений: {'Включен' if admin_notification_dispatcher.is_running() else 'Отключен'}",
         ]
         timeline.log_section("Активные фоновые сервисы", services_lines, icon="📄")
 
@@ -391,15 +389,6 @@ async def main():
             while not killer.exit:
                 await asyncio.sleep(1)
                 
-                if yookassa_server_task and yookassa_server_task.done():
-                    exception = yookassa_server_task.exception()
-                    if exception:
-                        logger.error(f"YooKassa webhook сервер завершился с ошибкой: {exception}")
-                        logger.info("🔄 Перезапуск YooKassa webhook сервера...")
-                        yookassa_server_task = asyncio.create_task(
-                            start_yookassa_webhook_server(payment_service)
-                        )
-                
                 if monitoring_task.done():
                     exception = monitoring_task.exception()
                     if exception:
@@ -439,14 +428,6 @@ async def main():
             summary_logged = True
         logger.info("🛑 Начинается корректное завершение работы...")
         
-        if yookassa_server_task and not yookassa_server_task.done():
-            logger.info("ℹ️ Остановка YooKassa webhook сервера...")
-            yookassa_server_task.cancel()
-            try:
-                await yookassa_server_task
-            except asyncio.CancelledError:
-                pass
-        
         if monitoring_task and not monitoring_task.done():
             logger.info("ℹ️ Остановка службы мониторинга...")
             monitoring_service.stop_monitoring()
@@ -456,10 +437,6 @@ async def main():
             except asyncio.CancelledError:
                 pass
 
-        if pal24_server:
-            logger.info("ℹ️ Остановка PayPalych webhook сервера...")
-            await asyncio.get_running_loop().run_in_executor(None, pal24_server.stop)
-        
         if maintenance_task and not maintenance_task.done():
             logger.info("ℹ️ Остановка службы техработ...")
             await maintenance_service.stop_monitoring()
@@ -503,9 +480,17 @@ async def main():
             except asyncio.CancelledError:
                 pass
         
-        if webhook_server:
-            logger.info("ℹ️ Остановка webhook сервера...")
-            await webhook_server.stop()
+        if payment_gateway:
+            logger.info("ℹ️ Остановка платёжного webhook-шлюза...")
+            await payment_gateway.stop()
+
+        if payment_event_inbox.is_running():
+            logger.info("ℹ️ Остановка очереди платёжных событий...")
+            await payment_event_inbox.stop()
+
+        if admin_notification_dispatcher.is_running():
+            logger.info("ℹ️ Остановка очереди админских уведомлений...")
+            await admin_notification_dispatcher.stop()
 
         if web_api_server:
             try:
@@ -514,6 +499,16 @@ async def main():
             except Exception as error:
                 logger.error(f"Ошибка остановки веб-API: {error}")
         
+        try:
+            await close_remnawave_sessions()
+        except Exception as e:
+            logger.error(f"Ошибка закрытия соединений с RemnaWave API: {e}")
+
+        try:
+            await close_db()
+        except Exception as e:
+            logger.error(f"Ошибка закрытия подключений к базе данных: {e}")
+
         if 'bot' in locals():
             try:
                 await bot.session.close()
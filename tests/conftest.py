@@ -6,6 +6,9 @@ import types
 from datetime import datetime, timezone
 
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 
 # Подменяем параметры подключения к БД, чтобы SQLAlchemy не требовал aiosqlite.
 os.environ.setdefault("DATABASE_MODE", "postgresql")
@@ -145,6 +148,112 @@ if "yookassa" not in sys.modules:
     sys.modules["yookassa.domain.common.confirmation_type"] = confirmation_module
 
 
+class AsyncResultAdapter:
+    """Async-обёртка над результатом sync-запроса для ``AsyncSession.stream``."""
+
+    def __init__(self, result) -> None:  # noqa: ANN001
+        self._result = result
+
+    async def partitions(self, size=None):  # noqa: ANN001
+        for partition in self._result.partitions(size):
+            yield partition
+
+
+class AsyncSessionAdapter:
+    """Async-обёртка над sync-сессией SQLAlchemy, считающая запросы и коммиты.
+
+    Реальный async-движок в тестах недоступен (драйверы заменены заглушками),
+    поэтому код, ожидающий ``AsyncSession``, работает через эту обёртку.
+    Экземпляр можно передавать и как фабрику сессий: вызов и ``async with``
+    возвращают его же.
+    """
+
+    def __init__(self, session: Session) -> None:
+        self._session = session
+        self.sync_session = session
+        self.statements = 0
+        self.commits = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):  # noqa: ANN001
+        return False
+
+    def get_bind(self):
+        return self._session.get_bind()
+
+    def add(self, instance) -> None:  # noqa: ANN001
+        self._session.add(instance)
+
+    def add_all(self, instances) -> None:  # noqa: ANN001
+        self._session.add_all(instances)
+
+    async def execute(self, stmt, params=None):  # noqa: ANN001
+        self.statements += 1
+        return self._session.execute(stmt, params)
+
+    async def stream(self, stmt):  # noqa: ANN001
+        self.statements += 1
+        return AsyncResultAdapter(self._session.execute(stmt))
+
+    async def get(self, entity, ident):  # noqa: ANN001
+        self.statements += 1
+        return self._session.get(entity, ident)
+
+    async def scalar(self, stmt, params=None):  # noqa: ANN001
+        self.statements += 1
+        return self._session.scalar(stmt, params)
+
+    async def flush(self) -> None:
+        self._session.flush()
+
+    async def commit(self) -> None:
+        self.commits += 1
+        self._session.commit()
+
+    async def rollback(self) -> None:
+        self._session.rollback()
+
+    async def refresh(self, instance) -> None:  # noqa: ANN001
+        self._session.refresh(instance)
+
+    async def close(self) -> None:
+        self._session.close()
+
+
+@pytest.fixture
+def sqlite_session():
+    """Sync-сессия на SQLite в памяти со всеми таблицами моделей.
+
+    Одно соединение на весь тест: дополнительные сессии на
+    ``sqlite_session.get_bind()`` видят те же данные.
+    """
+    from app.database.models import Base
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session = Session(engine, expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def async_session_adapter():
+    """Класс async-обёртки для тестов, которым нужны свои sync-сессии."""
+    return AsyncSessionAdapter
+
+
 @pytest.fixture
 def fixed_datetime() -> datetime:
     """Возвращает фиксированную отметку времени для воспроизводимых проверок."""
@@ -0,0 +1,155 @@
+"""Aiohttp-сервер postback'ов PayPalych."""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import time
+
+import pytest
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.test_utils import TestServer
+
+import app.external.pal24_webhook as pal24_webhook
+from app.config import settings
+from app.external.pal24_client import Pal24Client
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _FakeSession:
+    def __init__(self) -> None:
+        self.rolled_back = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def rollback(self) -> None:
+        self.rolled_back = True
+
+
+class _FakePaymentService:
+    def __init__(self, delay: float = 0.02) -> None:
+        self.delay = delay
+        self.payloads = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def process_pal24_postback(self, db, payload):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            self.payloads.append(payload)
+            return True
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def pal24_settings(monkeypatch):
+    monkeypatch.setattr(settings, "PAL24_API_TOKEN", "token", raising=False)
+    monkeypatch.setattr(settings, "PAL24_SIGNATURE_TOKEN", "sigsecret", raising=False)
+    monkeypatch.setattr(type(settings), "is_pal24_enabled", lambda self: True, raising=False)
+    monkeypatch.setattr(pal24_webhook, "AsyncSessionLocal", _FakeSession)
+
+
+async def _start(payment_service) -> TestServer:
+    server = TestServer(pal24_webhook.create_pal24_webhook_app(payment_service), host="127.0.0.1")
+    await server.start_server()
+    return server
+
+
+def _postback(inv_id: str, out_sum: str = "100.00") -> dict:
+    return {
+        "InvId": inv_id,
+        "OutSum": out_sum,
+        "Status": "SUCCESS",
+        "SignatureValue": Pal24Client.calculate_signature(out_sum, inv_id),
+    }
+
+
+@pytest.mark.anyio
+async def test_concurrent_postbacks_are_processed_without_thread_cap(pal24_settings):
+    payment_service = _FakePaymentService(delay=0.1)
+    server = await _start(payment_service)
+    url = str(server.make_url(settings.PAL24_WEBHOOK_PATH))
+    latencies = []
+    # Столько заняла бы пачка на пуле из 10 потоков, блокируемых на время транзакции
+    threaded_drain_seconds = 300 * payment_service.delay / 10
+
+    async def post(session: ClientSession, index: int) -> int:
+        started = time.perf_counter()
+        if index % 2:
+            response = await session.post(url, json=_postback(f"inv-{index}"))
+        else:
+            response = await session.post(url, data=_postback(f"inv-{index}"))
+        async with response:
+            await response.json()
+            latencies.append(time.perf_counter() - started)
+            return response.status
+
+    try:
+        async with ClientSession(connector=TCPConnector(limit=0)) as session:
+            started = time.perf_counter()
+            statuses = await asyncio.gather(*(post(session, index) for index in range(300)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await server.close()
+
+    assert statuses == [200] * 300
+    assert len(payment_service.payloads) == 300
+    # Обработка не ограничена пулом потоков: сотни postback'ов обрабатываются одновременно
+    assert payment_service.peak > 50
+    assert elapsed < threaded_drain_seconds
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    assert p95 < threaded_drain_seconds
+
+
+@pytest.mark.anyio
+async def test_invalid_signature_and_empty_payload_are_rejected(pal24_settings):
+    payment_service = _FakePaymentService()
+    server = await _start(payment_service)
+    url = str(server.make_url(settings.PAL24_WEBHOOK_PATH))
+
+    try:
+        async with ClientSession() as session:
+            payload = {**_postback("inv-1"), "SignatureValue": "BAD"}
+            async with session.post(url, json=payload) as response:
+                assert response.status == 400
+                assert "signature" in (await response.json())["reason"]
+
+            async with session.post(url, data=b"") as response:
+                assert response.status == 400
+                assert (await response.json())["reason"] == "empty_payload"
+
+            async with session.get(url) as response:
+                assert (await response.json())["service"] == "pal24_webhook"
+    finally:
+        await server.close()
+
+    assert payment_service.payloads == []
+
+
+@pytest.mark.anyio
+async def test_timeout_returns_504_but_processing_completes(pal24_settings, monkeypatch):
+    monkeypatch.setattr(settings, "PAL24_REQUEST_TIMEOUT", 0.05)
+    payment_service = _FakePaymentService(delay=0.2)
+    server = await _start(payment_service)
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url(settings.PAL24_WEBHOOK_PATH))
+            async with session.post(url, json=_postback("inv-slow")) as response:
+                assert response.status == 504
+        await asyncio.sleep(0.3)
+    finally:
+        await server.close()
+
+    assert [payload["InvId"] for payload in payment_service.payloads] == ["inv-slow"]
@@ -0,0 +1,237 @@
+"""Общие middleware единого шлюза платёжных webhook'ов."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+import app.external.payment_gateway as payment_gateway
+from app.config import settings
+from app.external.payment_gateway import LatencyHistogram, PaymentWebhookGateway, WebhookRoute
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def _offline_cache(monkeypatch):
+    monkeypatch.setattr(payment_gateway.cache, "_connected", False)
+
+
+class _RecordingHandler:
+    def __init__(self, delay: float = 0.0, status: int = 200) -> None:
+        self.delay = delay
+        self.status = status
+        self.calls = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        await request.read()
+        await asyncio.sleep(self.delay)
+        return web.json_response({"status": "ok" if self.status == 200 else "error"}, status=self.status)
+
+
+async def _start(gateway: PaymentWebhookGateway) -> TestServer:
+    server = TestServer(gateway.app, host="127.0.0.1")
+    await server.start_server()
+    return server
+
+
+@pytest.mark.anyio
+async def test_oversized_body_is_rejected_before_handler():
+    handler = _RecordingHandler()
+    gateway = PaymentWebhookGateway(
+        [WebhookRoute(provider="cryptobot", path="/cryptobot-webhook", handler=handler.handle)],
+        max_body_bytes=64,
+        idempotency_ttl_seconds=60,
+    )
+    server = await _start(gateway)
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url("/cryptobot-webhook"))
+            async with session.post(url, data=b"x" * 1024) as response:
+                assert response.status == 413
+            async with session.post(url, data=b"x" * 16) as response:
+                assert response.status == 200
+    finally:
+        await server.close()
+
+    assert handler.calls == 1
+    assert gateway.get_stats()["cryptobot"]["statuses"] == {413: 1, 200: 1}
+
+
+@pytest.mark.anyio
+async def test_tribute_signature_is_checked_by_middleware(monkeypatch):
+    monkeypatch.setattr(settings, "TRIBUTE_API_KEY", "secret", raising=False)
+    handler = _RecordingHandler()
+    gateway = PaymentWebhookGateway(
+        [
+            WebhookRoute(
+                provider="tribute",
+                path="/tribute-webhook",
+                handler=handler.handle,
+                verify_signature=payment_gateway._verify_tribute_signature,
+            )
+        ],
+        idempotency_ttl_seconds=60,
+    )
+    server = await _start(gateway)
+    body = json.dumps({"name": "new_donation", "payload": {"donation_request_id": 1}})
+    signature = hmac.new(b"secret", body.encode(), hashlib.sha256).hexdigest()
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url("/tribute-webhook"))
+            async with session.post(url, data=body) as response:
+                assert response.status == 401
+            async with session.post(url, data=body, headers={"trbt-signature": "bad"}) as response:
+                assert response.status == 401
+                assert (await response.json())["reason"] == "invalid_signature"
+            async with session.post(url, data=body, headers={"trbt-signature": signature}) as response:
+                assert response.status == 200
+    finally:
+        await server.close()
+
+    assert handler.calls == 1
+
+
+@pytest.mark.anyio
+async def test_duplicate_deliveries_short_circuit_before_handler():
+    handler = _RecordingHandler(delay=0.05)
+    gateway = PaymentWebhookGateway(
+        [
+            WebhookRoute(
+                provider="cryptobot",
+                path="/cryptobot-webhook",
+                handler=handler.handle,
+                idempotency_key=payment_gateway._cryptobot_event_id,
+            )
+        ],
+        idempotency_ttl_seconds=60,
+    )
+    server = await _start(gateway)
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url("/cryptobot-webhook"))
+
+            async def post(update_id: int) -> int:
+                async with session.post(url, json={"update_id": update_id}) as response:
+                    assert (await response.json())["status"] == "ok"
+                    return response.status
+
+            # Одновременные повторы склеиваются с первой доставкой
+            assert await asyncio.gather(*(post(1) for _ in range(5))) == [200] * 5
+            # Повтор после успешной обработки отвечает из памяти
+            assert await post(1) == 200
+            assert await post(2) == 200
+    finally:
+        await server.close()
+
+    assert handler.calls == 2
+    assert gateway.get_stats()["cryptobot"]["duplicates"] == 5
+
+
+@pytest.mark.anyio
+async def test_failed_delivery_is_not_remembered():
+    handler = _RecordingHandler(status=500)
+    gateway = PaymentWebhookGateway(
+        [
+            WebhookRoute(
+                provider="yookassa",
+                path="/yookassa-webhook",
+                handler=handler.handle,
+                idempotency_key=payment_gateway._yookassa_event_id,
+            )
+        ],
+        idempotency_ttl_seconds=60,
+    )
+    server = await _start(gateway)
+    payload = {"event": "payment.succeeded", "object": {"id": "pay-1"}}
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url("/yookassa-webhook"))
+            for _ in range(2):
+                async with session.post(url, json=payload) as response:
+                    assert response.status == 500
+            async with session.get(str(server.make_url("/health"))) as response:
+                health = await response.json()
+    finally:
+        await server.close()
+
+    assert handler.calls == 2
+    assert health["providers"] == {"yookassa": "/yookassa-webhook"}
+    assert health["metrics"]["yookassa"]["count"] == 2
+
+
+def test_latency_histogram_quantiles():
+    histogram = LatencyHistogram(buckets=(10, 100, 1000))
+    for duration in [1] * 90 + [50] * 5 + [500] * 5:
+        histogram.observe(duration, 200)
+
+    stats = histogram.as_dict()
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 10
+    assert stats["p95_ms"] == 100
+    assert stats["buckets"] == {"le_10": 90, "le_100": 5, "le_1000": 5, "le_inf": 0}
+
+
+class _RecordingInbox:
+    def __init__(self) -> None:
+        self.events = []
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return True
+
+    async def enqueue(self, provider, event_key, ordering_key, payload) -> bool:
+        self.events.append((provider, event_key, ordering_key, payload))
+        return True
+
+
+@pytest.mark.anyio
+async def test_supported_events_are_queued_instead_of_processed():
+    handler = _RecordingHandler(delay=1.0)
+    inbox = _RecordingInbox()
+    gateway = PaymentWebhookGateway(
+        [
+            WebhookRoute(
+                provider="yookassa",
+                path="/yookassa-webhook",
+                handler=handler.handle,
+                idempotency_key=payment_gateway._yookassa_event_id,
+                inbox_event=payment_gateway._yookassa_inbox_event,
+            )
+        ],
+        idempotency_ttl_seconds=60,
+        inbox=inbox,
+    )
+    server = await _start(gateway)
+    payload = {"event": "payment.succeeded", "object": {"id": "pay-1"}}
+
+    try:
+        async with ClientSession() as session:
+            url = str(server.make_url("/yookassa-webhook"))
+            for _ in range(2):
+                async with session.post(url, json=payload) as response:
+                    assert response.status == 200
+                    assert (await response.json())["status"] == "ok"
+            # Неподдерживаемые события подтверждает обработчик маршрута
+            async with session.post(url, json={"event": "refund.succeeded", "object": {"id": "r"}}) as response:
+                assert response.status == 200
+    finally:
+        await server.close()
+
+    assert inbox.events == [("yookassa", "payment.succeeded:pay-1", "pay-1", payload)]
+    assert handler.calls == 1
+    assert gateway.get_stats()["yookassa"]["duplicates"] == 1
@@ -0,0 +1,88 @@
+"""Общий пул соединений RemnaWaveAPI."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.external.remnawave_api import RemnaWaveAPI, RemnaWaveSessionPool, remnawave_session_pool
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def panel_server():
+    transports = []
+
+    async def handler(request: web.Request) -> web.Response:
+        transports.append(id(request.transport))
+        return web.json_response({"response": {"users": [], "total": 0}})
+
+    app = web.Application()
+    app.router.add_get("/api/users", handler)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    try:
+        yield server, transports
+    finally:
+        await remnawave_session_pool.close()
+        await server.close()
+
+
+def _api(server: TestServer) -> RemnaWaveAPI:
+    return RemnaWaveAPI(base_url=str(server.make_url("")), api_key="key")
+
+
+@pytest.mark.anyio
+async def test_context_manager_leases_shared_keep_alive_session(panel_server):
+    server, transports = panel_server
+
+    sessions = set()
+    for _ in range(5):
+        async with _api(server) as api:
+            await api.get_all_users()
+            sessions.add(id(api.session))
+        assert api.session is None
+
+    assert len(sessions) == 1
+    assert len(transports) == 5
+    # Все запросы прошли по одному TCP-соединению
+    assert len(set(transports)) == 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_leases_on_one_client_do_not_drop_session(panel_server):
+    server, _ = panel_server
+    api = _api(server)
+
+    async def call() -> None:
+        async with api:
+            await asyncio.sleep(0.01)
+            await api.get_all_users()
+
+    await asyncio.gather(*(call() for _ in range(5)))
+    assert api.session is None
+    assert remnawave_session_pool.get_stats()["sessions"] == 1
+
+
+@pytest.mark.anyio
+async def test_pool_close_closes_sessions_and_recreates_on_demand():
+    pool = RemnaWaveSessionPool()
+    api = RemnaWaveAPI(base_url="http://panel.local", api_key="key")
+
+    first = pool.acquire(api._pool_key(), api._create_session)
+    assert pool.acquire(api._pool_key(), api._create_session) is first
+
+    await pool.close()
+    assert first.closed
+
+    second = pool.acquire(api._pool_key(), api._create_session)
+    assert second is not first
+    assert pool.get_stats() == {"sessions": 1, "created": 2, "leases": 3}
+    await pool.close()
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.external import remnawave_api
+from app.external.remnawave_api import RemnaWaveAPI, RemnaWaveAPIError, RemnaWaveReadCoalescer
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def coalescer(monkeypatch):
+    instance = RemnaWaveReadCoalescer()
+    monkeypatch.setattr(remnawave_api, "remnawave_read_coalescer", instance)
+    monkeypatch.setattr(settings, "REMNAWAVE_READ_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "REMNAWAVE_READ_CACHE_USER_TTL_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "REMNAWAVE_READ_CACHE_DEVICES_TTL_SECONDS", 30.0)
+    return instance
+
+
+def _user_payload(uuid: str, status: str = "ACTIVE") -> dict:
+    return {
+        "uuid": uuid,
+        "shortUuid": "short",
+        "username": "user",
+        "status": status,
+        "usedTrafficBytes": 0,
+        "lifetimeUsedTrafficBytes": 0,
+        "trafficLimitBytes": 0,
+        "trafficLimitStrategy": "NO_RESET",
+        "expireAt": "2030-01-01T00:00:00Z",
+        "subscriptionUrl": "https://panel.example/sub",
+        "activeInternalSquads": [],
+        "createdAt": "2026-01-01T00:00:00Z",
+        "updatedAt": "2026-01-01T00:00:00Z",
+    }
+
+
+class _FakePanelAPI(RemnaWaveAPI):
+    def __init__(self, delay: float = 0.05, fail: bool = False) -> None:
+        super().__init__("https://panel.example", "key")
+        self.session = object()
+        self.delay = delay
+        self.fail = fail
+        self.requests = []
+        self.status = "ACTIVE"
+
+    async def _send_request(self, method, endpoint, data, params):
+        self.requests.append((method, endpoint))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RemnaWaveAPIError("HTTP 502", 502)
+        if endpoint.startswith("/api/hwid/devices/"):
+            return {"response": {"total": 1, "devices": [{"hwid": "a"}]}}
+        if method == "PATCH":
+            self.status = data.get("status", self.status)
+        return {"response": _user_payload("u1", self.status)}
+
+
+@pytest.mark.anyio
+async def test_concurrent_identical_reads_share_one_request(coalescer):
+    api = _FakePanelAPI()
+
+    users = await asyncio.gather(*(api.get_user_by_uuid("u1") for _ in range(10)))
+
+    assert api.requests == [("GET", "/api/users/u1")]
+    assert {user.uuid for user in users} == {"u1"}
+    assert coalescer.get_stats()["coalesced"] == 9
+
+    # Повторное чтение в пределах TTL отвечает из кэша
+    devices = await api.get_user_devices("u1")
+    devices["devices"].clear()
+    assert (await api.get_user_devices("u1"))["total"] == 1
+    assert len((await api.get_user_devices("u1"))["devices"]) == 1
+    assert api.requests.count(("GET", "/api/hwid/devices/u1")) == 1
+    assert coalescer.get_stats()["hits"] == 2
+
+
+@pytest.mark.anyio
+async def test_write_invalidates_cached_user(coalescer):
+    api = _FakePanelAPI(delay=0)
+
+    assert (await api.get_user_by_uuid("u1")).status.value == "ACTIVE"
+    await api.update_user("u1", status=remnawave_api.UserStatus.DISABLED)
+    assert (await api.get_user_by_uuid("u1")).status.value == "DISABLED"
+
+    assert api.requests == [
+        ("GET", "/api/users/u1"),
+        ("PATCH", "/api/users"),
+        ("GET", "/api/users/u1"),
+    ]
+    assert coalescer.get_stats()["invalidations"] == 1
+
+
+@pytest.mark.anyio
+async def test_errors_are_shared_but_not_cached(coalescer):
+    api = _FakePanelAPI(fail=True)
+
+    results = await asyncio.gather(
+        *(api.get_user_devices("u1") for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, RemnaWaveAPIError) for result in results)
+    assert len(api.requests) == 1
+
+    api.fail = False
+    assert (await api.get_user_devices("u1"))["total"] == 1
+    assert len(api.requests) == 2
+
+
+@pytest.mark.anyio
+async def test_cache_can_be_disabled(coalescer, monkeypatch):
+    monkeypatch.setattr(settings, "REMNAWAVE_READ_CACHE_ENABLED", False)
+    api = _FakePanelAPI(delay=0)
+
+    await api.get_user_by_uuid("u1")
+    await api.get_user_by_uuid("u1")
+
+    assert len(api.requests) == 2
+    assert coalescer.get_stats()["misses"] == 0
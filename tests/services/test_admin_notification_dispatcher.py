@@ -0,0 +1,191 @@
+"""Проверки очереди админских уведомлений на фиктивном боте."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.config import settings
+from app.services.admin_notification_dispatcher import (
+    AdminNotification,
+    AdminNotificationDispatcher,
+    admin_notification_dispatcher,
+)
+from app.services.admin_notification_service import AdminNotificationService
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+_METHOD = SendMessage(chat_id=1, text="test")
+
+
+class FakeBot:
+    """Имитирует задержку Bot API и RetryAfter."""
+
+    def __init__(self, latency: float = 0.0, retry_after: int = 0, retry_after_times: int = 0) -> None:
+        self.latency = latency
+        self.retry_after = retry_after
+        self.retry_after_times = retry_after_times
+        self.sent: list[dict] = []
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, **kwargs) -> None:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.retry_after_times:
+                self.retry_after_times -= 1
+                raise TelegramRetryAfter(method=_METHOD, message="Too Many Requests", retry_after=self.retry_after)
+            self.sent.append(kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def queue_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_QUEUE_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_QUEUE_WORKERS", 3)
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_QUEUE_RATE_PER_SECOND", 1000.0)
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_QUEUE_MAX_SIZE", 1000)
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_QUEUE_MAX_ATTEMPTS", 5)
+    monkeypatch.setattr(settings, "ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS", 0.0)
+    return monkeypatch
+
+
+async def _wait_for(predicate, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "условие не выполнилось вовремя"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_sends_with_bounded_concurrency(queue_settings):
+    bot = FakeBot(latency=0.02)
+    dispatcher = AdminNotificationDispatcher()
+    await dispatcher.start()
+    try:
+        for index in range(20):
+            assert dispatcher.enqueue(AdminNotification(bot=bot, chat_id=-100, text=f"#{index}", thread_id=7))
+        await _wait_for(lambda: len(bot.sent) == 20)
+    finally:
+        await dispatcher.stop()
+
+    assert bot.max_in_flight == 3
+    assert {message["message_thread_id"] for message in bot.sent} == {7}
+    assert dispatcher.get_stats()["sent"] == 20
+
+
+@pytest.mark.anyio
+async def test_retry_after_pauses_all_workers(queue_settings):
+    bot = FakeBot(retry_after=1, retry_after_times=1)
+    dispatcher = AdminNotificationDispatcher()
+    await dispatcher.start()
+    started = time.monotonic()
+    try:
+        for index in range(3):
+            dispatcher.enqueue(AdminNotification(bot=bot, chat_id=-100, text=f"#{index}"))
+        await _wait_for(lambda: len(bot.sent) == 3, timeout=5.0)
+    finally:
+        await dispatcher.stop()
+
+    # Первая отправка получила RetryAfter, остальные дождались паузы вместо повторного флуда
+    assert time.monotonic() - started >= 0.9
+    assert bot.calls == 4
+    assert dispatcher.get_stats()["retries"] == 1
+
+
+@pytest.mark.anyio
+async def test_burst_is_coalesced_into_digest(queue_settings):
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS", 0.2)
+    bot = FakeBot()
+    dispatcher = AdminNotificationDispatcher()
+    await dispatcher.start()
+    try:
+        for index in range(50):
+            dispatcher.enqueue(
+                AdminNotification(
+                    bot=bot,
+                    chat_id=-100,
+                    text=f"💰 <b>ПОПОЛНЕНИЕ</b>\n#{index}",
+                    coalesce_key="balance_topup",
+                    digest_line=f"user {index} · +100 ₽",
+                )
+            )
+        dispatcher.enqueue(AdminNotification(bot=bot, chat_id=-100, text="тикет"))
+        await _wait_for(lambda: len(bot.sent) == 3)
+
+        # После тихого окна следующее событие снова уходит сразу
+        await _wait_for(lambda: dispatcher.get_stats()["open_windows"] == 0)
+        dispatcher.enqueue(
+            AdminNotification(bot=bot, chat_id=-100, text="одиночное", coalesce_key="balance_topup")
+        )
+        await _wait_for(lambda: len(bot.sent) == 4)
+    finally:
+        await dispatcher.stop()
+
+    texts = [message["text"] for message in bot.sent]
+    assert texts[0].endswith("#0")
+    assert "тикет" in texts
+    digest = next(text for text in texts if "Сводка" in text)
+    assert "Пополнения баланса" in digest
+    assert "<b>49</b>" in digest
+    assert "user 1 · +100 ₽" in digest
+    assert "… и ещё 19" in digest
+    assert texts[-1] == "одиночное"
+    assert dispatcher.get_stats()["digests"] == 1
+
+
+@pytest.mark.anyio
+async def test_stop_flushes_pending_digest(queue_settings):
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_DIGEST_WINDOW_SECONDS", 60.0)
+    bot = FakeBot()
+    dispatcher = AdminNotificationDispatcher()
+    await dispatcher.start()
+    for index in range(5):
+        dispatcher.enqueue(AdminNotification(bot=bot, chat_id=-100, text=f"#{index}", coalesce_key="trial_activation"))
+    await dispatcher.stop()
+
+    assert len(bot.sent) == 2
+    assert "Активации триалов" in bot.sent[1]["text"]
+    assert not dispatcher.is_running()
+
+
+@pytest.mark.anyio
+async def test_service_enqueues_without_waiting_for_telegram(queue_settings):
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_ENABLED", True)
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_CHAT_ID", "-100123")
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_TOPIC_ID", 5)
+    queue_settings.setattr(settings, "ADMIN_NOTIFICATIONS_TICKET_TOPIC_ID", 9)
+    bot = FakeBot(latency=0.5)
+    service = AdminNotificationService(bot)
+
+    await admin_notification_dispatcher.start()
+    try:
+        started = time.perf_counter()
+        assert await service._send_message("событие")
+        assert await service._send_message("тикет", ticket_event=True)
+        assert time.perf_counter() - started < 0.1
+        await _wait_for(lambda: len(bot.sent) == 2)
+    finally:
+        await admin_notification_dispatcher.stop()
+
+    threads = {message["text"]: message["message_thread_id"] for message in bot.sent}
+    assert threads == {"событие": 5, "тикет": 9}
+
+    # Без запущенной очереди сервис, как и раньше, отправляет сам
+    bot.sent.clear()
+    assert await service._send_message("напрямую")
+    assert bot.sent[0]["chat_id"] == "-100123"
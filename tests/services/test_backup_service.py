@@ -0,0 +1,210 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+import app.services.backup_service as backup_module
+from app.config import settings
+from app.database.models import (
+    PromoGroup,
+    Subscription,
+    SubscriptionSquad,
+    Transaction,
+    TransactionType,
+    User,
+)
+from app.services.backup_service import BackupFormatError, BackupService, read_backup_structure
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def session_factory(sqlite_session, async_session_adapter, monkeypatch):
+    engine = sqlite_session.get_bind()
+
+    def factory():
+        return async_session_adapter(Session(engine, expire_on_commit=False))
+
+    factory.engine = engine
+
+    async def fake_get_db():
+        yield factory()
+
+    monkeypatch.setattr(backup_module, "get_db", fake_get_db)
+    return factory
+
+
+@pytest.fixture
+def service(tmp_path):
+    backup_service = BackupService()
+    backup_service.backup_dir = tmp_path / "backups"
+    backup_service.backup_dir.mkdir()
+    backup_service._settings.max_backups_keep = 10
+    return backup_service
+
+
+async def _seed(factory) -> None:
+    session = factory()
+    group = PromoGroup(name="Default", is_default=True)
+    session.add(group)
+    await session.flush()
+    for index in range(1, 31):
+        user = User(
+            telegram_id=index,
+            promo_group_id=group.id,
+            balance_kopeks=index * 100,
+            first_name="Тест",
+            referred_by_id=1 if index > 1 else None,
+        )
+        session.add(user)
+        await session.flush()
+        session.add(
+            Subscription(
+                user_id=user.id,
+                is_trial=index % 2 == 0,
+                end_date=datetime(2030, 1, 1),
+                connected_squads=["squad-a", "squad-b"],
+            )
+        )
+        session.add(
+            Transaction(
+                user_id=user.id,
+                type=TransactionType.DEPOSIT.value,
+                amount_kopeks=1000,
+                is_completed=True,
+            )
+        )
+    await session.commit()
+
+
+async def _count(factory, model) -> int:
+    return await factory().scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.anyio
+async def test_stream_backup_round_trip(session_factory, service, monkeypatch):
+    await _seed(session_factory)
+    monkeypatch.setattr(backup_module, "_EXPORT_BATCH_SIZE", 7)
+
+    success, _, path = await service.create_backup()
+    assert success
+    assert path.endswith(".ndjson.gz")
+    assert not list(service.backup_dir.glob("*.partial"))
+
+    with gzip.open(path, "rb") as handle:
+        lines = handle.read().splitlines()
+    header = json.loads(lines[0])
+    manifest = json.loads(lines[-1])
+    assert header["type"] == "header"
+    assert manifest["type"] == "manifest"
+    assert manifest["tables"]["users"]["records"] == 30
+    assert manifest["metadata"]["total_records"] == sum(
+        info["records"] for info in manifest["tables"].values()
+    )
+
+    backups = await service.get_backup_list()
+    assert backups[0]["total_records"] == manifest["metadata"]["total_records"]
+    assert backups[0]["version"] == backup_module.BACKUP_FORMAT_VERSION
+
+    structure = read_backup_structure(backup_module.Path(path))
+    assert structure["data"]["subscriptions"][0]["connected_squads"] == ["squad-a", "squad-b"]
+
+    success, message = await service.restore_backup(path, clear_existing=True)
+    assert success, message
+    assert await _count(session_factory, User) == 30
+    assert await _count(session_factory, Subscription) == 30
+    squads = await session_factory().scalar(select(Subscription.connected_squads).limit(1))
+    assert squads == ["squad-a", "squad-b"]
+
+
+@pytest.mark.anyio
+async def test_corrupted_stream_backup_is_rejected(session_factory, service, tmp_path):
+    await _seed(session_factory)
+    success, _, path = await service.create_backup(compress=False)
+    assert success
+
+    content = backup_module.Path(path).read_bytes()
+    tampered = tmp_path / "backup_tampered.ndjson"
+    tampered.write_bytes(content.replace("Тест".encode(), "Тост".encode(), 1))
+
+    with pytest.raises(BackupFormatError):
+        read_backup_structure(tampered)
+
+    success, _ = await service.restore_backup(str(tampered), clear_existing=True)
+    assert not success
+    assert await _count(session_factory, User) == 30
+
+
+@pytest.mark.anyio
+async def test_legacy_json_backup_still_restores(session_factory, service):
+    legacy = {
+        "metadata": {"timestamp": "2024-01-01T00:00:00", "version": "1.2", "total_records": 2},
+        "data": {
+            "promo_groups": [{"id": 1, "name": "Default", "is_default": True}],
+            "users": [
+                {
+                    "id": 1,
+                    "telegram_id": 42,
+                    "promo_group_id": 1,
+                    "balance_kopeks": 500,
+                    "created_at": "2024-01-01T00:00:00",
+                }
+            ],
+        },
+        "associations": {},
+        "files": {},
+    }
+    legacy_path = service.backup_dir / "backup_20240101_000000.json.gz"
+    legacy_path.write_bytes(gzip.compress(json.dumps(legacy).encode("utf-8")))
+
+    backups = await service.get_backup_list()
+    assert backups[0]["version"] == "1.2"
+
+    success, message = await service.restore_backup(str(legacy_path), clear_existing=True)
+    assert success, message
+    user = await session_factory().scalar(select(User).where(User.telegram_id == 42))
+    assert user.balance_kopeks == 500
+
+
+@pytest.mark.anyio
+async def test_restore_writes_in_batches_and_upserts(session_factory, service, monkeypatch):
+    await _seed(session_factory)
+    success, _, path = await service.create_backup()
+    assert success
+
+    session = session_factory()
+    await session.execute(update(User).where(User.id == 5).values(balance_kopeks=1))
+    await session.commit()
+
+    monkeypatch.setattr(settings, "BACKUP_RESTORE_BATCH_SIZE", 10)
+    monkeypatch.setattr(settings, "BACKUP_RESTORE_PROGRESS_INTERVAL_SECONDS", 0.0)
+    reports = []
+
+    async def progress(report):
+        reports.append((report.table, report.done, report.total))
+
+    statements = []
+    event.listen(session_factory.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    success, message = await service.restore_backup(path, clear_existing=False, progress=progress)
+    assert success, message
+    assert "записей/с" in message
+
+    user_inserts = [statement for statement in statements if statement.startswith("INSERT INTO users")]
+    assert len(user_inserts) == 3  # 30 пользователей пачками по 10
+    # Поштучных SELECT по первичному ключу больше нет: остаётся одна проверка рефереров
+    assert sum(statement.startswith("SELECT users") for statement in statements) == 1
+
+    assert await _count(session_factory, User) == 30
+    assert await session_factory().scalar(select(User.balance_kopeks).where(User.id == 5)) == 500
+    assert await session_factory().scalar(select(func.count()).where(User.referred_by_id == 1)) == 29
+    assert await _count(session_factory, SubscriptionSquad) == 60
+
+    assert reports[-1][1:] == (reports[-1][2], reports[-1][2])
+    assert any(table == "users" for table, _, _ in reports)
@@ -0,0 +1,102 @@
+"""Проверки жизненного цикла рассылки при остановке и отмене задачи."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+import app.services.broadcast_service as broadcast_module
+from app.database.models import BroadcastHistory
+from app.services.broadcast_delivery import BroadcastRecipient
+from app.services.broadcast_service import BroadcastConfig, BroadcastService
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def service(sqlite_session, async_session_adapter, monkeypatch):
+    monkeypatch.setattr(broadcast_module, "BackgroundSessionLocal", async_session_adapter(sqlite_session))
+    monkeypatch.setattr(broadcast_module.settings, "BROADCAST_CHECKPOINT_INTERVAL_SECONDS", 0)
+
+    sqlite_session.add(
+        BroadcastHistory(
+            id=1,
+            target_type="all",
+            message_text="hello",
+            total_count=20,
+            sent_count=7,
+            failed_count=3,
+            blocked_count=2,
+            last_processed_user_id=10,
+            status="in_progress",
+        )
+    )
+    sqlite_session.commit()
+
+    service = BroadcastService()
+    service.set_bot(object())
+    delivering = asyncio.Event()
+
+    async def stream_recipients(target, after_user_id=None):  # noqa: ANN001
+        for user_id in range(after_user_id + 1, 21):
+            yield BroadcastRecipient(user_id=user_id, telegram_id=1000 + user_id)
+
+    async def deliver_message(telegram_id, config, keyboard):  # noqa: ANN001
+        # Первые четыре получателя доставляются и попадают в контрольную точку,
+        # остальные зависают до отмены задачи
+        if telegram_id <= 1014:
+            return
+        delivering.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(service, "_stream_recipients", stream_recipients)
+    monkeypatch.setattr(service, "_deliver_message", deliver_message)
+    service.delivering = delivering
+    return service
+
+
+async def _start(service: BroadcastService) -> asyncio.Task:
+    await service.start_broadcast(1, BroadcastConfig(target="all", message_text="hello", selected_buttons=[]), resume=True)
+    task = service._tasks[1].task
+    await asyncio.wait_for(service.delivering.wait(), timeout=1)
+    return task
+
+
+def _broadcast_state(sqlite_session) -> tuple:
+    sqlite_session.expire_all()
+    broadcast = sqlite_session.get(BroadcastHistory, 1)
+    return (
+        broadcast.status,
+        broadcast.sent_count,
+        broadcast.failed_count,
+        broadcast.blocked_count,
+        broadcast.last_processed_user_id,
+    )
+
+
+@pytest.mark.anyio
+async def test_task_cancellation_keeps_broadcast_resumable(service, sqlite_session):
+    task = await _start(service)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # Отмена задачи при остановке бота: запись должна подхватить resume_interrupted
+    assert _broadcast_state(sqlite_session) == ("in_progress", 11, 3, 2, 14)
+
+
+@pytest.mark.anyio
+async def test_admin_stop_marks_cancelled_without_resetting_counters(service, sqlite_session):
+    task = await _start(service)
+
+    assert await service.request_stop(1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert _broadcast_state(sqlite_session) == ("cancelled", 11, 3, 2, 14)
@@ -0,0 +1,178 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import app.services.monitoring_service as monitoring_module
+from app.config import settings
+from app.database.models import (
+    MonitoringLog,
+    PromoGroup,
+    SentNotification,
+    Subscription,
+    SubscriptionStatus,
+    User,
+)
+from app.services.monitoring_service import MonitoringService, MonitoringStage
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _add_subscriptions(session: Session, end_dates, **kwargs) -> list[Subscription]:
+    group = PromoGroup(name="Default", is_default=True)
+    session.add(group)
+    subscriptions = []
+    for index, end_date in enumerate(end_dates, start=1):
+        user = User(
+            telegram_id=1000 + index,
+            referral_code=f"ref{index}",
+            promo_group=group,
+            remnawave_uuid=f"uuid-{index}",
+        )
+        subscription = Subscription(
+            status=SubscriptionStatus.ACTIVE.value,
+            is_trial=False,
+            end_date=end_date,
+            **kwargs,
+        )
+        user.subscription = subscription
+        session.add(user)
+        subscriptions.append(subscription)
+    session.commit()
+    return subscriptions
+
+
+def _service(monkeypatch) -> MonitoringService:
+    monkeypatch.setattr(settings, "MONITORING_NOTIFICATION_CONCURRENCY", 3)
+    monkeypatch.setattr(settings, "MONITORING_PANEL_CONCURRENCY", 3)
+    return MonitoringService(bot=object())
+
+
+@pytest.mark.anyio
+async def test_expiring_notifications_use_most_urgent_window_and_constant_queries(sqlite_session, monkeypatch, async_session_adapter):
+    monkeypatch.setattr(settings, "AUTOPAY_WARNING_DAYS", "3,1")
+    now = datetime.utcnow()
+    subscriptions = _add_subscriptions(
+        sqlite_session,
+        [now + timedelta(hours=12)] * 20 + [now + timedelta(days=2)] * 20 + [now + timedelta(days=10)],
+    )
+    already_notified = subscriptions[0]
+    sqlite_session.add(
+        SentNotification(
+            user_id=already_notified.user_id,
+            subscription_id=already_notified.id,
+            notification_type="expiring",
+            days_before=1,
+        )
+    )
+    sqlite_session.commit()
+
+    service = _service(monkeypatch)
+    sent = []
+
+    async def fake_send(user, subscription, days):
+        await asyncio.sleep(0)
+        sent.append((subscription.id, days))
+        return True
+
+    monkeypatch.setattr(service, "_send_subscription_expiring_notification", fake_send)
+    db = async_session_adapter(sqlite_session)
+
+    rows = await service._check_expiring_subscriptions(db)
+
+    assert rows == 40
+    assert sorted(days for _, days in sent) == [1] * 19 + [3] * 20
+    assert already_notified.id not in {subscription_id for subscription_id, _ in sent}
+    # Выборка подписок + их пользователей + уже отправленные уведомления, без запросов на каждого
+    assert db.statements <= 5
+
+    recorded = sqlite_session.execute(
+        select(SentNotification).where(SentNotification.notification_type == "expiring")
+    ).scalars().all()
+    assert len(recorded) == 40
+
+
+@pytest.mark.anyio
+async def test_expired_subscriptions_are_updated_in_bulk(sqlite_session, monkeypatch, async_session_adapter):
+    now = datetime.utcnow()
+    _add_subscriptions(sqlite_session, [now - timedelta(minutes=5)] * 10 + [now + timedelta(days=1)])
+
+    service = _service(monkeypatch)
+    bulk_calls = []
+
+    class _FakeAPI:
+        async def bulk_update_users(self, uuids, fields):
+            bulk_calls.append((sorted(uuids), fields))
+            return len(uuids)
+
+    @asynccontextmanager
+    async def fake_api_client():
+        yield _FakeAPI()
+
+    monkeypatch.setattr(service.subscription_service, "get_api_client", fake_api_client)
+    notify = AsyncMock(return_value=True)
+    monkeypatch.setattr(service, "_send_subscription_expired_notification", notify)
+    db = async_session_adapter(sqlite_session)
+
+    assert await service._check_expired_subscriptions(db) == 10
+    assert notify.await_count == 10
+    # Все истёкшие пользователи отключаются в панели одним bulk-запросом
+    assert bulk_calls == [(sorted(f"uuid-{index}" for index in range(1, 11)), {"status": "DISABLED"})]
+
+    statuses = sqlite_session.execute(select(Subscription.status)).scalars().all()
+    assert statuses.count(SubscriptionStatus.EXPIRED.value) == 10
+
+
+@pytest.mark.anyio
+async def test_cycle_runs_phases_in_order_and_logs_stage_timings(sqlite_session, monkeypatch, async_session_adapter):
+    monkeypatch.setattr(settings, "MONITORING_STAGE_CONCURRENCY", 3)
+    db = async_session_adapter(sqlite_session)
+    monkeypatch.setattr(monitoring_module, "BackgroundSessionLocal", db)
+
+    service = MonitoringService()
+    events = []
+    running = 0
+    peak = 0
+
+    def stage(name, rows, fail=False):
+        async def handler(session):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            events.append(f"start:{name}")
+            await asyncio.sleep(0.02)
+            running -= 1
+            events.append(f"end:{name}")
+            if fail:
+                raise RuntimeError("boom")
+            return rows
+
+        return MonitoringStage(name, handler)
+
+    monkeypatch.setattr(
+        service,
+        "_build_stage_phases",
+        lambda: [
+            [stage("a", 1), stage("b", 2), stage("c", 3)],
+            [stage("d", 4, fail=True)],
+        ],
+    )
+
+    await service._monitoring_cycle()
+
+    assert peak == 3
+    assert events.index("start:d") > max(events.index(f"end:{name}") for name in "abc")
+
+    log = sqlite_session.execute(select(MonitoringLog)).scalar_one()
+    assert log.event_type == "monitoring_cycle_error"
+    assert not log.is_success
+    assert log.data["stages"]["b"]["rows"] == 2
+    assert log.data["stages"]["d"]["error"] == "boom"
+    assert log.data["stages"]["a"]["duration_ms"] >= 15
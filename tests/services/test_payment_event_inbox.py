@@ -0,0 +1,257 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+import app.services.payment_event_inbox as inbox_module
+from app.config import settings
+from app.database.crud.payment_event import (
+    claim_due_payment_events,
+    complete_payment_event,
+    enqueue_payment_event,
+    get_payment_event_stats,
+    requeue_stale_payment_events,
+)
+from app.database.models import Base, PaymentEvent, PaymentEventStatus
+from app.services.payment_event_inbox import PaymentEventInbox
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def db(sqlite_session, async_session_adapter):
+    return async_session_adapter(sqlite_session)
+
+
+@pytest.fixture
+def inbox(sqlite_session, async_session_adapter, monkeypatch):
+    factory = lambda: async_session_adapter(sqlite_session)  # noqa: E731
+    monkeypatch.setattr(inbox_module, "AsyncSessionLocal", factory)
+    monkeypatch.setattr(inbox_module, "BackgroundSessionLocal", factory)
+    monkeypatch.setattr(settings, "PAYMENT_INBOX_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(settings, "PAYMENT_INBOX_MAX_ATTEMPTS", 3)
+    return PaymentEventInbox()
+
+
+class _FakePaymentService:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.processed = []
+
+    async def process_yookassa_webhook(self, db, payload):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("telegram timeout")
+        self.processed.append(payload["object"]["id"] + ":" + payload["event"])
+        return True
+
+
+def _yookassa(payment_id: str, event: str = "payment.succeeded") -> dict:
+    return {"event": event, "object": {"id": payment_id}}
+
+
+@pytest.mark.anyio
+async def test_enqueue_is_idempotent_per_provider_event(db, sqlite_session):
+    first, created = await enqueue_payment_event(
+        db, provider="yookassa", event_key="k1", ordering_key="p1", payload=_yookassa("p1")
+    )
+    again, created_again = await enqueue_payment_event(
+        db, provider="yookassa", event_key="k1", ordering_key="p1", payload=_yookassa("p1")
+    )
+
+    assert created and not created_again
+    assert again.id == first.id
+    assert len(sqlite_session.execute(select(PaymentEvent)).scalars().all()) == 1
+
+
+@pytest.mark.anyio
+async def test_claim_keeps_events_of_one_payment_in_order(db):
+    for key, ordering_key in [("a1", "a"), ("a2", "a"), ("b1", "b")]:
+        await enqueue_payment_event(
+            db, provider="yookassa", event_key=key, ordering_key=ordering_key, payload={}
+        )
+
+    claimed = await claim_due_payment_events(db, 10)
+    assert [event.event_key for event in claimed] == ["a1", "b1"]
+    assert {event.status for event in claimed} == {PaymentEventStatus.PROCESSING.value}
+    # Пока первое событие платежа в работе, следующее не выдаётся
+    assert await claim_due_payment_events(db, 10) == []
+
+    await complete_payment_event(db, claimed[0].id)
+    assert [event.event_key for event in await claim_due_payment_events(db, 10)] == ["a2"]
+
+
+@pytest.mark.anyio
+async def test_concurrent_claimers_never_share_an_event(tmp_path, async_session_adapter):
+    # Файл, а не :memory: — у каждой «реплики» своё соединение и своя транзакция
+    engine = create_engine(f"sqlite:///{tmp_path / 'inbox.db'}")
+    Base.metadata.create_all(engine)
+
+    class _Replica(async_session_adapter):
+        async def execute(self, stmt, params=None):
+            # После выборки строки читаются сразу, как у async-драйвера, и управление
+            # отдаётся второй реплике: обе успевают выбрать одно и то же событие
+            result = await super().execute(stmt, params)
+            if stmt.is_select:
+                result = result.freeze()()
+                await asyncio.sleep(0)
+            return result
+
+    try:
+        with Session(engine) as session:
+            await enqueue_payment_event(
+                async_session_adapter(session), provider="yookassa", event_key="k1", ordering_key="p1", payload={}
+            )
+
+        replicas = [_Replica(Session(engine, expire_on_commit=False)) for _ in range(2)]
+        claimed = await asyncio.gather(*(claim_due_payment_events(db, 10) for db in replicas))
+        for db in replicas:
+            await db.close()
+
+        assert sorted(len(events) for events in claimed) == [0, 1]
+        with Session(engine) as session:
+            event = session.execute(select(PaymentEvent)).scalar_one()
+            assert event.status == PaymentEventStatus.PROCESSING.value
+            assert event.attempts == 1
+            assert event.claimed_at is not None
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_requeue_skips_events_with_live_lease(db, sqlite_session):
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    sqlite_session.add_all(
+        [
+            PaymentEvent(
+                provider="yookassa",
+                event_key=key,
+                ordering_key=key,
+                payload={},
+                status=PaymentEventStatus.PROCESSING.value,
+                next_attempt_at=now,
+                claimed_at=claimed_at,
+                created_at=now,
+            )
+            for key, claimed_at in [("live", now - timedelta(seconds=30)), ("stale", now - timedelta(hours=1))]
+        ]
+    )
+    sqlite_session.commit()
+
+    assert await requeue_stale_payment_events(db, 600, now=now) == 1
+    statuses = dict(sqlite_session.execute(select(PaymentEvent.event_key, PaymentEvent.status)).all())
+    assert statuses == {"live": PaymentEventStatus.PROCESSING.value, "stale": PaymentEventStatus.PENDING.value}
+
+
+@pytest.mark.anyio
+async def test_worker_retries_then_completes(inbox, db, sqlite_session):
+    payment_service = _FakePaymentService(failures=1)
+    inbox.set_payment_service(payment_service, bot=object())
+    await inbox.enqueue("yookassa", "k1", "p1", _yookassa("p1", "payment.waiting_for_capture"))
+    await inbox.enqueue("yookassa", "k2", "p1", _yookassa("p1"))
+
+    assert await inbox.run_once() == 1
+    event = sqlite_session.execute(select(PaymentEvent).where(PaymentEvent.event_key == "k1")).scalar_one()
+    assert event.status == PaymentEventStatus.PENDING.value
+    assert "telegram timeout" in event.last_error
+
+    while await inbox.run_once():
+        pass
+
+    assert payment_service.processed == ["p1:payment.waiting_for_capture", "p1:payment.succeeded"]
+    stats = await inbox.get_metrics(db)
+    assert stats["by_status"][PaymentEventStatus.DONE.value] == 2
+    assert stats["processed"] == 2
+    assert stats["failed_attempts"] == 1
+    assert stats["lag_seconds"] == 0.0
+
+
+@pytest.mark.anyio
+async def test_worker_dead_letters_after_max_attempts(inbox, db, sqlite_session):
+    inbox.set_payment_service(_FakePaymentService(failures=10), bot=object())
+    await inbox.enqueue("yookassa", "k1", "p1", _yookassa("p1"))
+    await inbox.enqueue("unknown", "k2", "p2", {})
+
+    while await inbox.run_once():
+        pass
+
+    events = {
+        event.event_key: event for event in sqlite_session.execute(select(PaymentEvent)).scalars().all()
+    }
+    assert events["k1"].status == PaymentEventStatus.DEAD.value
+    assert events["k1"].attempts == settings.PAYMENT_INBOX_MAX_ATTEMPTS
+    assert events["k2"].status == PaymentEventStatus.DEAD.value
+    assert events["k2"].attempts == 1
+
+    metrics = await inbox.get_metrics(db)
+    assert metrics["dead_lettered"] == 2
+    assert metrics["by_status"][PaymentEventStatus.DEAD.value] == 2
+
+
+@pytest.mark.anyio
+async def test_stats_report_lag_of_oldest_open_event(db, sqlite_session):
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    sqlite_session.add_all(
+        [
+            PaymentEvent(
+                provider="pal24",
+                event_key="old",
+                ordering_key="x",
+                payload={},
+                status=PaymentEventStatus.PENDING.value,
+                created_at=now - timedelta(seconds=90),
+                next_attempt_at=now,
+            ),
+            PaymentEvent(
+                provider="pal24",
+                event_key="done",
+                ordering_key="y",
+                payload={},
+                status=PaymentEventStatus.DONE.value,
+                created_at=now - timedelta(minutes=5),
+                next_attempt_at=now,
+                processed_at=now - timedelta(seconds=30),
+            ),
+        ]
+    )
+    sqlite_session.commit()
+
+    stats = await get_payment_event_stats(db, now=now)
+    assert stats["lag_seconds"] == 90.0
+    assert stats["processed_last_minute"] == 1
+    assert stats["by_status"][PaymentEventStatus.PENDING.value] == 1
+
+
+@pytest.mark.anyio
+async def test_tribute_event_is_retried_when_credit_is_not_applied(inbox, db, sqlite_session, monkeypatch):
+    import app.services.tribute_service as tribute_module
+
+    async def fake_get_db():
+        yield db
+
+    async def fake_process_webhook(self, data):
+        return {
+            "event_type": "payment",
+            "status": "paid",
+            "user_id": 404,
+            "amount_kopeks": 10000,
+            "payment_id": "donation-1",
+        }
+
+    monkeypatch.setattr(tribute_module, "get_db", fake_get_db)
+    monkeypatch.setattr(tribute_module.TributeAPI, "process_webhook", fake_process_webhook)
+    inbox.set_payment_service(_FakePaymentService(), bot=object())
+    await inbox.enqueue("tribute", "t1", "donation-1", {"name": "new_donation"})
+
+    while await inbox.run_once():
+        pass
+
+    # Пользователь не найден: начисления нет, событие не должно считаться обработанным
+    event = sqlite_session.execute(select(PaymentEvent)).scalar_one()
+    assert event.status == PaymentEventStatus.DEAD.value
+    assert event.attempts == settings.PAYMENT_INBOX_MAX_ATTEMPTS
@@ -87,11 +87,12 @@ async def test_process_mulenpay_callback_success(monkeypatch: pytest.MonkeyPatch
 
     transactions: list[Dict[str, Any]] = []
 
-    async def fake_create_transaction(db, **kwargs):
-        transactions.append(kwargs)
-        return SimpleNamespace(id=777, **kwargs)
+    async def fake_credit_user_balance(db, target_user, amount_kopeks, description, **kwargs):
+        target_user.balance_kopeks += amount_kopeks
+        transactions.append({"user_id": target_user.id, "amount_kopeks": amount_kopeks, **kwargs})
+        return SimpleNamespace(id=777, amount_kopeks=amount_kopeks, **kwargs)
 
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
+    monkeypatch.setattr(payment_service_module, "credit_user_balance", fake_credit_user_balance)
 
     updated_status: dict[str, Any] = {}
 
@@ -122,6 +123,8 @@ async def test_process_mulenpay_callback_success(monkeypatch: pytest.MonkeyPatch
         return user
 
     monkeypatch.setattr(payment_service_module, "get_user_by_id", fake_get_user)
+
+    # Баланс меняется UPDATE-выражением в БД, FakeSession его не выполняет
     monkeypatch.setattr(type(settings), "format_price", lambda self, amount: f"{amount / 100:.2f}₽", raising=False)
 
     referral_mock = SimpleNamespace(process_referral_topup=AsyncMock())
@@ -192,14 +195,12 @@ async def test_process_cryptobot_webhook_success(monkeypatch: pytest.MonkeyPatch
 
     transactions: list[Dict[str, Any]] = []
 
-    async def fake_create_transaction(db, **kwargs):
-        transactions.append(kwargs)
-        return SimpleNamespace(id=888, **kwargs)
+    async def fake_credit_user_balance(db, target_user, amount_kopeks, description, **kwargs):
+        target_user.balance_kopeks += amount_kopeks
+        transactions.append({"amount_kopeks": amount_kopeks, "description": description, **kwargs})
+        return SimpleNamespace(id=888, amount_kopeks=amount_kopeks, **kwargs)
 
-    fake_transaction_module = ModuleType("app.database.crud.transaction")
-    fake_transaction_module.create_transaction = fake_create_transaction
-    monkeypatch.setitem(sys.modules, "app.database.crud.transaction", fake_transaction_module)
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
+    monkeypatch.setattr(payment_service_module, "credit_user_balance", fake_credit_user_balance)
 
     user = SimpleNamespace(
         id=7,
@@ -286,16 +287,12 @@ async def test_process_yookassa_webhook_success(monkeypatch: pytest.MonkeyPatch)
 
     transactions: list[Dict[str, Any]] = []
 
-    async def fake_create_transaction(db, **kwargs):
-        transactions.append(kwargs)
-        return SimpleNamespace(id=999, **kwargs)
+    async def fake_credit_user_balance(db, target_user, amount_kopeks, description, **kwargs):
+        target_user.balance_kopeks += amount_kopeks
+        transactions.append({"amount_kopeks": amount_kopeks, "description": description, **kwargs})
+        return SimpleNamespace(id=999, amount_kopeks=amount_kopeks, **kwargs)
 
-    trx_module = ModuleType("app.database.crud.transaction")
-    trx_module.create_transaction = fake_create_transaction
-    monkeypatch.setitem(sys.modules, "app.database.crud.transaction", trx_module)
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
+    monkeypatch.setattr(payment_service_module, "credit_user_balance", fake_credit_user_balance)
 
     user = SimpleNamespace(
         id=21,
@@ -401,14 +398,14 @@ async def test_process_pal24_postback_success(monkeypatch: pytest.MonkeyPatch) -
     monkeypatch.setattr(payment_service_module, "update_pal24_payment_status", fake_update)
     monkeypatch.setattr(payment_service_module, "link_pal24_payment_to_transaction", fake_link)
 
-    async def fake_create_transaction(db, **kwargs):
-        payment.transaction_id = 654
-        return SimpleNamespace(id=654, **kwargs)
+    transactions: list[Dict[str, Any]] = []
+
+    async def fake_credit_user_balance(db, target_user, amount_kopeks, description, **kwargs):
+        target_user.balance_kopeks += amount_kopeks
+        transactions.append({"amount_kopeks": amount_kopeks, "description": description, **kwargs})
+        return SimpleNamespace(id=654, amount_kopeks=amount_kopeks, **kwargs)
 
-    trx_module = ModuleType("app.database.crud.transaction")
-    trx_module.create_transaction = fake_create_transaction
-    monkeypatch.setitem(sys.modules, "app.database.crud.transaction", trx_module)
-    monkeypatch.setattr(payment_service_module, "create_transaction", fake_create_transaction)
+    monkeypatch.setattr(payment_service_module, "credit_user_balance", fake_credit_user_balance)
 
     user = SimpleNamespace(
         id=33,
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.services.remnawave_service import RemnaWaveService
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _FakeStatsAPI:
+    def __init__(self, delay: float = 0.1, slow_method: str | None = None) -> None:
+        self.base_url = f"https://panel-{id(self)}.example"
+        self.delay = delay
+        self.slow_method = slow_method
+        self.calls: dict[str, int] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def _call(self, name: str, value):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(10 if name == self.slow_method else self.delay)
+        return value
+
+    async def get_system_stats(self):
+        return await self._call(
+            "get_system_stats",
+            {"users": {"totalUsers": 7, "totalTrafficBytes": "100"}, "onlineStats": {"onlineNow": 3}},
+        )
+
+    async def get_bandwidth_stats(self):
+        return await self._call(
+            "get_bandwidth_stats",
+            {"bandwidthLastTwoDays": {"current": "1 KB", "previous": "0 B", "difference": "1 KB"}},
+        )
+
+    async def get_nodes_realtime_usage(self):
+        return await self._call("get_nodes_realtime_usage", [{"downloadBytes": 5, "uploadBytes": 6}])
+
+    async def get_nodes_statistics(self):
+        return await self._call(
+            "get_nodes_statistics",
+            {"lastSevenDays": [{"nodeName": "n1", "totalBytes": "10", "date": "2026-01-01"}]},
+        )
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(settings, "REMNAWAVE_API_URL", "https://panel.example")
+    monkeypatch.setattr(settings, "REMNAWAVE_API_KEY", "key")
+    monkeypatch.setattr(settings, "REMNAWAVE_STATS_CACHE_TTL_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS", 1.0)
+
+    def factory(api: _FakeStatsAPI) -> RemnaWaveService:
+        service = RemnaWaveService()
+        service.api = api
+        return service
+
+    return factory
+
+
+@pytest.mark.anyio
+async def test_statistics_calls_run_concurrently_and_are_shared(make_service):
+    api = _FakeStatsAPI(delay=0.1)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(make_service(api).get_system_statistics() for _ in range(10))
+    )
+    elapsed = time.perf_counter() - started
+
+    # Четыре вызова по 0.1с параллельно, а не последовательно, и один раз на всех
+    assert elapsed < 0.3
+    assert set(api.calls.values()) == {1}
+    assert all(result["system"]["total_users"] == 7 for result in results)
+    assert results[0]["bandwidth"]["realtime_total"] == 11
+    assert results[0]["nodes_weekly"][0]["total_bytes"] == 10
+
+    # Повторный запрос в пределах TTL берётся из кэша; результат — независимая копия
+    results[0]["system"]["total_users"] = 0
+    cached = await make_service(api).get_system_statistics()
+    assert cached["system"]["total_users"] == 7
+    assert set(api.calls.values()) == {1}
+
+    await make_service(api).get_system_statistics(force_refresh=True)
+    assert set(api.calls.values()) == {2}
+
+
+@pytest.mark.anyio
+async def test_slow_call_times_out_and_partial_result_is_not_cached(make_service, monkeypatch):
+    monkeypatch.setattr(settings, "REMNAWAVE_STATS_CALL_TIMEOUT_SECONDS", 0.2)
+    api = _FakeStatsAPI(delay=0.01, slow_method="get_bandwidth_stats")
+
+    started = time.perf_counter()
+    stats = await make_service(api).get_system_statistics()
+    assert time.perf_counter() - started < 1.0
+
+    assert stats["system"]["total_users"] == 7
+    assert stats["traffic_periods"]["last_2_days"]["current"] == 0
+
+    sources = await make_service(api).get_statistics_sources()
+    assert sources["bandwidth_stats"] == {}
+    assert api.calls["get_system_stats"] == 2
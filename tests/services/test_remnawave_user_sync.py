@@ -0,0 +1,255 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database.models import (
+    PromoGroup,
+    ServerSquad,
+    StatisticsRollup,
+    Subscription,
+    SubscriptionServer,
+    SubscriptionSquad,
+    SubscriptionStatus,
+    User,
+)
+from app.database.crud.statistics_rollup import rebuild_statistics_rollups
+from app.services.remnawave_user_sync import (
+    LocalUserRow,
+    PanelUserRecord,
+    UserSyncApplier,
+    UserSyncReport,
+    build_sync_plan,
+    fetch_panel_users,
+    load_local_snapshot,
+)
+
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _panel_user(telegram_id, **overrides):
+    data = dict(
+        uuid=f"uuid-{telegram_id}",
+        short_uuid=f"short-{telegram_id}",
+        username=f"panel_{telegram_id}",
+        telegram_id=telegram_id,
+        status=SimpleNamespace(value="ACTIVE"),
+        expire_at=NOW + timedelta(days=30),
+        traffic_limit_bytes=100 * GB,
+        used_traffic_bytes=GB,
+        hwid_device_limit=3,
+        subscription_url=f"https://sub/{telegram_id}",
+        happ_crypto_link="",
+        active_internal_squads=[{"uuid": "squad-a"}],
+    )
+    data.update(overrides)
+    return SimpleNamespace(**data)
+
+
+def _record(telegram_id, **overrides) -> PanelUserRecord:
+    return PanelUserRecord.from_api_user(_panel_user(telegram_id, **overrides), ZoneInfo("UTC"))
+
+
+class FakePanelApi:
+    def __init__(self, users, max_page_size=None) -> None:
+        self.users = users
+        self.max_page_size = max_page_size
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get_all_users(self, start=0, size=100):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.max_page_size:
+                size = min(size, self.max_page_size)
+            self.requests.append((start, size))
+            return {"users": self.users[start:start + size], "total": len(self.users)}
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.anyio
+async def test_fetch_streams_pages_concurrently_and_respects_panel_page_limit():
+    users = [_panel_user(index) for index in range(1, 24)]
+    users.append(_panel_user(None))
+    api = FakePanelApi(users, max_page_size=4)
+
+    records = await fetch_panel_users(api, ZoneInfo("UTC"), page_size=10, concurrency=3)
+
+    assert sorted(record.telegram_id for record in records) == list(range(1, 24))
+    assert [start for start, _ in api.requests] == sorted({start for start, _ in api.requests})
+    assert len(api.requests) == 6
+    assert 1 < api.max_in_flight <= 3
+
+
+def _local_from_record(user_id, record: PanelUserRecord, **overrides) -> LocalUserRow:
+    values = dict(
+        user_id=user_id,
+        telegram_id=record.telegram_id,
+        remnawave_uuid=record.uuid,
+        subscription_id=user_id * 10,
+        status=SubscriptionStatus.ACTIVE.value,
+        is_trial=False,
+        end_date=record.expire_at,
+        traffic_limit_gb=record.traffic_limit_gb,
+        traffic_used_gb=record.traffic_used_gb,
+        device_limit=record.device_limit,
+        connected_squads=list(record.squads),
+        autopay_enabled=False,
+        remnawave_short_uuid=record.short_uuid,
+        subscription_url=record.subscription_url,
+        subscription_crypto_link=record.subscription_crypto_link,
+    )
+    values.update(overrides)
+    return LocalUserRow(**values)
+
+
+def test_plan_contains_only_changed_rows():
+    unchanged = _record(1)
+    changed = _record(2, hwid_device_limit=5)
+    new = _record(3)
+    local = {
+        1: _local_from_record(1, unchanged),
+        2: _local_from_record(2, _record(2)),
+        4: LocalUserRow(user_id=4, telegram_id=4, remnawave_uuid="uuid-4", subscription_id=40, status="active"),
+        5: _local_from_record(
+            5,
+            _record(5),
+            remnawave_uuid=None,
+            status=SubscriptionStatus.DISABLED.value,
+            is_trial=True,
+            traffic_limit_gb=0,
+            traffic_used_gb=0.0,
+            device_limit=1,
+            connected_squads=[],
+            remnawave_short_uuid=None,
+            subscription_url="",
+        ),
+    }
+
+    plan = build_sync_plan([unchanged, changed, new], local, "all", NOW)
+
+    assert plan.creates == [new]
+    assert plan.subscription_updates == [(2, {"device_limit": 5, "id": 20})]
+    assert [row.telegram_id for row in plan.deactivations] == [4]
+    assert plan.update_count == 1
+
+    only_new = build_sync_plan([unchanged, changed, new], local, "new_only", NOW)
+    assert only_new.creates == [new]
+    assert not only_new.subscription_updates and not only_new.deactivations
+
+
+@pytest.mark.anyio
+async def test_applier_uses_bulk_statements_in_chunks(sqlite_session, async_session_adapter):
+    group = PromoGroup(name="Default", is_default=True)
+    server = ServerSquad(squad_uuid="squad-a", display_name="A", current_users=3)
+    sqlite_session.add_all([group, server])
+    sqlite_session.flush()
+
+    kept = User(telegram_id=1, referral_code="ref1", promo_group_id=group.id)
+    gone = User(telegram_id=2, referral_code="ref2", promo_group_id=group.id, remnawave_uuid="uuid-2")
+    sqlite_session.add_all([kept, gone])
+    sqlite_session.flush()
+    sqlite_session.add(Subscription(user_id=kept.id, end_date=NOW, status="expired", traffic_limit_gb=0))
+    gone_subscription = Subscription(
+        user_id=gone.id,
+        end_date=NOW + timedelta(days=5),
+        status="active",
+        connected_squads=["squad-a"],
+    )
+    sqlite_session.add(gone_subscription)
+    sqlite_session.flush()
+    sqlite_session.add(SubscriptionServer(subscription_id=gone_subscription.id, server_squad_id=server.id))
+    sqlite_session.commit()
+
+    db = async_session_adapter(sqlite_session)
+    panel = [_record(1)] + [_record(telegram_id) for telegram_id in range(100, 150)]
+    plan = build_sync_plan(panel, await load_local_snapshot(db), "all", NOW)
+
+    codes = iter(f"code{index}" for index in range(1000))
+    applier = UserSyncApplier(db, chunk_size=20, now=NOW, referral_code_factory=lambda: next(codes))
+    report = UserSyncReport()
+    db.statements = 0
+    await applier.apply(plan, report)
+
+    assert (report.created, report.updated, report.deleted, report.errors) == (50, 1, 1, 0)
+    assert db.commits == 5
+    # Число запросов зависит от числа чанков, а не от числа пользователей;
+    # чанк со вставками добавляет один upsert корзин статистики
+    assert db.statements <= 30
+
+    created = sqlite_session.execute(select(User).where(User.telegram_id == 120)).scalar_one()
+    assert created.remnawave_uuid == "uuid-120"
+    assert created.promo_group_id == group.id
+    assert created.subscription.status == SubscriptionStatus.ACTIVE.value
+    assert created.subscription.traffic_limit_gb == 100
+
+    sqlite_session.expire_all()
+    assert kept.subscription.status == SubscriptionStatus.ACTIVE.value
+    assert kept.subscription.device_limit == 3
+    assert gone.remnawave_uuid is None
+    assert gone.subscription.status == SubscriptionStatus.DISABLED.value
+    assert gone.subscription.connected_squads == []
+    assert server.current_users == 2
+    assert sqlite_session.execute(select(SubscriptionServer)).first() is None
+    assert report.changed_telegram_ids >= {1, 2, 120}
+
+    memberships = sqlite_session.execute(select(SubscriptionSquad.subscription_id, SubscriptionSquad.squad_uuid)).all()
+    assert len(memberships) == 51
+    assert (created.subscription.id, "squad-a") in memberships
+    assert all(subscription_id != gone_subscription.id for subscription_id, _ in memberships)
+
+    second_plan = build_sync_plan(panel, await load_local_snapshot(db), "all", NOW)
+    assert not second_plan.creates
+    assert second_plan.update_count == 0
+    assert not second_plan.deactivations
+
+
+def _rollups(session: Session):
+    return {
+        (row.bucket_start, row.metric, row.dimension): (row.events_count, row.amount_kopeks)
+        for row in session.execute(select(StatisticsRollup)).scalars()
+    }
+
+
+@pytest.mark.anyio
+async def test_bulk_sync_keeps_statistics_rollups_consistent(sqlite_session, async_session_adapter):
+    group = PromoGroup(name="Default", is_default=True)
+    sqlite_session.add(group)
+    sqlite_session.flush()
+    existing = User(telegram_id=1, referral_code="ref1", promo_group_id=group.id)
+    sqlite_session.add(existing)
+    sqlite_session.commit()
+
+    db = async_session_adapter(sqlite_session)
+    # Корзины заполнены по истории до синхронизации
+    await rebuild_statistics_rollups(db)
+    sqlite_session.commit()
+
+    panel = [_record(1)] + [_record(telegram_id) for telegram_id in range(100, 145)]
+    plan = build_sync_plan(panel, await load_local_snapshot(db), "all", NOW)
+    codes = iter(f"code{index}" for index in range(1000))
+    applier = UserSyncApplier(db, chunk_size=20, now=NOW, referral_code_factory=lambda: next(codes))
+    await applier.apply(plan, UserSyncReport())
+
+    incremental = _rollups(sqlite_session)
+    assert sum(count for (_, metric, _), (count, _) in incremental.items() if metric == "new_user") == 46
+    assert sum(count for (_, metric, _), (count, _) in incremental.items() if metric == "paid_subscription") == 46
+
+    await rebuild_statistics_rollups(db)
+    sqlite_session.commit()
+    assert _rollups(sqlite_session) == incremental
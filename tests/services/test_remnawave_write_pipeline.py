@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from app.external.remnawave_api import RemnaWaveAPIError
+from app.services.remnawave_write_pipeline import RemnaWaveWritePipeline
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _FakeAPI:
+    def __init__(self, *, failures=None, bulk_status=None, delay: float = 0.01) -> None:
+        self.failures = dict(failures or {})
+        self.bulk_status = bulk_status
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def _request(self, name, key):
+        self.calls.append((name, key))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            pending = self.failures.get(key)
+            if pending:
+                status, left = pending
+                if left:
+                    self.failures[key] = (status, left - 1)
+                    raise RemnaWaveAPIError(f"HTTP {status}", status)
+        finally:
+            self.in_flight -= 1
+
+    async def update_user(self, uuid, **fields):
+        await self._request("update_user", uuid)
+        return {"uuid": uuid, **fields}
+
+    async def disable_user(self, uuid):
+        await self._request("disable_user", uuid)
+        return uuid
+
+    async def bulk_update_users_squads(self, uuids, active_internal_squads):
+        await self._request("bulk_update_users_squads", tuple(uuids))
+        if self.bulk_status:
+            raise RemnaWaveAPIError("Not Found", self.bulk_status)
+        return len(uuids)
+
+    async def bulk_update_users(self, uuids, fields):
+        await self._request("bulk_update_users", tuple(uuids))
+        if self.bulk_status:
+            raise RemnaWaveAPIError("Not Found", self.bulk_status)
+        return len(uuids)
+
+
+def _pipeline(api, **kwargs) -> RemnaWaveWritePipeline:
+    options = dict(concurrency=3, rate_limit=0, bulk_size=2, max_attempts=3, retry_base_seconds=0)
+    options.update(kwargs)
+    return RemnaWaveWritePipeline(api, **options)
+
+
+@pytest.mark.anyio
+async def test_identical_changes_use_bulk_endpoints_in_chunks():
+    api = _FakeAPI()
+    pipeline = _pipeline(api)
+    for index in range(3):
+        pipeline.set_squads(index, f"u{index}", ["sq-b"])
+    pipeline.set_squads(10, "u10", ["sq-a"])
+    pipeline.disable_user(20, "u20")
+    pipeline.disable_user(21, "u21")
+    pipeline.update_user(30, "u30", hwid_device_limit=3)
+
+    report = await pipeline.run()
+
+    assert sorted(report.succeeded()) == [0, 1, 2, 10, 20, 21, 30]
+    names = [name for name, _ in api.calls]
+    assert names.count("bulk_update_users_squads") == 2
+    assert names.count("bulk_update_users") == 1
+    # Одиночная смена сквада и произвольное обновление идут обычными вызовами
+    assert ("update_user", "u10") in api.calls
+    assert report.results[30].value == {"uuid": "u30", "hwid_device_limit": 3}
+    assert report.progress.bulk_requests == 3
+    assert len(pipeline) == 0
+
+
+@pytest.mark.anyio
+async def test_transient_errors_are_retried_and_client_errors_are_not():
+    api = _FakeAPI(failures={"u1": (503, 2), "u2": (400, 5), "u3": (502, 5)})
+    pipeline = _pipeline(api)
+    for index in range(1, 5):
+        pipeline.update_user(index, f"u{index}", status=None)
+
+    report = await pipeline.run()
+
+    assert report.results[1].success and report.results[1].attempts == 3
+    assert not report.results[2].success and report.results[2].attempts == 1
+    assert not report.results[3].success and report.results[3].attempts == 3
+    assert report.results[4].success and report.results[4].attempts == 1
+    assert report.progress.retries == 4
+    assert report.as_dict()["failed"] == 2
+
+
+@pytest.mark.anyio
+async def test_missing_bulk_endpoint_falls_back_to_single_writes():
+    api = _FakeAPI(bulk_status=404)
+    pipeline = _pipeline(api, bulk_size=10)
+    for index in range(4):
+        pipeline.disable_user(index, f"u{index}")
+
+    report = await pipeline.run()
+
+    assert sorted(report.succeeded()) == [0, 1, 2, 3]
+    assert all(not result.bulk for result in report.results.values())
+    assert [name for name, _ in api.calls].count("disable_user") == 4
+    assert pipeline.use_bulk is False
+
+
+@pytest.mark.anyio
+async def test_concurrency_is_bounded_and_progress_is_reported():
+    api = _FakeAPI(delay=0.02)
+    snapshots = []
+
+    async def on_progress(progress):
+        snapshots.append((progress.done, progress.total))
+
+    pipeline = _pipeline(api, concurrency=4, progress=on_progress, progress_interval=0)
+    for index in range(20):
+        pipeline.update_user(index, f"u{index}", tag="x")
+
+    report = await pipeline.run()
+
+    assert report.progress.succeeded == 20
+    assert api.peak == 4
+    assert snapshots[-1] == (20, 20)
+    assert len(snapshots) > 2
@@ -0,0 +1,234 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.models import (
+    PaymentMethod,
+    PromoGroup,
+    StatisticsRollup,
+    Subscription,
+    SubscriptionStatus,
+    Transaction,
+    TransactionType,
+    User,
+    UserStatus,
+)
+from app.database.crud.statistics_rollup import rebuild_statistics_rollups
+from app.database.crud.transaction import create_transaction
+from app.services.statistics_service import StatisticsService
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def queries(sqlite_session):
+    counter = {"count": 0}
+
+    @event.listens_for(sqlite_session.get_bind(), "before_cursor_execute")
+    def _count(*_args, **_kwargs):
+        counter["count"] += 1
+
+    return sqlite_session, counter
+
+
+def _seed(session: Session) -> None:
+    now = datetime.utcnow()
+    group = PromoGroup(name="Default", is_default=True)
+    session.add(group)
+    session.flush()
+
+    users = [
+        User(telegram_id=1, promo_group_id=group.id, balance_kopeks=1000, has_had_paid_subscription=True),
+        User(telegram_id=2, promo_group_id=group.id, balance_kopeks=500),
+        User(
+            telegram_id=3,
+            promo_group_id=group.id,
+            status=UserStatus.BLOCKED.value,
+            created_at=now - timedelta(days=40),
+        ),
+    ]
+    session.add_all(users)
+    session.flush()
+
+    session.add_all(
+        [
+            Subscription(
+                user_id=users[0].id,
+                status=SubscriptionStatus.ACTIVE.value,
+                is_trial=False,
+                end_date=now + timedelta(days=30),
+            ),
+            Subscription(
+                user_id=users[1].id,
+                status=SubscriptionStatus.ACTIVE.value,
+                is_trial=True,
+                end_date=now + timedelta(days=3),
+            ),
+            Subscription(
+                user_id=users[2].id,
+                status=SubscriptionStatus.EXPIRED.value,
+                is_trial=False,
+                end_date=now - timedelta(days=1),
+            ),
+            Transaction(
+                user_id=users[0].id,
+                type=TransactionType.DEPOSIT.value,
+                amount_kopeks=30000,
+                payment_method="yookassa",
+                is_completed=True,
+            ),
+            Transaction(
+                user_id=users[0].id,
+                type=TransactionType.SUBSCRIPTION_PAYMENT.value,
+                amount_kopeks=20000,
+                is_completed=True,
+            ),
+        ]
+    )
+    session.commit()
+
+
+@pytest.mark.anyio
+async def test_dashboards_take_one_round_trip_each(queries, async_session_adapter, monkeypatch):
+    session, counter = queries
+    _seed(session)
+    monkeypatch.setattr(settings, "STATISTICS_CACHE_TTL_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "STATISTICS_ROLLUPS_ENABLED", False)
+    service = StatisticsService()
+    db = async_session_adapter(session)
+    now = datetime.utcnow()
+
+    dashboards = {
+        "users": lambda: service.get_users_statistics(db),
+        "subscriptions": lambda: service.get_subscriptions_statistics(db),
+        "transactions": lambda: service.get_transactions_statistics(db, now - timedelta(days=1)),
+        "overview": lambda: service.get_overview(db),
+        "report_totals": lambda: service.get_report_totals(db),
+        "period": lambda: service.get_period_statistics(db, now - timedelta(days=1), now + timedelta(minutes=1)),
+    }
+
+    results = {}
+    for name, load in dashboards.items():
+        counter["count"] = 0
+        results[name] = await load()
+        assert counter["count"] == 1, name
+
+    assert results["users"]["total_users"] == 3
+    assert results["users"]["active_users"] == 2
+    assert results["users"]["blocked_users"] == 1
+    assert results["users"]["new_month"] == 2
+
+    assert results["subscriptions"]["total_subscriptions"] == 3
+    assert results["subscriptions"]["active_subscriptions"] == 2
+    assert results["subscriptions"]["trial_subscriptions"] == 1
+    assert results["subscriptions"]["paid_subscriptions"] == 1
+
+    totals = results["transactions"]["totals"]
+    assert totals["income_kopeks"] == 30000
+    assert totals["subscription_income_kopeks"] == 20000
+    assert results["transactions"]["by_payment_method"]["yookassa"]["amount"] == 30000
+
+    assert results["overview"] == {
+        "total_users": 3,
+        "active_users": 2,
+        "blocked_users": 1,
+        "balance_kopeks": 1500,
+        "active_subscriptions": 2,
+        "expired_subscriptions": 1,
+        "open_tickets": 0,
+        "today_deposits_kopeks": 30000,
+    }
+    assert results["report_totals"] == {"active_trials": 1, "active_paid": 1, "open_tickets": 0}
+    assert results["period"]["new_trials"] == 1
+    assert results["period"]["total_payments_amount"] == 50000
+
+
+@pytest.mark.anyio
+async def test_results_are_shared_between_callers(queries, async_session_adapter, monkeypatch):
+    session, counter = queries
+    _seed(session)
+    monkeypatch.setattr(settings, "STATISTICS_CACHE_TTL_SECONDS", 60.0)
+    service = StatisticsService()
+    db = async_session_adapter(session)
+
+    counter["count"] = 0
+    results = await asyncio.gather(*(service.get_overview(db) for _ in range(5)))
+    assert counter["count"] == 1
+    assert {result["total_users"] for result in results} == {3}
+
+    # Каждый вызывающий получает собственную копию
+    results[0]["total_users"] = 0
+    assert (await service.get_overview(db))["total_users"] == 3
+    assert counter["count"] == 1
+
+    await service.get_overview(db, force_refresh=True)
+    assert counter["count"] == 2
+
+    service.invalidate()
+    await service.get_overview(db)
+    assert counter["count"] == 3
+
+
+@pytest.mark.anyio
+async def test_rollups_match_raw_statistics_and_grow_incrementally(queries, async_session_adapter, monkeypatch):
+    session, counter = queries
+    _seed(session)
+    monkeypatch.setattr(settings, "STATISTICS_CACHE_TTL_SECONDS", 0.0)
+    service = StatisticsService()
+    db = async_session_adapter(session)
+    now = datetime.utcnow()
+    month_start = now - timedelta(days=1)
+    period = (now - timedelta(days=1), now + timedelta(hours=1))
+
+    monkeypatch.setattr(settings, "STATISTICS_ROLLUPS_ENABLED", False)
+    raw_transactions = await service.get_transactions_statistics(db, month_start)
+    raw_period = await service.get_period_statistics(db, *period)
+    raw_revenue = await service.get_revenue_by_period(db, 7)
+
+    # Пустая таблица заполняется по истории один раз
+    assert await service.ensure_rollups(db) > 0
+    assert await service.ensure_rollups(db) == 0
+
+    monkeypatch.setattr(settings, "STATISTICS_ROLLUPS_ENABLED", True)
+    counter["count"] = 0
+    transactions = await service.get_transactions_statistics(db, month_start)
+    assert {key: value for key, value in transactions.items() if key != "period"} == {
+        key: value for key, value in raw_transactions.items() if key != "period"
+    }
+    assert await service.get_period_statistics(db, *period) == raw_period
+    revenue = await service.get_revenue_by_period(db, 7)
+    assert counter["count"] == 3
+    assert [row["amount_kopeks"] for row in revenue] == [row["amount_kopeks"] for row in raw_revenue]
+    assert raw_period["new_users"] == 2
+
+    # Новая завершённая транзакция сразу попадает в корзину
+    await create_transaction(
+        db,
+        user_id=1,
+        type=TransactionType.DEPOSIT,
+        amount_kopeks=5000,
+        description="topup",
+        payment_method=PaymentMethod.YOOKASSA,
+    )
+    stats = await service.get_transactions_statistics(db, month_start)
+    assert stats["by_payment_method"]["yookassa"] == {"count": 2, "amount": 35000}
+    assert stats["today"]["income_kopeks"] == 35000
+
+    # Полный пересчёт даёт те же корзины, что и инкрементальные обновления
+    before = {
+        (row.bucket_start, row.metric, row.dimension): (row.events_count, row.amount_kopeks)
+        for row in session.query(StatisticsRollup)
+    }
+    await rebuild_statistics_rollups(db)
+    after = {
+        (row.bucket_start, row.metric, row.dimension): (row.events_count, row.amount_kopeks)
+        for row in session.query(StatisticsRollup)
+    }
+    assert after == before
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database.models import PromoGroup, Subscription, SubscriptionStatus, User
+from app.handlers.admin.messages import (
+    _with_subscription,
+    build_broadcast_condition,
+    iter_broadcast_recipients,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _populate(session: Session) -> None:
+    now = datetime.utcnow()
+    group = PromoGroup(name="Default", is_default=True)
+    session.add(group)
+
+    def add_user(telegram_id: int, subscription=None, **kwargs) -> User:
+        user = User(
+            telegram_id=telegram_id,
+            referral_code=f"ref{telegram_id}",
+            promo_group=group,
+            **kwargs,
+        )
+        if subscription is not None:
+            user.subscription = subscription
+        session.add(user)
+        return user
+
+    add_user(1, Subscription(status=SubscriptionStatus.ACTIVE.value, is_trial=False, end_date=now + timedelta(days=30), traffic_used_gb=5))
+    add_user(2, Subscription(status=SubscriptionStatus.ACTIVE.value, is_trial=False, end_date=now + timedelta(days=30), traffic_used_gb=0))
+    add_user(3, Subscription(status=SubscriptionStatus.ACTIVE.value, is_trial=True, end_date=now + timedelta(days=2), traffic_used_gb=0))
+    add_user(4, Subscription(status=SubscriptionStatus.EXPIRED.value, is_trial=False, end_date=now - timedelta(days=1)))
+    add_user(5)
+    add_user(6, has_had_paid_subscription=True)
+    add_user(7, status="blocked")
+    add_user(
+        8,
+        broadcast_unreachable_at=now,
+        last_activity=now - timedelta(days=1),
+    )
+    session.commit()
+
+
+def _telegram_ids(session: Session, target: str, **kwargs) -> list[int]:
+    condition = build_broadcast_condition(target, **kwargs)
+    rows = session.execute(
+        _with_subscription(select(User.telegram_id)).where(condition).order_by(User.id)
+    )
+    return [row[0] for row in rows]
+
+
+@pytest.mark.parametrize(
+    ("target", "expected"),
+    [
+        ("all", [1, 2, 3, 4, 5, 6]),
+        ("active", [1, 2]),
+        ("trial", [3]),
+        ("no", [4, 5, 6]),
+        ("expiring", [3]),
+        ("expired", [4, 6]),
+        ("active_zero", [2]),
+        ("trial_zero", [3]),
+        ("zero", [2, 3]),
+        ("custom_direct", [1, 2, 3, 4, 5, 6]),
+    ],
+)
+def test_targets_compile_to_sql(sqlite_session, target, expected):
+    _populate(sqlite_session)
+    assert _telegram_ids(sqlite_session, target) == expected
+
+
+def test_unreachable_users_are_skipped_until_active_again(sqlite_session):
+    _populate(sqlite_session)
+    assert 8 in _telegram_ids(sqlite_session, "all", reachable_only=False)
+    assert 8 not in _telegram_ids(sqlite_session, "all")
+
+    user = sqlite_session.execute(select(User).where(User.telegram_id == 8)).scalar_one()
+    user.last_activity = datetime.utcnow() + timedelta(seconds=1)
+    sqlite_session.commit()
+    assert 8 in _telegram_ids(sqlite_session, "all")
+
+
+def test_unknown_target_has_no_condition():
+    assert build_broadcast_condition("unknown") is None
+
+
+@pytest.mark.anyio
+async def test_recipients_are_streamed_by_keyset_pages(sqlite_session, async_session_adapter):
+    _populate(sqlite_session)
+    factory = async_session_adapter(sqlite_session)
+
+    recipients = [
+        telegram_id
+        async for _, telegram_id in iter_broadcast_recipients(factory, "all", batch_size=4)
+    ]
+    assert recipients == [1, 2, 3, 4, 5, 6]
+    assert factory.statements == 2
+
+    resumed = [
+        telegram_id
+        async for _, telegram_id in iter_broadcast_recipients(factory, "all", after_user_id=4, batch_size=4)
+    ]
+    assert resumed == [5, 6]
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.util import greenlet_spawn
+
+from app.config import settings
+from app.database.pool_metrics import InstrumentedAsyncAdaptedQueuePool, PoolMetrics
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _build_pool(metrics: PoolMetrics) -> InstrumentedAsyncAdaptedQueuePool:
+    pool = InstrumentedAsyncAdaptedQueuePool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        pool_size=1,
+        max_overflow=1,
+        timeout=0.05,
+    )
+    pool.metrics = metrics
+    return pool
+
+
+def test_pool_metrics_snapshot_without_samples():
+    metrics = PoolMetrics("bot")
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["role"] == "bot"
+    assert snapshot["checkouts"] == 0
+    assert snapshot["avg_checkout_ms"] == 0.0
+    assert snapshot["p95_checkout_ms"] == 0.0
+
+
+def test_pool_metrics_percentiles():
+    metrics = PoolMetrics("web_api")
+    for value in range(1, 101):
+        metrics.record_checkout(value / 1000, waited=value > 90)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["checkouts"] == 100
+    assert snapshot["waits"] == 10
+    assert snapshot["max_checkout_ms"] == 100.0
+    assert snapshot["p95_checkout_ms"] == 95.0
+    assert snapshot["avg_checkout_ms"] == pytest.approx(50.5)
+
+
+@pytest.mark.anyio
+async def test_instrumented_pool_tracks_saturation_and_timeouts():
+    metrics = PoolMetrics("background")
+    pool = _build_pool(metrics)
+
+    first = await greenlet_spawn(pool.connect)
+    second = await greenlet_spawn(pool.connect)
+
+    snapshot = metrics.snapshot(pool)
+    assert snapshot["checkouts"] == 2
+    assert snapshot["checked_out"] == 2
+    assert snapshot["capacity"] == 2
+    assert snapshot["saturation"] == 1.0
+
+    with pytest.raises(exc.TimeoutError):
+        await greenlet_spawn(pool.connect)
+
+    assert metrics.timeouts == 1
+    assert metrics.waits == 1
+
+    first.close()
+    second.close()
+    assert metrics.snapshot(pool)["checked_out"] == 0
+
+    recreated = pool.recreate()
+    assert recreated.metrics is metrics
+    pool.dispose()
+
+
+def test_database_pool_options_per_role(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_POOL_SIZE", 12)
+    monkeypatch.setattr(settings, "DATABASE_WEB_API_POOL_SIZE", 4)
+    monkeypatch.setattr(settings, "DATABASE_BACKGROUND_POOL_SIZE", 0)
+
+    assert settings.get_database_pool_options("bot")["pool_size"] == 12
+    assert settings.get_database_pool_options("web_api")["pool_size"] == 4
+    assert settings.get_database_pool_options("background")["pool_size"] == 1
+
+
+@pytest.mark.parametrize(
+    "raw_mode, expected",
+    [("queue", "queue"), ("NULL", "null"), ("unknown", "null"), ("auto", "queue")],
+)
+def test_database_pool_mode(monkeypatch, raw_mode, expected):
+    monkeypatch.setattr(settings, "DATABASE_POOL_MODE", raw_mode)
+
+    assert settings.get_database_pool_mode() == expected
@@ -0,0 +1,75 @@
+import pytest
+
+import app.localization.texts as texts_module
+from app.config import refresh_period_prices, settings
+from app.keyboards.inline import get_subscription_period_keyboard
+from app.localization.loader import DEFAULT_LANGUAGE, clear_locale_cache, load_locale
+from app.localization.texts import get_texts, reload_locales
+from app.services.system_settings_service import BotConfigurationService
+
+
+@pytest.fixture(autouse=True)
+def _fresh_texts():
+    texts_module.clear_texts_cache()
+    yield
+    texts_module.clear_texts_cache()
+
+
+def test_bundle_is_built_once_per_language(monkeypatch):
+    calls = []
+    original = texts_module.load_locale
+
+    def counting_load_locale(language):
+        calls.append(language)
+        return original(language)
+
+    monkeypatch.setattr(texts_module, "load_locale", counting_load_locale)
+
+    first = get_texts("en")
+    for _ in range(50):
+        assert get_texts("en") is first
+        get_subscription_period_keyboard("en")
+
+    assert len(calls) == 2  # язык и запасной язык, один раз
+    assert get_texts("ru") is not first
+
+
+def test_bundle_resolves_fallback_and_is_read_only():
+    english = load_locale("en")
+    missing = next((key for key in load_locale(DEFAULT_LANGUAGE) if key not in english), None)
+    texts = get_texts("en")
+
+    if missing is not None:
+        assert texts[missing] == load_locale(DEFAULT_LANGUAGE)[missing]
+    assert texts.PERIOD_30_DAYS.endswith(settings.format_price(settings.PRICE_30_DAYS))
+    assert texts.get("NO_SUCH_KEY", "default") == "default"
+
+    with pytest.raises(AttributeError):
+        texts.language = "ru"
+    with pytest.raises(TypeError):
+        texts._values["PERIOD_30_DAYS"] = "changed"
+
+
+def test_bundles_are_rebuilt_after_locale_reload():
+    texts = get_texts("ru")
+
+    reload_locales()
+    reloaded = get_texts("ru")
+    assert reloaded is not texts
+
+    clear_locale_cache()
+    assert get_texts("ru") is not reloaded
+
+
+def test_bundles_follow_price_changes(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_30_DAYS", settings.PRICE_30_DAYS)
+    before = get_texts("ru")
+
+    BotConfigurationService._apply_to_settings("PRICE_30_DAYS", 12345)
+    try:
+        after = get_texts("ru")
+        assert after is not before
+        assert after.PERIOD_30_DAYS.endswith(settings.format_price(12345))
+    finally:
+        monkeypatch.undo()
+        refresh_period_prices()
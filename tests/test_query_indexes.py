@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.database.crud import notification as notification_crud
+from app.database.crud import subscription as subscription_crud
+from app.database.crud import transaction as transaction_crud
+from app.database.models import Base, PaymentMethod
+from app.database.universal_migration import QUERY_INDEXES
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def explain_session(sqlite_session):
+    captured = []
+
+    @event.listens_for(sqlite_session.get_bind(), "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        if not statement.startswith("EXPLAIN"):
+            captured.append((statement, parameters))
+
+    return sqlite_session, captured
+
+
+NOW = datetime(2026, 1, 1)
+
+HOT_QUERIES = {
+    "transactions_statistics": lambda db: transaction_crud.get_transactions_statistics(
+        db, NOW - timedelta(days=30), NOW
+    ),
+    "revenue_by_period": lambda db: transaction_crud.get_revenue_by_period(db, 30),
+    "transaction_by_external_id": lambda db: transaction_crud.get_transaction_by_external_id(
+        db, "donation_1", PaymentMethod.TRIBUTE
+    ),
+    "user_transactions": lambda db: transaction_crud.get_user_transactions(db, 1),
+    "expiring_subscriptions": lambda db: subscription_crud.get_expiring_subscriptions(db, 3),
+    "expired_subscriptions": lambda db: subscription_crud.get_expired_subscriptions(db),
+    "autopay_subscriptions": lambda db: subscription_crud.get_subscriptions_for_autopay(db),
+    "sent_notification_keys": lambda db: notification_crud.get_sent_notification_keys(db, [1, 2], ["expiring"]),
+    "notification_sent": lambda db: notification_crud.notification_sent(db, 1, 1, "expiring", 1),
+}
+
+
+def test_query_indexes_are_declared_on_models():
+    for table_name, index_name in QUERY_INDEXES:
+        assert index_name in {index.name for index in Base.metadata.tables[table_name].indexes}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_plan_uses_index(explain_session, async_session_adapter, name):
+    session, captured = explain_session
+    await HOT_QUERIES[name](async_session_adapter(session))
+
+    index_names = {index_name for _, index_name in QUERY_INDEXES}
+    assert captured
+    for statement, parameters in captured:
+        plan = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        details = [row[-1] for row in plan]
+        assert any(
+            index_name in detail for detail in details for index_name in index_names
+        ), f"{name}: {statement}\n{details}"
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database.crud.server_squad import count_active_users_for_squad, sync_server_user_counts
+from app.database.crud.subscription import add_subscription_squad, remove_subscription_squad
+from app.database.crud.subscription_squad import rebuild_subscription_squads
+from app.database.models import (
+    PromoGroup,
+    ServerSquad,
+    Subscription,
+    SubscriptionSquad,
+    SubscriptionStatus,
+    User,
+)
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _memberships(session: Session) -> set:
+    return set(session.execute(select(SubscriptionSquad.subscription_id, SubscriptionSquad.squad_uuid)).all())
+
+
+def _add_subscription(session: Session, index: int, squads, status=SubscriptionStatus.ACTIVE.value) -> Subscription:
+    group = session.execute(select(PromoGroup)).scalars().first() or PromoGroup(name="Default", is_default=True)
+    user = User(telegram_id=index, referral_code=f"ref{index}", promo_group=group)
+    subscription = Subscription(
+        status=status,
+        end_date=datetime.utcnow() + timedelta(days=10),
+        connected_squads=squads,
+    )
+    user.subscription = subscription
+    session.add(user)
+    session.commit()
+    return subscription
+
+
+@pytest.mark.anyio
+async def test_membership_follows_orm_changes(sqlite_session, async_session_adapter):
+    subscription = _add_subscription(sqlite_session, 1, ["a", "b"])
+    assert _memberships(sqlite_session) == {(subscription.id, "a"), (subscription.id, "b")}
+
+    db = async_session_adapter(sqlite_session)
+    await add_subscription_squad(db, subscription, "c")
+    await remove_subscription_squad(db, subscription, "a")
+    assert _memberships(sqlite_session) == {(subscription.id, "b"), (subscription.id, "c")}
+
+    subscription.end_date = datetime.utcnow() + timedelta(days=20)
+    sqlite_session.commit()
+    assert len(_memberships(sqlite_session)) == 2
+
+    sqlite_session.delete(subscription)
+    sqlite_session.commit()
+    assert _memberships(sqlite_session) == set()
+
+
+@pytest.mark.anyio
+async def test_server_counts_come_from_single_group_by(sqlite_session, async_session_adapter):
+    sqlite_session.add_all(
+        [
+            ServerSquad(squad_uuid="a", display_name="A", current_users=99),
+            ServerSquad(squad_uuid="b", display_name="B", current_users=99),
+            ServerSquad(squad_uuid="c", display_name="C", current_users=99),
+        ]
+    )
+    for index in range(1, 6):
+        _add_subscription(sqlite_session, index, ["a", "b"] if index % 2 else ["a"])
+    _add_subscription(sqlite_session, 10, ["c"], status=SubscriptionStatus.EXPIRED.value)
+
+    db = async_session_adapter(sqlite_session)
+    assert await sync_server_user_counts(db) == 3
+    # Список серверов, GROUP BY по членству и одно пакетное обновление
+    assert db.statements == 3
+
+    counts = dict(sqlite_session.execute(select(ServerSquad.squad_uuid, ServerSquad.current_users)).all())
+    assert counts == {"a": 5, "b": 3, "c": 0}
+    assert await count_active_users_for_squad(db, "b") == 3
+
+
+@pytest.mark.anyio
+async def test_rebuild_backfills_from_connected_squads(sqlite_session, async_session_adapter):
+    first = _add_subscription(sqlite_session, 1, ["a"])
+    second = _add_subscription(sqlite_session, 2, ["b", "c", "b"])
+    sqlite_session.execute(SubscriptionSquad.__table__.delete())
+    sqlite_session.commit()
+
+    assert await rebuild_subscription_squads(async_session_adapter(sqlite_session)) == 3
+    assert _memberships(sqlite_session) == {(first.id, "a"), (second.id, "b"), (second.id, "c")}
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.database.crud.user import add_user_balance, credit_user_balance, subtract_user_balance
+from app.database.models import Base, PaymentMethod, PromoGroup, Transaction, TransactionType, User
+
+TOP_UPS = 150
+CHARGES = 150
+TOP_UP_KOPEKS = 100
+CHARGE_KOPEKS = 150
+INITIAL_KOPEKS = 1000
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # Файл, а не :memory: — у каждой сессии своё соединение и своя транзакция
+    engine = create_engine(f"sqlite:///{tmp_path / 'ledger.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        group = PromoGroup(name="Default", is_default=True)
+        session.add(group)
+        session.flush()
+        session.add(User(id=1, telegram_id=100, promo_group_id=group.id, balance_kopeks=INITIAL_KOPEKS))
+        session.commit()
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+async def _run_parallel_operations(open_session):
+    total = TOP_UPS + CHARGES
+    loaded = []
+    everyone_loaded = asyncio.Event()
+
+    async def load(db):
+        user = (await db.execute(select(User).where(User.id == 1))).scalar_one()
+        await db.commit()
+        # Все операции стартуют с одного снимка: баланс в памяти у всех устаревший
+        loaded.append(user)
+        if len(loaded) == total:
+            everyone_loaded.set()
+        await everyone_loaded.wait()
+        return user
+
+    async def top_up():
+        db = open_session()
+        try:
+            user = await load(db)
+            return await add_user_balance(db, user, TOP_UP_KOPEKS, "Пополнение")
+        finally:
+            await db.close()
+
+    async def charge():
+        db = open_session()
+        try:
+            user = await load(db)
+            return await subtract_user_balance(db, user, CHARGE_KOPEKS, "Списание", create_transaction=True)
+        finally:
+            await db.close()
+
+    operations = [top_up() for _ in range(TOP_UPS)] + [charge() for _ in range(CHARGES)]
+    results = await asyncio.gather(*operations)
+    return results[:TOP_UPS], results[TOP_UPS:]
+
+
+def _assert_ledger(balance, deposits, withdrawals, top_ups, charges):
+    assert all(top_ups)
+    succeeded = sum(charges)
+    assert 0 < succeeded < CHARGES
+    assert balance == INITIAL_KOPEKS + TOP_UPS * TOP_UP_KOPEKS - succeeded * CHARGE_KOPEKS
+    assert balance >= 0
+    assert deposits == TOP_UPS
+    assert withdrawals == succeeded
+
+
+async def _ledger_totals(db):
+    balance = await db.scalar(select(User.balance_kopeks).where(User.id == 1))
+    counts = dict(
+        (await db.execute(select(Transaction.type, func.count()).group_by(Transaction.type))).all()
+    )
+    return (
+        balance,
+        counts.get(TransactionType.DEPOSIT.value, 0),
+        counts.get(TransactionType.WITHDRAWAL.value, 0),
+    )
+
+
+@pytest.mark.anyio
+async def test_parallel_balance_changes_do_not_lose_updates_sqlite(engine, async_session_adapter):
+    top_ups, charges = await _run_parallel_operations(
+        lambda: async_session_adapter(Session(engine, expire_on_commit=False))
+    )
+
+    with Session(engine) as session:
+        totals = await _ledger_totals(async_session_adapter(session))
+    _assert_ledger(*totals, top_ups, charges)
+
+
+@pytest.mark.anyio
+async def test_balance_change_is_one_update_without_reload(engine, async_session_adapter):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    session = Session(engine, expire_on_commit=False)
+    db = async_session_adapter(session)
+    user = session.get(User, 1)
+
+    # Баланс в памяти устарел: решение о списании принимает сама БД
+    set_committed_value(user, "balance_kopeks", 10**9)
+
+    statements.clear()
+    assert not await subtract_user_balance(db, user, INITIAL_KOPEKS + 1, "Списание")
+    assert await add_user_balance(db, user, 500, "Пополнение", create_transaction=False)
+
+    updates = [statement for statement in statements if statement.startswith("UPDATE users")]
+    assert len(updates) == 2
+    assert all("RETURNING" in statement for statement in updates)
+    assert not any(statement.startswith("SELECT users") for statement in statements)
+    assert user.balance_kopeks == INITIAL_KOPEKS + 500
+
+
+@pytest.mark.anyio
+async def test_provider_credits_commit_balance_with_transaction(engine, async_session_adapter):
+    credits = 40
+    loaded = []
+    everyone_loaded = asyncio.Event()
+
+    async def credit(index):
+        db = async_session_adapter(Session(engine, expire_on_commit=False))
+        try:
+            user = (await db.execute(select(User).where(User.id == 1))).scalar_one()
+            await db.commit()
+            loaded.append(user)
+            if len(loaded) == credits:
+                everyone_loaded.set()
+            await everyone_loaded.wait()
+            return await credit_user_balance(
+                db,
+                user,
+                TOP_UP_KOPEKS,
+                "Пополнение через YooKassa",
+                payment_method=PaymentMethod.YOOKASSA,
+                external_id=f"yk_{index}",
+            )
+        finally:
+            await db.close()
+
+    transactions = await asyncio.gather(*(credit(index) for index in range(credits)))
+    assert all(transactions)
+
+    with Session(engine) as session:
+        balance, deposits, _ = await _ledger_totals(async_session_adapter(session))
+        external_ids = set(session.scalars(select(Transaction.external_id)))
+    assert balance == INITIAL_KOPEKS + credits * TOP_UP_KOPEKS
+    assert deposits == credits
+    assert external_ids == {f"yk_{index}" for index in range(credits)}
+
+    missing = async_session_adapter(Session(engine, expire_on_commit=False))
+    assert await credit_user_balance(missing, User(id=999, telegram_id=999), 100, "Пополнение") is None
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL не задан")
+async def test_parallel_balance_changes_do_not_lose_updates_postgresql():
+    # conftest подменяет asyncpg заглушкой — для этого теста нужен настоящий драйвер
+    if not hasattr(sys.modules.get("asyncpg"), "connect"):
+        sys.modules.pop("asyncpg", None)
+    pytest.importorskip("asyncpg")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    engine = create_async_engine(os.environ["TEST_POSTGRES_URL"], pool_size=20, max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    try:
+        async with sessions() as db:
+            group = PromoGroup(name="Default", is_default=True)
+            db.add(group)
+            await db.flush()
+            db.add(User(id=1, telegram_id=100, promo_group_id=group.id, balance_kopeks=INITIAL_KOPEKS))
+            await db.commit()
+
+        top_ups, charges = await _run_parallel_operations(sessions)
+
+        async with sessions() as db:
+            totals = await _ledger_totals(db)
+        _assert_ledger(*totals, top_ups, charges)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
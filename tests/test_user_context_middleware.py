@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from aiogram.types import Chat, Message, User as TgUser
+
+from app.database.models import SubscriptionStatus, UserStatus
+from app.database.query_counter import (
+    _before_cursor_execute,
+    start_query_counter,
+    stop_query_counter,
+)
+from app.middlewares.auth import AuthMiddleware
+from app.middlewares.subscription_checker import SubscriptionStatusMiddleware
+from app.middlewares.user_context import UserContextMiddleware
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _DummySession:
+    def __init__(self) -> None:
+        self.commit = AsyncMock()
+        self.rollback = AsyncMock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def _build_message(telegram_id: int = 42) -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.utcnow(),
+        chat=Chat(id=telegram_id, type="private"),
+        from_user=TgUser(id=telegram_id, is_bot=False, first_name="Test", username="tester"),
+        text="/menu",
+    )
+
+
+def _build_db_user(telegram_id: int = 42):
+    subscription = SimpleNamespace(
+        status=SubscriptionStatus.ACTIVE.value,
+        end_date=datetime.utcnow() - timedelta(minutes=1),
+        updated_at=None,
+    )
+    return SimpleNamespace(
+        id=1,
+        telegram_id=telegram_id,
+        status=UserStatus.ACTIVE.value,
+        username="tester",
+        first_name="Test",
+        last_name=None,
+        full_name="Test",
+        remnawave_uuid=None,
+        last_activity=None,
+        updated_at=None,
+        subscription=subscription,
+        promo_group=None,
+    )
+
+
+@pytest.mark.anyio
+async def test_middlewares_share_single_user_load(monkeypatch):
+    session = _DummySession()
+    db_user = _build_db_user()
+    loader = AsyncMock(return_value=db_user)
+
+    monkeypatch.setattr("app.middlewares.user_context.AsyncSessionLocal", lambda: session)
+    monkeypatch.setattr("app.middlewares.user_context.get_user_by_telegram_id", loader)
+
+    def _fail_get_db():
+        raise AssertionError("middleware must reuse the user context session")
+
+    monkeypatch.setattr("app.middlewares.auth.get_db", _fail_get_db)
+    monkeypatch.setattr("app.middlewares.subscription_checker.get_db", _fail_get_db)
+
+    received = {}
+
+    async def final_handler(event, data):
+        received.update(data)
+        return "handled"
+
+    auth = AuthMiddleware()
+    subscription_checker = SubscriptionStatusMiddleware()
+
+    async def after_auth(event, data):
+        return await subscription_checker(final_handler, event, data)
+
+    async def after_context(event, data):
+        return await auth(after_auth, event, data)
+
+    result = await UserContextMiddleware()(after_context, _build_message(), {})
+
+    assert result == "handled"
+    loader.assert_awaited_once()
+    assert received["db"] is session
+    assert received["db_user"] is db_user
+    assert received["user_context"].subscription is db_user.subscription
+    assert db_user.subscription.status == SubscriptionStatus.EXPIRED.value
+
+
+def test_query_counter_counts_only_inside_update():
+    _before_cursor_execute(None, None, "SELECT 1", None, None, False)
+
+    counter, token = start_query_counter()
+    try:
+        for _ in range(3):
+            _before_cursor_execute(None, None, "SELECT 1", None, None, False)
+    finally:
+        stop_query_counter(token)
+
+    _before_cursor_execute(None, None, "SELECT 1", None, None, False)
+
+    assert counter.queries == 3
@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.crud.user import get_user_by_telegram_id
+from app.database.models import PromoGroup, Subscription, User
+from app.database.user_cache import (
+    _INVALIDATION_KEY,
+    _LocalLRU,
+    build_user_snapshot,
+    restore_user_snapshot,
+    user_snapshot_cache,
+)
+from app.utils.user_utils import format_referrer_info
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+def _create_user(session: Session) -> User:
+    promo_group = PromoGroup(name="Default", is_default=True)
+    user = User(
+        telegram_id=777,
+        username="tester",
+        first_name="Test",
+        referral_code="refTEST",
+        balance_kopeks=1500,
+        promo_group=promo_group,
+    )
+    user.subscription = Subscription(
+        end_date=datetime(2030, 1, 1, 12, 30),
+        connected_squads=["squad-a"],
+    )
+    session.add(user)
+    session.commit()
+    return user
+
+
+def test_snapshot_round_trip_restores_user_without_queries(sqlite_session):
+    user = _create_user(sqlite_session)
+    snapshot = build_user_snapshot(user)
+
+    other_session = Session(sqlite_session.get_bind())
+    try:
+        restored = restore_user_snapshot(other_session, snapshot)
+
+        assert restored is not None
+        assert restored.telegram_id == 777
+        assert restored.balance_kopeks == 1500
+        assert restored.subscription.end_date == datetime(2030, 1, 1, 12, 30)
+        assert restored.subscription.connected_squads == ["squad-a"]
+        assert restored.promo_group.name == "Default"
+        assert restored in other_session
+        assert not other_session.dirty
+
+        restored.balance_kopeks += 100
+        other_session.commit()
+    finally:
+        other_session.close()
+
+    sqlite_session.expire_all()
+    assert sqlite_session.get(User, user.id).balance_kopeks == 1600
+
+
+def test_last_activity_change_does_not_schedule_invalidation(sqlite_session, monkeypatch):
+    monkeypatch.setattr(settings, "USER_CACHE_ENABLED", True)
+    user = _create_user(sqlite_session)
+
+    user.last_activity = datetime.utcnow()
+    sqlite_session.flush()
+    assert _INVALIDATION_KEY not in sqlite_session.info
+
+    user.balance_kopeks = 0
+    sqlite_session.flush()
+    assert sqlite_session.info[_INVALIDATION_KEY][1] == {777}
+    sqlite_session.rollback()
+
+
+@pytest.mark.anyio
+async def test_uncommitted_changes_are_not_cached(sqlite_session, async_session_adapter, monkeypatch):
+    monkeypatch.setattr(settings, "USER_CACHE_ENABLED", True)
+    monkeypatch.setattr(user_snapshot_cache, "_local", _LocalLRU(max_size=16))
+    user = _create_user(sqlite_session)
+    db = async_session_adapter(sqlite_session)
+    snapshot_key = user_snapshot_cache._snapshot_key(777)
+
+    user.balance_kopeks = 9900
+    sqlite_session.flush()
+    assert (await get_user_by_telegram_id(db, 777)).balance_kopeks == 9900
+    # Транзакция ещё может откатиться — снимок с 9900 в кеш не попадает
+    assert user_snapshot_cache._local.get(snapshot_key) is None
+
+    sqlite_session.rollback()
+    assert (await get_user_by_telegram_id(db, 777)).balance_kopeks == 1500
+    assert user_snapshot_cache._local.get(snapshot_key)["user"]["balance_kopeks"] == 1500
+
+
+@pytest.mark.anyio
+async def test_cached_user_keeps_referrer_loaded(sqlite_session, async_session_adapter, monkeypatch):
+    monkeypatch.setattr(settings, "USER_CACHE_ENABLED", True)
+    monkeypatch.setattr(user_snapshot_cache, "_local", _LocalLRU(max_size=16))
+    user = _create_user(sqlite_session)
+    referral = User(
+        telegram_id=778,
+        referral_code="refREFERRAL",
+        referred_by_id=user.id,
+        promo_group_id=user.promo_group_id,
+    )
+    sqlite_session.add(referral)
+    sqlite_session.commit()
+
+    for telegram_id in (777, 778):
+        await get_user_by_telegram_id(async_session_adapter(sqlite_session), telegram_id)
+
+    other_session = Session(sqlite_session.get_bind())
+    queries = []
+    event.listen(other_session.get_bind(), "before_cursor_execute", lambda *args: queries.append(args[2]))
+    try:
+        hits = user_snapshot_cache.hits
+        restored_user = await get_user_by_telegram_id(async_session_adapter(other_session), 777)
+        restored_referral = await get_user_by_telegram_id(async_session_adapter(other_session), 778)
+
+        assert user_snapshot_cache.hits == hits + 2
+        # В AsyncSession ленивая загрузка реферера упала бы с MissingGreenlet
+        assert [item.telegram_id for item in restored_user.referrer] == [778]
+        assert restored_referral.referrer == []
+        assert format_referrer_info(restored_referral).startswith(f"ID {user.id}")
+        assert queries == []
+    finally:
+        other_session.close()
+
+
+def test_local_lru_evicts_oldest_entries():
+    lru = _LocalLRU(max_size=2)
+    lru.set("a", 1, ttl=10)
+    lru.set("b", 2, ttl=10)
+    lru.get("a")
+    lru.set("c", 3, ttl=10)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
@@ -0,0 +1,193 @@
+import fnmatch
+
+import pytest
+
+from app.utils.cache import CacheService
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _FakePipeline:
+    def __init__(self, client: "_FakeRedis") -> None:
+        self._client = client
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        self._client.round_trips += 1
+        results = []
+        for name, args, kwargs in self._commands:
+            results.append(await getattr(self._client, name)(*args, _pipelined=True, **kwargs))
+        return results
+
+
+class _FakeRedis:
+    """Минимальный клиент Redis в памяти, считающий сетевые обращения."""
+
+    def __init__(self) -> None:
+        self.data = {}
+        self.sets = {}
+        self.ttl = {}
+        self.round_trips = 0
+        self.unlink_calls = []
+
+    def __getattr__(self, name):
+        # Скрипты (EVALSHA, SCRIPT EXISTS/LOAD) добавляли бы обращения к серверу
+        # и не работают с членами индекса в Redis Cluster
+        raise AssertionError(f"Неожиданная команда Redis: {name}")
+
+    def _call(self, pipelined: bool) -> None:
+        if not pipelined:
+            self.round_trips += 1
+
+    async def keys(self, pattern):
+        raise AssertionError("KEYS не должен использоваться")
+
+    async def scan_iter(self, match=None, count=None):
+        snapshot = sorted(self.data)
+        for start in range(0, len(snapshot), count):
+            self.round_trips += 1
+            for key in snapshot[start:start + count]:
+                if fnmatch.fnmatchcase(key, match):
+                    yield key.encode()
+
+    async def sscan_iter(self, name, count=None):
+        self.round_trips += 1
+        for member in sorted(self.sets.get(name, ())):
+            yield member.encode()
+
+    async def unlink(self, *keys, _pipelined=False):
+        self._call(_pipelined)
+        self.unlink_calls.append(len(keys))
+        removed = 0
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            self.ttl.pop(key, None)
+            removed += int(self.data.pop(key, None) is not None or self.sets.pop(key, None) is not None)
+        return removed
+
+    async def set(self, key, value, ex=None, _pipelined=False):
+        self._call(_pipelined)
+        self.data[key] = value.encode()
+        self.ttl[key] = ex
+        return True
+
+    async def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(key) for key in keys]
+
+    async def sadd(self, name, *members, _pipelined=False):
+        self._call(_pipelined)
+        self.sets.setdefault(name, set()).update(members)
+        return len(members)
+
+    async def expire(self, name, seconds, nx=False, gt=False, _pipelined=False):
+        self._call(_pipelined)
+        if name not in self.data and name not in self.sets:
+            return False
+        current = self.ttl.get(name)
+        # Как в Redis: ключ без TTL для GT считается бессрочным
+        if (nx and current is not None) or (gt and (current is None or current >= seconds)):
+            return False
+        self.ttl[name] = seconds
+        return True
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+def _service(batch_size: int = 3) -> CacheService:
+    service = CacheService()
+    service.redis_client = _FakeRedis()
+    service._connected = True
+    service.SCAN_BATCH_SIZE = batch_size
+    return service
+
+
+@pytest.mark.anyio
+async def test_delete_pattern_scans_and_unlinks_in_batches():
+    service = _service()
+    client = service.redis_client
+    for index in range(7):
+        client.data[f"available_countries:{index}"] = b"[]"
+    client.data["fsm:state"] = b"{}"
+
+    assert await service.delete_pattern("available_countries*") == 7
+    assert client.unlink_calls == [3, 3, 1]
+    assert list(client.data) == ["fsm:state"]
+    assert await service.get_keys("*") == ["fsm:state"]
+
+
+@pytest.mark.anyio
+async def test_get_many_and_set_many_use_single_round_trip():
+    service = _service()
+    client = service.redis_client
+
+    assert await service.set_many({"a": 1, "b": {"x": 2}}, expire=60)
+    assert client.round_trips == 1
+    assert client.ttl["a"] == 60
+
+    assert await service.get_many(["a", "missing", "b"]) == {"a": 1, "b": {"x": 2}}
+    assert client.round_trips == 2
+
+
+@pytest.mark.anyio
+async def test_invalidate_tag_removes_only_tagged_keys():
+    service = _service(batch_size=10)
+    client = service.redis_client
+
+    assert await service.set("available_countries:all", [1], 300, tags=["countries"])
+    # Ключ и индекс тега пишутся одним конвейером, без SCRIPT EXISTS/EVALSHA
+    assert client.round_trips == 1
+    assert await service.set_many({"available_countries:1": [], "available_countries:2": []}, 60, tags=["countries"])
+    assert await service.set("available_countries:forever", [], tags=["countries"])
+    assert await service.set("other", 1)
+    assert client.ttl["cache_tag:countries"] == CacheService.TAG_MIN_TTL_SECONDS
+
+    client.round_trips = 0
+    assert await service.invalidate_tag("countries") == 4
+    assert list(client.data) == ["other"]
+    assert not client.sets
+    # Без обхода пространства ключей: чтение двух индексов, удаление членов и индексов
+    assert client.round_trips == 4
+
+
+@pytest.mark.anyio
+async def test_tag_index_ttl_only_grows_and_persistent_keys_keep_index():
+    service = _service()
+    client = service.redis_client
+    tag_key = "cache_tag:countries"
+    persistent_key = "cache_tag:countries:persistent"
+
+    assert await service.set("long", 1, 7200, tags=["countries"])
+    assert await service.set("short", 1, 60, tags=["countries"])
+    # Короткий TTL нового ключа не сокращает индекс, в котором есть более долгие ключи
+    assert client.ttl[tag_key] == 7200
+
+    assert await service.set("forever", 1, tags=["countries"])
+    assert await service.set_many({"short:2": 1}, 60, tags=["countries"])
+    # Индекс бессрочных ключей не получает TTL от последующих записей
+    assert client.ttl.get(persistent_key) is None
+    assert client.ttl[tag_key] == 7200
+    assert client.sets[tag_key] == {"long", "short", "short:2"}
+    assert client.sets[persistent_key] == {"forever"}
+
+    # Истёкшие члены индекса не мешают инвалидации и удаляются вместе с ним
+    del client.data["short"]
+    assert await service.invalidate_tag("countries") == 3
+    assert not client.sets
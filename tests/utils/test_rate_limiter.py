@@ -0,0 +1,126 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from aiogram.types import CallbackQuery, User as TgUser
+
+from app.config import settings
+from app.middlewares.throttling import ThrottlingMiddleware
+from app.utils.rate_limiter import InMemoryRateLimiter, RateLimitRule, ThrottlingPolicy
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.anyio
+async def test_token_bucket_allows_burst_and_refills():
+    clock = _Clock()
+    limiter = InMemoryRateLimiter(clock=clock)
+    rule = RateLimitRule(rate=2.0, burst=2)
+
+    assert (await limiter.hit("user:1", rule)).allowed
+    assert (await limiter.hit("user:1", rule)).allowed
+    blocked = await limiter.hit("user:1", rule)
+    assert not blocked.allowed
+    assert blocked.retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert (await limiter.hit("user:1", rule)).allowed
+
+
+@pytest.mark.anyio
+async def test_idle_buckets_are_evicted():
+    clock = _Clock()
+    limiter = InMemoryRateLimiter(clock=clock)
+    rule = RateLimitRule(rate=1.0, burst=1)
+
+    for user_id in range(100):
+        await limiter.hit(f"user:{user_id}", rule)
+    assert len(limiter) == 100
+
+    clock.now += 5
+    await limiter.hit("user:new", rule)
+    assert len(limiter) == 1
+
+
+def test_policy_prefers_longest_route_prefix():
+    default_callback = RateLimitRule(rate=2.0)
+    payment_rule = RateLimitRule(rate=0.2)
+    topup_rule = RateLimitRule(rate=0.5)
+    policy = ThrottlingPolicy(
+        message_rule=RateLimitRule(rate=2.0),
+        callback_rule=default_callback,
+        route_rules=[("balance_", payment_rule), ("balance_topup", topup_rule)],
+    )
+
+    assert policy.resolve("callback", "balance_topup_yookassa") == ("callback:balance_topup", topup_rule)
+    assert policy.resolve("callback", "balance_history") == ("callback:balance_", payment_rule)
+    assert policy.resolve("callback", "menu_profile") == ("callback", default_callback)
+
+
+def test_route_limits_parsing(monkeypatch):
+    monkeypatch.setattr(settings, "THROTTLING_ROUTE_LIMITS", "menu_=4/6, balance_topup=0.5\nbroken, x=0/1")
+
+    assert settings.get_throttling_route_limits() == [
+        ("balance_topup", 0.5, 1),
+        ("menu_", 4.0, 6),
+    ]
+
+
+@pytest.mark.anyio
+async def test_non_positive_settings_rates_disable_throttling(monkeypatch):
+    monkeypatch.setattr(settings, "THROTTLING_MESSAGE_RATE", 0)
+    monkeypatch.setattr(settings, "THROTTLING_CALLBACK_RATE", -1.0)
+    monkeypatch.setattr(settings, "THROTTLING_CALLBACK_BURST", 0)
+    monkeypatch.setattr(settings, "THROTTLING_ROUTE_LIMITS", "")
+    policy = ThrottlingPolicy.from_settings()
+    limiter = InMemoryRateLimiter(clock=_Clock())
+
+    assert policy.callback_rule.burst == 1
+    for event_type in ("message", "callback"):
+        bucket, rule = policy.resolve(event_type, None)
+        for _ in range(5):
+            assert (await limiter.hit(f"{bucket}:1", rule)).allowed
+    assert len(limiter) == 0
+
+
+@pytest.mark.anyio
+async def test_middleware_blocks_repeated_callback():
+    clock = _Clock()
+    middleware = ThrottlingMiddleware(
+        limiter=InMemoryRateLimiter(clock=clock),
+        policy=ThrottlingPolicy(
+            message_rule=RateLimitRule(rate=2.0),
+            callback_rule=RateLimitRule(rate=2.0),
+            route_rules=[("menu_", RateLimitRule(rate=4.0, burst=3))],
+        ),
+    )
+    handler = AsyncMock(return_value="ok")
+    answer = AsyncMock()
+
+    def _callback(data: str) -> CallbackQuery:
+        callback = CallbackQuery(
+            id="1",
+            from_user=TgUser(id=5, is_bot=False, first_name="Test"),
+            chat_instance="chat",
+            data=data,
+        )
+        object.__setattr__(callback, "answer", answer)
+        return callback
+
+    assert await middleware(handler, _callback("buy_subscription"), {}) == "ok"
+    assert await middleware(handler, _callback("buy_subscription"), {}) is None
+    answer.assert_awaited_once()
+
+    for _ in range(3):
+        assert await middleware(handler, _callback("menu_profile"), {}) == "ok"
+    assert handler.await_count == 4
@@ -92,7 +92,7 @@ def test_perform_sync_rebuilds_service_on_each_run(monkeypatch):
     async def fake_sync_with_remnawave(session, squads):
         return 1, 2, 3
 
-    cache_mock = SimpleNamespace(delete_pattern=AsyncMock())
+    cache_mock = SimpleNamespace(invalidate_tag=AsyncMock())
 
     class DummySession:
         async def __aenter__(self):
@@ -102,7 +102,7 @@ def test_perform_sync_rebuilds_service_on_each_run(monkeypatch):
             return False
 
     monkeypatch.setattr(
-        "app.services.remnawave_sync_service.AsyncSessionLocal",
+        "app.services.remnawave_sync_service.BackgroundSessionLocal",
         lambda: DummySession(),
     )
     monkeypatch.setattr(
@@ -128,4 +128,4 @@ def test_perform_sync_rebuilds_service_on_each_run(monkeypatch):
     asyncio.run(runner())
 
     assert not services
-    cache_mock.delete_pattern.assert_awaited_once_with("available_countries*")
+    cache_mock.invalidate_tag.assert_awaited_once_with("available_countries")